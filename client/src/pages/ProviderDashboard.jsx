@@ -63,24 +63,28 @@ const ProviderDashboard = () => {
     }
   };
 
-  const updateNodeStatus = async (routeId, nodeId, status, notes = '') => {
+  const updateNodeStatus = async (routeId, node, status, notes = '') => {
     setUpdating(true);
     try {
       await axios.put(
-        `${API_BASE_URL}/api/routes/${routeId}/update_node_status?node_id=${nodeId}`,
+        `${API_BASE_URL}/api/routes/${routeId}/update_node_status?node_id=${node.node_id}`,
         {
           status,
-          notes
+          notes,
+          expected_version: node.version
         }
       );
       toast.success('Status updated successfully');
-      // Refresh route details
-      if (selectedRoute) {
-        await fetchRouteDetails(routeId);
-      }
+      // The route's event stream delivers the new status (see useEffect below)
     } catch (error) {
       console.error('Error updating node status:', error);
-      toast.error(error.response?.data?.detail || 'Failed to update status');
+      if (error.response?.status === 409) {
+        // Someone else changed the stop (or the route was re-optimized): show the current state
+        toast.warning('This stop was updated by someone else. Please review and try again.');
+        await fetchRouteDetails(routeId);
+      } else {
+        toast.error(error.response?.data?.detail || 'Failed to update status');
+      }
     } finally {
       setUpdating(false);
     }
@@ -109,6 +113,38 @@ const ProviderDashboard = () => {
     return Math.round((completed / route.route.length) * 100);
   };
 
+  // Live status updates for the loaded route (Server-Sent Events) instead of polling
+  const selectedRouteId = selectedRoute?.route_id;
+  useEffect(() => {
+    if (!selectedRouteId) return undefined;
+    const source = new EventSource(`${API_BASE_URL}/api/routes/${selectedRouteId}/events`);
+    const refetch = async () => {
+      try {
+        const response = await axios.get(`${API_BASE_URL}/api/routes/${selectedRouteId}`);
+        setSelectedRoute(response.data);
+      } catch (error) {
+        console.error('Error refreshing route:', error);
+      }
+    };
+
+    source.addEventListener('node_status', (e) => {
+      const event = JSON.parse(e.data);
+      setSelectedRoute((route) => route && route.route_id === event.route_id ? {
+        ...route,
+        // Each status change moves the route version too; keep it for expected_version
+        version: event.route_version ?? route.version,
+        route: route.route.map((node) => node.order_index === event.order_index
+          ? { ...node, status: event.status, version: event.version }
+          : node)
+      } : route);
+    });
+    // Re-optimized, or we missed events: reload the route once
+    source.addEventListener('route_updated', refetch);
+    source.addEventListener('resync', refetch);
+
+    return () => source.close();
+  }, [selectedRouteId]);
+
   useEffect(() => {
     // Fetch routes on component mount
     // In production, implement proper route fetching with provider filtering
@@ -311,7 +347,7 @@ const ProviderDashboard = () => {
                             <button
                               onClick={() => updateNodeStatus(
                                 selectedRoute.route_id,
-                                node.service_id,
+                                node,
                                 'In Progress'
                               )}
                               disabled={updating}
@@ -322,7 +358,7 @@ const ProviderDashboard = () => {
                             <button
                               onClick={() => updateNodeStatus(
                                 selectedRoute.route_id,
-                                node.service_id,
+                                node,
                                 'Completed'
                               )}
                               disabled={updating}
@@ -69,7 +69,8 @@ const RoutePlanner = () => {
         `${API_BASE_URL}/api/reoptimize_route`,
         {
           route_id: routeData.route_id,
-          excluded_service_ids: Array.from(excludedServices)
+          excluded_service_ids: Array.from(excludedServices),
+          expected_version: routeData.version
         }
       );
       setRouteData(response.data);
@@ -77,12 +78,49 @@ const RoutePlanner = () => {
       toast.success('Route reoptimized successfully!');
     } catch (error) {
       console.error('Reoptimization error:', error);
-      toast.error(error.response?.data?.detail || 'Failed to reoptimize route');
+      if (error.response?.status === 409) {
+        // The route changed since it was loaded (e.g. a provider updated a stop): reload it
+        const response = await axios.get(`${API_BASE_URL}/api/routes/${routeData.route_id}`);
+        setRouteData((current) => ({ ...current, ...response.data }));
+        toast.warning('The route was updated in the meantime. Please review and reoptimize again.');
+      } else {
+        toast.error(error.response?.data?.detail || 'Failed to reoptimize route');
+      }
     } finally {
       setLoading(false);
     }
   };
 
+  // Provider status changes on the planned route (Server-Sent Events) instead of polling
+  const routeId = routeData?.route_id;
+  useEffect(() => {
+    if (!routeId) return undefined;
+    const source = new EventSource(`${API_BASE_URL}/api/routes/${routeId}/events`);
+    const refetch = async () => {
+      try {
+        const response = await axios.get(`${API_BASE_URL}/api/routes/${routeId}`);
+        setRouteData((current) => ({ ...current, ...response.data }));
+      } catch (error) {
+        console.error('Error refreshing route:', error);
+      }
+    };
+
+    source.addEventListener('node_status', (e) => {
+      const event = JSON.parse(e.data);
+      setRouteData((current) => current && current.route_id === event.route_id ? {
+        ...current,
+        // Each status change moves the route version too; keep it for expected_version
+        version: event.route_version ?? current.version,
+        route: current.route.map((node) => node.order_index === event.order_index
+          ? { ...node, status: event.status, version: event.version }
+          : node)
+      } : current);
+    });
+    source.addEventListener('resync', refetch);
+
+    return () => source.close();
+  }, [routeId]);
+
   const formatTime = (timeStr) => {
     return timeStr || '0 mins';
   };
@@ -0,0 +1,192 @@
+"""
+Admission control for the optimization endpoints
+Solves run with bounded concurrency (sized below the DB connection pool) and wait in a bounded
+priority queue: urgent before interactive before batch, FIFO within a class. Batch work may
+only use part of the slots, so urgent same-day referrals are not stuck behind bulk submissions.
+When the queue is full, a newcomer displaces the newest lower-priority waiter or is rejected
+at once; callers turn rejections into 429 with Retry-After.
+
+Runs on the event loop (no locks); one controller per worker process.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from metrics import Gauge, Histogram, register
+
+PRIORITIES = ("urgent", "interactive", "batch")
+DEFAULT_PRIORITY = "interactive"
+
+# 0 = pool_size + max_overflow of the engine, less ADMISSION_POOL_RESERVE
+ADMISSION_CONCURRENCY = int(os.getenv("ADMISSION_CONCURRENCY", "0"))
+# Connections kept free of admitted solves for unadmitted work (status updates, reads, idempotency)
+ADMISSION_POOL_RESERVE = int(os.getenv("ADMISSION_POOL_RESERVE", "4"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+# Fraction of the slots batch requests may occupy; slots held back from interactive for urgent
+ADMISSION_BATCH_SHARE = float(os.getenv("ADMISSION_BATCH_SHARE", "0.5"))
+ADMISSION_URGENT_RESERVE = int(os.getenv("ADMISSION_URGENT_RESERVE", "2"))
+
+ADMISSION_WAIT_SECONDS = register(Histogram(
+    "route_optimizer_admission_wait_seconds", "Time spent in the admission queue",
+    ["priority", "outcome"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+))
+
+
+class AdmissionRejected(Exception):
+    """The request was not admitted (queue full, displaced or timed out)"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def pool_concurrency(engine, reserve: int = ADMISSION_POOL_RESERVE) -> int:
+    """Connections the engine's pool can hand out (pool_size + max_overflow), less reserve"""
+    pool = engine.pool
+    size = pool.size() if callable(getattr(pool, "size", None)) else 5
+    return max(1, size + max(getattr(pool, "_max_overflow", 0), 0) - reserve)
+
+
+def request_priority(value: Optional[str]) -> str:
+    """Priority class from a header value (unknown or missing values are interactive)"""
+    value = (value or "").strip().lower()
+    return value if value in PRIORITIES else DEFAULT_PRIORITY
+
+
+class AdmissionController:
+    """Priority-queued concurrency limiter"""
+
+    def __init__(
+        self,
+        concurrency: int,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        batch_share: float = ADMISSION_BATCH_SHARE,
+        urgent_reserve: int = ADMISSION_URGENT_RESERVE
+    ):
+        self.concurrency = max(1, concurrency)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.limits = {
+            "urgent": self.concurrency,
+            "interactive": max(1, self.concurrency - urgent_reserve),
+            "batch": max(1, int(self.concurrency * batch_share))
+        }
+        self.active = 0
+        self._queues: Dict[str, Deque[asyncio.Future]] = {p: deque() for p in PRIORITIES}
+        self._hold_seconds = 0.5  # EWMA of slot hold time, for Retry-After
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free for a new arrival"""
+        backlog = self.queued + 1
+        return max(1, math.ceil(backlog * self._hold_seconds / self.concurrency))
+
+    async def acquire(self, priority: str) -> float:
+        """Wait for a slot; returns seconds waited or raises AdmissionRejected"""
+        started = time.perf_counter()
+        if self._can_start(priority) and not self._queued_at_or_above(priority):
+            self.active += 1
+            ADMISSION_WAIT_SECONDS.observe(0.0, priority=priority, outcome="admitted")
+            return 0.0
+
+        if self.queued >= self.queue_size and not self._displace_below(priority):
+            ADMISSION_WAIT_SECONDS.observe(0.0, priority=priority, outcome="rejected")
+            raise AdmissionRejected("Server busy: admission queue full", self.retry_after())
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._queues[priority].append(waiter)
+        expiry = loop.call_later(self.queue_timeout, self._expire, priority, waiter)
+        try:
+            await waiter
+        except AdmissionRejected as e:
+            ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started, priority=priority, outcome=e.reason)
+            raise
+        except asyncio.CancelledError:
+            # Client went away; hand back a slot granted in the meantime
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self.release(priority)
+            else:
+                self._discard(priority, waiter)
+            raise
+        finally:
+            expiry.cancel()
+        waited = time.perf_counter() - started
+        ADMISSION_WAIT_SECONDS.observe(waited, priority=priority, outcome="admitted")
+        return waited
+
+    @asynccontextmanager
+    async def slot(self, priority: str):
+        """Hold a slot for the block (raises AdmissionRejected like acquire)"""
+        await self.acquire(priority)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(priority, time.perf_counter() - started)
+
+    def release(self, priority: str, held_seconds: Optional[float] = None):
+        """Return a slot and admit the next waiters"""
+        self.active -= 1
+        if held_seconds is not None:
+            self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held_seconds
+        self._dispatch()
+
+    def _can_start(self, priority: str) -> bool:
+        return self.active < self.limits[priority]
+
+    def _queued_at_or_above(self, priority: str) -> bool:
+        rank = PRIORITIES.index(priority)
+        return any(self._queues[p] for p in PRIORITIES[:rank + 1])
+
+    def _dispatch(self):
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue and self._can_start(priority):
+                waiter = queue.popleft()
+                if waiter.done():
+                    continue
+                self.active += 1
+                waiter.set_result(None)
+
+    def _displace_below(self, priority: str) -> bool:
+        """Reject the newest waiter of the lowest class below priority; False if there is none"""
+        rank = PRIORITIES.index(priority)
+        for lower in reversed(PRIORITIES[rank + 1:]):
+            queue = self._queues[lower]
+            while queue:
+                waiter = queue.pop()
+                if not waiter.done():
+                    waiter.set_exception(AdmissionRejected("displaced", self.retry_after()))
+                    return True
+        return False
+
+    def _expire(self, priority: str, waiter: asyncio.Future):
+        if not waiter.done():
+            self._discard(priority, waiter)
+            waiter.set_exception(AdmissionRejected("timeout", self.retry_after()))
+
+    def _discard(self, priority: str, waiter: asyncio.Future):
+        try:
+            self._queues[priority].remove(waiter)
+        except ValueError:
+            pass
+
+
+def register_admission_gauges(controller: AdmissionController):
+    """Export in-flight and queued request counts"""
+    register(Gauge("route_optimizer_admission_in_flight", "Requests holding an admission slot",
+                   lambda: controller.active))
+    register(Gauge("route_optimizer_admission_queued", "Requests waiting for an admission slot",
+                   lambda: controller.queued))
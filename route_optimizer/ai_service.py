@@ -7,6 +7,8 @@ import json
 from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 
+from tracing import current_span, traced
+
 load_dotenv()
 
 # Try to import OpenAI (primary choice)
@@ -137,8 +139,10 @@ Format your response as JSON with these keys:
 """
         return prompt
     
+    @traced("llm.openai")
     def _get_openai_recommendations(self, prompt: str) -> Dict[str, Any]:
         """Get recommendations from OpenAI"""
+        current_span().set_attributes({"llm.model": os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"), "llm.prompt_chars": len(prompt)})
         try:
             response = self.openai_client.ChatCompletion.create(
                 model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
@@ -165,10 +169,13 @@ Format your response as JSON with these keys:
                 }
         except Exception as e:
             print(f"OpenAI error: {e}")
+            current_span().set_attribute("llm.error", str(e))
             return self._fallback_recommendations([])
     
+    @traced("llm.anthropic")
     def _get_anthropic_recommendations(self, prompt: str) -> Dict[str, Any]:
         """Get recommendations from Anthropic Claude"""
+        current_span().set_attributes({"llm.model": os.getenv("ANTHROPIC_MODEL", "claude-3-sonnet-20240229"), "llm.prompt_chars": len(prompt)})
         try:
             message = self.anthropic_client.messages.create(
                 model=os.getenv("ANTHROPIC_MODEL", "claude-3-sonnet-20240229"),
@@ -191,10 +198,13 @@ Format your response as JSON with these keys:
                 }
         except Exception as e:
             print(f"Anthropic error: {e}")
+            current_span().set_attribute("llm.error", str(e))
             return self._fallback_recommendations([])
     
+    @traced("llm.ollama")
     def _get_ollama_recommendations(self, prompt: str) -> Dict[str, Any]:
         """Get recommendations from local Ollama"""
+        current_span().set_attributes({"llm.model": os.getenv("OLLAMA_MODEL", "llama2"), "llm.prompt_chars": len(prompt)})
         try:
             model = os.getenv("OLLAMA_MODEL", "llama2")
             response = requests.post(
@@ -221,6 +231,7 @@ Format your response as JSON with these keys:
                     }
         except Exception as e:
             print(f"Ollama error: {e}")
+            current_span().set_attribute("llm.error", str(e))
             return self._fallback_recommendations([])
     
     def _fallback_recommendations(self, route: List[Dict[str, Any]]) -> Dict[str, Any]:
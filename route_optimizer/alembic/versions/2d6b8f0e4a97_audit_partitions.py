@@ -0,0 +1,131 @@
+"""Monthly audit trail partitions
+
+On PostgreSQL, audit_trails becomes a table partitioned by RANGE ("timestamp"), one
+partition per calendar month plus a DEFAULT partition. Existing rows are copied into
+it, and the old table is dropped once the copy has completed (all in this migration's
+transaction). The primary key becomes (id, "timestamp"), because a partitioned table's
+keys must include the partition column. The id sequence is kept.
+
+Partitions are created from the oldest existing month through PARTITIONS_AHEAD months
+ahead. audit.py's maintenance job keeps creating them after that. The partition DDL and
+month arithmetic are frozen here rather than imported from audit.py, so later changes
+there do not change what this revision does.
+
+Both dialects get ix_audit_trails_entity (entity_type, entity_id, "timestamp") for the
+audit query API. SQLite stays unpartitioned.
+
+Revision ID: 2d6b8f0e4a97
+Revises: 7c3e9a2f5b18
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d6b8f0e4a97'
+down_revision = '7c3e9a2f5b18'
+branch_labels = None
+depends_on = None
+
+INDEX_NAME = "ix_audit_trails_entity"
+COLUMNS = "id, user_id, user_role, action, entity_type, entity_id, details, ip_address, \"timestamp\""
+PARTITIONS_AHEAD = 3
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_ddl(month: datetime) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS audit_trails_y{month.year:04d}m{month.month:02d} PARTITION OF audit_trails "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+    )
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name != "postgresql":
+        if INDEX_NAME not in {i["name"] for i in sa.inspect(conn).get_indexes("audit_trails")}:
+            op.create_index(INDEX_NAME, "audit_trails", ["entity_type", "entity_id", "timestamp"])
+        return
+
+    partitioned = conn.execute(sa.text(
+        "SELECT c.relkind = 'p' FROM pg_class c WHERE c.oid = to_regclass('audit_trails')"
+    )).scalar()
+    if partitioned:
+        return
+
+    op.execute("ALTER TABLE audit_trails RENAME TO audit_trails_unpartitioned")
+    op.execute("ALTER INDEX IF EXISTS audit_trails_pkey RENAME TO audit_trails_unpartitioned_pkey")
+    op.execute("""
+        CREATE TABLE audit_trails (
+            id INTEGER NOT NULL DEFAULT nextval('audit_trails_id_seq'),
+            user_id VARCHAR NOT NULL,
+            user_role VARCHAR NOT NULL,
+            action VARCHAR NOT NULL,
+            entity_type VARCHAR NOT NULL,
+            entity_id INTEGER,
+            details TEXT,
+            ip_address VARCHAR,
+            "timestamp" TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")
+    """)
+    op.execute("ALTER SEQUENCE audit_trails_id_seq OWNED BY audit_trails.id")
+
+    oldest = conn.execute(sa.text('SELECT min("timestamp") FROM audit_trails_unpartitioned')).scalar()
+    month = month_start(oldest or datetime.utcnow())
+    last = add_months(month_start(datetime.utcnow()), PARTITIONS_AHEAD)
+    while month <= last:
+        op.execute(partition_ddl(month))
+        month = add_months(month, 1)
+    op.execute("CREATE TABLE audit_trails_default PARTITION OF audit_trails DEFAULT")
+
+    op.execute(f"""
+        INSERT INTO audit_trails ({COLUMNS})
+        SELECT id, user_id, user_role, action, entity_type, entity_id, details, ip_address,
+               COALESCE("timestamp", now())
+        FROM audit_trails_unpartitioned
+    """)
+    op.execute("DROP TABLE audit_trails_unpartitioned")
+
+    op.create_index("ix_audit_trails_timestamp", "audit_trails", ["timestamp"])
+    op.create_index(INDEX_NAME, "audit_trails", ["entity_type", "entity_id", "timestamp"])
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name != "postgresql":
+        op.drop_index(INDEX_NAME, table_name="audit_trails")
+        return
+
+    op.execute("ALTER TABLE audit_trails RENAME TO audit_trails_partitioned")
+    op.execute("ALTER INDEX audit_trails_pkey RENAME TO audit_trails_partitioned_pkey")
+    op.execute("""
+        CREATE TABLE audit_trails (
+            id INTEGER NOT NULL DEFAULT nextval('audit_trails_id_seq') PRIMARY KEY,
+            user_id VARCHAR NOT NULL,
+            user_role VARCHAR NOT NULL,
+            action VARCHAR NOT NULL,
+            entity_type VARCHAR NOT NULL,
+            entity_id INTEGER,
+            details TEXT,
+            ip_address VARCHAR,
+            "timestamp" TIMESTAMP WITHOUT TIME ZONE DEFAULT now()
+        )
+    """)
+    op.execute("ALTER SEQUENCE audit_trails_id_seq OWNED BY audit_trails.id")
+    op.execute(f"INSERT INTO audit_trails ({COLUMNS}) SELECT {COLUMNS} FROM audit_trails_partitioned")
+    op.execute("DROP TABLE audit_trails_partitioned CASCADE")
+    op.create_index("ix_audit_trails_timestamp", "audit_trails", ["timestamp"])
+    op.create_index("ix_audit_trails_id", "audit_trails", ["id"])
@@ -0,0 +1,150 @@
+"""Patient location cell and identity index
+
+Adds patients.location_cell (geohash of the patient location) and patients.identity_key
+(folded name + birth date), backfills both and creates the partial unique index used by
+the patient upsert: (insurance_code, location_cell, identity_key) WHERE fhir_id IS NULL.
+
+Existing duplicates (no FHIR ID, same plan, cell, name and birth date) are kept as
+separate records: every row after the oldest gets an identity_key suffixed with its own
+id, and their ids are printed so they can be reviewed and merged by hand. The oldest row
+stays the one the upsert matches.
+
+Revision ID: 3f2b9c1d7e01
+Revises: 
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2b9c1d7e01'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+INDEX_NAME = "uq_patients_identity"
+PREVIOUS_INDEX_NAME = "uq_patients_insurance_cell"
+BATCH_SIZE = 5000
+
+# Must match geo.PATIENT_CELL_PRECISION (same environment variable)
+CELL_PRECISION = int(os.getenv("PATIENT_CELL_PRECISION", "8"))
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(lat: float, lon: float, precision: int) -> str:
+    """Geohash of a coordinate (same encoding as geo.geohash_encode, frozen for this migration)"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        bounds, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        mid = (bounds[0] + bounds[1]) / 2
+        if coordinate >= mid:
+            value = (value << 1) | 1
+            bounds[0] = mid
+        else:
+            value <<= 1
+            bounds[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def identity_key(name: str, date_of_birth) -> str:
+    """Same folding as models.patient_identity_key"""
+    return " ".join((name or "").casefold().split()) + "|" + (f"{date_of_birth:%Y-%m-%d}" if date_of_birth else "")
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    # Databases created by init_db() may already have the new schema
+    columns = {c["name"] for c in inspector.get_columns("patients")}
+    if "location_cell" not in columns:
+        op.add_column("patients", sa.Column("location_cell", sa.String(length=12), nullable=True))
+    if "identity_key" not in columns:
+        op.add_column("patients", sa.Column("identity_key", sa.String(), nullable=True))
+    indexes = {i["name"] for i in inspector.get_indexes("patients")}
+    if PREVIOUS_INDEX_NAME in indexes:
+        op.drop_index(PREVIOUS_INDEX_NAME, table_name="patients")
+
+    patients = sa.table(
+        "patients",
+        sa.column("id", sa.Integer),
+        sa.column("fhir_id", sa.String),
+        sa.column("name", sa.String),
+        sa.column("date_of_birth", sa.DateTime),
+        sa.column("insurance_code", sa.String),
+        sa.column("location_latitude", sa.Float),
+        sa.column("location_longitude", sa.Float),
+        sa.column("location_cell", sa.String),
+        sa.column("identity_key", sa.String),
+    )
+
+    taken = set(conn.execute(
+        sa.select(patients.c.insurance_code, patients.c.location_cell, patients.c.identity_key)
+        .where(patients.c.location_cell.isnot(None), patients.c.identity_key.isnot(None),
+               patients.c.fhir_id.is_(None))
+    ).all())
+
+    rows = conn.execute(
+        sa.select(patients.c.id, patients.c.fhir_id, patients.c.name, patients.c.date_of_birth,
+                  patients.c.insurance_code, patients.c.location_latitude, patients.c.location_longitude)
+        .where(sa.or_(patients.c.location_cell.is_(None),
+                      sa.and_(patients.c.identity_key.is_(None), patients.c.fhir_id.is_(None))))
+        .order_by(patients.c.id)
+    ).all()
+
+    update = (
+        sa.update(patients)
+        .where(patients.c.id == sa.bindparam("patient_id"))
+        .values(location_cell=sa.bindparam("cell"), identity_key=sa.bindparam("key"))
+    )
+    batch = []
+    duplicates = []
+    for row in rows:
+        cell = geohash(row.location_latitude, row.location_longitude, CELL_PRECISION)
+        key = None
+        if row.fhir_id is None:
+            key = identity_key(row.name, row.date_of_birth)
+            if (row.insurance_code, cell, key) in taken:
+                duplicates.append(row.id)
+                key = f"{key}|duplicate:{row.id}"
+            taken.add((row.insurance_code, cell, key))
+        batch.append({"patient_id": row.id, "cell": cell, "key": key})
+        if len(batch) >= BATCH_SIZE:
+            conn.execute(update, batch)
+            batch = []
+    if batch:
+        conn.execute(update, batch)
+    if duplicates:
+        print(f"{len(duplicates)} patients duplicate an older record (same plan, location, name and birth date); "
+              f"kept separate for manual review: ids {', '.join(str(i) for i in duplicates)}")
+
+    if INDEX_NAME not in indexes:
+        op.create_index(
+            INDEX_NAME,
+            "patients",
+            ["insurance_code", "location_cell", "identity_key"],
+            unique=True,
+            postgresql_where=sa.text("fhir_id IS NULL"),
+            sqlite_where=sa.text("fhir_id IS NULL"),
+        )
+
+
+def downgrade() -> None:
+    op.drop_index(INDEX_NAME, table_name="patients")
+    with op.batch_alter_table("patients") as batch_op:
+        batch_op.drop_column("identity_key")
+        batch_op.drop_column("location_cell")
@@ -0,0 +1,41 @@
+"""Idempotency keys for route optimization
+
+Creates idempotency_keys, which maps a client Idempotency-Key header to the request
+fingerprint and the route/response it produced (see idempotency.py).
+
+Revision ID: 5a7e3c19f2d4
+Revises: d27e5a90c4b8
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a7e3c19f2d4'
+down_revision = 'd27e5a90c4b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Databases created by init_db() may already have the table
+    if sa.inspect(op.get_bind()).has_table("idempotency_keys"):
+        return
+    op.create_table(
+        "idempotency_keys",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("key", sa.String(255), nullable=False, unique=True),
+        sa.Column("request_hash", sa.String(64), nullable=False),
+        sa.Column("route_id", sa.Integer(), sa.ForeignKey("routes.id", ondelete="SET NULL"), nullable=True),
+        sa.Column("response", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_idempotency_keys_expires_at", "idempotency_keys", ["expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_idempotency_keys_expires_at", table_name="idempotency_keys")
+    op.drop_table("idempotency_keys")
@@ -0,0 +1,54 @@
+"""Analytics rollup tables
+
+Creates route_daily_rollups and provider_daily_rollups, maintained incrementally by the
+write paths (rollups.py). They are filled from the existing routes and route nodes by
+f0b7d3c8e215, once routes carry their plan snapshot.
+
+Revision ID: 6e1a4c8b2f90
+Revises: 2d6b8f0e4a97
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e1a4c8b2f90'
+down_revision = '2d6b8f0e4a97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # Databases created by init_db() may already have the tables
+    if not inspector.has_table("route_daily_rollups"):
+        op.create_table(
+            "route_daily_rollups",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("day", sa.Date(), nullable=False),
+            sa.Column("insurance_code", sa.String(), nullable=False),
+            sa.Column("route_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("total_cost", sa.Float(), nullable=False, server_default="0"),
+            sa.Column("total_distance_miles", sa.Float(), nullable=False, server_default="0"),
+            sa.Column("distance_route_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.UniqueConstraint("day", "insurance_code", name="uq_route_daily_rollups_key"),
+        )
+    if not inspector.has_table("provider_daily_rollups"):
+        op.create_table(
+            "provider_daily_rollups",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("day", sa.Date(), nullable=False),
+            sa.Column("provider_id", sa.Integer(), sa.ForeignKey("providers.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("node_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("completed_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.UniqueConstraint("day", "provider_id", name="uq_provider_daily_rollups_key"),
+        )
+        op.create_index("ix_provider_daily_rollups_provider", "provider_daily_rollups", ["provider_id", "day"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_provider_daily_rollups_provider", table_name="provider_daily_rollups")
+    op.drop_table("provider_daily_rollups")
+    op.drop_table("route_daily_rollups")
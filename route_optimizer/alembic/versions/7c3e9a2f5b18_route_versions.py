@@ -0,0 +1,36 @@
+"""Route and route node versions
+
+Adds routes.version and route_nodes.version, bumped on every change and used for
+compare-and-swap updates (UPDATE ... WHERE version = :expected). Existing rows start
+at version 1.
+
+Revision ID: 7c3e9a2f5b18
+Revises: e91f0c7b5d26
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e9a2f5b18'
+down_revision = 'e91f0c7b5d26'
+branch_labels = None
+depends_on = None
+
+TABLES = ("routes", "route_nodes")
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for table in TABLES:
+        # Databases created by init_db() may already have the column
+        if "version" not in {c["name"] for c in inspector.get_columns(table)}:
+            op.add_column(table, sa.Column("version", sa.Integer(), nullable=False, server_default="1"))
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column("version")
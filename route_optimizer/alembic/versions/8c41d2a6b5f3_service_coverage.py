@@ -0,0 +1,48 @@
+"""Normalized service coverage table
+
+Creates service_coverage (insurance_code, service_id, service_code, category) and
+backfills it from the plans' covered categories (InsuranceProgram.covered_services)
+and the service names (see coverage.py for the matching rule).
+
+Revision ID: 8c41d2a6b5f3
+Revises: 3f2b9c1d7e01
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from coverage import rebuild_service_coverage
+
+
+# revision identifiers, used by Alembic.
+revision = '8c41d2a6b5f3'
+down_revision = '3f2b9c1d7e01'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    # Databases created by init_db() may already have the table
+    if not sa.inspect(conn).has_table("service_coverage"):
+        op.create_table(
+            "service_coverage",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("insurance_code", sa.String(), nullable=False),
+            sa.Column("service_id", sa.Integer(), sa.ForeignKey("services.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("service_code", sa.String(), nullable=True),
+            sa.Column("category", sa.String(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+            sa.UniqueConstraint("insurance_code", "service_id", name="uq_service_coverage_plan_service"),
+        )
+        op.create_index("ix_service_coverage_service_id", "service_coverage", ["service_id"])
+        op.create_index("ix_service_coverage_plan_code", "service_coverage", ["insurance_code", "service_code"])
+
+    rebuild_service_coverage(conn)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_service_coverage_plan_code", table_name="service_coverage")
+    op.drop_index("ix_service_coverage_service_id", table_name="service_coverage")
+    op.drop_table("service_coverage")
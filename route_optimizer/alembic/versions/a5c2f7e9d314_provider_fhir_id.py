@@ -0,0 +1,35 @@
+"""Provider FHIR ID
+
+Adds providers.fhir_id ("<resourceType>/<id>" of an imported Organization, Practitioner or
+Location) with a unique index, the upsert key of the FHIR bulk import (fhir_import.py).
+
+Revision ID: a5c2f7e9d314
+Revises: 6e1a4c8b2f90
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5c2f7e9d314'
+down_revision = '6e1a4c8b2f90'
+branch_labels = None
+depends_on = None
+
+INDEX_NAME = "ix_providers_fhir_id"
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # Databases created by init_db() may already have the column
+    if "fhir_id" not in {c["name"] for c in inspector.get_columns("providers")}:
+        op.add_column("providers", sa.Column("fhir_id", sa.String(), nullable=True))
+    if INDEX_NAME not in {i["name"] for i in inspector.get_indexes("providers")}:
+        op.create_index(INDEX_NAME, "providers", ["fhir_id"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(INDEX_NAME, table_name="providers")
+    op.drop_column("providers", "fhir_id")
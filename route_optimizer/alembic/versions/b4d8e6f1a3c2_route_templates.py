@@ -0,0 +1,40 @@
+"""Route templates
+
+Creates route_templates: the solved stop order for an insurance plan within a geohash cell,
+per catalog version (see route_templates.py).
+
+Revision ID: b4d8e6f1a3c2
+Revises: 5a7e3c19f2d4
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d8e6f1a3c2'
+down_revision = '5a7e3c19f2d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Databases created by init_db() may already have the table
+    if sa.inspect(op.get_bind()).has_table("route_templates"):
+        return
+    op.create_table(
+        "route_templates",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("location_cell", sa.String(12), nullable=False),
+        sa.Column("insurance_code", sa.String(), nullable=False),
+        sa.Column("catalog_version", sa.String(16), nullable=False),
+        sa.Column("path", sa.Text(), nullable=False),
+        sa.Column("stop_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.UniqueConstraint("location_cell", "insurance_code", "catalog_version", name="uq_route_templates_key"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("route_templates")
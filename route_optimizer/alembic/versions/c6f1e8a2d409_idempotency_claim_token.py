@@ -0,0 +1,30 @@
+"""Idempotency key claim tokens
+
+Adds idempotency_keys.claim_token, a random token per claim, so only the request that
+claimed a key can complete or release it (see idempotency.py). Claims made before the
+column existed have no token and simply lapse.
+
+Revision ID: c6f1e8a2d409
+Revises: f0b7d3c8e215
+Create Date: 2026-10-20 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6f1e8a2d409'
+down_revision = 'f0b7d3c8e215'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Databases created by init_db() may already have the column
+    if "claim_token" not in {c["name"] for c in sa.inspect(op.get_bind()).get_columns("idempotency_keys")}:
+        op.add_column("idempotency_keys", sa.Column("claim_token", sa.String(32), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("idempotency_keys", "claim_token")
@@ -0,0 +1,32 @@
+"""Trigram index on service names
+
+PostgreSQL only: enables pg_trgm and adds a GIN gin_trgm_ops index on services.name, which
+backs the word-similarity name matching in service_matcher.py (and ILIKE '%...%' filters).
+Other databases use the in-process matcher, so this is a no-op there.
+
+Revision ID: d27e5a90c4b8
+Revises: 8c41d2a6b5f3
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd27e5a90c4b8'
+down_revision = '8c41d2a6b5f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_services_name_trgm ON services USING gin (name gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("DROP INDEX IF EXISTS ix_services_name_trgm")
@@ -0,0 +1,48 @@
+"""Background jobs table
+
+Creates jobs, the durable queue claimed by jobs.py workers (SKIP LOCKED on PostgreSQL).
+
+Revision ID: e91f0c7b5d26
+Revises: b4d8e6f1a3c2
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e91f0c7b5d26'
+down_revision = 'b4d8e6f1a3c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Databases created by init_db() may already have the table
+    if sa.inspect(op.get_bind()).has_table("jobs"):
+        return
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("kind", sa.String(64), nullable=False),
+        sa.Column("payload", sa.Text(), nullable=True),
+        sa.Column("status", sa.String(16), nullable=False, server_default="queued"),
+        sa.Column("priority", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("max_attempts", sa.Integer(), nullable=False, server_default="5"),
+        sa.Column("run_at", sa.DateTime(), nullable=False),
+        sa.Column("locked_by", sa.String(), nullable=True),
+        sa.Column("locked_at", sa.DateTime(), nullable=True),
+        sa.Column("lease_expires_at", sa.DateTime(), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("result", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_jobs_claim", "jobs", ["status", "priority", "run_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_jobs_claim", table_name="jobs")
+    op.drop_table("jobs")
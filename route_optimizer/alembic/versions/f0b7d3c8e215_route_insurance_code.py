@@ -0,0 +1,40 @@
+"""Route insurance code snapshot
+
+Adds routes.insurance_code, the patient's plan when the route was created, so analytics
+rollups keep counting a route under that plan after the patient changes plans. Existing
+routes take their patient's current plan (the best record there is), then the rollup
+tables are rebuilt from the routes.
+
+Revision ID: f0b7d3c8e215
+Revises: a5c2f7e9d314
+Create Date: 2026-10-20 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from rollups import rebuild_rollups
+
+
+# revision identifiers, used by Alembic.
+revision = 'f0b7d3c8e215'
+down_revision = 'a5c2f7e9d314'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    # Databases created by init_db() may already have the column
+    if "insurance_code" not in {c["name"] for c in sa.inspect(conn).get_columns("routes")}:
+        op.add_column("routes", sa.Column("insurance_code", sa.String(), nullable=True))
+    op.execute(
+        "UPDATE routes SET insurance_code = "
+        "(SELECT patients.insurance_code FROM patients WHERE patients.id = routes.patient_id) "
+        "WHERE insurance_code IS NULL"
+    )
+    rebuild_rollups(conn)
+
+
+def downgrade() -> None:
+    op.drop_column("routes", "insurance_code")
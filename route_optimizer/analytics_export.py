@@ -0,0 +1,227 @@
+"""
+Analytics export of routes: one row per route node, streamed as CSV or Parquet
+Rows come from a single Route + Patient + RouteNode + Service + Provider join read
+through a server-side cursor (yield_per), and are encoded batch by batch, so memory
+stays constant whatever the number of routes exported.
+
+Usage:
+    python analytics_export.py routes.csv --since 2026-01-01 --insurance-code AET-GOLD
+    python analytics_export.py routes.parquet --format parquet
+"""
+import csv
+import io
+import os
+from datetime import datetime
+from typing import Any, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import Patient, Provider, Route, RouteNode, Service
+from rollups import route_plan
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# Rows fetched per round trip, and per CSV chunk / Parquet row group
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "10000"))
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet")
+}
+
+# (name, column, Parquet type name); routes without nodes export one row with empty node columns
+EXPORT_COLUMNS = (
+    ("route_id", Route.id, "int64"),
+    ("route_created_at", Route.created_at, "timestamp"),
+    ("route_status", Route.status, "string"),
+    ("patient_id", Route.patient_id, "int64"),
+    ("insurance_code", route_plan().label("insurance_code"), "string"),  # The plan the route was made under
+    ("total_cost", Route.total_cost, "float64"),
+    ("total_time_minutes", Route.total_time_minutes, "int64"),
+    ("total_distance_miles", Route.total_distance_miles, "float64"),
+    ("node_id", RouteNode.id, "int64"),
+    ("order_index", RouteNode.order_index, "int64"),
+    ("node_status", RouteNode.status, "string"),
+    ("estimated_arrival_time", RouteNode.estimated_arrival_time, "timestamp"),
+    ("actual_completion_time", RouteNode.actual_completion_time, "timestamp"),
+    ("service_id", Service.id, "int64"),
+    ("service_name", Service.name, "string"),
+    ("service_code", Service.service_code, "string"),
+    ("service_price", Service.price, "float64"),
+    ("duration_minutes", Service.duration_minutes, "int64"),
+    ("provider_id", Provider.id, "int64"),
+    ("provider_name", Provider.name, "string"),
+    ("specialty", Provider.specialty, "string"),
+)
+COLUMN_NAMES = [name for name, _, _ in EXPORT_COLUMNS]
+NODE_STATUS_INDEX = COLUMN_NAMES.index("node_status")
+
+
+def export_query(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    insurance_code: Optional[str] = None
+):
+    """
+    SELECT of the export rows, routes filtered by created_at range and plan, in route order
+    The plan is the route's own (rollups.route_plan), as in the analytics rollups, not the
+    patient's current one
+    """
+    query = (
+        select(*[column for _, column, _ in EXPORT_COLUMNS])
+        .select_from(Route)
+        .join(Patient, Patient.id == Route.patient_id)
+        .outerjoin(RouteNode, RouteNode.route_id == Route.id)
+        .outerjoin(Service, Service.id == RouteNode.service_id)
+        .outerjoin(Provider, Provider.id == Service.provider_id)
+    )
+    if since is not None:
+        query = query.where(Route.created_at >= since)
+    if until is not None:
+        query = query.where(Route.created_at < until)
+    if insurance_code:
+        query = query.where(route_plan() == insurance_code)
+    return query.order_by(Route.id, RouteNode.order_index)
+
+
+def export_batches(
+    db: Session,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    insurance_code: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[List[Tuple[Any, ...]]]:
+    """Export rows in lists of batch_size, streamed from a server-side cursor (Core rows, no ORM loading)"""
+    result = db.connection().execute(
+        export_query(since, until, insurance_code).execution_options(yield_per=batch_size)
+    )
+    for partition in result.partitions():
+        rows = [tuple(row) for row in partition]
+        for row_index, row in enumerate(rows):
+            status = row[NODE_STATUS_INDEX]
+            if status is not None:
+                rows[row_index] = row[:NODE_STATUS_INDEX] + (status.value,) + row[NODE_STATUS_INDEX + 1:]
+        yield rows
+
+
+def csv_chunks(batches: Iterator[List[Tuple[Any, ...]]]) -> Iterator[bytes]:
+    """Header, then one UTF-8 CSV chunk per batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(COLUMN_NAMES)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink:
+    """Write-only file for ParquetWriter whose written bytes are handed out as they arrive"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_schema():
+    types = {"int64": pa.int64(), "float64": pa.float64(), "string": pa.string(), "timestamp": pa.timestamp("us")}
+    return pa.schema([(name, types[type_name]) for name, _, type_name in EXPORT_COLUMNS])
+
+
+def parquet_chunks(batches: Iterator[List[Tuple[Any, ...]]]) -> Iterator[bytes]:
+    """A Parquet file written one row group per batch; each row group's bytes are yielded when written"""
+    if not PARQUET_AVAILABLE:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+    try:
+        for rows in batches:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+            ))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_routes(
+    db: Session,
+    export_format: str = "csv",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    insurance_code: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[bytes]:
+    """Encoded export (csv or parquet) as a stream of byte chunks"""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    if export_format == "parquet" and not PARQUET_AVAILABLE:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    batches = export_batches(db, since, until, insurance_code, batch_size)
+    return parquet_chunks(batches) if export_format == "parquet" else csv_chunks(batches)
+
+
+def export_filename(export_format: str) -> str:
+    return f"routes_{datetime.utcnow():%Y%m%dT%H%M%S}.{EXPORT_FORMATS[export_format][1]}"
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from database import read_session
+
+    parser = argparse.ArgumentParser(description="Export routes (one row per route node) for analytics")
+    parser.add_argument("output", help="Output file")
+    parser.add_argument("--format", choices=tuple(EXPORT_FORMATS), default=None,
+                        help="Default: from the output file extension")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Routes created at or after (ISO 8601)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Routes created before (ISO 8601)")
+    parser.add_argument("--insurance-code")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    export_format = args.format or ("parquet" if args.output.endswith(".parquet") else "csv")
+    started = time.perf_counter()
+    written = 0
+    with read_session() as session, open(args.output, "wb") as out:
+        for chunk in export_routes(session, export_format, args.since, args.until, args.insurance_code, args.batch_size):
+            out.write(chunk)
+            written += len(chunk)
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {written / 1e6:.1f} MB to {args.output} in {elapsed:.1f}s")
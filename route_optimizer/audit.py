@@ -0,0 +1,428 @@
+"""
+Audit trail storage: monthly partitions, archival and queries
+On PostgreSQL, audit_trails is partitioned by month (see the 2d6b8f0e4a97 migration).
+Months older than AUDIT_HOT_MONTHS are streamed to compressed archive files and then
+removed from the database: a dedicated partition is detached and dropped, and rows that
+landed in the DEFAULT partition are deleted. On SQLite the same archival deletes by range.
+
+Retention (HIPAA keeps audit documentation for 6 years):
+- rows leave the database only after their archive file is written, fsynced and read back
+  with a matching row count; the checksum is recorded in a manifest next to the file
+- archives are never deleted before AUDIT_RETENTION_YEARS (at least 6) after the end of
+  their month, and only by an explicit `purge-archives`
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from models import AuditTrail
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+HIPAA_RETENTION_YEARS = 6
+AUDIT_RETENTION_YEARS = max(HIPAA_RETENTION_YEARS, int(os.getenv("AUDIT_RETENTION_YEARS", "6")))
+# Months kept in the database (the current month counts as one)
+AUDIT_HOT_MONTHS = max(1, int(os.getenv("AUDIT_HOT_MONTHS", "13")))
+# Monthly partitions created ahead of time
+AUDIT_PARTITIONS_AHEAD = int(os.getenv("AUDIT_PARTITIONS_AHEAD", "3"))
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "./audit_archive")
+AUDIT_ARCHIVE_FORMAT = os.getenv("AUDIT_ARCHIVE_FORMAT", "ndjson")  # ndjson (gzip) or parquet
+# Window of GET /api/audit when no `since` is given (bounds the partitions scanned)
+AUDIT_QUERY_DEFAULT_DAYS = int(os.getenv("AUDIT_QUERY_DEFAULT_DAYS", "90"))
+
+COLUMNS = ("id", "user_id", "user_role", "action", "entity_type", "entity_id", "details", "ip_address", "timestamp")
+PARTITION_NAME = re.compile(r"^audit_trails_y(\d{4})m(\d{2})$")
+STREAM_BATCH_SIZE = 5000
+
+
+# ==================== Months and Partitions ====================
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"audit_trails_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_ddl(month: datetime) -> str:
+    """CREATE TABLE for the partition holding the month starting at `month`"""
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF audit_trails "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+    )
+
+
+def is_partitioned(db: Session) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return bool(db.execute(text(
+        "SELECT c.relkind = 'p' FROM pg_class c WHERE c.oid = to_regclass('audit_trails')"
+    )).scalar())
+
+
+def monthly_partitions(db: Session) -> List[datetime]:
+    """Months that have their own partition, oldest first"""
+    if not is_partitioned(db):
+        return []
+    names = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('audit_trails')"
+    )).scalars()
+    months = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(datetime(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def ensure_partitions(db: Session, months_ahead: int = AUDIT_PARTITIONS_AHEAD) -> List[str]:
+    """Create partitions for the current month and the next months_ahead; returns new ones"""
+    if not is_partitioned(db):
+        return []
+    existing = set(monthly_partitions(db))
+    current = month_start(datetime.utcnow())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month not in existing:
+            db.execute(text(partition_ddl(month)))
+            created.append(partition_name(month))
+    db.commit()
+    return created
+
+
+# ==================== Archival ====================
+
+def hot_cutoff(hot_months: int = AUDIT_HOT_MONTHS) -> datetime:
+    """
+    Start of the oldest month kept in the database
+    Never fewer than AUDIT_HOT_MONTHS months (so never the current month), whatever the caller asks
+    """
+    return add_months(month_start(datetime.utcnow()), -(max(hot_months, AUDIT_HOT_MONTHS) - 1))
+
+
+def archivable_months(db: Session, hot_months: int = AUDIT_HOT_MONTHS) -> List[datetime]:
+    """Months older than the hot window that have rows or a partition, oldest first"""
+    cutoff = hot_cutoff(hot_months)
+    oldest = db.query(func.min(AuditTrail.timestamp)).scalar()
+    months = set(month for month in monthly_partitions(db) if month < cutoff)
+    month = month_start(oldest) if oldest is not None else cutoff
+    while month < cutoff:
+        has_rows = db.query(AuditTrail.id).filter(
+            AuditTrail.timestamp >= month, AuditTrail.timestamp < add_months(month, 1)
+        ).first()
+        if has_rows:
+            months.add(month)
+        month = add_months(month, 1)
+    return sorted(months)
+
+
+def _month_rows(db: Session, month: datetime) -> Iterator[Dict[str, Any]]:
+    """Rows of one month in timestamp order, streamed from a server-side cursor"""
+    columns = [getattr(AuditTrail, name) for name in COLUMNS]
+    result = db.execute(
+        select(*columns)
+        .where(AuditTrail.timestamp >= month, AuditTrail.timestamp < add_months(month, 1))
+        .order_by(AuditTrail.timestamp, AuditTrail.id)
+        .execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+    for row in result:
+        values = dict(zip(COLUMNS, row))
+        values["timestamp"] = values["timestamp"].isoformat() if values["timestamp"] else None
+        yield values
+
+
+def _write_ndjson(path: str, rows: Iterator[Dict[str, Any]]) -> int:
+    written = 0
+    with open(path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as out:
+            for row in rows:
+                out.write(json.dumps(row, separators=(",", ":")).encode() + b"\n")
+                written += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    return written
+
+
+def _write_parquet(path: str, rows: Iterator[Dict[str, Any]]) -> int:
+    schema = pa.schema([
+        ("id", pa.int64()), ("user_id", pa.string()), ("user_role", pa.string()), ("action", pa.string()),
+        ("entity_type", pa.string()), ("entity_id", pa.int64()), ("details", pa.string()),
+        ("ip_address", pa.string()), ("timestamp", pa.string())
+    ])
+    written = 0
+    with open(path, "wb") as raw:
+        with pq.ParquetWriter(raw, schema, compression="zstd") as writer:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= STREAM_BATCH_SIZE:
+                    writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                    written += len(batch)
+                    batch = []
+            if batch:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                written += len(batch)
+        raw.flush()
+        os.fsync(raw.fileno())
+    return written
+
+
+def _count_archived(path: str, archive_format: str) -> int:
+    """Rows in an archive file, read back from disk"""
+    if archive_format == "parquet":
+        return pq.ParquetFile(path).metadata.num_rows
+    with gzip.open(path, "rb") as archived:
+        return sum(1 for _ in archived)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as archived:
+        for chunk in iter(lambda: archived.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _archived_ids(path: str, archive_format: str) -> List[int]:
+    if archive_format == "parquet":
+        return pq.read_table(path, columns=["id"]).column("id").to_pylist()
+    with gzip.open(path, "rb") as archived:
+        return [json.loads(line)["id"] for line in archived]
+
+
+def _still_in_table(db: Session, ids: List[int]) -> bool:
+    """Whether every archived row is still in the table (the run that wrote the file never removed them)"""
+    present = 0
+    for offset in range(0, len(ids), STREAM_BATCH_SIZE):
+        chunk = ids[offset:offset + STREAM_BATCH_SIZE]
+        present += db.query(func.count(AuditTrail.id)).filter(AuditTrail.id.in_(chunk)).scalar()
+    return present == len(ids)
+
+
+def _write_atomic(path: str, write) -> Any:
+    """Run write(temp_path) on a temporary file next to path, then rename it over path"""
+    handle, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                         dir=os.path.dirname(path) or ".")
+    os.close(handle)
+    try:
+        result = write(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return result
+
+
+def archive_path(month: datetime, archive_dir: str = AUDIT_ARCHIVE_DIR, archive_format: str = AUDIT_ARCHIVE_FORMAT) -> str:
+    extension = "parquet" if archive_format == "parquet" else "ndjson.gz"
+    return os.path.join(archive_dir, f"audit_trails_{month:%Y-%m}.{extension}")
+
+
+def archive_month(
+    db: Session,
+    month: datetime,
+    archive_dir: str = AUDIT_ARCHIVE_DIR,
+    archive_format: str = AUDIT_ARCHIVE_FORMAT
+) -> Dict[str, Any]:
+    """
+    Write one month to an archive file, verify it, then remove the month from the database
+    Raises RuntimeError (and leaves the rows in place) if the file does not match the table.
+    Files are written to a temporary name and renamed into place, so a run that crashed
+    can simply be retried: an existing archive is replaced as long as every row it holds
+    is still in the table.
+    """
+    if archive_format == "parquet" and not PARQUET_AVAILABLE:
+        raise RuntimeError("Parquet archives need pyarrow (pip install pyarrow)")
+    if month >= hot_cutoff(AUDIT_HOT_MONTHS):
+        raise ValueError(f"{month:%Y-%m} is within the last {AUDIT_HOT_MONTHS} months; not archiving it")
+    os.makedirs(archive_dir, exist_ok=True)
+    path = archive_path(month, archive_dir, archive_format)
+    if os.path.exists(path) and not _still_in_table(db, _archived_ids(path, archive_format)):
+        # Rows written after an earlier, completed archival of this month: replacing the file would lose the old ones
+        raise RuntimeError(f"{path} holds rows no longer in the table; merge the month manually")
+
+    end = add_months(month, 1)
+    in_month = (AuditTrail.timestamp >= month, AuditTrail.timestamp < end)
+    expected = db.query(func.count(AuditTrail.id)).filter(*in_month).scalar()
+    writer = _write_parquet if archive_format == "parquet" else _write_ndjson
+
+    def write_verified(temp_path: str) -> Dict[str, Any]:
+        written = writer(temp_path, _month_rows(db, month))
+        if written != expected or _count_archived(temp_path, archive_format) != expected:
+            raise RuntimeError(f"Archive of {month:%Y-%m} has {written} rows, table has {expected}; nothing removed")
+        return {
+            "month": f"{month:%Y-%m}",
+            "rows": written,
+            "format": archive_format,
+            "sha256": _sha256(temp_path),
+            "archived_at": datetime.utcnow().isoformat(),
+            "retain_until": f"{add_months(end, 12 * AUDIT_RETENTION_YEARS):%Y-%m-%d}"
+        }
+
+    def write_manifest(temp_path: str):
+        with open(temp_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+
+    manifest = _write_atomic(path, write_verified)
+    written = manifest["rows"]
+    _write_atomic(path + ".manifest.json", write_manifest)
+
+    # Only now leave the database: the whole partition if the month has one, otherwise by range
+    if month in monthly_partitions(db):
+        name = partition_name(month)
+        db.execute(text(f"ALTER TABLE audit_trails DETACH PARTITION {name}"))
+        db.execute(text(f"DROP TABLE {name}"))
+        removed = written
+    else:
+        removed = db.query(AuditTrail).filter(*in_month).delete(synchronize_session=False)
+    if removed != written:
+        db.rollback()
+        raise RuntimeError(f"{removed} rows matched {month:%Y-%m} on delete, {written} archived; rolled back")
+    db.commit()
+    return {**manifest, "path": path}
+
+
+def archive_old_months(
+    db: Session,
+    hot_months: int = AUDIT_HOT_MONTHS,
+    archive_dir: str = AUDIT_ARCHIVE_DIR,
+    archive_format: str = AUDIT_ARCHIVE_FORMAT
+) -> List[Dict[str, Any]]:
+    """Create upcoming partitions and archive every month older than the hot window"""
+    ensure_partitions(db)
+    return [archive_month(db, month, archive_dir, archive_format) for month in archivable_months(db, hot_months)]
+
+
+def expired_archives(archive_dir: str = AUDIT_ARCHIVE_DIR, today: Optional[date] = None) -> List[str]:
+    """Archive files whose retention period has ended (per their manifest)"""
+    today = today or datetime.utcnow().date()
+    expired = []
+    if not os.path.isdir(archive_dir):
+        return expired
+    for name in sorted(os.listdir(archive_dir)):
+        if not name.endswith(".manifest.json"):
+            continue
+        with open(os.path.join(archive_dir, name)) as manifest_file:
+            manifest = json.load(manifest_file)
+        retain_until = datetime.strptime(manifest["retain_until"], "%Y-%m-%d").date()
+        # Never earlier than the HIPAA minimum, whatever the manifest says
+        month = datetime.strptime(manifest["month"], "%Y-%m")
+        minimum = add_months(month, 1 + 12 * HIPAA_RETENTION_YEARS).date()
+        if today >= max(retain_until, minimum):
+            expired.append(os.path.join(archive_dir, name[:-len(".manifest.json")]))
+    return expired
+
+
+# ==================== Queries ====================
+
+def query_audit(
+    db: Session,
+    entity_type: str,
+    entity_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    action: Optional[str] = None,
+    limit: int = 100
+) -> Tuple[List[AuditTrail], datetime]:
+    """
+    Audit rows for an entity, newest first, and the effective `since`
+    The timestamp range lets PostgreSQL prune partitions; it defaults to the last
+    AUDIT_QUERY_DEFAULT_DAYS days.
+    """
+    since = since or datetime.utcnow() - timedelta(days=AUDIT_QUERY_DEFAULT_DAYS)
+    query = db.query(AuditTrail).filter(AuditTrail.entity_type == entity_type, AuditTrail.timestamp >= since)
+    if until is not None:
+        query = query.filter(AuditTrail.timestamp < until)
+    if entity_id is not None:
+        query = query.filter(AuditTrail.entity_id == entity_id)
+    if action:
+        query = query.filter(AuditTrail.action == action)
+    return query.order_by(AuditTrail.timestamp.desc(), AuditTrail.id.desc()).limit(limit).all(), since
+
+
+def search_archives(
+    entity_type: str,
+    entity_id: Optional[int] = None,
+    archive_dir: str = AUDIT_ARCHIVE_DIR
+) -> Iterator[Dict[str, Any]]:
+    """Rows of archived months for an entity (compliance lookups past the hot window)"""
+    if not os.path.isdir(archive_dir):
+        return
+    for name in sorted(os.listdir(archive_dir)):
+        path = os.path.join(archive_dir, name)
+        if name.endswith(".ndjson.gz"):
+            with gzip.open(path, "rt") as archived:
+                rows = (json.loads(line) for line in archived)
+                yield from (r for r in rows if r["entity_type"] == entity_type
+                            and (entity_id is None or r["entity_id"] == entity_id))
+        elif name.endswith(".parquet") and PARQUET_AVAILABLE:
+            for r in pq.read_table(path).to_pylist():
+                if r["entity_type"] == entity_type and (entity_id is None or r["entity_id"] == entity_id):
+                    yield r
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Audit trail partitions and archives")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("partitions", help="Create upcoming monthly partitions")
+    archive = subparsers.add_parser("archive", help="Archive months older than the hot window")
+    archive.add_argument("--hot-months", type=int, default=AUDIT_HOT_MONTHS)
+    archive.add_argument("--dir", default=AUDIT_ARCHIVE_DIR)
+    archive.add_argument("--format", choices=("ndjson", "parquet"), default=AUDIT_ARCHIVE_FORMAT)
+    purge = subparsers.add_parser("purge-archives", help="Delete archives past their retention period")
+    purge.add_argument("--dir", default=AUDIT_ARCHIVE_DIR)
+    purge.add_argument("--yes", action="store_true", help="Delete (default: list only)")
+    search = subparsers.add_parser("search", help="Search archived months for an entity")
+    search.add_argument("entity_type")
+    search.add_argument("entity_id", type=int, nargs="?")
+    search.add_argument("--dir", default=AUDIT_ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "purge-archives":
+        for path in expired_archives(args.dir):
+            print(f"{'Deleting' if args.yes else 'Expired'}: {path}")
+            if args.yes:
+                os.remove(path)
+                os.remove(path + ".manifest.json")
+    elif args.command == "search":
+        for row in search_archives(args.entity_type, args.entity_id, args.dir):
+            print(json.dumps(row))
+    else:
+        session = SessionLocal()
+        try:
+            if args.command == "partitions":
+                print(f"Created partitions: {', '.join(ensure_partitions(session)) or 'none'}")
+            else:
+                for archived in archive_old_months(session, args.hot_months, args.dir, args.format):
+                    print(f"Archived {archived['month']}: {archived['rows']} rows -> {archived['path']}")
+        finally:
+            session.close()
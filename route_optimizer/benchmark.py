@@ -0,0 +1,464 @@
+"""
+Benchmark suite for the route optimizer hot paths
+Generates synthetic Joplin-area catalogs and times the solver, distance function,
+service-matching query and the end-to-end endpoint in-process against SQLite.
+
+Usage:
+    python benchmark.py                              # sizes 10, 100, 1000, 10000
+    python benchmark.py --sizes 10,100 --output bench.json
+    python benchmark.py --sizes 10 --export-nodes 2000000   # analytics export throughput
+    python benchmark.py --sizes 10 --transport-patients 300  # shared van routing
+
+Results are written as JSON (with the git revision) so runs can be compared between commits.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+
+def timed(fn: Callable, repeat: int) -> Dict[str, float]:
+    """Run fn repeat times and summarize wall time in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "min_ms": round(min(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "repeat": repeat
+    }
+
+
+def repeat_for(size: int, base: int) -> int:
+    """Fewer repetitions for large catalogs so a full run stays in minutes"""
+    return max(1, base // max(1, size // 100))
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# ==================== Synthetic Data ====================
+
+def clear_dataset(engine):
+    """Empty the catalog and route history tables"""
+    from sqlalchemy import delete
+    from models import Base, Provider, Service, ServiceCoverage, RouteNode, Route, Patient, AuditTrail
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for model in (RouteNode, Route, Patient, AuditTrail, ServiceCoverage, Service, Provider):
+            conn.execute(delete(model))
+
+
+def build_catalog(engine, size: int, seed: int = 42):
+    """Replace the catalog with `size` services (two per site) from the seed_data generator"""
+    from seed_data import generate_dataset
+
+    clear_dataset(engine)
+
+    result = generate_dataset(
+        providers=max(1, size // 2),
+        services_per_provider=2 if size > 1 else 1,
+        plans=0,
+        patients=0,
+        routes=0,
+        seed=seed,
+        bind=engine
+    )
+    return result["rows"]["providers"]
+
+
+# ==================== Benchmarks ====================
+
+def bench_haversine(calls: int = 200000) -> Dict[str, float]:
+    from route_optimizer import haversine_distance
+    from seed_data import JOPLIN_LAT, JOPLIN_LON, random_point
+
+    rng = random.Random(1)
+    pairs = [
+        random_point(rng, JOPLIN_LAT, JOPLIN_LON, 25) + random_point(rng, JOPLIN_LAT, JOPLIN_LON, 25)
+        for _ in range(calls)
+    ]
+    started = time.perf_counter()
+    for lat1, lon1, lat2, lon2 in pairs:
+        haversine_distance(lat1, lon1, lat2, lon2)
+    elapsed = time.perf_counter() - started
+    return {"calls": calls, "ns_per_call": round(elapsed / calls * 1e9, 1)}
+
+
+def tour_length(patient, points: List, order) -> float:
+    from route_optimizer import haversine_distance
+
+    total, current = 0.0, patient
+    for idx in order:
+        total += haversine_distance(current[0], current[1], points[idx][0], points[idx][1])
+        current = points[idx]
+    return total
+
+
+def bench_quality(instances: int = 30, stop_counts=(4, 5, 6, 7, 8), seed: int = 7) -> Dict[str, Dict]:
+    """
+    Greedy solver tour length vs the brute-force optimum for small routes
+    Services share price/duration so the comparison isolates travel distance
+    """
+    from types import SimpleNamespace
+    from route_optimizer import optimize_route_astar
+    from seed_data import JOPLIN_LAT, JOPLIN_LON, random_point
+
+    rng = random.Random(seed)
+    results = {}
+    for stops in stop_counts:
+        gaps = []
+        for _ in range(instances):
+            patient = random_point(rng, JOPLIN_LAT, JOPLIN_LON, 15)
+            points = [random_point(rng, JOPLIN_LAT, JOPLIN_LON, 15) for _ in range(stops)]
+            providers = [
+                SimpleNamespace(id=idx + 1, location_latitude=lat, location_longitude=lon)
+                for idx, (lat, lon) in enumerate(points)
+            ]
+            services = [
+                SimpleNamespace(id=idx + 1, provider_id=idx + 1, price=100.0, duration_minutes=30)
+                for idx in range(stops)
+            ]
+            path = optimize_route_astar(patient[0], patient[1], services, providers)
+            greedy = tour_length(patient, points, [service_id - 1 for service_id, _ in path])
+            optimum = min(tour_length(patient, points, order) for order in itertools.permutations(range(stops)))
+            gaps.append((greedy / optimum - 1) * 100 if optimum > 0 else 0.0)
+        results[str(stops)] = {
+            "instances": instances,
+            "mean_gap_pct": round(statistics.fmean(gaps), 2),
+            "max_gap_pct": round(max(gaps), 2),
+            "optimal_pct": round(sum(1 for g in gaps if g < 1e-9) / len(gaps) * 100, 1)
+        }
+    return results
+
+
+def legacy_assembly(path, services, providers, patient, coverage_pct, cost_per_mile, distance_provider):
+    """The previous two-pass assembly: linear lookups, legs computed twice, validated models"""
+    from route_optimizer import ServiceNode, calculate_travel_cost
+
+    total_distance, current = 0.0, patient
+    for service_id, provider_id in path:
+        service = next(s for s in services if s.id == service_id)
+        provider = next(p for p in providers if p.id == provider_id)
+        point = (provider.location_latitude, provider.location_longitude)
+        total_distance += distance_provider.leg(current, point)[0]
+        calculate_travel_cost(total_distance, cost_per_mile)
+        current = point
+
+    nodes, current = [], patient
+    for idx, (service_id, provider_id) in enumerate(path):
+        service = next(s for s in services if s.id == service_id)
+        provider = next(p for p in providers if p.id == provider_id)
+        point = (provider.location_latitude, provider.location_longitude)
+        distance = distance_provider.leg(current, point)[0]
+        nodes.append(ServiceNode(
+            service_name=service.name, location=provider.name,
+            price=round(service.price * (1 - coverage_pct / 100.0), 2),
+            duration=f"{service.duration_minutes} mins", covered=True, status="Pending",
+            order_index=idx, service_id=service.id, provider_id=provider.id,
+            latitude=provider.location_latitude, longitude=provider.location_longitude,
+            travel_distance_miles=round(distance, 2),
+            travel_cost=calculate_travel_cost(distance, cost_per_mile)
+        ))
+        current = point
+    return nodes
+
+
+def bench_assembly(stops_list=(10, 100, 1000, 5000), repeat: int = 20, seed: int = 3) -> Dict[str, Dict]:
+    """
+    Route assembly + response serialization for long routes
+    legacy: two passes with linear lookups, validated models, response_model re-validation, json.dumps
+    current: assemble_route (one pass over id dicts), model_construct, json_response
+    """
+    from types import SimpleNamespace
+    from distance_provider import HaversineProvider
+    from route_optimizer import RouteResponse, assemble_route, format_duration, json_response
+    from seed_data import JOPLIN_LAT, JOPLIN_LON, random_point
+
+    rng = random.Random(seed)
+    distance_provider = HaversineProvider()
+    patient = (JOPLIN_LAT, JOPLIN_LON)
+    results = {}
+    for stops in stops_list:
+        providers = [
+            SimpleNamespace(id=idx + 1, name=f"Clinic {idx + 1}",
+                            location_latitude=lat, location_longitude=lon)
+            for idx, (lat, lon) in enumerate(random_point(rng, JOPLIN_LAT, JOPLIN_LON, 25) for _ in range(stops))
+        ]
+        services = [
+            SimpleNamespace(id=idx + 1, name=f"Service {idx + 1}", provider_id=idx + 1,
+                            price=float(rng.randint(50, 500)), duration_minutes=rng.choice((15, 30, 45, 60)))
+            for idx in range(stops)
+        ]
+        path = [(s.id, s.provider_id) for s in services]
+        rng.shuffle(path)
+
+        def response_fields(nodes):
+            return dict(patient_id="P1", route_id=1, insurance_code="AET-GOLD", route=nodes,
+                        total_estimated_cost=1.0, total_service_cost=1.0, total_travel_cost=0.0,
+                        total_estimated_time=format_duration(90), total_distance_miles=1.0)
+
+        def legacy():
+            nodes = legacy_assembly(path, services, providers, patient, 80.0, 0.5, distance_provider)
+            response = RouteResponse(**response_fields(nodes))
+            # FastAPI re-validates against response_model, then encodes with the stdlib
+            validated = RouteResponse.model_validate(response.model_dump())
+            json.dumps(validated.model_dump(mode="json")).encode()
+
+        def current():
+            assembled = assemble_route(
+                path, {s.id: s for s in services}, {p.id: p for p in providers},
+                patient[0], patient[1], 80.0, 0.5, distance_provider=distance_provider
+            )
+            json_response(RouteResponse.model_construct(**response_fields(assembled["nodes"])))
+
+        runs = repeat_for(stops, repeat)
+        legacy_stats = timed(legacy, runs)
+        current_stats = timed(current, runs)
+        results[str(stops)] = {
+            "legacy": legacy_stats,
+            "single_pass": current_stats,
+            "speedup": round(legacy_stats["median_ms"] / max(current_stats["median_ms"], 1e-6), 1)
+        }
+    return results
+
+
+def bench_name_match(db, covered: List[str], runs: int) -> Dict:
+    """Free-text name matching: the ILIKE OR-chain vs the compiled automaton (cold and cached)"""
+    import service_matcher
+    from route_optimizer import load_services_ranked, query_services_ilike
+
+    def automaton():
+        ranked = service_matcher.match_service_names(db, covered)
+        return load_services_ranked(db, [service_id for service_id, _, _ in ranked])
+
+    def automaton_cold():
+        service_matcher._index = None
+        service_matcher.get_matcher.cache_clear()
+        return automaton()
+
+    return {
+        "ilike": timed(lambda: query_services_ilike(db, covered), runs),
+        "automaton_cold": timed(automaton_cold, runs),
+        "automaton": timed(automaton, runs),
+        "ilike_matches": len(query_services_ilike(db, covered)),
+        "automaton_matches": len(automaton())
+    }
+
+
+def bench_size(engine, size: int, repeat: int, e2e_max: int) -> Dict:
+    from fastapi.testclient import TestClient
+    from database import SessionLocal
+    from models import Provider
+    from route_optimizer import app, optimize_route_astar, query_covered_services, verify_insurance_eligibility
+    from seed_data import JOPLIN_LAT, JOPLIN_LON
+
+    provider_count = build_catalog(engine, size)
+    covered = verify_insurance_eligibility("AET-GOLD")["covered_services"]
+    result = {"size": size, "providers": provider_count}
+
+    db = SessionLocal()
+    try:
+        result["service_query"] = timed(
+            lambda: query_covered_services(db, covered, "AET-GOLD"), repeat_for(size, repeat)
+        )
+        result["service_query_name_match"] = timed(lambda: query_covered_services(db, covered), repeat_for(size, repeat))
+        result["service_name_match"] = bench_name_match(db, covered, repeat_for(size, repeat))
+        services = query_covered_services(db, covered, "AET-GOLD")
+        providers = db.query(Provider).filter(Provider.id.in_({s.provider_id for s in services})).all()
+        result["matched_services"] = len(services)
+        result["optimize_route_astar"] = timed(
+            lambda: optimize_route_astar(JOPLIN_LAT, JOPLIN_LON, services, providers),
+            repeat_for(size, repeat)
+        )
+    finally:
+        db.close()
+
+    if size <= e2e_max:
+        payload = {
+            "name": "Benchmark Patient",
+            "insurance_code": "AET-GOLD",
+            "location_latitude": JOPLIN_LAT,
+            "location_longitude": JOPLIN_LON
+        }
+        from route_templates import template_store
+
+        with TestClient(app) as client:
+            def call():
+                response = client.post("/api/route_optimizer", json=payload)
+                response.raise_for_status()
+            # Full solve on every call, then the same request served from its route template
+            template_store.enabled = False
+            result["end_to_end"] = timed(call, repeat_for(size, repeat))
+            template_store.enabled = True
+            call()
+            result["end_to_end_template"] = timed(call, repeat_for(size, repeat))
+    else:
+        result["end_to_end"] = {"skipped": f"size > --e2e-max ({e2e_max})"}
+    return result
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def bench_export(engine, nodes: int, seed: int = 11) -> Dict:
+    """
+    Analytics export throughput over a route history of about `nodes` route nodes
+    Peak RSS growth during each export shows whether memory stays flat as the export grows
+    """
+    from database import SessionLocal
+    from analytics_export import PARQUET_AVAILABLE, export_routes
+
+    from seed_data import generate_dataset
+
+    clear_dataset(engine)
+    # Routes average 2.5 nodes with max_nodes_per_route=4
+    generated = generate_dataset(
+        providers=200, plans=4, patients=max(1, nodes // 50), routes=max(1, int(nodes / 2.5)),
+        seed=seed, bind=engine
+    )
+    result = {"route_nodes": generated["rows"]["route_nodes"], "routes": generated["rows"]["routes"]}
+
+    for export_format in ("csv", "parquet"):
+        if export_format == "parquet" and not PARQUET_AVAILABLE:
+            result[export_format] = {"skipped": "pyarrow not installed"}
+            continue
+        db = SessionLocal()
+        try:
+            rss_before = peak_rss_mb()
+            started = time.perf_counter()
+            written = sum(len(chunk) for chunk in export_routes(db, export_format))
+            elapsed = time.perf_counter() - started
+        finally:
+            db.close()
+        result[export_format] = {
+            "seconds": round(elapsed, 2),
+            "rows_per_second": round(result["route_nodes"] / elapsed),
+            "megabytes": round(written / 1e6, 1),
+            "peak_rss_growth_mb": round(peak_rss_mb() - rss_before, 1)
+        }
+    return result
+
+
+def bench_transport(patients: int, time_limit: float, seed: int = 13) -> Dict:
+    """
+    Shared van routing for a synthetic day: patients within 15 miles of Joplin, one or two
+    daytime appointments at 15 provider sites, with return rides
+    Reports vans and miles against one dedicated trip per patient, as the time limit grows
+    """
+    from datetime import date
+
+    from seed_data import JOPLIN_LAT, JOPLIN_LON, random_point
+    from transport import plan_rides, route_rides
+
+    rng = random.Random(seed)
+    sites = [random_point(rng, JOPLIN_LAT, JOPLIN_LON, 4) for _ in range(15)]
+    rides = []
+    for patient_id in range(patients):
+        home = random_point(rng, JOPLIN_LAT, JOPLIN_LON, 15)
+        appointment = rng.randrange(8 * 4, 15 * 4) * 15  # 08:00-15:00 in 15 minute slots
+        stops = []
+        for order_idx in range(rng.choice((1, 1, 1, 2))):
+            site = rng.randrange(len(sites))
+            stops.append({"node_id": patient_id * 10 + order_idx, "provider_id": site, "point": sites[site],
+                          "appointment": appointment, "duration": 30})
+            appointment += 60 + rng.choice((0, 15, 30))
+        rides.extend(route_rides(patient_id, patient_id, home, stops))
+
+    result = {"patients": patients, "rides": len(rides)}
+    for limit in (time_limit / 10, time_limit):
+        summary = plan_rides(rides, date(2026, 1, 5), time_limit=limit)["summary"]
+        result[f"{limit:g}s"] = {
+            key: summary[key] for key in
+            ("vans", "miles", "dedicated_trip_miles", "average_occupancy", "iterations", "seconds")
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Route optimizer benchmark suite")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="Comma-separated catalog sizes (number of services)")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetitions at size 100 (scaled down for larger sizes)")
+    parser.add_argument("--e2e-max", type=int, default=10000, help="Largest size to run end-to-end")
+    parser.add_argument("--export-nodes", type=int, default=0,
+                        help="Also benchmark the analytics export over this many route nodes (0: skip)")
+    parser.add_argument("--transport-patients", type=int, default=0,
+                        help="Also benchmark shared van routing for this many patients (0: skip)")
+    parser.add_argument("--transport-seconds", type=float, default=20, help="Van routing time limit")
+    parser.add_argument("--output", help="Write JSON results to this file (default: stdout)")
+    args = parser.parse_args()
+
+    # The app binds its engine at import time, so point it at a scratch SQLite file first
+    workdir = tempfile.mkdtemp(prefix="route_bench_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("LLM_PROVIDER", "none")
+    # Identical end-to-end requests would otherwise be served from the route result cache
+    os.environ.setdefault("ROUTE_RESULT_CACHE_TTL_SECONDS", "0")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from database import engine
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": "sqlite",
+            "sizes": sizes
+        },
+        "haversine_distance": bench_haversine(),
+        "solution_quality": bench_quality(),
+        "route_assembly": bench_assembly(),
+        "sizes": []
+    }
+    for size in sizes:
+        print(f"Benchmarking size {size}...", file=sys.stderr)
+        report["sizes"].append(bench_size(engine, size, args.repeat, args.e2e_max))
+    if args.export_nodes:
+        # Runs last: it replaces the catalog with a generated route history
+        print(f"Benchmarking analytics export over {args.export_nodes} route nodes...", file=sys.stderr)
+        report["analytics_export"] = bench_export(engine, args.export_nodes)
+    if args.transport_patients:
+        print(f"Benchmarking van routing for {args.transport_patients} patients...", file=sys.stderr)
+        report["transport"] = bench_transport(args.transport_patients, args.transport_seconds)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Provider/service catalog versioning
+A cheap fingerprint of the catalog used to invalidate precomputed data
+(provider matrices, route templates)
+"""
+import hashlib
+import os
+import time
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from models import Provider, Service
+
+
+def catalog_version(db: Session) -> str:
+    """
+    Fingerprint of the active catalog
+    Changes whenever a provider or service is added, removed or updated
+    """
+    parts = []
+    for model in (Provider, Service):
+        count, max_id, last_update = db.query(
+            func.count(model.id), func.max(model.id), func.max(model.updated_at)
+        ).one()
+        parts.append(f"{model.__tablename__}:{count}:{max_id}:{last_update}")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+
+# Per-request callers can tolerate a slightly stale fingerprint
+CATALOG_VERSION_TTL_SECONDS = float(os.getenv("CATALOG_VERSION_TTL_SECONDS", "5"))
+
+_cached_version = (0.0, None)
+
+
+def current_catalog_version(db: Session, max_age: float = CATALOG_VERSION_TTL_SECONDS) -> str:
+    """catalog_version, recomputed at most every max_age seconds per process"""
+    global _cached_version
+    checked_at, version = _cached_version
+    now = time.monotonic()
+    if version is None or now - checked_at > max_age:
+        version = catalog_version(db)
+        _cached_version = (now, version)
+    return version
+
+
+def invalidate_catalog_version():
+    """Recompute the fingerprint on the next current_catalog_version call"""
+    global _cached_version
+    _cached_version = (0.0, None)
+
+
+@event.listens_for(Session, "after_flush")
+def _note_catalog_writes(session: Session, flush_context):
+    if any(isinstance(obj, (Provider, Service)) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info["catalog_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _expire_catalog_version(session: Session):
+    # Catalog edits made through this process are seen at once; other processes within the TTL
+    if session.info.pop("catalog_changed", False):
+        invalidate_catalog_version()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_catalog_writes(session: Session):
+    session.info.pop("catalog_changed", None)
@@ -0,0 +1,63 @@
+"""
+Shared pytest setup
+The app modules bind their database engine at import time, so DATABASE_URL points at a
+scratch SQLite file before any of them is imported. Each test gets freshly created tables.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+_workdir = tempfile.mkdtemp(prefix="route_optimizer_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'test.db')}"
+os.environ["DATABASE_REPLICA_URLS"] = ""
+os.environ["LLM_PROVIDER"] = "none"
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Manual smoke script against a running server, not a pytest module
+collect_ignore = ["test_api.py"]
+
+
+@pytest.fixture
+def db():
+    from database import SessionLocal, engine
+    from models import Base
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def catalog(db):
+    """Two providers with a service each, covered by the AET-GOLD mock plan; returns service ids"""
+    from models import Provider, Service
+
+    cardiology = Provider(name="Heart Clinic", specialty="Cardiology", location_latitude=37.09,
+                          location_longitude=-94.51, address="1 Main St")
+    radiology = Provider(name="Imaging Center", specialty="Radiology", location_latitude=37.10,
+                         location_longitude=-94.53, address="2 Oak Ave")
+    db.add_all([cardiology, radiology])
+    db.flush()
+    services = [
+        Service(name="Cardiology Follow-up", price=150.0, duration_minutes=30, provider_id=cardiology.id),
+        Service(name="Radiology Imaging", price=90.0, duration_minutes=20, provider_id=radiology.id),
+    ]
+    db.add_all(services)
+    db.commit()
+    return [service.id for service in services]
+
+
+@pytest.fixture
+def route(db, catalog):
+    """A persisted route (RouteResponse) over the catalog"""
+    from route_optimizer import PatientInput, create_optimized_route
+
+    patient = PatientInput(name="Ana Diaz", insurance_code="AET-GOLD", location_latitude=37.08,
+                           location_longitude=-94.51)
+    return create_optimized_route(patient, db)
@@ -0,0 +1,178 @@
+"""
+Normalized insurance coverage
+service_coverage rows say which services each plan covers, so the optimizer resolves
+"services covered by plan X" with one indexed lookup instead of ILIKE chains.
+
+Rows are derived from the plan's covered categories (InsuranceProgram.covered_services)
+with the same rule as the free-text fallback (service_matcher): a service is covered when
+one of the categories appears in its name as whole words, ignoring case and punctuation.
+
+ORM writes keep the rows current: a flush that adds, renames or re-codes a service
+recomputes that service's rows, and one that adds or changes a plan's categories
+recomputes the plan's, in the same transaction. Core bulk loads (seed_data) rebuild
+with rebuild_service_coverage.
+"""
+import json
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from sqlalchemy import delete, event, inspect, insert, select
+from sqlalchemy.orm import Session
+
+from models import InsuranceProgram, Service, ServiceCoverage
+from service_matcher import normalize
+
+BATCH_SIZE = 5000
+
+
+def _json_list(value: Optional[str]) -> Optional[List[str]]:
+    if not value:
+        return None
+    try:
+        items = json.loads(value)
+    except ValueError:
+        return None
+    return [str(item) for item in items] if isinstance(items, list) else None
+
+
+def matching_category(categories: Iterable[str], service_name: str) -> Optional[str]:
+    """The first plan category contained in the service name as whole words, or None"""
+    name = normalize(service_name or "")
+    for category in categories:
+        words = normalize(category)
+        if words.strip() and words in name:
+            return category
+    return None
+
+
+def coverage_rows(plans: Dict[str, List[str]], services: Iterable) -> Iterator[Dict]:
+    """
+    Coverage rows for (insurance_code -> categories) plans over service rows
+    Service rows need id, name and service_code
+    """
+    for service in services:
+        for insurance_code, categories in plans.items():
+            category = matching_category(categories, service.name)
+            if category:
+                yield {
+                    "insurance_code": insurance_code,
+                    "service_id": service.id,
+                    "service_code": service.service_code,
+                    "category": category
+                }
+
+
+def _write_rows(conn, rows: Iterable[Dict]) -> int:
+    written = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.execute(insert(ServiceCoverage), batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        conn.execute(insert(ServiceCoverage), batch)
+        written += len(batch)
+    return written
+
+
+def load_plans(conn) -> Dict[str, List[str]]:
+    """insurance_code -> covered categories from the InsuranceProgram JSON column"""
+    rows = conn.execute(select(InsuranceProgram.insurance_code, InsuranceProgram.covered_services))
+    return {code: _json_list(covered) or [] for code, covered in rows}
+
+
+def rebuild_service_coverage(conn, insurance_codes: Optional[List[str]] = None) -> int:
+    """Recompute coverage rows (all plans, or only the given ones); returns rows written"""
+    plans = load_plans(conn)
+    if insurance_codes is not None:
+        plans = {code: plans[code] for code in insurance_codes if code in plans}
+        conn.execute(delete(ServiceCoverage).where(ServiceCoverage.insurance_code.in_(list(insurance_codes))))
+    else:
+        conn.execute(delete(ServiceCoverage))
+    if not plans:
+        return 0
+
+    services = conn.execute(select(Service.id, Service.name, Service.service_code).order_by(Service.id))
+    return _write_rows(conn, coverage_rows(plans, services))
+
+
+def refresh_services_coverage(conn, service_ids: List[int]) -> int:
+    """Recompute the coverage rows of the given services for every plan; returns rows written"""
+    conn.execute(delete(ServiceCoverage).where(ServiceCoverage.service_id.in_(service_ids)))
+    plans = load_plans(conn)
+    if not plans:
+        return 0
+    services = conn.execute(
+        select(Service.id, Service.name, Service.service_code).where(Service.id.in_(service_ids))
+    )
+    return _write_rows(conn, coverage_rows(plans, services))
+
+
+def _changed(obj, *attributes: str) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[attribute].history.has_changes() for attribute in attributes)
+
+
+@event.listens_for(Session, "after_flush")
+def _maintain_coverage(session: Session, flush_context):
+    """Recompute the rows of services and plans this flush added or changed"""
+    service_ids: Set[int] = set()
+    plan_codes: Set[str] = set()
+    for obj in session.new:
+        if isinstance(obj, Service):
+            service_ids.add(obj.id)
+        elif isinstance(obj, InsuranceProgram):
+            plan_codes.add(obj.insurance_code)
+    for obj in session.dirty:
+        if isinstance(obj, Service) and _changed(obj, "name", "service_code"):
+            service_ids.add(obj.id)
+        elif isinstance(obj, InsuranceProgram) and _changed(obj, "insurance_code", "covered_services"):
+            plan_codes.add(obj.insurance_code)
+    for obj in session.deleted:
+        if isinstance(obj, InsuranceProgram):
+            plan_codes.add(obj.insurance_code)
+    if not service_ids and not plan_codes:
+        return
+    conn = session.connection()
+    if plan_codes:
+        rebuild_service_coverage(conn, sorted(plan_codes))
+        # Rows of a renamed or deleted plan code
+        conn.execute(delete(ServiceCoverage).where(
+            ServiceCoverage.insurance_code.not_in(select(InsuranceProgram.insurance_code))
+        ))
+    if service_ids:
+        refresh_services_coverage(conn, sorted(service_ids))
+
+
+def covered_services(db: Session, insurance_code: str) -> Optional[List[Service]]:
+    """
+    Available services covered by a plan (one indexed join)
+    Returns None when the plan has no coverage rows, so callers can fall back to name matching
+    """
+    services = db.query(Service).join(
+        ServiceCoverage, ServiceCoverage.service_id == Service.id
+    ).filter(
+        ServiceCoverage.insurance_code == insurance_code,
+        Service.is_available == True
+    ).all()
+    if services:
+        return services
+    has_rows = db.query(ServiceCoverage.id).filter(ServiceCoverage.insurance_code == insurance_code).first()
+    return [] if has_rows else None
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Rebuild normalized service coverage from the plan/service JSON columns")
+    parser.add_argument("--plan", action="append", dest="plans", help="Only rebuild this insurance code (repeatable)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        written = rebuild_service_coverage(conn, args.plans)
+    print(f"Wrote {written} coverage rows in {time.perf_counter() - started:.1f}s")
@@ -1,12 +1,29 @@
 """
 Database connection and session management
+Writes go to the primary engine. With DATABASE_REPLICA_URLS set, read-only endpoints
+(get_read_db) and catalog loads (read_session) go to a healthy replica, falling back to
+the primary.
+
+Read-your-writes: responses to writes carry a consistency token (X-Read-Consistency header
+and cookie). On PostgreSQL it is the primary's WAL LSN after the write, and a read that
+presents it only uses a replica that has replayed that far. Elsewhere it is the write time,
+and the client's reads stick to the primary for READ_YOUR_WRITES_SECONDS.
 """
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
+from typing import Iterator, List, Optional, Tuple
+from fastapi import Request
+import itertools
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
+from metrics import POOL_WAIT_SECONDS, Gauge, register, register_pool_gauges
+from tracing import instrument_engine
+
 load_dotenv()
 
 # Database URL from environment
@@ -23,20 +40,222 @@ DATABASE_URL = os.getenv(
 #     poolclass=StaticPool
 # )
 
-# PostgreSQL engine
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
-)
+# Comma-separated read replica URLs (empty: everything uses the primary)
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+# How long a read waits for a replica to replay the client's last write (PostgreSQL)
+REPLICA_LSN_WAIT_SECONDS = float(os.getenv("REPLICA_LSN_WAIT_SECONDS", "0.05"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "10"))
+REPLICA_HEALTH_INTERVAL_SECONDS = float(os.getenv("REPLICA_HEALTH_INTERVAL_SECONDS", "5"))
+
+CONSISTENCY_HEADER = "X-Read-Consistency"
+CONSISTENCY_COOKIE = "rh_read_consistency"
+
+
+def make_engine(url: str):
+    """Engine with the service's pool settings (primary and replicas), traced"""
+    db_engine = create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_size=10,
+        max_overflow=20
+    )
+    instrument_engine(db_engine)
+    return db_engine
+
+
+engine = make_engine(DATABASE_URL)
+register_pool_gauges(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
-def get_db() -> Session:
-    """Dependency for getting database session"""
+class ReplicaSet:
+    """Replica engines with health state; picks a replica for a read or falls back to the primary"""
+
+    def __init__(self, primary, replicas: List):
+        self.primary = primary
+        self.engines = replicas
+        self.healthy = [True] * len(replicas)
+        self._next = itertools.count()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def healthy_count(self) -> int:
+        return sum(self.healthy)
+
+    def candidates(self, token: Optional[str] = None) -> Tuple[List, Optional[str]]:
+        """
+        Healthy replicas to try, in order, for a read by a client presenting `token` (see
+        write_token), and the LSN a replica must have replayed; no candidates = the primary
+        """
+        if not self.engines:
+            return [], None
+        lsn = None
+        if token and token.startswith("t:"):
+            try:
+                if time.time() < float(token[2:]) + READ_YOUR_WRITES_SECONDS:
+                    return [], None
+            except ValueError:
+                pass
+        elif token and token.startswith("lsn:"):
+            lsn = token[4:]
+
+        start = next(self._next)
+        order = [(start + offset) % len(self.engines) for offset in range(len(self.engines))]
+        return [self.engines[index] for index in order if self.healthy[index]], lsn
+
+    def engine_for(self, token: Optional[str] = None):
+        """Engine a read without a replay requirement goes to"""
+        engines, _ = self.candidates(token)
+        return engines[0] if engines else self.primary
+
+    def mark_unhealthy(self, db_engine):
+        if db_engine in self.engines:
+            self.healthy[self.engines.index(db_engine)] = False
+
+    @staticmethod
+    def replayed(db: Session, lsn: str) -> bool:
+        """
+        Whether the replica behind the session has replayed up to lsn, waiting up to
+        REPLICA_LSN_WAIT_SECONDS (on the session's own connection)
+        """
+        deadline = time.monotonic() + REPLICA_LSN_WAIT_SECONDS
+        while True:
+            if db.execute(text("SELECT pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn)"), {"lsn": lsn}).scalar():
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+
+    def check(self) -> List[bool]:
+        """Probe every replica: reachable and (PostgreSQL) replaying within REPLICA_MAX_LAG_SECONDS"""
+        for index, db_engine in enumerate(self.engines):
+            try:
+                with db_engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                    lag = 0.0
+                    if db_engine.dialect.name == "postgresql":
+                        lag = conn.execute(text(
+                            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                            "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                        )).scalar() or 0.0
+                healthy = float(lag) <= REPLICA_MAX_LAG_SECONDS
+            except Exception as e:
+                print(f"Replica {index} unavailable: {e}")
+                healthy = False
+            if healthy != self.healthy[index]:
+                print(f"Replica {index} is now {'healthy' if healthy else 'unhealthy'}")
+            self.healthy[index] = healthy
+        return list(self.healthy)
+
+    def start_health_checks(self, interval: float = REPLICA_HEALTH_INTERVAL_SECONDS):
+        if not self.engines or self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                self.check()
+
+        self.check()
+        self._thread = threading.Thread(target=run, name="replica-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+replicas = ReplicaSet(engine, [make_engine(url) for url in DATABASE_REPLICA_URLS])
+register(Gauge("route_optimizer_db_replicas_healthy", "Read replicas currently used for reads",
+               lambda: replicas.healthy_count))
+
+
+def write_token(db: Optional[Session] = None) -> Optional[str]:
+    """
+    Consistency token for a client that just wrote (None without replicas)
+    Read on the request's session, so it shares the session's pool checkout
+    """
+    if not replicas.engines:
+        return None
+    if engine.dialect.name == "postgresql":
+        if db is None:
+            with engine.connect() as conn:
+                return "lsn:" + conn.execute(text("SELECT pg_current_wal_lsn()")).scalar()
+        return "lsn:" + db.execute(text("SELECT pg_current_wal_lsn()")).scalar()
+    return f"t:{time.time():.3f}"
+
+
+def get_db(request: Request) -> Session:
+    """Dependency for getting database session (kept on request.state for the write token)"""
     db = SessionLocal()
+    request.state.db = db
+    # Connections are checked out on first use (requests served from caches never take one);
+    # each checkout's pool wait is timed by the listeners below
+    db.info["time_pool_wait"] = True
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@event.listens_for(Session, "after_transaction_create")
+def _checkout_started(session: Session, transaction):
+    # A root transaction starts right before its connection is requested from the pool
+    if transaction.parent is None and session.info.get("time_pool_wait"):
+        session.info["checkout_started"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_begin")
+def _checkout_finished(session: Session, transaction, connection):
+    started = session.info.pop("checkout_started", None)
+    if started is not None:
+        POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+
+def _read_session(token: Optional[str]) -> Session:
+    """
+    Session on the engine chosen for a read, with a connection already checked out
+    A replica's replay position is checked on that same connection; one that has not caught
+    up is released before the next is tried, falling back to the primary.
+    """
+    engines, lsn = replicas.candidates(token)
+    for db_engine in engines:
+        db = SessionLocal(bind=db_engine)
+        try:
+            db.connection()
+            if lsn is None or replicas.replayed(db, lsn):
+                return db
+        except Exception as e:
+            # Replica went away between health checks: try the next one
+            print(f"Replica read failed: {e}")
+            replicas.mark_unhealthy(db_engine)
+        db.close()
+    return SessionLocal()
+
+
+def get_read_db(request: Request) -> Session:
+    """Dependency for read-only endpoints: a replica session honouring the client's consistency token"""
+    token = request.headers.get(CONSISTENCY_HEADER) or request.cookies.get(CONSISTENCY_COOKIE)
+    started = time.perf_counter()
+    db = _read_session(token)
+    POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@contextmanager
+def read_session(fallback: Optional[Session] = None) -> Iterator[Session]:
+    """
+    Session for catalog loads (no read-your-writes requirement)
+    Yields `fallback` instead when the read would go to the primary anyway
+    """
+    if fallback is not None and replicas.engine_for() is engine:
+        yield fallback
+        return
+    db = _read_session(None)
     try:
         yield db
     finally:
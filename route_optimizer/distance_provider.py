@@ -0,0 +1,158 @@
+"""
+Pluggable distance providers for route optimization
+Straight-line (haversine) by default, or an offline road network for real drive times
+
+Select with DISTANCE_PROVIDER=haversine|road; the road provider reads ROAD_GRAPH_PATH.
+Set PROVIDER_MATRIX_DIR to share a precomputed provider matrix across workers (provider_matrix.py).
+"""
+import abc
+import math
+import os
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from geo import haversine_distance
+
+# Average door-to-door driving speed used when only straight-line distance is known
+AVERAGE_SPEED_MPH = float(os.getenv("AVERAGE_SPEED_MPH", "30"))
+
+Point = Tuple[float, float]
+
+
+class TravelMatrix(abc.ABC):
+    """Travel legs between origins (rows) and destinations (columns)"""
+
+    @abc.abstractmethod
+    def leg(self, i: int, j: int) -> Tuple[float, float]:
+        """Return (miles, minutes) from origin i to destination j"""
+        raise NotImplementedError
+
+
+class DenseTravelMatrix(TravelMatrix):
+    """Precomputed matrix (e.g. from a many-to-many road query)"""
+
+    def __init__(self, miles: List[List[float]], minutes: List[List[float]]):
+        self.miles = miles
+        self.minutes = minutes
+
+    def leg(self, i: int, j: int) -> Tuple[float, float]:
+        return self.miles[i][j], self.minutes[i][j]
+
+
+class HaversineTravelMatrix(TravelMatrix):
+    """Straight-line matrix computed on demand (no O(n^2) precomputation)"""
+
+    def __init__(self, origins: Sequence[Point], destinations: Sequence[Point]):
+        self.origins = origins
+        self.destinations = destinations
+
+    def leg(self, i: int, j: int) -> Tuple[float, float]:
+        (lat1, lon1), (lat2, lon2) = self.origins[i], self.destinations[j]
+        miles = haversine_distance(lat1, lon1, lat2, lon2)
+        return miles, miles / AVERAGE_SPEED_MPH * 60
+
+
+class DistanceProvider(abc.ABC):
+    """Interface for travel distance and time between coordinates"""
+    name = "base"
+
+    def leg(self, origin: Point, destination: Point) -> Tuple[float, float]:
+        """Return (miles, minutes) between two coordinates"""
+        return self.matrix([origin], [destination]).leg(0, 0)
+
+    def path_legs(self, points: Sequence[Point]) -> List[Tuple[float, float]]:
+        """(miles, minutes) of each consecutive leg along points, from a single matrix query"""
+        if len(points) < 2:
+            return []
+        matrix = self.matrix(points[:-1], points[1:])
+        return [matrix.leg(k, k) for k in range(len(points) - 1)]
+
+    @abc.abstractmethod
+    def matrix(self, origins: Sequence[Point], destinations: Sequence[Point]) -> TravelMatrix:
+        """Return the origins x destinations travel matrix"""
+        raise NotImplementedError
+
+    def matrix_rows(self, origins: Sequence[Point], destinations: Sequence[Point]) -> Iterator[Tuple[List[float], List[float]]]:
+        """(miles, minutes) lists of one origin's row at a time, for matrices too large to hold"""
+        for origin in origins:
+            matrix = self.matrix([origin], destinations)
+            legs = [matrix.leg(0, j) for j in range(len(destinations))]
+            yield [miles for miles, _ in legs], [minutes for _, minutes in legs]
+
+    def provider_matrix(self, origin: Point, providers: Sequence) -> TravelMatrix:
+        """
+        Square matrix over the patient and candidate providers used by the solver
+        Index 0 is the origin, index k + 1 is providers[k]
+        """
+        points = [origin] + [(p.location_latitude, p.location_longitude) for p in providers]
+        return self.matrix(points, points)
+
+
+class HaversineProvider(DistanceProvider):
+    """Straight-line distance with a constant average speed"""
+    name = "haversine"
+
+    def leg(self, origin: Point, destination: Point) -> Tuple[float, float]:
+        miles = haversine_distance(origin[0], origin[1], destination[0], destination[1])
+        return miles, miles / AVERAGE_SPEED_MPH * 60
+
+    def matrix(self, origins: Sequence[Point], destinations: Sequence[Point]) -> TravelMatrix:
+        return HaversineTravelMatrix(list(origins), list(destinations))
+
+
+class RoadNetworkProvider(DistanceProvider):
+    """Drive distance and time from the offline road graph (contraction hierarchies)"""
+    name = "road"
+
+    def __init__(self, graph_path: str):
+        from road_network import RoadGraph
+        self.graph = RoadGraph.load(graph_path)
+        self.fallback = HaversineProvider()
+
+    def matrix(self, origins: Sequence[Point], destinations: Sequence[Point]) -> TravelMatrix:
+        miles, minutes = self.graph.travel_matrix(origins, destinations)
+        # Disconnected pairs (e.g. a point snapped onto an isolated road) fall back to straight line
+        for i, origin in enumerate(origins):
+            for j, destination in enumerate(destinations):
+                if math.isinf(miles[i][j]):
+                    miles[i][j], minutes[i][j] = self.fallback.leg(origin, destination)
+        return DenseTravelMatrix(miles, minutes)
+
+    def matrix_rows(self, origins: Sequence[Point], destinations: Sequence[Point]) -> Iterator[Tuple[List[float], List[float]]]:
+        # One bucket pass over the destinations, then one upward search per origin row
+        for origin, (miles, minutes) in zip(origins, self.graph.travel_matrix_rows(origins, destinations)):
+            for j, destination in enumerate(destinations):
+                if math.isinf(miles[j]):
+                    miles[j], minutes[j] = self.fallback.leg(origin, destination)
+            yield miles, minutes
+
+
+_distance_provider: Optional[DistanceProvider] = None
+
+
+def get_distance_provider() -> DistanceProvider:
+    """Return the configured distance provider (loaded once per process)"""
+    global _distance_provider
+    if _distance_provider is None:
+        provider_name = os.getenv("DISTANCE_PROVIDER", "haversine").lower()
+        graph_path = os.getenv("ROAD_GRAPH_PATH")
+        if provider_name == "road" and graph_path:
+            try:
+                _distance_provider = RoadNetworkProvider(graph_path)
+            except (OSError, ValueError) as e:
+                print(f"Road network unavailable ({e}) - falling back to straight-line distances")
+                _distance_provider = HaversineProvider()
+        else:
+            _distance_provider = HaversineProvider()
+
+        # Serve provider-to-provider legs from the shared memory-mapped matrix when configured
+        matrix_dir = os.getenv("PROVIDER_MATRIX_DIR")
+        if matrix_dir:
+            from provider_matrix import MatrixBackedProvider, ProviderMatrixStore
+            _distance_provider = MatrixBackedProvider(_distance_provider, ProviderMatrixStore(matrix_dir))
+    return _distance_provider
+
+
+def set_distance_provider(provider: DistanceProvider):
+    """Replace the process-wide distance provider (startup hooks, benchmarks)"""
+    global _distance_provider
+    _distance_provider = provider
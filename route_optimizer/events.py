@@ -0,0 +1,184 @@
+"""
+Route status push (pub/sub)
+Status changes are published as small deltas and fanned out to WebSocket / SSE subscribers of
+the route, so dashboards stop polling GET /api/routes/{id}.
+
+- In-process: RouteEventHub keeps one bounded queue per subscriber on the worker's event loop.
+  A subscriber that falls EVENT_QUEUE_SIZE events behind has its backlog dropped and gets a
+  single "resync" event (refetch the route once) instead of growing memory without bound.
+- Across workers: on PostgreSQL, events go through NOTIFY route_events, and each worker runs a
+  LISTEN thread that feeds its hub. On other databases (SQLite in tests and development),
+  events are dispatched to the local hub directly, as an in-memory stand-in.
+"""
+import asyncio
+import json
+import os
+import select
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from metrics import Gauge, register
+
+EVENT_CHANNEL = "route_events"
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+
+
+class Subscription:
+    """One client's view of a route's events"""
+
+    def __init__(self, route_id: int, max_queued: int = EVENT_QUEUE_SIZE):
+        self.route_id = route_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+        self.dropped = 0
+
+    def offer(self, event: Dict[str, Any]):
+        """Queue an event; a full queue is replaced by one resync marker"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait({"type": "resync", "route_id": self.route_id, "dropped": self.dropped})
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Next event, or None after timeout seconds without one"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class RouteEventHub:
+    """Per-worker fan-out of route events to subscriptions (event-loop owned)"""
+
+    def __init__(self):
+        self._subscriptions: Dict[int, Set[Subscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subs) for subs in self._subscriptions.values())
+
+    def subscribe(self, route_id: int) -> Subscription:
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(route_id)
+        self._subscriptions.setdefault(route_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subs = self._subscriptions.get(subscription.route_id)
+        if subs is not None:
+            subs.discard(subscription)
+            if not subs:
+                del self._subscriptions[subscription.route_id]
+
+    def dispatch(self, event: Dict[str, Any]):
+        """Deliver an event to the route's subscribers (safe to call from any thread)"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._fan_out(event)
+        else:
+            loop.call_soon_threadsafe(self._fan_out, event)
+
+    def _fan_out(self, event: Dict[str, Any]):
+        for subscription in list(self._subscriptions.get(event.get("route_id"), ())):
+            subscription.offer(event)
+
+
+hub = RouteEventHub()
+register(Gauge("route_optimizer_event_subscribers", "Open route event subscriptions", lambda: hub.subscriber_count))
+
+
+def publish_route_event(db: Session, event: Dict[str, Any]):
+    """
+    Publish a route/node status delta
+    Call after the change is committed. On PostgreSQL this sends NOTIFY, which reaches every
+    worker's listener (including this one); elsewhere it goes straight to the local hub.
+    """
+    publish_route_events(db, [event])
+
+
+def publish_route_events(db: Session, events: List[Dict[str, Any]]):
+    """Publish several deltas with one round trip (see publish_route_event)"""
+    if not events:
+        return
+    now = time.time()
+    events = [{**event, "ts": now} for event in events]
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), [
+            {"channel": EVENT_CHANNEL, "payload": json.dumps(event, default=str)} for event in events
+        ])
+        db.commit()
+    else:
+        for event in events:
+            hub.dispatch(event)
+
+
+# ==================== PostgreSQL LISTEN ====================
+
+class PostgresListener(threading.Thread):
+    """Background thread: LISTEN on a dedicated connection and feed the local hub"""
+
+    def __init__(self, engine, event_hub: RouteEventHub = hub, channel: str = EVENT_CHANNEL):
+        super().__init__(name="route-events-listener", daemon=True)
+        self.engine = engine
+        self.hub = event_hub
+        self.channel = channel
+        self._stopping = threading.Event()
+
+    def run(self):
+        backoff = 1.0
+        while not self._stopping.is_set():
+            try:
+                self._listen()
+                backoff = 1.0
+            except Exception as e:
+                print(f"Route event listener error: {e}; reconnecting in {backoff:.0f}s")
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def _listen(self):
+        # Detached from the pool: a LISTEN connection is held for the life of the worker
+        connection = self.engine.raw_connection()
+        connection.detach()
+        dbapi = connection.dbapi_connection
+        try:
+            dbapi.autocommit = True
+            with dbapi.cursor() as cursor:
+                cursor.execute(f"LISTEN {self.channel}")
+            while not self._stopping.is_set():
+                if select.select([dbapi], [], [], 5.0) == ([], [], []):
+                    continue
+                dbapi.poll()
+                while dbapi.notifies:
+                    notify = dbapi.notifies.pop(0)
+                    try:
+                        self.hub.dispatch(json.loads(notify.payload))
+                    except ValueError:
+                        pass
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._stopping.set()
+
+
+def start_listener(engine) -> Optional[PostgresListener]:
+    """Start the LISTEN thread when the database supports it"""
+    if engine.dialect.name != "postgresql":
+        return None
+    listener = PostgresListener(engine)
+    listener.start()
+    return listener
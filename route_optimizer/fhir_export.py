@@ -0,0 +1,320 @@
+"""
+FHIR Bulk Data $export of routes
+Each Route becomes a CarePlan, and each RouteNode a ServiceRequest based on that
+CarePlan. They are written as gzip-compressed NDJSON files, one per resource type.
+
+Routes are read in keyset-paginated chunks (WHERE id > :last ORDER BY id LIMIT n) with
+their nodes, services, providers and patients in one query per chunk. A writer thread
+per resource type serializes and compresses its resources, fed through a bounded queue,
+so the file types are compressed in parallel with each other and with the next chunk's
+query. Memory is bounded by a few chunks.
+
+_since exports only routes updated at or after that instant. Node status changes bump
+the route's version and updated_at, so an incremental export picks them up. The
+manifest's transactionTime is the `_since` for the next incremental export. It is read
+from the database clock, like updated_at, and set FHIR_EXPORT_SINCE_MARGIN_SECONDS back:
+updated_at is the writer's transaction start (now() on PostgreSQL), so a transaction that
+began before the export but commits after it has an updated_at before the export's own
+clock. Routes changed in that margin are exported again next time; consumers replace
+resources by id, so the overlap is harmless. A writer transaction open longer than the
+margin (or a replica lagging further behind) can still be missed.
+
+    python fhir_export.py ./export --since 2026-10-01T00:00:00
+"""
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models import Patient, Provider, Route, RouteNode, Service, StatusEnum
+
+FHIR_EXPORT_DIR = os.getenv("FHIR_EXPORT_DIR", "./fhir_export")
+FHIR_EXPORT_CHUNK_SIZE = int(os.getenv("FHIR_EXPORT_CHUNK_SIZE", "2000"))  # Routes per query
+FHIR_EXPORT_COMPRESSLEVEL = int(os.getenv("FHIR_EXPORT_COMPRESSLEVEL", "6"))
+# How far the manifest's transactionTime is set before the database clock (see above)
+FHIR_EXPORT_SINCE_MARGIN_SECONDS = float(os.getenv("FHIR_EXPORT_SINCE_MARGIN_SECONDS", "300"))
+
+EXPORT_TYPES = ("CarePlan", "ServiceRequest")
+IDENTIFIER_SYSTEM = "http://referharmony.org/fhir/identifier"
+COST_EXTENSION_URL = "http://referharmony.org/fhir/StructureDefinition/route-estimated-cost"
+DISTANCE_EXTENSION_URL = "http://referharmony.org/fhir/StructureDefinition/route-distance-miles"
+CPT_SYSTEM = "http://www.ama-assn.org/go/cpt"
+
+SERVICE_REQUEST_STATUS = {
+    StatusEnum.PENDING: "active",
+    StatusEnum.SCHEDULED: "active",
+    StatusEnum.IN_PROGRESS: "active",
+    StatusEnum.COMPLETED: "completed",
+    StatusEnum.CANCELLED: "revoked",
+    StatusEnum.SKIPPED: "revoked",
+}
+
+
+def _instant(moment: Optional[datetime]) -> Optional[str]:
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ") if moment else None
+
+
+def patient_reference(patient_id: int, fhir_id: Optional[str]) -> Dict[str, Any]:
+    if fhir_id:
+        return {"reference": f"Patient/{fhir_id}"}
+    return {"identifier": {"system": f"{IDENTIFIER_SYSTEM}/patient", "value": str(patient_id)}}
+
+
+def care_plan_status(route_status: str, node_statuses: List[StatusEnum]) -> str:
+    """completed once every node is done (completed or skipped), revoked if all cancelled"""
+    if node_statuses and all(s == StatusEnum.CANCELLED for s in node_statuses):
+        return "revoked"
+    if node_statuses and all(s in (StatusEnum.COMPLETED, StatusEnum.SKIPPED, StatusEnum.CANCELLED)
+                             for s in node_statuses):
+        return "completed"
+    return "completed" if route_status == "Completed" else "active"
+
+
+def care_plan(route, nodes: List) -> Dict[str, Any]:
+    """CarePlan for a route row; activities reference the nodes' ServiceRequests in order"""
+    resource = {
+        "resourceType": "CarePlan",
+        "id": f"route-{route.id}",
+        "meta": {"versionId": str(route.version), "lastUpdated": _instant(route.updated_at or route.created_at)},
+        "identifier": [{"system": f"{IDENTIFIER_SYSTEM}/route", "value": str(route.id)}],
+        "status": care_plan_status(route.status, [node.status for node in nodes]),
+        "intent": "plan",
+        "title": "Referral care route",
+        "subject": patient_reference(route.patient_id, route.patient_fhir_id),
+        "created": _instant(route.created_at),
+        "extension": [
+            {"url": COST_EXTENSION_URL, "valueMoney": {"value": round(route.total_cost, 2), "currency": "USD"}}
+        ],
+        "activity": [
+            {"reference": {"reference": f"ServiceRequest/routenode-{node.node_id}"}} for node in nodes
+        ]
+    }
+    if route.total_distance_miles is not None:
+        resource["extension"].append({"url": DISTANCE_EXTENSION_URL, "valueDecimal": round(route.total_distance_miles, 2)})
+    return resource
+
+
+def service_request(route, node) -> Dict[str, Any]:
+    """ServiceRequest for a route node: the service at its provider, based on the route's CarePlan"""
+    coding = {"display": node.service_name}
+    if node.service_code:
+        coding = {"system": CPT_SYSTEM, "code": node.service_code, "display": node.service_name}
+    performer = {"display": node.provider_name}
+    if node.provider_fhir_id:
+        performer["reference"] = node.provider_fhir_id
+    elif node.npi:
+        performer["identifier"] = {"system": "http://hl7.org/fhir/sid/us-npi", "value": node.npi}
+    resource = {
+        "resourceType": "ServiceRequest",
+        "id": f"routenode-{node.node_id}",
+        "meta": {"versionId": str(node.version), "lastUpdated": _instant(node.updated_at or node.created_at)},
+        "identifier": [{"system": f"{IDENTIFIER_SYSTEM}/route-node", "value": str(node.node_id)}],
+        "basedOn": [{"reference": f"CarePlan/route-{route.id}"}],
+        "status": SERVICE_REQUEST_STATUS.get(node.status, "unknown"),
+        "intent": "order",
+        "code": {"coding": [coding], "text": node.service_name},
+        "subject": patient_reference(route.patient_id, route.patient_fhir_id),
+        "authoredOn": _instant(node.created_at),
+        "performer": [performer]
+    }
+    if node.estimated_arrival_time:
+        resource["occurrenceDateTime"] = _instant(node.estimated_arrival_time)
+    if node.provider_fhir_id and node.provider_fhir_id.startswith("Location/"):
+        resource["locationReference"] = [{"reference": node.provider_fhir_id}]
+    if node.notes:
+        resource["note"] = [{"text": node.notes}]
+    return resource
+
+
+# ==================== Reading ====================
+
+def export_transaction_time(db: Session) -> datetime:
+    """
+    transactionTime of an export starting now: the database clock, the one updated_at is
+    written with, less FHIR_EXPORT_SINCE_MARGIN_SECONDS (naive UTC)
+    """
+    moment = db.execute(select(func.now())).scalar()
+    if moment.tzinfo is not None:
+        moment = (moment - moment.utcoffset()).replace(tzinfo=None)
+    return moment - timedelta(seconds=FHIR_EXPORT_SINCE_MARGIN_SECONDS)
+
+
+def route_chunks(
+    db: Session,
+    since: Optional[datetime] = None,
+    chunk_size: int = FHIR_EXPORT_CHUNK_SIZE
+) -> Iterator[List[Tuple[Any, List[Any]]]]:
+    """(route row, node rows in order) lists, keyset-paginated by route id"""
+    last_id = 0
+    while True:
+        query = (
+            select(Route.id, Route.patient_id, Route.status, Route.total_cost, Route.total_distance_miles,
+                   Route.version, Route.created_at, Route.updated_at, Patient.fhir_id.label("patient_fhir_id"))
+            .join(Patient, Patient.id == Route.patient_id)
+            .where(Route.id > last_id)
+            .order_by(Route.id)
+            .limit(chunk_size)
+        )
+        if since is not None:
+            query = query.where(Route.updated_at >= since)
+        routes = db.execute(query).all()
+        if not routes:
+            return
+        nodes: Dict[int, List[Any]] = {route.id: [] for route in routes}
+        for node in db.execute(
+            select(RouteNode.route_id, RouteNode.id.label("node_id"), RouteNode.status, RouteNode.version,
+                   RouteNode.estimated_arrival_time, RouteNode.notes, RouteNode.created_at, RouteNode.updated_at,
+                   Service.name.label("service_name"), Service.service_code,
+                   Provider.name.label("provider_name"), Provider.fhir_id.label("provider_fhir_id"), Provider.npi)
+            .join(Service, Service.id == RouteNode.service_id)
+            .join(Provider, Provider.id == Service.provider_id)
+            .where(RouteNode.route_id.in_(list(nodes)))
+            .order_by(RouteNode.route_id, RouteNode.order_index)
+        ):
+            nodes[node.route_id].append(node)
+        yield [(route, nodes[route.id]) for route in routes]
+        last_id = routes[-1].id
+        # The chunk's reads are done; don't hold a connection while the writers catch up
+        db.commit()
+
+
+# ==================== Writing ====================
+
+class NdjsonWriter(threading.Thread):
+    """Serializes and gzips one resource type from a bounded queue of resource lists"""
+
+    def __init__(self, path: str, max_pending: int = 4):
+        super().__init__(name=f"fhir-export-{os.path.basename(path)}", daemon=True)
+        self.path = path
+        self.pending: "queue.Queue[Optional[List[Dict[str, Any]]]]" = queue.Queue(max_pending)
+        self.count = 0
+        self.error: Optional[BaseException] = None
+
+    def run(self):
+        try:
+            with open(self.path, "wb") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=FHIR_EXPORT_COMPRESSLEVEL) as out:
+                    while True:
+                        resources = self.pending.get()
+                        if resources is None:
+                            break
+                        out.write(b"".join(
+                            json.dumps(r, separators=(",", ":")).encode() + b"\n" for r in resources
+                        ))
+                        self.count += len(resources)
+                raw.flush()
+                os.fsync(raw.fileno())
+        except BaseException as e:
+            self.error = e
+            # Keep draining so the producer never blocks on a dead writer
+            while self.pending.get() is not None:
+                pass
+
+    def put(self, resources: List[Dict[str, Any]]):
+        if self.error is None:
+            self.pending.put(resources)
+
+    def finish(self):
+        self.pending.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+
+def export_routes(
+    db: Session,
+    output_dir: str,
+    since: Optional[datetime] = None,
+    types: Tuple[str, ...] = EXPORT_TYPES,
+    chunk_size: int = FHIR_EXPORT_CHUNK_SIZE,
+    progress: Optional[Callable[[int], None]] = None
+) -> Dict[str, Any]:
+    """
+    Write <type>.ndjson.gz files for the requested types into output_dir; returns the
+    Bulk Data manifest (output urls are file names relative to output_dir)
+    """
+    unknown = set(types) - set(EXPORT_TYPES)
+    if unknown:
+        raise ValueError(f"Unsupported _type: {', '.join(sorted(unknown))} (supported: {', '.join(EXPORT_TYPES)})")
+    # Before the first chunk is read: everything the export may miss is after this instant
+    transaction_time = export_transaction_time(db)
+    started = time.perf_counter()
+    # Written under a temporary name; a re-run (at-least-once jobs) replaces the whole output
+    partial_dir = output_dir.rstrip("/") + ".partial"
+    shutil.rmtree(partial_dir, ignore_errors=True)
+    os.makedirs(partial_dir)
+    writers = {t: NdjsonWriter(os.path.join(partial_dir, f"{t}.ndjson.gz")) for t in types}
+    for writer in writers.values():
+        writer.start()
+
+    routes_read = 0
+    try:
+        for chunk in route_chunks(db, since, chunk_size):
+            if "CarePlan" in writers:
+                writers["CarePlan"].put([care_plan(route, nodes) for route, nodes in chunk])
+            if "ServiceRequest" in writers:
+                writers["ServiceRequest"].put([service_request(route, node) for route, nodes in chunk for node in nodes])
+            routes_read += len(chunk)
+            if progress:
+                progress(routes_read)
+    finally:
+        for writer in writers.values():
+            writer.finish()
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(partial_dir, output_dir)
+    elapsed = time.perf_counter() - started
+    return {
+        "transactionTime": _instant(transaction_time),
+        "requiresAccessToken": False,
+        "output": [
+            {"type": t, "url": f"{t}.ndjson.gz", "count": writer.count} for t, writer in writers.items()
+        ],
+        "error": [],
+        "routes": routes_read,
+        "seconds": round(elapsed, 2)
+    }
+
+
+def export_dir(job_id: int) -> str:
+    """Output directory of the fhir_export job"""
+    return os.path.join(FHIR_EXPORT_DIR, f"job-{job_id}")
+
+
+def parse_since(value: Optional[str]) -> Optional[datetime]:
+    """_since as a naive UTC datetime (FHIR instants carry a Z or offset)"""
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if moment.tzinfo is not None:
+        moment = (moment - moment.utcoffset()).replace(tzinfo=None)
+    return moment
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import read_session
+
+    parser = argparse.ArgumentParser(description="FHIR bulk export of routes (CarePlan/ServiceRequest NDJSON)")
+    parser.add_argument("output_dir")
+    parser.add_argument("--since", help="Only routes updated at or after this instant (ISO 8601)")
+    parser.add_argument("--type", default=",".join(EXPORT_TYPES), help="Comma-separated resource types")
+    parser.add_argument("--chunk-size", type=int, default=FHIR_EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    with read_session() as session:
+        manifest = export_routes(
+            session, args.output_dir, parse_since(args.since),
+            tuple(t.strip() for t in args.type.split(",") if t.strip()), args.chunk_size,
+            progress=lambda routes: print(f"{routes} routes exported", flush=True)
+        )
+    print(json.dumps(manifest, indent=2))
@@ -0,0 +1,441 @@
+"""
+FHIR Bulk Data $import of patients and providers
+Streams NDJSON files (optionally .gz) of FHIR R4 resources and upserts them in batches:
+
+- Patient -> patients (keyed by fhir_id)
+- Organization, Practitioner, Location -> providers (keyed by fhir_id "<type>/<id>")
+
+Files are read line by line and written every FHIR_IMPORT_BATCH_SIZE resources, so memory
+does not grow with the file. Only the names/NPIs/specialties of imported Organizations are
+kept, to fill in the Locations they manage. On PostgreSQL each batch is COPY'd into a
+temporary staging table and merged with INSERT ... SELECT ... ON CONFLICT; other databases
+use a multi-row INSERT ... ON CONFLICT. Each batch commits, and re-running an import
+updates the same rows.
+
+Coordinates come from Location.position, or from the standard geolocation extension on
+the first address of a Patient, Organization or Practitioner. The patient's plan comes
+from the FHIR_INSURANCE_EXTENSION_URL extension (or FHIR_IMPORT_DEFAULT_INSURANCE_CODE).
+Resources missing either are skipped and counted.
+
+    python fhir_import.py Organization.ndjson Location.ndjson Patient.ndjson.gz
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from sqlalchemy import String, func, insert, text
+from sqlalchemy.orm import Session
+
+from geo import patient_location_cell
+from models import Patient, Provider
+
+FHIR_IMPORT_BATCH_SIZE = int(os.getenv("FHIR_IMPORT_BATCH_SIZE", "5000"))
+# Directory the $import endpoint may read from (inputs are local files)
+FHIR_IMPORT_DIR = os.getenv("FHIR_IMPORT_DIR", "./fhir_import")
+FHIR_INSURANCE_EXTENSION_URL = os.getenv(
+    "FHIR_INSURANCE_EXTENSION_URL", "http://referharmony.org/fhir/StructureDefinition/insurance-code"
+)
+FHIR_IMPORT_DEFAULT_INSURANCE_CODE = os.getenv("FHIR_IMPORT_DEFAULT_INSURANCE_CODE") or None
+FHIR_IMPORT_DEFAULT_SPECIALTY = os.getenv("FHIR_IMPORT_DEFAULT_SPECIALTY", "General Practice")
+
+GEOLOCATION_URL = "http://hl7.org/fhir/StructureDefinition/geolocation"
+NPI_SYSTEM = "http://hl7.org/fhir/sid/us-npi"
+
+# Organizations first, so Locations can take their managing organization's details
+RESOURCE_TYPES = ("Organization", "Practitioner", "Location", "Patient")
+
+PATIENT_COLUMNS = ("fhir_id", "name", "insurance_code", "location_latitude", "location_longitude",
+                   "location_cell", "address", "phone", "email", "date_of_birth")
+PROVIDER_COLUMNS = ("fhir_id", "name", "specialty", "location_latitude", "location_longitude",
+                    "address", "phone", "email", "npi", "is_active")
+
+
+class SkipResource(Exception):
+    """A resource that cannot be mapped (missing coordinates, plan, ...)"""
+
+
+# ==================== Reading ====================
+
+def input_path(url: str, base_dir: Optional[str] = None) -> str:
+    """
+    Local path of an input url (file:// url or path)
+    With base_dir, the path must resolve inside it (the API only reads FHIR_IMPORT_DIR)
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("", "file"):
+        raise ValueError(f"Only local files can be imported, got {url}")
+    path = parsed.path if parsed.scheme == "file" else url
+    if base_dir is not None:
+        root = os.path.realpath(base_dir)
+        path = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError(f"{url} is outside the import directory")
+    return path
+
+
+def read_ndjson(path: str) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+    """(line number, resource) per non-blank line; resource is None for a line that is not JSON"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as lines:
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError:
+                yield line_number, None
+
+
+# ==================== Mapping ====================
+
+def _human_name(names: Optional[List[Dict[str, Any]]]) -> Optional[str]:
+    if not names:
+        return None
+    name = next((n for n in names if n.get("use") == "official"), names[0])
+    if name.get("text"):
+        return name["text"]
+    parts = list(name.get("given") or []) + ([name["family"]] if name.get("family") else [])
+    return " ".join(parts) or None
+
+
+def _telecom(resource: Dict[str, Any], system: str) -> Optional[str]:
+    for contact in resource.get("telecom") or []:
+        if contact.get("system") == system and contact.get("value"):
+            return contact["value"]
+    return None
+
+
+def _address_text(address: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not address:
+        return None
+    if address.get("text"):
+        return address["text"]
+    parts = list(address.get("line") or [])
+    locality = " ".join(p for p in (address.get("state"), address.get("postalCode")) if p)
+    parts += [p for p in (address.get("city"), locality) if p]
+    return ", ".join(parts) or None
+
+
+def _geolocation(address: Optional[Dict[str, Any]]) -> Optional[Tuple[float, float]]:
+    for extension in (address or {}).get("extension") or []:
+        if extension.get("url") == GEOLOCATION_URL:
+            values = {e.get("url"): e.get("valueDecimal") for e in extension.get("extension") or []}
+            if values.get("latitude") is not None and values.get("longitude") is not None:
+                return float(values["latitude"]), float(values["longitude"])
+    return None
+
+
+def _first_address(resource: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    addresses = resource.get("address")
+    if isinstance(addresses, dict):  # Location.address is a single Address
+        return addresses
+    return addresses[0] if addresses else None
+
+
+def _npi(resource: Dict[str, Any]) -> Optional[str]:
+    for identifier in resource.get("identifier") or []:
+        if identifier.get("system") == NPI_SYSTEM and identifier.get("value"):
+            return identifier["value"]
+    return None
+
+
+def _concept_text(concepts) -> Optional[str]:
+    for concept in concepts or []:
+        if concept.get("text"):
+            return concept["text"]
+        for coding in concept.get("coding") or []:
+            if coding.get("display"):
+                return coding["display"]
+    return None
+
+
+def map_patient(resource: Dict[str, Any]) -> Dict[str, Any]:
+    """patients row for a FHIR Patient"""
+    address = _first_address(resource)
+    point = _geolocation(address)
+    if point is None:
+        raise SkipResource("no geolocation on the address")
+    insurance_code = next(
+        (e.get("valueString") or e.get("valueCode") for e in resource.get("extension") or []
+         if e.get("url") == FHIR_INSURANCE_EXTENSION_URL),
+        None
+    ) or FHIR_IMPORT_DEFAULT_INSURANCE_CODE
+    if not insurance_code:
+        raise SkipResource("no insurance code")
+    birth_date = resource.get("birthDate")
+    return {
+        "fhir_id": resource["id"],
+        "name": _human_name(resource.get("name")) or f"Patient {resource['id']}",
+        "insurance_code": insurance_code,
+        "location_latitude": point[0],
+        "location_longitude": point[1],
+        "location_cell": patient_location_cell(point[0], point[1]),
+        "address": _address_text(address),
+        "phone": _telecom(resource, "phone"),
+        "email": _telecom(resource, "email"),
+        "date_of_birth": datetime.strptime(birth_date[:10], "%Y-%m-%d") if birth_date and len(birth_date) >= 10 else None
+    }
+
+
+def map_provider(resource: Dict[str, Any], organizations: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """providers row for a FHIR Organization, Practitioner or Location"""
+    resource_type = resource["resourceType"]
+    address = _first_address(resource)
+    organization = {}
+    if resource_type == "Location":
+        position = resource.get("position") or {}
+        point = (position.get("latitude"), position.get("longitude"))
+        point = (float(point[0]), float(point[1])) if None not in point else _geolocation(address)
+        reference = (resource.get("managingOrganization") or {}).get("reference", "")
+        organization = organizations.get(reference, {})
+        name = resource.get("name") or organization.get("name")
+        specialty = _concept_text(resource.get("type"))
+    elif resource_type == "Practitioner":
+        point = _geolocation(address)
+        name = _human_name(resource.get("name"))
+        specialty = _concept_text([q.get("code") for q in resource.get("qualification") or [] if q.get("code")])
+    else:
+        point = _geolocation(address)
+        name = resource.get("name")
+        specialty = _concept_text(resource.get("type"))
+    if point is None:
+        raise SkipResource("no position")
+    return {
+        "fhir_id": f"{resource_type}/{resource['id']}",
+        "name": name or f"{resource_type} {resource['id']}",
+        "specialty": specialty or organization.get("specialty") or FHIR_IMPORT_DEFAULT_SPECIALTY,
+        "location_latitude": point[0],
+        "location_longitude": point[1],
+        "address": _address_text(address) or "",
+        "phone": _telecom(resource, "phone") or organization.get("phone"),
+        "email": _telecom(resource, "email"),
+        "npi": _npi(resource) or organization.get("npi"),
+        "is_active": resource.get("active", True) is not False and resource.get("status", "active") == "active"
+    }
+
+
+# ==================== Upsert ====================
+
+def _copy_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return value
+
+
+def copy_statement(target: str, model, columns: Tuple[str, ...]) -> str:
+    """
+    COPY ... FROM STDIN (csv) of columns into target
+    CSV COPY reads an empty field as NULL, so the model's NOT NULL text columns are
+    FORCE_NOT_NULL: a provider without an address is loaded as "" rather than rejected.
+    """
+    table = model.__table__
+    not_null = [c for c in columns if not table.c[c].nullable and isinstance(table.c[c].type, String)]
+    options = "FORMAT csv" + (f", FORCE_NOT_NULL ({', '.join(not_null)})" if not_null else "")
+    return f"COPY {target} ({', '.join(columns)}) FROM STDIN WITH ({options})"
+
+
+def upsert_batch(db: Session, model, columns: Tuple[str, ...], rows: List[Dict[str, Any]]) -> int:
+    """Insert or update rows by fhir_id; returns rows written"""
+    # The last occurrence of a repeated id wins (ON CONFLICT cannot touch a row twice)
+    rows = list({row["fhir_id"]: row for row in rows}.values())
+    if not rows:
+        return 0
+    updates = [c for c in columns if c != "fhir_id"]
+    dialect = db.get_bind().dialect.name
+    table = model.__tablename__
+
+    if dialect == "postgresql":
+        staging = f"fhir_import_{table}"
+        db.execute(text(
+            f"CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        ))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([_copy_value(row[c]) for c in columns])
+        buffer.seek(0)
+        cursor = db.connection().connection.cursor()
+        cursor.copy_expert(copy_statement(staging, model, columns), buffer)
+        column_list = ", ".join(columns)
+        db.execute(text(
+            f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staging} "
+            f"ON CONFLICT (fhir_id) DO UPDATE SET "
+            + ", ".join(f"{c} = EXCLUDED.{c}" for c in updates) + ", updated_at = now()"
+        ))
+        return len(rows)
+
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+        stmt = dialect_insert(model)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[model.fhir_id],
+            set_={c: stmt.excluded[c] for c in updates} | {"updated_at": func.now()}
+        ), rows)
+        return len(rows)
+
+    # Other databases: update existing ids, insert the rest
+    existing = {fhir_id for (fhir_id,) in db.query(model.fhir_id).filter(model.fhir_id.in_([r["fhir_id"] for r in rows]))}
+    for row in rows:
+        if row["fhir_id"] in existing:
+            db.query(model).filter(model.fhir_id == row["fhir_id"]).update(
+                {c: row[c] for c in updates}, synchronize_session=False
+            )
+    new_rows = [row for row in rows if row["fhir_id"] not in existing]
+    if new_rows:
+        db.execute(insert(model), new_rows)
+    return len(rows)
+
+
+# ==================== Import ====================
+
+def import_file(
+    db: Session,
+    path: str,
+    resource_type: Optional[str] = None,
+    organizations: Optional[Dict[str, Dict[str, Any]]] = None,
+    batch_size: int = FHIR_IMPORT_BATCH_SIZE,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    Stream one NDJSON file into patients/providers; returns counts and throughput
+    resource_type restricts the file to one type (others are counted as skipped)
+    """
+    organizations = {} if organizations is None else organizations
+    stats = {"file": path, "read": 0, "written": 0, "skipped": 0, "errors": []}
+    batches = {"Patient": [], "Provider": []}
+    started = time.perf_counter()
+
+    def flush(kind: str):
+        rows = batches[kind]
+        if kind == "Patient":
+            stats["written"] += upsert_batch(db, Patient, PATIENT_COLUMNS, rows)
+        else:
+            stats["written"] += upsert_batch(db, Provider, PROVIDER_COLUMNS, rows)
+        db.commit()
+        rows.clear()
+        if progress:
+            progress(dict(stats, seconds=time.perf_counter() - started))
+
+    def skip(line_number: int, reason: str):
+        stats["skipped"] += 1
+        if len(stats["errors"]) < 100:
+            stats["errors"].append(f"line {line_number}: {reason}")
+
+    for line_number, resource in read_ndjson(path):
+        stats["read"] += 1
+        if not isinstance(resource, dict) or not resource.get("id"):
+            skip(line_number, "not a FHIR resource")
+            continue
+        kind = resource.get("resourceType")
+        if kind not in RESOURCE_TYPES or (resource_type and kind != resource_type):
+            skip(line_number, f"unexpected resourceType {kind}")
+            continue
+        try:
+            if kind == "Patient":
+                batches["Patient"].append(map_patient(resource))
+            else:
+                if kind == "Location":
+                    _load_organization(db, resource, organizations)
+                row = map_provider(resource, organizations)
+                if kind == "Organization":
+                    organizations[row["fhir_id"]] = {
+                        key: row[key] for key in ("name", "specialty", "npi", "phone")
+                    }
+                batches["Provider"].append(row)
+        except (SkipResource, KeyError, TypeError, ValueError) as e:
+            skip(line_number, str(e) or type(e).__name__)
+            continue
+        batch_kind = "Patient" if kind == "Patient" else "Provider"
+        if len(batches[batch_kind]) >= batch_size:
+            flush(batch_kind)
+    for kind in batches:
+        if batches[kind]:
+            flush(kind)
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 2)
+    stats["resources_per_second"] = round(stats["read"] / elapsed) if elapsed > 0 else None
+    return stats
+
+
+def _load_organization(db: Session, location: Dict[str, Any], organizations: Dict[str, Dict[str, Any]]):
+    """Cache the Location's managing organization from providers when an earlier import loaded it"""
+    reference = (location.get("managingOrganization") or {}).get("reference")
+    if not reference or reference in organizations:
+        return
+    row = db.query(Provider.name, Provider.specialty, Provider.npi, Provider.phone).filter(
+        Provider.fhir_id == reference
+    ).first()
+    organizations[reference] = dict(row._mapping) if row else {}
+
+
+def _type_order(item: Dict[str, Any]) -> int:
+    resource_type = item.get("type")
+    return RESOURCE_TYPES.index(resource_type) if resource_type in RESOURCE_TYPES else len(RESOURCE_TYPES)
+
+
+def run_import(
+    db: Session,
+    inputs: Iterable[Dict[str, Any]],
+    base_dir: Optional[str] = None,
+    batch_size: int = FHIR_IMPORT_BATCH_SIZE,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    Import every {"type": ..., "url": ...} input (Organizations first); returns per-file stats
+    and the overall throughput
+    """
+    started = time.perf_counter()
+    organizations: Dict[str, Dict[str, Any]] = {}
+    files = []
+    for item in sorted(inputs, key=_type_order):
+        path = input_path(item["url"], base_dir)
+        files.append(import_file(db, path, item.get("type"), organizations, batch_size, progress))
+    elapsed = time.perf_counter() - started
+    read = sum(f["read"] for f in files)
+    return {
+        "files": files,
+        "read": read,
+        "written": sum(f["written"] for f in files),
+        "skipped": sum(f["skipped"] for f in files),
+        "seconds": round(elapsed, 2),
+        "resources_per_second": round(read / elapsed) if elapsed > 0 else None
+    }
+
+
+def print_progress(stats: Dict[str, Any]):
+    rate = stats["read"] / stats["seconds"] if stats["seconds"] else 0
+    print(f"{stats['file']}: {stats['read']} read, {stats['written']} written, "
+          f"{stats['skipped']} skipped ({rate:,.0f}/s)", flush=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="FHIR bulk import of NDJSON Patient/Organization/Practitioner/Location files")
+    parser.add_argument("files", nargs="+", help="NDJSON files (.ndjson or .ndjson.gz)")
+    parser.add_argument("--type", choices=RESOURCE_TYPES, help="Resource type of every file (default: per line)")
+    parser.add_argument("--batch-size", type=int, default=FHIR_IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        summary = run_import(
+            session, [{"type": args.type, "url": path} for path in args.files],
+            batch_size=args.batch_size, progress=print_progress
+        )
+    finally:
+        session.close()
+    print(f"Imported {summary['written']} resources ({summary['skipped']} skipped) in {summary['seconds']}s "
+          f"- {summary['resources_per_second']}/s")
@@ -0,0 +1,55 @@
+"""
+Geographic helper functions shared by the optimizer modules
+"""
+import math
+import os
+
+# Geohash length of Patient.location_cell; changing it requires re-running the backfill migration
+PATIENT_CELL_PRECISION = int(os.getenv("PATIENT_CELL_PRECISION", "8"))
+
+
+def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Calculate distance between two coordinates in miles using Haversine formula"""
+    R = 3959  # Earth radius in miles
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
+    c = 2 * math.asin(math.sqrt(a))
+    return R * c
+
+
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat: float, lon: float, precision: int = 8) -> str:
+    """
+    Geohash of a coordinate (precision 8 is a ~38 m x 19 m cell)
+    Nearby points share a prefix, so the hash works as a quantized location key
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # Bits alternate longitude, latitude, starting with longitude
+    while len(chars) < precision:
+        bounds, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        mid = (bounds[0] + bounds[1]) / 2
+        if coordinate >= mid:
+            value = (value << 1) | 1
+            bounds[0] = mid
+        else:
+            value <<= 1
+            bounds[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def patient_location_cell(lat: float, lon: float) -> str:
+    """Quantized patient location used for identity matching (absorbs coordinate jitter)"""
+    return geohash_encode(lat, lon, PATIENT_CELL_PRECISION)
@@ -0,0 +1,254 @@
+"""
+Request coalescing and idempotency for route optimization
+- SingleFlight: concurrent identical requests share one in-flight computation
+- ResultCache: bounded TTL LRU of recently solved request fingerprints (per process)
+- Idempotency-Key: client keys stored in idempotency_keys, so a retried request returns the
+  route it already created (across workers and restarts) instead of writing new rows
+"""
+import asyncio
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import IdempotencyKey
+
+RESULT_CACHE_SIZE = int(os.getenv("ROUTE_RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("ROUTE_RESULT_CACHE_TTL_SECONDS", "300"))
+IDEMPOTENCY_KEY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+# A claim whose request never completed (worker killed, client gone) is released after this
+IDEMPOTENCY_PENDING_SECONDS = float(os.getenv("IDEMPOTENCY_PENDING_SECONDS", "120"))
+
+
+def request_fingerprint(payload: Dict[str, Any]) -> str:
+    """Stable hash of a request body (key order and whitespace do not matter)"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+# ==================== Single Flight ====================
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run fn once per key at a time; returns (result, shared) where shared means another call ran it
+        fn runs as its own task that every caller awaits through a shield, so cancelling one
+        caller (the one that started it included) does not cancel it for the others
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task), shared
+
+    def _finished(self, key: str, task: asyncio.Future):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved, so a failure whose callers all left is not logged as unhandled
+
+
+# ==================== Result Cache ====================
+
+class ResultCache:
+    """Thread-safe LRU of results with a time-to-live, indexed by route for invalidation"""
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, ttl_seconds: float = RESULT_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (expires at, value, route id, route version)
+        self._entries: "OrderedDict[str, Tuple[float, Any, Optional[int], Optional[int]]]" = OrderedDict()
+        self._by_route: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def get(self, key: str, version_of: Optional[Callable[[int], Optional[int]]] = None) -> Optional[Any]:
+        """
+        Cached value, or None
+        With version_of(route_id), an entry stored with a route version is only returned while
+        the route is still at that version (changes made by other processes retire it too)
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                return None
+            _, value, route_id, version = entry
+        if version_of is not None and route_id is not None and version is not None:
+            if version_of(route_id) != version:
+                with self._lock:
+                    if self._entries.get(key) is entry:
+                        self._remove(key)
+                return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Any, route_id: Optional[int] = None, version: Optional[int] = None):
+        if not self.enabled:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value, route_id, version)
+            if route_id is not None:
+                self._by_route.setdefault(route_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_route(self, route_id: int):
+        """Drop cached results that describe a route (e.g. after a node status change)"""
+        with self._lock:
+            for key in list(self._by_route.get(route_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_route.clear()
+
+    def _remove(self, key: str):
+        _, _, route_id, _ = self._entries.pop(key)
+        if route_id is not None:
+            keys = self._by_route.get(route_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_route[route_id]
+
+
+# ==================== Idempotency-Key ====================
+
+class IdempotencyConflict(Exception):
+    """The key is in use by a different request, or its first request is still running"""
+
+    def __init__(self, message: str, in_progress: bool = False):
+        super().__init__(message)
+        self.in_progress = in_progress
+
+
+def claim_idempotency_key(db: Session, key: str, request_hash: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Claim a key for this request
+    Returns (stored JSON response, None) when the key already completed for the same request,
+    (None, claim token) when the caller now owns the key and should run the request, and raises
+    IdempotencyConflict when the key belongs to another request or is still in flight
+    The token identifies this claim when it is completed or released: a claim that lapsed
+    and was taken over by a retry has a new token, so the original request cannot touch it
+    """
+    now = datetime.utcnow()
+    for _ in range(2):
+        record = db.query(IdempotencyKey).filter(IdempotencyKey.key == key).first()
+        if record is not None and record.expires_at <= now:
+            db.query(IdempotencyKey).filter(
+                IdempotencyKey.key == key, IdempotencyKey.expires_at <= now
+            ).delete(synchronize_session=False)
+            db.commit()
+            db.expunge(record)
+            record = None
+        if record is not None:
+            if record.request_hash != request_hash:
+                raise IdempotencyConflict("Idempotency-Key was already used with a different request")
+            if record.response is None:
+                raise IdempotencyConflict("A request with this Idempotency-Key is still in progress", in_progress=True)
+            return record.response, None
+
+        claim_token = secrets.token_hex(16)
+        db.add(IdempotencyKey(
+            key=key,
+            request_hash=request_hash,
+            claim_token=claim_token,
+            expires_at=now + timedelta(seconds=IDEMPOTENCY_PENDING_SECONDS)
+        ))
+        try:
+            db.commit()
+            return None, claim_token
+        except IntegrityError:
+            # Another worker claimed it between the lookup and the insert; re-read its state
+            db.rollback()
+    raise IdempotencyConflict("A request with this Idempotency-Key is still in progress", in_progress=True)
+
+
+def complete_idempotency_key(
+    db: Session,
+    key: str,
+    claim_token: str,
+    route_id: Optional[int],
+    response: str,
+    commit: bool = True
+) -> bool:
+    """
+    Store the response of a claimed key and keep it for IDEMPOTENCY_KEY_TTL_HOURS
+    Only updates the pending claim holding claim_token; returns False when the request no longer owns
+    the key (its claim lapsed and was released or taken over), in which case the caller
+    must not keep what it wrote. With commit=False it joins the caller's transaction
+    (e.g. the one that inserts the route).
+    """
+    updated = db.query(IdempotencyKey).filter(
+        IdempotencyKey.claim_token == claim_token, IdempotencyKey.key == key, IdempotencyKey.response.is_(None)
+    ).update({
+        "route_id": route_id,
+        "response": response,
+        "expires_at": datetime.utcnow() + timedelta(hours=IDEMPOTENCY_KEY_TTL_HOURS)
+    }, synchronize_session=False)
+    if commit:
+        db.commit()
+    return updated == 1
+
+
+def store_idempotency_response(db: Session, key: str, route_id: int, response: str):
+    """Replace the stored response of a completed key with the full response for its route"""
+    db.query(IdempotencyKey).filter(
+        IdempotencyKey.key == key, IdempotencyKey.route_id == route_id
+    ).update({"response": response}, synchronize_session=False)
+    db.commit()
+
+
+def release_idempotency_key(db: Session, key: str, claim_token: str):
+    """Drop an unfinished claim (the request failed) so the client can retry with the same key"""
+    db.rollback()
+    db.query(IdempotencyKey).filter(
+        IdempotencyKey.claim_token == claim_token, IdempotencyKey.key == key, IdempotencyKey.response.is_(None)
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def purge_expired_keys(db: Session) -> int:
+    """Delete expired idempotency keys; returns rows removed"""
+    result = db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow()))
+    db.commit()
+    return result.rowcount
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        print(f"Purged {purge_expired_keys(session)} expired idempotency keys")
+    finally:
+        session.close()
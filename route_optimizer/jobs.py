@@ -0,0 +1,533 @@
+"""
+Durable background jobs
+Work that does not belong on the request path (batch optimizations, LLM enrichment,
+coverage/template backfills) is stored in the jobs table and run by worker processes:
+
+    python jobs.py worker [--kind optimize_route] [--batch 1] [--once]
+
+Claiming uses SELECT ... FOR UPDATE SKIP LOCKED on PostgreSQL, so workers never block on
+each other's rows. Other databases (SQLite in tests and development) fall back to an
+optimistic compare-and-set UPDATE per candidate row. Delivery is at-least-once: a claim holds
+a lease, renewed by a heartbeat while the handler runs, and a job whose worker died is picked
+up again once the lease expires. Completion is fenced by the claim's attempt number, so a
+worker that lost its lease cannot overwrite the new owner's outcome. Handlers must therefore
+be safe to re-run. Failures are retried with exponential backoff up to
+max_attempts.
+"""
+import json
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import traceback
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.orm import Session
+
+from models import Job
+from tracing import span
+
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "900"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class PermanentJobError(Exception):
+    """A failure that retrying cannot fix (bad payload, missing entity)"""
+
+
+# ==================== Handlers ====================
+
+JobHandler = Callable[[Session, Dict[str, Any], Job], Optional[Dict[str, Any]]]
+_handlers: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str):
+    """Register a handler(db, payload, job) -> result dict for a job kind"""
+    def decorator(fn: JobHandler) -> JobHandler:
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def job_kinds() -> List[str]:
+    return sorted(_handlers)
+
+
+@job_handler("optimize_route")
+def run_optimize_route(db: Session, payload: Dict[str, Any], job: Job) -> Dict[str, Any]:
+    """
+    Optimize and persist a route for a PatientInput payload
+    Keyed by the job id, so a re-delivered job returns the route it already created. The key
+    is completed in the transaction that inserts the route.
+    """
+    from fastapi import HTTPException
+    from idempotency import claim_idempotency_key, release_idempotency_key, request_fingerprint
+    from route_optimizer import PatientInput, create_optimized_route
+
+    try:
+        patient_input = PatientInput(**payload)
+    except ValueError as e:
+        raise PermanentJobError(f"Invalid patient input: {e}")
+
+    key = f"job:{job.id}"
+    stored, claim_token = claim_idempotency_key(db, key, request_fingerprint(patient_input.model_dump()))
+    if stored is not None:
+        return {"route_id": json.loads(stored).get("route_id")}
+    try:
+        response = create_optimized_route(patient_input, db, idempotency_key=key, claim_token=claim_token)
+    except Exception as e:
+        release_idempotency_key(db, key, claim_token)
+        if isinstance(e, HTTPException) and e.status_code < 500:
+            raise PermanentJobError(str(e.detail))
+        raise
+    return {"route_id": response.route_id, "total_estimated_cost": response.total_estimated_cost}
+
+
+@job_handler("route_recommendations")
+def run_route_recommendations(db: Session, payload: Dict[str, Any], job: Job) -> Dict[str, Any]:
+    """LLM recommendations for a persisted route"""
+    from route_optimizer import route_recommendations
+
+    route_id = payload.get("route_id")
+    if route_id is None:
+        raise PermanentJobError("route_id is required")
+    recommendations = route_recommendations(db, int(route_id), payload.get("patient_info"))
+    if recommendations is None:
+        raise PermanentJobError(f"Route {route_id} not found or AI service unavailable")
+    return recommendations
+
+
+@job_handler("rebuild_service_coverage")
+def run_rebuild_service_coverage(db: Session, payload: Dict[str, Any], job: Job) -> Dict[str, Any]:
+    """Recompute service_coverage rows (all plans or payload["plans"])"""
+    from coverage import rebuild_service_coverage
+
+    written = rebuild_service_coverage(db.connection(), payload.get("plans"))
+    db.commit()
+    return {"rows": written}
+
+
+@job_handler("warm_route_templates")
+def run_warm_route_templates(db: Session, payload: Dict[str, Any], job: Job) -> Dict[str, Any]:
+    """Precompute route templates for populated cells"""
+    from route_templates import warm_templates
+
+    return warm_templates(db, payload.get("min_patients", 1), payload.get("plans"), payload.get("limit"))
+
+
+@job_handler("archive_audit_trails")
+def run_archive_audit_trails(db: Session, payload: Dict[str, Any], job: Job) -> Dict[str, Any]:
+    """
+    Create upcoming audit partitions and archive months older than the hot window
+    payload["hot_months"] can only lengthen the window; archives always go to AUDIT_ARCHIVE_DIR
+    """
+    from audit import AUDIT_ARCHIVE_DIR, AUDIT_ARCHIVE_FORMAT, AUDIT_HOT_MONTHS, archive_old_months
+
+    archive_format = payload.get("format", AUDIT_ARCHIVE_FORMAT)
+    if archive_format not in ("ndjson", "parquet"):
+        raise PermanentJobError(f"Unknown archive format: {archive_format}")
+    try:
+        hot_months = max(int(payload.get("hot_months", AUDIT_HOT_MONTHS)), AUDIT_HOT_MONTHS)
+    except (TypeError, ValueError):
+        raise PermanentJobError("hot_months must be an integer")
+    archived = archive_old_months(db, hot_months, AUDIT_ARCHIVE_DIR, archive_format)
+    return {"months": [{"month": a["month"], "rows": a["rows"], "path": a["path"]} for a in archived]}
+
+
+@job_handler("rebuild_analytics_rollups")
+def run_rebuild_analytics_rollups(db: Session, payload: Dict[str, Any], job: Job) -> Dict[str, Any]:
+    """Recompute the analytics rollup tables from routes and route nodes"""
+    from rollups import rebuild_rollups
+
+    written = rebuild_rollups(db.connection())
+    db.commit()
+    return {"rows": written}
+
+
+@job_handler("fhir_import")
+def run_fhir_import(db: Session, payload: Dict[str, Any], job: Job) -> Dict[str, Any]:
+    """FHIR bulk $import of payload["input"] ([{"type", "url"}]) from FHIR_IMPORT_DIR; upserts, so safe to re-run"""
+    from fhir_import import FHIR_IMPORT_DIR, print_progress, run_import
+
+    inputs = payload.get("input") or []
+    if not inputs:
+        raise PermanentJobError("input is required")
+    try:
+        return run_import(db, inputs, FHIR_IMPORT_DIR, progress=print_progress)
+    except (FileNotFoundError, ValueError) as e:
+        raise PermanentJobError(str(e))
+
+
+@job_handler("fhir_export")
+def run_fhir_export(db: Session, payload: Dict[str, Any], job: Job) -> Dict[str, Any]:
+    """FHIR bulk $export of routes into FHIR_EXPORT_DIR/job-<id>; returns the Bulk Data manifest"""
+    from fhir_export import EXPORT_TYPES, export_dir, export_routes, parse_since
+
+    try:
+        since = parse_since(payload.get("since"))
+        types = tuple(payload.get("types") or EXPORT_TYPES)
+        manifest = export_routes(db, export_dir(job.id), since, types)
+    except ValueError as e:
+        raise PermanentJobError(str(e))
+    return {**manifest, "request": payload.get("request")}
+
+
+@job_handler("plan_transport")
+def run_plan_transport(db: Session, payload: Dict[str, Any], job: Job) -> Dict[str, Any]:
+    """Shared van routes for payload["day"]; read-only, so a retry simply plans again"""
+    from transport import TRANSPORT_TIME_LIMIT_SECONDS, TRANSPORT_VAN_CAPACITY, plan_day, print_progress
+
+    try:
+        day = date.fromisoformat(payload["day"])
+    except (KeyError, TypeError, ValueError):
+        raise PermanentJobError("day (YYYY-MM-DD) is required")
+    appointments = None
+    if payload.get("appointments") is not None:
+        try:
+            # Wall-clock appointment times, like estimated_arrival_time; an offset is dropped
+            appointments = {
+                int(item["route_node_id"]): datetime.fromisoformat(item["appointment_time"]).replace(tzinfo=None)
+                for item in payload["appointments"]
+            }
+        except (KeyError, TypeError, ValueError):
+            raise PermanentJobError("appointments must be [{route_node_id, appointment_time}]")
+    return plan_day(
+        db, day, bool(payload.get("return_trips", True)), appointments,
+        time_limit=float(payload.get("time_limit_seconds") or TRANSPORT_TIME_LIMIT_SECONDS),
+        capacity=int(payload.get("capacity") or TRANSPORT_VAN_CAPACITY),
+        progress=print_progress
+    )
+
+
+# ==================== Queue ====================
+
+def enqueue_job(
+    db: Session,
+    kind: str,
+    payload: Optional[Dict[str, Any]] = None,
+    priority: int = 0,
+    max_attempts: int = 5,
+    delay_seconds: float = 0.0,
+    commit: bool = True
+) -> Job:
+    """Add a job; higher priority runs first, then oldest run_at"""
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind '{kind}' (known: {', '.join(job_kinds())})")
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        status=QUEUED,
+        priority=priority,
+        max_attempts=max_attempts,
+        attempts=0,
+        run_at=datetime.utcnow() + timedelta(seconds=delay_seconds)
+    )
+    db.add(job)
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    return job
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter for the given attempt count"""
+    delay = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _claimable(now: datetime, kinds: Optional[List[str]] = None):
+    condition = or_(
+        and_(Job.status == QUEUED, Job.run_at <= now),
+        and_(Job.status == RUNNING, Job.lease_expires_at < now)  # Worker died mid-job
+    )
+    if kinds:
+        condition = and_(condition, Job.kind.in_(kinds))
+    return condition
+
+
+def claim_jobs(
+    db: Session,
+    worker_id: str,
+    limit: int = 1,
+    kinds: Optional[List[str]] = None,
+    lease_seconds: float = JOB_LEASE_SECONDS
+) -> List[int]:
+    """Lease up to limit runnable jobs to this worker; returns their ids"""
+    return [job_id for job_id, _ in claim_job_leases(db, worker_id, limit, kinds, lease_seconds)]
+
+
+def claim_job_leases(
+    db: Session,
+    worker_id: str,
+    limit: int = 1,
+    kinds: Optional[List[str]] = None,
+    lease_seconds: float = JOB_LEASE_SECONDS
+) -> List[Tuple[int, int]]:
+    """Lease up to limit runnable jobs to this worker; returns (id, attempt) lease tokens"""
+    now = datetime.utcnow()
+    candidates = select(Job.id).where(_claimable(now, kinds)).order_by(
+        Job.priority.desc(), Job.run_at, Job.id
+    ).limit(limit)
+    if db.get_bind().dialect.name == "postgresql":
+        candidates = candidates.with_for_update(skip_locked=True)
+
+    claimed = []
+    for job_id in db.execute(candidates).scalars().all():
+        # Compare-and-set: only one worker can move a row out of the claimable state
+        result = db.execute(
+            update(Job).where(Job.id == job_id, _claimable(now)).values(
+                status=RUNNING,
+                locked_by=worker_id,
+                locked_at=now,
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                attempts=Job.attempts + 1
+            ).execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            # Read in the claiming transaction: the attempts count this claim set
+            claimed.append((job_id, db.execute(select(Job.attempts).where(Job.id == job_id)).scalar_one()))
+    db.commit()
+    return claimed
+
+
+def _leased(job_id: int, worker_id: str, attempt: Optional[int] = None):
+    """
+    The job is still leased to this worker; attempt (the attempts count at claim time) fences
+    off a lease that expired and was claimed again, even by the same worker id
+    """
+    condition = and_(Job.id == job_id, Job.locked_by == worker_id, Job.status == RUNNING)
+    if attempt is not None:
+        condition = and_(condition, Job.attempts == attempt)
+    return condition
+
+
+def renew_lease(
+    db: Session,
+    job_id: int,
+    worker_id: str,
+    attempt: Optional[int] = None,
+    lease_seconds: float = JOB_LEASE_SECONDS
+) -> bool:
+    """Extend a running job's lease; False if it was already lost"""
+    updated = db.execute(
+        update(Job).where(_leased(job_id, worker_id, attempt)).values(
+            lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds)
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return updated == 1
+
+
+def complete_job(
+    db: Session,
+    job_id: int,
+    worker_id: str,
+    result: Optional[Dict[str, Any]],
+    attempt: Optional[int] = None
+) -> bool:
+    """Mark a leased job succeeded; False if the lease was lost to another worker"""
+    updated = db.execute(
+        update(Job).where(_leased(job_id, worker_id, attempt)).values(
+            status=SUCCEEDED,
+            result=json.dumps(result, default=str) if result is not None else None,
+            last_error=None,
+            finished_at=datetime.utcnow(),
+            lease_expires_at=None
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return updated == 1
+
+
+def fail_job(
+    db: Session,
+    job_id: int,
+    worker_id: str,
+    error: str,
+    permanent: bool = False,
+    attempt: Optional[int] = None
+) -> str:
+    """Requeue a failed job with backoff, or fail it for good; returns the new status"""
+    job = db.get(Job, job_id)
+    if job is None or job.locked_by != worker_id or job.status != RUNNING or (
+        attempt is not None and job.attempts != attempt
+    ):
+        db.rollback()
+        return job.status if job else FAILED
+    now = datetime.utcnow()
+    job.last_error = error[-4000:]
+    job.lease_expires_at = None
+    if permanent or job.attempts >= job.max_attempts:
+        job.status = FAILED
+        job.finished_at = now
+    else:
+        job.status = QUEUED
+        job.run_at = now + timedelta(seconds=retry_delay(job.attempts))
+    db.commit()
+    return job.status
+
+
+# ==================== Worker ====================
+
+class LeaseHeartbeat(threading.Thread):
+    """Renews a job's lease every third of its length while the handler runs"""
+
+    def __init__(self, session_factory, job_id: int, worker_id: str, attempt: int, lease_seconds: float):
+        super().__init__(name=f"job-{job_id}-lease", daemon=True)
+        self.session_factory = session_factory
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.attempt = attempt
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stopping = threading.Event()
+
+    def run(self):
+        while not self._stopping.wait(self.lease_seconds / 3):
+            db = self.session_factory()
+            try:
+                if not renew_lease(db, self.job_id, self.worker_id, self.attempt, self.lease_seconds):
+                    self.lost = True
+                    return
+            except Exception as e:
+                # A busy database delays one renewal; the next tick tries again
+                print(f"Job {self.job_id} lease renewal failed: {e}")
+            finally:
+                db.close()
+
+    def stop(self):
+        self._stopping.set()
+        self.join()
+
+
+class Worker:
+    """Polls the queue and runs jobs one at a time; run several processes to scale out"""
+
+    def __init__(
+        self,
+        session_factory=None,
+        worker_id: Optional[str] = None,
+        kinds: Optional[List[str]] = None,
+        batch_size: int = 1,
+        poll_seconds: float = JOB_POLL_SECONDS,
+        lease_seconds: float = JOB_LEASE_SECONDS
+    ):
+        if session_factory is None:
+            from database import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.kinds = kinds
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.stopping = False
+
+    def run(self, once: bool = False) -> int:
+        """Process jobs until stopped (or until the queue is empty with once=True); returns jobs run"""
+        processed = 0
+        while not self.stopping:
+            ran = self.run_batch()
+            processed += ran
+            if not ran:
+                if once:
+                    break
+                time.sleep(self.poll_seconds)
+        return processed
+
+    def run_batch(self) -> int:
+        db = self.session_factory()
+        try:
+            leases = claim_job_leases(db, self.worker_id, self.batch_size, self.kinds, self.lease_seconds)
+        finally:
+            db.close()
+        for job_id, attempt in leases:
+            self.execute(job_id, attempt)
+        return len(leases)
+
+    def execute(self, job_id: int, attempt: Optional[int] = None):
+        """
+        Run a claimed job; attempt is the lease token returned by the claim. A job that waited
+        behind others in the batch may have lost its lease meanwhile, and is then left to the
+        worker that claimed it again.
+        """
+        db = self.session_factory()
+        try:
+            if attempt is None:
+                attempt = db.execute(select(Job.attempts).where(Job.id == job_id)).scalar_one()
+            # Extends the lease while checking it is still this claim's
+            if not renew_lease(db, job_id, self.worker_id, attempt, self.lease_seconds):
+                print(f"Job {job_id} lease was lost before it started; skipped")
+                return
+            job = db.get(Job, job_id)
+            handler = _handlers.get(job.kind)
+            heartbeat = LeaseHeartbeat(self.session_factory, job_id, self.worker_id, attempt, self.lease_seconds)
+            heartbeat.start()
+            with span(f"job.{job.kind}", {"job.id": job.id, "job.attempt": attempt}) as job_span:
+                try:
+                    if handler is None:
+                        raise PermanentJobError(f"No handler for job kind '{job.kind}'")
+                    if attempt > job.max_attempts:
+                        raise PermanentJobError("Retry limit reached (lease expired on the last attempt)")
+                    result = handler(db, json.loads(job.payload or "{}"), job)
+                except Exception as e:
+                    heartbeat.stop()
+                    db.rollback()
+                    permanent = isinstance(e, PermanentJobError)
+                    error = str(e) if permanent else traceback.format_exc()
+                    job_span.record_exception(e)
+                    status = fail_job(db, job_id, self.worker_id, error, permanent, attempt)
+                    print(f"Job {job_id} ({job.kind}) failed, now {status}: {e}")
+                    return
+                heartbeat.stop()
+                if not complete_job(db, job_id, self.worker_id, result, attempt):
+                    print(f"Job {job_id} lease was lost before completion; result discarded")
+        finally:
+            db.close()
+
+    def stop(self, *_):
+        self.stopping = True
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Background job worker")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    worker_parser = subparsers.add_parser("worker", help="Run a worker process")
+    worker_parser.add_argument("--kind", action="append", dest="kinds", help="Only run this job kind (repeatable)")
+    worker_parser.add_argument("--batch", type=int, default=1, help="Jobs claimed per poll")
+    worker_parser.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+    enqueue_parser = subparsers.add_parser("enqueue", help="Add a job")
+    enqueue_parser.add_argument("kind", choices=job_kinds())
+    enqueue_parser.add_argument("--payload", default="{}", help="JSON payload")
+    enqueue_parser.add_argument("--priority", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        worker = Worker(kinds=args.kinds, batch_size=args.batch)
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+        print(f"Worker {worker.worker_id} polling for {', '.join(args.kinds or job_kinds())}")
+        print(f"Processed {worker.run(once=args.once)} jobs")
+    else:
+        from database import SessionLocal
+
+        session = SessionLocal()
+        try:
+            job = enqueue_job(session, args.kind, json.loads(args.payload), args.priority)
+            print(f"Enqueued job {job.id} ({job.kind})")
+        finally:
+            session.close()
@@ -0,0 +1,163 @@
+"""
+Lightweight Prometheus metrics and per-request stage timing
+Stage timers feed latency histograms (exported on /metrics) and the Server-Timing header.
+Dependency-free and cheap enough to leave on in production: one perf_counter pair,
+a bisect and a short locked update per observation.
+
+Metrics are kept per worker process; scrape each worker (or run one worker per port).
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from tracing import span
+
+# Latency buckets in seconds (1 ms .. 30 s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Prometheus histogram with fixed label names"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for key, counts, total, count in snapshot:
+            base = _labels(self.labelnames, key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{base} {total}")
+            lines.append(f"{self.name}_count{base} {count}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time"""
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        try:
+            value = float(self.callback())
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+_registry: List = []
+
+
+def register(metric):
+    """Add a metric to the /metrics output and return it"""
+    _registry.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_SECONDS = register(Histogram(
+    "route_optimizer_request_seconds", "HTTP request latency", ["method", "route", "status"]
+))
+STAGE_SECONDS = register(Histogram(
+    "route_optimizer_stage_seconds", "Latency of individual request stages", ["stage"]
+))
+POOL_WAIT_SECONDS = register(Histogram(
+    "route_optimizer_db_pool_wait_seconds", "Time spent waiting for a database connection",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+))
+
+
+def register_pool_gauges(engine):
+    """Export SQLAlchemy connection pool gauges for an engine"""
+    pool = engine.pool
+    for attr, name, documentation in (
+        ("checkedout", "route_optimizer_db_pool_checked_out", "Connections currently checked out"),
+        ("overflow", "route_optimizer_db_pool_overflow", "Connections opened beyond pool_size"),
+        ("size", "route_optimizer_db_pool_size", "Configured pool size"),
+        ("checkedin", "route_optimizer_db_pool_checked_in", "Idle connections in the pool"),
+    ):
+        if callable(getattr(pool, attr, None)):
+            register(Gauge(name, documentation, getattr(pool, attr)))
+
+
+# ==================== Stage Timing ====================
+
+# Stages recorded for the current request: list of (stage, seconds)
+_request_stages: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_stages", default=None)
+
+
+def start_request() -> List[Tuple[str, float]]:
+    """Begin collecting stage timings for the current request"""
+    stages: List[Tuple[str, float]] = []
+    _request_stages.set(stages)
+    return stages
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as a named stage (histogram, Server-Timing entry and trace span)"""
+    started = time.perf_counter()
+    try:
+        with span(name):
+            yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages.append((name, elapsed))
+
+
+def server_timing_header(stages: List[Tuple[str, float]], total: Optional[float] = None) -> str:
+    """Format stages as a Server-Timing header value (durations in ms)"""
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in stages]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
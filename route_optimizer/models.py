@@ -2,16 +2,22 @@
 SQLAlchemy ORM Models for Route Optimization System
 FHIR-compliant data structures for healthcare integration
 """
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Float, Boolean, Date, DateTime, ForeignKey, Text, Index, UniqueConstraint, Enum as SQLEnum
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from datetime import datetime
+from datetime import date, datetime
+from typing import Optional
 import enum
 
 Base = declarative_base()
 
 
+def patient_identity_key(name: str, date_of_birth: Optional[date] = None) -> str:
+    """Folded name and birth date; with plan and location cell it identifies a patient without a FHIR ID"""
+    return " ".join(name.casefold().split()) + "|" + (f"{date_of_birth:%Y-%m-%d}" if date_of_birth else "")
+
+
 class StatusEnum(str, enum.Enum):
     """Route node status enumeration"""
     PENDING = "Pending"
@@ -32,6 +38,8 @@ class Patient(Base):
     insurance_code = Column(String, nullable=False, index=True)  # e.g., "AET-GOLD"
     location_latitude = Column(Float, nullable=False)
     location_longitude = Column(Float, nullable=False)
+    location_cell = Column(String(12), nullable=True)  # Geohash of the location (geo.patient_location_cell)
+    identity_key = Column(String, nullable=True)  # patient_identity_key(name, date_of_birth)
     address = Column(Text, nullable=True)
     phone = Column(String, nullable=True)
     email = Column(String, nullable=True)
@@ -42,6 +50,17 @@ class Patient(Base):
     # Relationships
     routes = relationship("Route", back_populates="patient", cascade="all, delete-orphan")
 
+    # Patients without a FHIR ID are identified by plan + location cell + name/birth date (upsert target)
+    __table_args__ = (
+        Index(
+            "uq_patients_identity",
+            "insurance_code", "location_cell", "identity_key",
+            unique=True,
+            postgresql_where=fhir_id.is_(None),
+            sqlite_where=fhir_id.is_(None)
+        ),
+    )
+
     def __repr__(self):
         return f"<Patient(id={self.id}, name={self.name}, insurance={self.insurance_code})>"
 
@@ -51,6 +70,7 @@ class Provider(Base):
     __tablename__ = "providers"
 
     id = Column(Integer, primary_key=True, index=True)
+    fhir_id = Column(String, unique=True, index=True, nullable=True)  # "<resourceType>/<id>" of an imported Organization/Practitioner/Location
     name = Column(String, nullable=False)
     specialty = Column(String, nullable=False, index=True)  # e.g., "Cardiology", "Primary Care"
     location_latitude = Column(Float, nullable=False)
@@ -94,16 +114,38 @@ class Service(Base):
         return f"<Service(id={self.id}, name={self.name}, price={self.price})>"
 
 
+class ServiceCoverage(Base):
+    """Normalized plan coverage: one row per (insurance plan, covered service)"""
+    __tablename__ = "service_coverage"
+
+    id = Column(Integer, primary_key=True)
+    insurance_code = Column(String, nullable=False)  # e.g., "AET-GOLD"
+    service_id = Column(Integer, ForeignKey("services.id", ondelete="CASCADE"), nullable=False, index=True)
+    service_code = Column(String, nullable=True)  # CPT/HCPCS code (copied from the service)
+    category = Column(String, nullable=True)  # Plan category that matched, e.g. "Cardiology"
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("insurance_code", "service_id", name="uq_service_coverage_plan_service"),
+        Index("ix_service_coverage_plan_code", "insurance_code", "service_code"),
+    )
+
+    def __repr__(self):
+        return f"<ServiceCoverage(plan={self.insurance_code}, service_id={self.service_id})>"
+
+
 class Route(Base):
     """Optimized care route for a patient"""
     __tablename__ = "routes"
 
     id = Column(Integer, primary_key=True, index=True)
     patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
+    insurance_code = Column(String, nullable=True)  # Patient's plan when the route was created (rollups)
     total_cost = Column(Float, nullable=False, default=0.0)
     total_time_minutes = Column(Integer, nullable=False, default=0)
     total_distance_miles = Column(Float, nullable=True)
     status = Column(String, default="Pending")
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Bumped on every change (CAS updates)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
@@ -127,6 +169,7 @@ class RouteNode(Base):
     estimated_arrival_time = Column(DateTime, nullable=True)
     actual_completion_time = Column(DateTime, nullable=True)
     notes = Column(Text, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Bumped on every change (CAS updates)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
@@ -152,10 +195,119 @@ class AuditTrail(Base):
     ip_address = Column(String, nullable=True)
     timestamp = Column(DateTime, server_default=func.now(), index=True)
 
+    # Monthly partitions by timestamp on PostgreSQL (audit.py); entity lookups for GET /api/audit
+    __table_args__ = (
+        Index("ix_audit_trails_entity", "entity_type", "entity_id", "timestamp"),
+    )
+
     def __repr__(self):
         return f"<AuditTrail(id={self.id}, action={self.action}, timestamp={self.timestamp})>"
 
 
+class RouteTemplate(Base):
+    """Solved route (ordered service/provider sequence) shared by a plan within a geohash cell"""
+    __tablename__ = "route_templates"
+
+    id = Column(Integer, primary_key=True)
+    location_cell = Column(String(12), nullable=False)  # Geohash prefix (route_templates.TEMPLATE_CELL_PRECISION)
+    insurance_code = Column(String, nullable=False)
+    catalog_version = Column(String(16), nullable=False)  # catalog.catalog_version() when solved
+    path = Column(Text, nullable=False)  # JSON array of [service_id, provider_id]
+    stop_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("location_cell", "insurance_code", "catalog_version", name="uq_route_templates_key"),
+    )
+
+    def __repr__(self):
+        return f"<RouteTemplate(cell={self.location_cell}, plan={self.insurance_code}, stops={self.stop_count})>"
+
+
+class IdempotencyKey(Base):
+    """Idempotency-Key of a route optimization request and the response it produced"""
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True)
+    key = Column(String(255), nullable=False, unique=True)  # Client-supplied Idempotency-Key header
+    request_hash = Column(String(64), nullable=False)  # Fingerprint of the request body
+    claim_token = Column(String(32), nullable=True)  # Identifies the request that claimed the key
+    route_id = Column(Integer, ForeignKey("routes.id", ondelete="SET NULL"), nullable=True)
+    response = Column(Text, nullable=True)  # JSON response body; NULL while the request is in flight
+    created_at = Column(DateTime, server_default=func.now())
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<IdempotencyKey(key={self.key}, route_id={self.route_id})>"
+
+
+class Job(Base):
+    """Background job (see jobs.py); claimed by workers under a lease"""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(64), nullable=False)  # Handler name, e.g. "optimize_route"
+    payload = Column(Text, nullable=True)  # JSON arguments
+    status = Column(String(16), nullable=False, default="queued")  # queued, running, succeeded, failed
+    priority = Column(Integer, nullable=False, default=0)  # Higher runs first
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(DateTime, nullable=False)  # Not before (backoff after failures)
+    locked_by = Column(String, nullable=True)  # Worker holding the lease
+    locked_at = Column(DateTime, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)  # JSON result of the handler
+    created_at = Column(DateTime, server_default=func.now())
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_claim", "status", "priority", "run_at"),
+    )
+
+    def __repr__(self):
+        return f"<Job(id={self.id}, kind={self.kind}, status={self.status}, attempts={self.attempts})>"
+
+
+class RouteDailyRollup(Base):
+    """Routes created per day and plan, with summed patient cost and distance (rollups.py)"""
+    __tablename__ = "route_daily_rollups"
+
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)  # Route created_at date
+    insurance_code = Column(String, nullable=False)
+    route_count = Column(Integer, nullable=False, default=0)
+    total_cost = Column(Float, nullable=False, default=0.0)  # Sum of Route.total_cost
+    total_distance_miles = Column(Float, nullable=False, default=0.0)  # Sum of Route.total_distance_miles
+    distance_route_count = Column(Integer, nullable=False, default=0)  # Routes with a distance
+
+    __table_args__ = (
+        UniqueConstraint("day", "insurance_code", name="uq_route_daily_rollups_key"),
+    )
+
+    def __repr__(self):
+        return f"<RouteDailyRollup(day={self.day}, plan={self.insurance_code}, routes={self.route_count})>"
+
+
+class ProviderDailyRollup(Base):
+    """Route nodes per day and provider, and how many are completed (rollups.py)"""
+    __tablename__ = "provider_daily_rollups"
+
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)  # RouteNode created_at date
+    provider_id = Column(Integer, ForeignKey("providers.id", ondelete="CASCADE"), nullable=False)
+    node_count = Column(Integer, nullable=False, default=0)
+    completed_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("day", "provider_id", name="uq_provider_daily_rollups_key"),
+        Index("ix_provider_daily_rollups_provider", "provider_id", "day"),
+    )
+
+    def __repr__(self):
+        return f"<ProviderDailyRollup(day={self.day}, provider_id={self.provider_id}, nodes={self.node_count})>"
+
+
 class InsuranceProgram(Base):
     """Insurance program coverage information"""
     __tablename__ = "insurance_programs"
@@ -0,0 +1,195 @@
+"""
+Multi-objective route search
+Builds a small Pareto front of non-dominated routes over patient cost,
+travel distance and total time instead of a single fixed-weight score
+
+The exact search keeps one set of labels per (visited groups, current stop) state, so it
+grows with 2^groups. Above PARETO_MAX_GROUPS it turns into a beam search: each layer
+keeps only the PARETO_BEAM_WIDTH best partial routes, so the front is approximate but the
+work stays polynomial.
+"""
+import os
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from service_matcher import normalize
+
+# Candidate sites kept per covered service after dominance pruning
+PARETO_CANDIDATES_PER_GROUP = int(os.getenv("PARETO_CANDIDATES_PER_GROUP", "4"))
+
+# Partial routes kept per search state (visited groups, current stop)
+PARETO_LABELS_PER_STATE = int(os.getenv("PARETO_LABELS_PER_STATE", "8"))
+
+# Groups searched exactly; larger requests use the beam search
+PARETO_MAX_GROUPS = int(os.getenv("PARETO_MAX_GROUPS", "6"))
+# Partial routes kept per layer by the beam search
+PARETO_BEAM_WIDTH = int(os.getenv("PARETO_BEAM_WIDTH", "48"))
+
+# Group of the services that match no covered name
+UNMATCHED_GROUP = ""
+
+# Objective vector: (patient cost, distance miles, total minutes)
+Objectives = Tuple[float, float, float]
+
+
+def dominates(a: Sequence[float], b: Sequence[float]) -> bool:
+    """True if objective vector a is no worse than b everywhere and better somewhere"""
+    better = False
+    for x, y in zip(a, b):
+        if x > y:
+            return False
+        if x < y:
+            better = True
+    return better
+
+
+def pareto_filter(items: List[Any], key: Callable[[Any], Sequence[float]]) -> List[Any]:
+    """Return the non-dominated items (first occurrence wins on identical vectors)"""
+    front = []
+    seen = set()
+    for item in sorted(items, key=key):
+        vector = tuple(key(item))
+        if vector in seen:
+            continue
+        if any(dominates(key(other), vector) for other in front):
+            continue
+        front.append(item)
+        seen.add(vector)
+    return front
+
+
+def group_services(services: List[Any], covered_service_names: List[str]) -> Dict[str, List[Any]]:
+    """
+    Group services by the covered service they satisfy (whole words, as in service_matcher)
+    A route needs one stop per group; services matching no covered name share one group
+    """
+    covered = [(name, normalize(name)) for name in covered_service_names if normalize(name).strip()]
+    groups: Dict[str, List[Any]] = {}
+    for service in services:
+        service_words = normalize(service.name)
+        group = next((name for name, words in covered if words in service_words), UNMATCHED_GROUP)
+        groups.setdefault(group, []).append(service)
+    return groups
+
+
+def pareto_route_search(
+    groups: List[List[Dict[str, Any]]],
+    leg: Callable[[int, int], Tuple[float, float]],
+    cost_per_mile: float,
+    max_alternatives: int = 5
+) -> List[Dict[str, Any]]:
+    """
+    Label-setting search for non-dominated routes
+
+    groups: one list of candidate nodes per covered service. Each node is a dict with
+        'point' (index understood by leg, 0 is the patient), 'service_id', 'provider_id',
+        'cost' (patient cost of the service) and 'time' (service minutes).
+    leg: returns (miles, minutes) between two point indexes.
+
+    Each route visits exactly one candidate from every group, in any order.
+    Dominated partial routes are dropped at every state so the search stays small; with
+    more than PARETO_MAX_GROUPS groups each layer is also cut to PARETO_BEAM_WIDTH labels.
+    """
+    groups = [_prune_candidates(candidates, leg, cost_per_mile) for candidates in groups if candidates]
+    if not groups:
+        return []
+    beam = len(groups) > PARETO_MAX_GROUPS
+
+    # Label: (objectives, current point, path of nodes)
+    # State: (visited group mask, current point)
+    layer: Dict[Tuple[int, int], List[Tuple[Objectives, int, Tuple[Dict[str, Any], ...]]]] = {
+        (0, 0): [((0.0, 0.0, 0.0), 0, ())]
+    }
+    full_mask = (1 << len(groups)) - 1
+
+    for _ in range(len(groups)):
+        next_layer: Dict[Tuple[int, int], List] = {}
+        for (mask, _point), labels in layer.items():
+            for group_idx, candidates in enumerate(groups):
+                if mask & (1 << group_idx):
+                    continue
+                for node in candidates:
+                    for (cost, miles, minutes), point, path in labels:
+                        leg_miles, leg_minutes = leg(point, node['point'])
+                        label = (
+                            (
+                                cost + node['cost'] + leg_miles * cost_per_mile,
+                                miles + leg_miles,
+                                minutes + node['time'] + leg_minutes
+                            ),
+                            node['point'],
+                            path + (node,)
+                        )
+                        state = (mask | (1 << group_idx), node['point'])
+                        next_layer.setdefault(state, []).append(label)
+
+        layer = {
+            state: pareto_filter(labels, key=lambda l: l[0])[:PARETO_LABELS_PER_STATE]
+            for state, labels in next_layer.items()
+        }
+        if beam:
+            layer = _beam(layer, PARETO_BEAM_WIDTH)
+
+    finished = [label for (mask, _), labels in layer.items() if mask == full_mask for label in labels]
+    front = pareto_filter(finished, key=lambda l: l[0])
+    return _describe_front(front, max_alternatives)
+
+
+def _beam(layer: Dict[Tuple[int, int], List], width: int) -> Dict[Tuple[int, int], List]:
+    """Keep the width best labels of a layer, an equal share by each objective"""
+    entries = [(state, label) for state, labels in layer.items() for label in labels]
+    if len(entries) <= width:
+        return layer
+    kept = {}
+    share = max(1, width // 3)
+    for objective in range(3):
+        for state, label in sorted(entries, key=lambda e: (e[1][0][objective], e[1][0]))[:share]:
+            kept[id(label)] = (state, label)
+    beamed: Dict[Tuple[int, int], List] = {}
+    for state, label in kept.values():
+        beamed.setdefault(state, []).append(label)
+    return beamed
+
+
+def _prune_candidates(
+    candidates: List[Dict[str, Any]],
+    leg: Callable[[int, int], Tuple[float, float]],
+    cost_per_mile: float
+) -> List[Dict[str, Any]]:
+    """Keep non-dominated sites of a group, judged by cost and distance from the patient"""
+    def vector(node):
+        miles, minutes = leg(0, node['point'])
+        return (node['cost'] + miles * cost_per_mile, miles, node['time'] + minutes)
+
+    front = pareto_filter(candidates, key=vector)
+    return front[:PARETO_CANDIDATES_PER_GROUP]
+
+
+def _describe_front(front: List[Tuple], max_alternatives: int) -> List[Dict[str, Any]]:
+    """Pick a diverse, cost-ordered subset of the front and tag the per-objective winners"""
+    if not front:
+        return []
+
+    winners = {
+        "lowest_cost": min(front, key=lambda l: l[0]),
+        "shortest_distance": min(front, key=lambda l: (l[0][1], l[0][0])),
+        "fastest": min(front, key=lambda l: (l[0][2], l[0][0])),
+    }
+    chosen = []
+    for label in list(winners.values()) + sorted(front, key=lambda l: l[0]):
+        if len(chosen) >= max_alternatives:
+            break
+        if not any(label is other for other in chosen):
+            chosen.append(label)
+    chosen.sort(key=lambda l: l[0])
+
+    alternatives = []
+    for label in chosen:
+        (cost, miles, minutes), _point, path = label
+        alternatives.append({
+            "path": [(node['service_id'], node['provider_id']) for node in path],
+            "patient_cost": cost,
+            "distance_miles": miles,
+            "time_minutes": minutes,
+            "labels": [name for name, winner in winners.items() if winner is label],
+        })
+    return alternatives
@@ -0,0 +1,422 @@
+"""
+Memory-mapped provider-to-provider travel matrix shared across worker processes
+
+An offline or startup job writes the provider x provider matrix to a flat float32 file.
+Every uvicorn worker maps the same file read-only (zero-copy, shared page cache), so per
+request only the patient -> candidates row is computed live.
+
+Files in PROVIDER_MATRIX_DIR:
+    provider_matrix-<version>.bin  magic b"PMATRIX2", byte order b"<" or b">" + 3 pad bytes,
+                                   uint32 n, float64[2n] provider lat/lon, uint32[n] provider ids,
+                                   float32[n*n] miles, float32[n*n] minutes (writer's byte order)
+    current.json                   manifest naming the active file; replaced atomically
+
+Each request checks the candidates' current coordinates against the ones the matrix was
+built from, so a moved provider is computed live until the next build.
+"""
+import json
+import mmap
+import os
+import secrets
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to an exclusive lock file kept fresh by the builder
+    fcntl = None
+
+from distance_provider import DistanceProvider, TravelMatrix
+
+MATRIX_MAGIC = b"PMATRIX2"
+NATIVE_ORDER = b"<" if sys.byteorder == "little" else b">"
+MANIFEST_NAME = "current.json"
+LOCK_NAME = "build.lock"
+
+# How often readers stat the manifest for a newer matrix
+MANIFEST_CHECK_SECONDS = float(os.getenv("PROVIDER_MATRIX_CHECK_SECONDS", "2"))
+
+# Without fcntl, a lock file the builder has not touched for this long is considered abandoned
+LOCK_STALE_SECONDS = 600
+
+Point = Tuple[float, float]
+
+
+class MatrixSnapshot:
+    """One mapped matrix file"""
+
+    def __init__(self, path: str, manifest: Dict):
+        self.path = path
+        self.version = manifest["version"]
+        self.distance_provider = manifest.get("distance_provider")
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:8] != MATRIX_MAGIC:
+            raise ValueError(f"{path} is not a provider matrix file")
+        order = self._mmap[8:9]
+        if order not in (b"<", b">"):
+            raise ValueError(f"{path} has an unknown byte order {order!r}")
+        (self.size,) = struct.unpack_from(order.decode() + "I", self._mmap, 12)
+        n = self.size
+
+        view = memoryview(self._mmap)
+        points_start = 16
+        ids_start = points_start + 16 * n
+        miles_start = ids_start + 4 * n
+        minutes_start = miles_start + 4 * n * n
+        sections = [
+            (view[points_start:ids_start], "d"), (view[ids_start:miles_start], "I"),
+            (view[miles_start:minutes_start], "f"), (view[minutes_start:minutes_start + 4 * n * n], "f")
+        ]
+        if order == NATIVE_ORDER:
+            # Views into the shared mapping - nothing is copied into this process
+            points, ids, self.miles, self.minutes = [section.cast(code) for section, code in sections]
+        else:
+            # Written on a host of the other byte order: swap into private copies
+            points, ids, self.miles, self.minutes = [_swapped(section, code) for section, code in sections]
+        self.points = points
+        self.index = {provider_id: row for row, provider_id in enumerate(ids)}
+
+    def located_at(self, rows: List[int], points: Sequence[Point]) -> bool:
+        """Whether the providers at rows are still where the matrix was built for"""
+        return all(
+            self.points[2 * row] == lat and self.points[2 * row + 1] == lon
+            for row, (lat, lon) in zip(rows, points)
+        )
+
+    def leg(self, row: int, column: int) -> Tuple[float, float]:
+        offset = row * self.size + column
+        return self.miles[offset], self.minutes[offset]
+
+
+def _swapped(section: memoryview, code: str) -> array:
+    values = array(code)
+    values.frombytes(section)
+    values.byteswap()
+    return values
+
+
+class SharedTravelMatrix(TravelMatrix):
+    """Solver matrix: live patient row plus the shared provider x provider block"""
+
+    def __init__(self, snapshot: MatrixSnapshot, rows: List[int], origin_row: TravelMatrix,
+                 origin: Point, points: List[Point], base: DistanceProvider):
+        self.snapshot = snapshot
+        self.rows = rows
+        self.origin_row = origin_row
+        self.origin = origin
+        self.points = points
+        self.base = base
+
+    def leg(self, i: int, j: int) -> Tuple[float, float]:
+        if i == j:
+            return 0.0, 0.0
+        if i == 0:
+            return self.origin_row.leg(0, j - 1)
+        if j == 0:
+            # Provider -> patient is never needed by the solvers; compute it live when asked
+            return self.base.leg(self.points[i - 1], self.origin)
+        return self.snapshot.leg(self.rows[i - 1], self.rows[j - 1])
+
+
+class ProviderMatrixStore:
+    """Reader side: maps the current matrix and hot-swaps when the manifest changes"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self._snapshot: Optional[MatrixSnapshot] = None
+        self._manifest_mtime = None
+        self._checked_at = 0.0
+
+    def current(self) -> Optional[MatrixSnapshot]:
+        """Return the active snapshot, remapping at most every MANIFEST_CHECK_SECONDS"""
+        now = time.monotonic()
+        if now - self._checked_at < MANIFEST_CHECK_SECONDS:
+            return self._snapshot
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return self._snapshot
+        if mtime != self._manifest_mtime:
+            try:
+                with open(self.manifest_path) as f:
+                    manifest = json.load(f)
+                # Swap the reference in one assignment; requests holding the old snapshot keep it alive
+                self._snapshot = MatrixSnapshot(os.path.join(self.directory, manifest["file"]), manifest)
+                self._manifest_mtime = mtime
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Could not load provider matrix: {e}")
+        return self._snapshot
+
+
+class MatrixBackedProvider(DistanceProvider):
+    """Distance provider that serves provider-to-provider legs from the shared matrix"""
+
+    def __init__(self, base: DistanceProvider, store: ProviderMatrixStore):
+        self.base = base
+        self.store = store
+        self.name = base.name
+
+    def leg(self, origin: Point, destination: Point) -> Tuple[float, float]:
+        return self.base.leg(origin, destination)
+
+    def path_legs(self, points: Sequence[Point]) -> List[Tuple[float, float]]:
+        return self.base.path_legs(points)
+
+    def matrix(self, origins: Sequence[Point], destinations: Sequence[Point]) -> TravelMatrix:
+        return self.base.matrix(origins, destinations)
+
+    def matrix_rows(self, origins: Sequence[Point], destinations: Sequence[Point]):
+        return self.base.matrix_rows(origins, destinations)
+
+    def provider_matrix(self, origin: Point, providers: Sequence) -> TravelMatrix:
+        snapshot = self.store.current()
+        if snapshot is None or snapshot.distance_provider != self.base.name:
+            return self.base.provider_matrix(origin, providers)
+        rows = [snapshot.index.get(p.id) for p in providers]
+        points = [(p.location_latitude, p.location_longitude) for p in providers]
+        if any(row is None for row in rows) or not snapshot.located_at(rows, points):
+            # Catalog changed since the last build; stay correct until the rebuild lands
+            return self.base.provider_matrix(origin, providers)
+
+        origin_row = self.base.matrix([origin], points)
+        return SharedTravelMatrix(snapshot, rows, origin_row, origin, points, self.base)
+
+
+# ==================== Builder ====================
+
+def read_manifest(directory: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_matrix_file(
+    path: str,
+    provider_ids: List[int],
+    points: List[Point],
+    distance_provider: DistanceProvider,
+    on_row: Optional[Callable[[int], None]] = None
+):
+    """
+    Compute the full provider x provider matrix and write it as float32 in native byte order
+    Rows are streamed from distance_provider.matrix_rows into their place in the file, so
+    only one row is held in memory; on_row(i) is called after each row is written
+    """
+    n = len(points)
+    ids = array("I", provider_ids)
+    coordinates = array("d", [value for point in points for value in point])
+    with open(path, "w+b") as f:
+        f.write(MATRIX_MAGIC)
+        f.write(NATIVE_ORDER + bytes(3))
+        f.write(struct.pack("=I", n))
+        coordinates.tofile(f)
+        ids.tofile(f)
+        miles_start = f.tell()
+        minutes_start = miles_start + 4 * n * n
+        f.truncate(minutes_start + 4 * n * n)
+        for i, (miles, minutes) in enumerate(distance_provider.matrix_rows(points, points)):
+            miles[i] = minutes[i] = 0.0
+            f.seek(miles_start + 4 * n * i)
+            array("f", miles).tofile(f)
+            f.seek(minutes_start + 4 * n * i)
+            array("f", minutes).tofile(f)
+            if on_row is not None:
+                on_row(i)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class _BuildLock:
+    """
+    Cross-process build lock on LOCK_NAME
+    With fcntl it is a flock on the file, which the kernel releases if the builder dies, so
+    it never goes stale however long the build runs. Without fcntl it is a file created
+    exclusively; the builder touches it as it goes (refresh) and only removes its own.
+    """
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, LOCK_NAME)
+        self.token = secrets.token_hex(8)
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> bool:
+        if fcntl is not None:
+            fd = os.open(self.path, os.O_CREAT | os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            self._fd = fd
+            return True
+        try:
+            if time.time() - os.path.getmtime(self.path) > LOCK_STALE_SECONDS:
+                os.remove(self.path)
+        except OSError:
+            pass
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.write(fd, self.token.encode())
+        os.close(fd)
+        return True
+
+    def refresh(self):
+        """Mark the lock as still in use (lock files only; a flock needs no refresh)"""
+        if fcntl is None:
+            try:
+                os.utime(self.path)
+            except OSError:
+                pass
+
+    def release(self):
+        if self._fd is not None:
+            # The file stays: removing it could let a builder lock a new inode while another holds the old one
+            os.close(self._fd)
+            self._fd = None
+            return
+        try:
+            with open(self.path) as f:
+                owned = f.read() == self.token
+            if owned:
+                os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _temp_path(directory: str, name: str) -> str:
+    """A temporary file of this builder's own next to name"""
+    handle, path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory)
+    os.close(handle)
+    return path
+
+
+def build_provider_matrix(db, directory: str, distance_provider: DistanceProvider, force: bool = False) -> Optional[Dict]:
+    """
+    Rebuild the shared matrix if the catalog version changed
+    Returns the new manifest, or None when the current matrix is up to date
+    or another process holds the build lock
+    """
+    from catalog import catalog_version
+    from models import Provider
+
+    os.makedirs(directory, exist_ok=True)
+    version = catalog_version(db)
+    current = read_manifest(directory)
+    if not force and current and current.get("version") == version \
+            and current.get("distance_provider") == distance_provider.name \
+            and current.get("format") == MATRIX_MAGIC.decode():
+        return None
+    lock = _BuildLock(directory)
+    if not lock.acquire():
+        return None
+
+    tmp_path = manifest_tmp = None
+    try:
+        providers = db.query(Provider).filter(Provider.is_active == True).order_by(Provider.id).all()
+        file_name = f"provider_matrix-{version}.bin"
+        tmp_path = _temp_path(directory, file_name)
+        write_matrix_file(
+            tmp_path,
+            [p.id for p in providers],
+            [(p.location_latitude, p.location_longitude) for p in providers],
+            distance_provider,
+            on_row=lambda row: lock.refresh()
+        )
+        os.replace(tmp_path, os.path.join(directory, file_name))
+
+        manifest = {
+            "version": version,
+            "file": file_name,
+            "providers": len(providers),
+            "distance_provider": distance_provider.name,
+            "format": MATRIX_MAGIC.decode(),
+            "created_at": datetime.utcnow().isoformat()
+        }
+        manifest_tmp = _temp_path(directory, MANIFEST_NAME)
+        with open(manifest_tmp, "w") as f:
+            json.dump(manifest, f)
+        # Atomic swap: readers see either the old or the new manifest, never a partial one
+        os.replace(manifest_tmp, os.path.join(directory, MANIFEST_NAME))
+
+        # Keep the previous file for readers still mapping it; drop anything older
+        keep = {file_name, current.get("file") if current else None}
+        for name in os.listdir(directory):
+            if name.startswith("provider_matrix-") and name.endswith(".bin") and name not in keep:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+        return manifest
+    finally:
+        for path in (tmp_path, manifest_tmp):
+            if path and os.path.exists(path):
+                os.remove(path)
+        lock.release()
+
+
+def refresh_provider_matrix(directory: str, distance_provider: DistanceProvider) -> Optional[Dict]:
+    """Open a session and rebuild the matrix if the catalog changed"""
+    from database import SessionLocal
+
+    if isinstance(distance_provider, MatrixBackedProvider):
+        distance_provider = distance_provider.base
+    db = SessionLocal()
+    try:
+        return build_provider_matrix(db, directory, distance_provider)
+    finally:
+        db.close()
+
+
+async def provider_matrix_refresher(directory: str, distance_provider: DistanceProvider, interval_seconds: float):
+    """Startup job: build once, then re-check the catalog version every interval (0 = once)"""
+    import asyncio
+
+    while True:
+        try:
+            manifest = await asyncio.to_thread(refresh_provider_matrix, directory, distance_provider)
+            if manifest:
+                print(f"Provider matrix rebuilt: {manifest['file']} ({manifest['providers']} providers)")
+        except Exception as e:
+            print(f"Provider matrix build failed: {e}")
+        if interval_seconds <= 0:
+            return
+        await asyncio.sleep(interval_seconds)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import SessionLocal
+    from distance_provider import get_distance_provider
+
+    parser = argparse.ArgumentParser(description="Precompute the shared provider travel matrix")
+    parser.add_argument("--dir", default=os.getenv("PROVIDER_MATRIX_DIR", "./provider_matrix"))
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the catalog version is unchanged")
+    args = parser.parse_args()
+
+    base = get_distance_provider()
+    if isinstance(base, MatrixBackedProvider):
+        base = base.base
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        manifest = build_provider_matrix(db, args.dir, base, force=args.force)
+        if manifest:
+            print(f"Built {manifest['file']} ({manifest['providers']} providers) "
+                  f"in {time.perf_counter() - started:.1f}s")
+        else:
+            print("Provider matrix is up to date (or another build is running)")
+    finally:
+        db.close()
@@ -0,0 +1,430 @@
+"""
+Offline road-network travel-time engine
+Loads a regional road graph from a compact CSR file, precomputes contraction
+hierarchies and answers many-to-many travel-time queries without any external API
+
+Graph file layout (little-endian, written by build_graph_file):
+    magic b"RGRAPH1\\0", uint32 node count, uint32 edge count
+    float64[n] latitudes, float64[n] longitudes
+    uint32[n+1] edge offsets, uint32[m] edge targets
+    float32[m] travel seconds, float32[m] meters
+
+The contracted hierarchy is cached next to the graph as "<file>.ch" and rebuilt
+whenever the graph file is newer than the cache.
+"""
+import csv
+import heapq
+import math
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from geo import haversine_distance
+
+GRAPH_MAGIC = b"RGRAPH1\0"
+CH_MAGIC = b"RGRAPHCH"
+
+METERS_PER_MILE = 1609.344
+
+# Speed assumed for the straight-line hop between a coordinate and its nearest road node
+ACCESS_SPEED_MPH = float(os.getenv("ROAD_ACCESS_SPEED_MPH", "15"))
+
+# Witness searches stop after settling this many nodes (more shortcuts, faster preprocessing)
+WITNESS_SETTLE_LIMIT = 60
+
+# Snapping grid cell size in degrees (~0.7 miles around Joplin)
+GRID_CELL_DEG = 0.01
+
+Point = Tuple[float, float]
+
+
+# ==================== File I/O ====================
+
+def _write_array(handle, values: array):
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    values.tofile(handle)
+
+
+def _read_array(handle, typecode: str, count: int) -> array:
+    values = array(typecode)
+    values.fromfile(handle, count)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def _write_csr(handle, offsets: array, targets: array, seconds: array, meters: array):
+    _write_array(handle, offsets)
+    _write_array(handle, targets)
+    _write_array(handle, seconds)
+    _write_array(handle, meters)
+
+
+def _read_csr(handle, node_count: int, edge_count: int):
+    offsets = _read_array(handle, "I", node_count + 1)
+    targets = _read_array(handle, "I", edge_count)
+    seconds = _read_array(handle, "f", edge_count)
+    meters = _read_array(handle, "f", edge_count)
+    return offsets, targets, seconds, meters
+
+
+def _to_csr(node_count: int, adjacency: List[Dict[int, Tuple[float, float]]]):
+    """Pack per-node {target: (seconds, meters)} dicts into CSR arrays"""
+    offsets, targets, seconds, meters = array("I", [0]), array("I"), array("f"), array("f")
+    for node in range(node_count):
+        for target, (sec, m) in sorted(adjacency[node].items()):
+            targets.append(target)
+            seconds.append(sec)
+            meters.append(m)
+        offsets.append(len(targets))
+    return offsets, targets, seconds, meters
+
+
+def build_graph_file(nodes_csv: str, edges_csv: str, output_path: str) -> Tuple[int, int]:
+    """
+    Convert a node/edge CSV export of a road network (e.g. from an OSM extract) to the CSR file
+    nodes_csv columns: id, lat, lon
+    edges_csv columns: from_id, to_id, length_m, speed_kph[, oneway]
+    Returns (node count, edge count)
+    """
+    node_index: Dict[str, int] = {}
+    lats, lons = array("d"), array("d")
+    with open(nodes_csv, newline="") as f:
+        for row in csv.DictReader(f):
+            node_index[row["id"]] = len(lats)
+            lats.append(float(row["lat"]))
+            lons.append(float(row["lon"]))
+
+    adjacency: List[Dict[int, Tuple[float, float]]] = [dict() for _ in range(len(lats))]
+
+    def add_edge(u: int, v: int, sec: float, m: float):
+        # Keep the fastest of parallel edges
+        if u != v and (v not in adjacency[u] or adjacency[u][v][0] > sec):
+            adjacency[u][v] = (sec, m)
+
+    with open(edges_csv, newline="") as f:
+        for row in csv.DictReader(f):
+            u, v = node_index[row["from_id"]], node_index[row["to_id"]]
+            length_m = float(row["length_m"])
+            seconds = length_m / (float(row["speed_kph"]) / 3.6)
+            add_edge(u, v, seconds, length_m)
+            if row.get("oneway", "").strip().lower() not in ("1", "true", "yes"):
+                add_edge(v, u, seconds, length_m)
+
+    offsets, targets, seconds, meters = _to_csr(len(lats), adjacency)
+    with open(output_path, "wb") as f:
+        f.write(GRAPH_MAGIC)
+        f.write(struct.pack("<II", len(lats), len(targets)))
+        _write_array(f, lats)
+        _write_array(f, lons)
+        _write_csr(f, offsets, targets, seconds, meters)
+    return len(lats), len(targets)
+
+
+# ==================== Road Graph ====================
+
+class RoadGraph:
+    """Road graph with a contraction hierarchy for fast travel-time queries"""
+
+    def __init__(self, lats: array, lons: array, offsets: array, targets: array, seconds: array, meters: array):
+        self.node_count = len(lats)
+        self.lats = lats
+        self.lons = lons
+        self.offsets = offsets
+        self.targets = targets
+        self.seconds = seconds
+        self.meters = meters
+        self.rank: Optional[array] = None
+        self.up = None  # CSR of edges u -> x with rank[x] > rank[u]
+        self.down = None  # CSR of reversed edges: for u, (y, w) where y -> u and rank[y] > rank[u]
+        self._grid = self._build_grid()
+
+    @classmethod
+    def load(cls, path: str, use_cache: bool = True) -> "RoadGraph":
+        """Load a graph file and its hierarchy (contracting and caching it if needed)"""
+        with open(path, "rb") as f:
+            if f.read(8) != GRAPH_MAGIC:
+                raise ValueError(f"{path} is not a road graph file")
+            node_count, edge_count = struct.unpack("<II", f.read(8))
+            lats = _read_array(f, "d", node_count)
+            lons = _read_array(f, "d", node_count)
+            csr = _read_csr(f, node_count, edge_count)
+        graph = cls(lats, lons, *csr)
+
+        cache_path = path + ".ch"
+        if use_cache and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+            graph._load_hierarchy(cache_path)
+        else:
+            graph.contract()
+            if use_cache:
+                try:
+                    graph._save_hierarchy(cache_path)
+                except OSError as e:
+                    print(f"Could not cache contraction hierarchy: {e}")
+        return graph
+
+    # ---------- Snapping ----------
+
+    def _build_grid(self) -> Dict[Tuple[int, int], List[int]]:
+        grid: Dict[Tuple[int, int], List[int]] = {}
+        for node in range(self.node_count):
+            grid.setdefault(self._cell(self.lats[node], self.lons[node]), []).append(node)
+        return grid
+
+    @staticmethod
+    def _cell(lat: float, lon: float) -> Tuple[int, int]:
+        return (int(math.floor(lat / GRID_CELL_DEG)), int(math.floor(lon / GRID_CELL_DEG)))
+
+    def nearest_node(self, lat: float, lon: float) -> Tuple[int, float]:
+        """Return (node, straight-line miles) of the closest road node"""
+        if not self.node_count:
+            raise ValueError("Road graph is empty")
+        cx, cy = self._cell(lat, lon)
+        best, best_miles = -1, float("inf")
+        ring = 0
+        # Grow square rings of cells until the ring is farther away than the best hit
+        while True:
+            for dx in range(-ring, ring + 1):
+                for dy in range(-ring, ring + 1):
+                    if max(abs(dx), abs(dy)) != ring:
+                        continue
+                    for node in self._grid.get((cx + dx, cy + dy), ()):
+                        miles = haversine_distance(lat, lon, self.lats[node], self.lons[node])
+                        if miles < best_miles:
+                            best, best_miles = node, miles
+            ring_miles = (ring * GRID_CELL_DEG) * 69.0 * math.cos(math.radians(lat))
+            if best >= 0 and ring_miles > best_miles:
+                return best, best_miles
+            ring += 1
+            if ring > 2000:
+                return best, best_miles
+
+    # ---------- Contraction ----------
+
+    def contract(self):
+        """Build the contraction hierarchy (node order, shortcuts, upward/downward graphs)"""
+        n = self.node_count
+        out_edges: List[Dict[int, Tuple[float, float]]] = [dict() for _ in range(n)]
+        in_edges: List[Dict[int, Tuple[float, float]]] = [dict() for _ in range(n)]
+        for u in range(n):
+            for e in range(self.offsets[u], self.offsets[u + 1]):
+                v = self.targets[e]
+                out_edges[u][v] = (self.seconds[e], self.meters[e])
+                in_edges[v][u] = (self.seconds[e], self.meters[e])
+
+        # All edges ever present (original + shortcuts), split by rank after ordering
+        all_edges: List[Dict[int, Tuple[float, float]]] = [dict(edges) for edges in out_edges]
+        contracted = [False] * n
+        contracted_neighbours = [0] * n
+        rank = array("I", [0] * n)
+
+        def shortcuts_for(v: int) -> List[Tuple[int, int, float, float]]:
+            shortcuts = []
+            for u, (w_in, m_in) in in_edges[v].items():
+                if contracted[u]:
+                    continue
+                targets = {
+                    x: (w_in + w_out, m_in + m_out)
+                    for x, (w_out, m_out) in out_edges[v].items()
+                    if not contracted[x] and x != u
+                }
+                if not targets:
+                    continue
+                limit = max(w for w, _ in targets.values())
+                witness = self._witness_search(out_edges, contracted, u, v, limit)
+                for x, (w, m) in targets.items():
+                    if witness.get(x, float("inf")) > w:
+                        shortcuts.append((u, x, w, m))
+            return shortcuts
+
+        def priority(v: int) -> int:
+            degree = sum(1 for u in in_edges[v] if not contracted[u]) + \
+                sum(1 for x in out_edges[v] if not contracted[x])
+            return len(shortcuts_for(v)) - degree + contracted_neighbours[v]
+
+        heap = [(priority(v), v) for v in range(n)]
+        heapq.heapify(heap)
+        order = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            if contracted[v]:
+                continue
+            # Lazy update: re-queue if the node got more expensive than the next candidate
+            current = priority(v)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, v))
+                continue
+
+            for u, x, w, m in shortcuts_for(v):
+                if x not in out_edges[u] or out_edges[u][x][0] > w:
+                    out_edges[u][x] = (w, m)
+                    in_edges[x][u] = (w, m)
+                if x not in all_edges[u] or all_edges[u][x][0] > w:
+                    all_edges[u][x] = (w, m)
+
+            contracted[v] = True
+            rank[v] = order
+            order += 1
+            for neighbour in list(in_edges[v]) + list(out_edges[v]):
+                contracted_neighbours[neighbour] += 1
+
+        self.rank = rank
+        self._split_hierarchy(all_edges)
+
+    def _witness_search(self, out_edges, contracted, source: int, skip: int, limit: float) -> Dict[int, float]:
+        """Bounded Dijkstra from source avoiding skip; used to prove shortcuts unnecessary"""
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = 0
+        while heap and settled < WITNESS_SETTLE_LIMIT:
+            d, u = heapq.heappop(heap)
+            if d > dist.get(u, float("inf")) or d > limit:
+                continue
+            settled += 1
+            for x, (w, _) in out_edges[u].items():
+                if x == skip or contracted[x]:
+                    continue
+                nd = d + w
+                if nd < dist.get(x, float("inf")):
+                    dist[x] = nd
+                    heapq.heappush(heap, (nd, x))
+        return dist
+
+    def _split_hierarchy(self, all_edges: List[Dict[int, Tuple[float, float]]]):
+        n = self.node_count
+        up: List[Dict[int, Tuple[float, float]]] = [dict() for _ in range(n)]
+        down: List[Dict[int, Tuple[float, float]]] = [dict() for _ in range(n)]
+        for u in range(n):
+            for x, edge in all_edges[u].items():
+                if self.rank[x] > self.rank[u]:
+                    up[u][x] = edge
+                else:
+                    down[x][u] = edge
+        self.up = _to_csr(n, up)
+        self.down = _to_csr(n, down)
+
+    def _save_hierarchy(self, path: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(CH_MAGIC)
+            f.write(struct.pack("<III", self.node_count, len(self.up[1]), len(self.down[1])))
+            _write_array(f, self.rank)
+            _write_csr(f, *self.up)
+            _write_csr(f, *self.down)
+        os.replace(tmp_path, path)
+
+    def _load_hierarchy(self, path: str):
+        with open(path, "rb") as f:
+            if f.read(8) != CH_MAGIC:
+                raise ValueError(f"{path} is not a contraction hierarchy file")
+            node_count, up_count, down_count = struct.unpack("<III", f.read(12))
+            if node_count != self.node_count:
+                raise ValueError(f"{path} does not match its road graph")
+            self.rank = _read_array(f, "I", node_count)
+            self.up = _read_csr(f, node_count, up_count)
+            self.down = _read_csr(f, node_count, down_count)
+
+    # ---------- Queries ----------
+
+    @staticmethod
+    def _upward_search(csr, source: int) -> Dict[int, Tuple[float, float]]:
+        """Complete Dijkstra over one direction of the hierarchy: node -> (seconds, meters)"""
+        offsets, targets, seconds, meters = csr
+        best = {source: (0.0, 0.0)}
+        heap = [(0.0, 0.0, source)]
+        while heap:
+            d, m, u = heapq.heappop(heap)
+            if d > best[u][0]:
+                continue
+            for e in range(offsets[u], offsets[u + 1]):
+                x = targets[e]
+                nd = d + seconds[e]
+                if x not in best or nd < best[x][0]:
+                    best[x] = (nd, m + meters[e])
+                    heapq.heappush(heap, (nd, m + meters[e], x))
+        return best
+
+    def many_to_many(self, sources: Sequence[int], targets: Sequence[int]) -> Tuple[List[List[float]], List[List[float]]]:
+        """
+        Bucket-based many-to-many query over the hierarchy
+        Returns (seconds, meters) matrices indexed [source][target]; unreachable pairs are inf
+        """
+        seconds, meters = [], []
+        for row_sec, row_m in self.many_to_many_rows(sources, targets):
+            seconds.append(row_sec)
+            meters.append(row_m)
+        return seconds, meters
+
+    def many_to_many_rows(self, sources: Sequence[int], targets: Sequence[int]) -> Iterator[Tuple[List[float], List[float]]]:
+        """many_to_many one source at a time: (seconds, meters) rows, so callers can stream them"""
+        if self.up is None:
+            self.contract()
+
+        buckets: Dict[int, List[Tuple[int, float, float]]] = {}
+        for t_idx, target in enumerate(targets):
+            for node, (d, m) in self._upward_search(self.down, target).items():
+                buckets.setdefault(node, []).append((t_idx, d, m))
+
+        for source in sources:
+            row_sec = [math.inf] * len(targets)
+            row_m = [math.inf] * len(targets)
+            for node, (d, m) in self._upward_search(self.up, source).items():
+                for t_idx, d2, m2 in buckets.get(node, ()):
+                    if d + d2 < row_sec[t_idx]:
+                        row_sec[t_idx] = d + d2
+                        row_m[t_idx] = m + m2
+            yield row_sec, row_m
+
+    def travel_matrix(self, origins: Sequence[Point], destinations: Sequence[Point]) -> Tuple[List[List[float]], List[List[float]]]:
+        """
+        Many-to-many (miles, minutes) between coordinates
+        Coordinates are snapped to their nearest road node; the snap hop is added at ACCESS_SPEED_MPH
+        """
+        miles, minutes = [], []
+        for row_miles, row_minutes in self.travel_matrix_rows(origins, destinations):
+            miles.append(row_miles)
+            minutes.append(row_minutes)
+        return miles, minutes
+
+    def travel_matrix_rows(self, origins: Sequence[Point], destinations: Sequence[Point]) -> Iterator[Tuple[List[float], List[float]]]:
+        """travel_matrix one origin at a time: (miles, minutes) rows; unreachable pairs are inf"""
+        origin_snaps = [self.nearest_node(lat, lon) for lat, lon in origins]
+        destination_snaps = [self.nearest_node(lat, lon) for lat, lon in destinations]
+        rows = self.many_to_many_rows(
+            [node for node, _ in origin_snaps],
+            [node for node, _ in destination_snaps]
+        )
+        for (_, access_o), (seconds, meters) in zip(origin_snaps, rows):
+            row_miles = [math.inf] * len(destinations)
+            row_minutes = [math.inf] * len(destinations)
+            for j, (_, access_d) in enumerate(destination_snaps):
+                if math.isinf(seconds[j]):
+                    continue
+                access = access_o + access_d
+                row_miles[j] = meters[j] / METERS_PER_MILE + access
+                row_minutes[j] = seconds[j] / 60.0 + access / ACCESS_SPEED_MPH * 60.0
+            yield row_miles, row_minutes
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Build and query offline road graphs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Convert node/edge CSV files to a graph file and contract it")
+    build.add_argument("nodes_csv")
+    build.add_argument("edges_csv")
+    build.add_argument("output")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        node_count, edge_count = build_graph_file(args.nodes_csv, args.edges_csv, args.output)
+        print(f"Wrote {args.output}: {node_count} nodes, {edge_count} edges")
+        started = time.perf_counter()
+        RoadGraph.load(args.output)
+        print(f"Contraction hierarchy built in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,295 @@
+"""
+Incrementally maintained analytics rollups
+Dashboards read these aggregate tables instead of scanning routes and route_nodes:
+
+- route_daily_rollups: per (day, insurance_code) route count, summed patient cost and distance
+- provider_daily_rollups: per (day, provider_id) route nodes and completed nodes
+
+The write paths apply deltas in the same transaction as the change (route created,
+node status changed, route re-optimized), as additive INSERT ... ON CONFLICT DO UPDATE
+statements, so concurrent writers never overwrite each other's counts. Days are the
+date of the stored created_at of the route (route rollups) or of the node (provider
+rollups), and plans are the insurance code snapshotted on the route when it was created;
+the write paths read both back from the database with the same expressions as the rebuild,
+so the two always agree. Rows written outside those paths (seed data, manual fixes) are
+picked up by a rebuild:
+
+    python rollups.py rebuild
+"""
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, insert, select, text, update
+from sqlalchemy.orm import Session
+
+from models import (
+    Patient, Provider, ProviderDailyRollup, Route, RouteDailyRollup, RouteNode, Service, StatusEnum
+)
+
+# Node state needed to move its counts: (day, provider_id, status)
+NodeState = Tuple[date, int, StatusEnum]
+
+
+def _as_date(value) -> date:
+    """date(created_at) as returned by the database (SQLite returns ISO strings)"""
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def route_plan():
+    """A route's plan: its snapshot, or the patient's plan for routes created before snapshots"""
+    return func.coalesce(Route.insurance_code, Patient.insurance_code)
+
+
+def _add(db: Session, model, key_columns: Tuple[str, ...], rows: Iterable[Dict[str, Any]]):
+    """Add each row's counters to the rollup row with the same key (created at zero if missing)"""
+    rows = [row for row in rows if any(value for name, value in row.items() if name not in key_columns)]
+    if not rows:
+        return
+    counters = [name for name in rows[0] if name not in key_columns]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        # Sorted keys: concurrent writers lock rollup rows in the same order
+        for row in sorted(rows, key=lambda r: tuple(r[name] for name in key_columns)):
+            stmt = dialect_insert(model).values(**row)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[getattr(model, name) for name in key_columns],
+                set_={name: getattr(model, name) + stmt.excluded[name] for name in counters}
+            ))
+        return
+
+    # Other databases: increment, then insert when the key is new
+    for row in rows:
+        key = [getattr(model, name) == row[name] for name in key_columns]
+        if not db.execute(update(model).where(*key).values(
+            **{name: getattr(model, name) + row[name] for name in counters}
+        ).execution_options(synchronize_session=False)).rowcount:
+            db.execute(insert(model).values(**row))
+
+
+def _add_routes(db: Session, day: date, insurance_code: str, routes: int, cost: float,
+                distance: Optional[float], distance_routes: int):
+    _add(db, RouteDailyRollup, ("day", "insurance_code"), [{
+        "day": day,
+        "insurance_code": insurance_code,
+        "route_count": routes,
+        "total_cost": cost,
+        "total_distance_miles": distance or 0.0,
+        "distance_route_count": distance_routes
+    }])
+
+
+def _add_nodes(db: Session, deltas: Dict[Tuple[date, int], List[int]]):
+    _add(db, ProviderDailyRollup, ("day", "provider_id"), [
+        {"day": day, "provider_id": provider_id, "node_count": nodes, "completed_count": completed}
+        for (day, provider_id), (nodes, completed) in deltas.items()
+    ])
+
+
+# ==================== Write Hooks ====================
+
+def node_states(db: Session, node_ids: Iterable[int] = (), route_id: Optional[int] = None) -> Dict[int, NodeState]:
+    """
+    Current rollup state of nodes (by id, or all nodes of a route)
+    Read after the route row is locked (bump_route_versions) and before the nodes change
+    """
+    query = select(RouteNode.id, func.date(RouteNode.created_at), Service.provider_id, RouteNode.status).join(
+        Service, Service.id == RouteNode.service_id
+    )
+    if route_id is not None:
+        query = query.where(RouteNode.route_id == route_id)
+    else:
+        node_ids = list(node_ids)
+        if not node_ids:
+            return {}
+        query = query.where(RouteNode.id.in_(node_ids))
+    return {node_id: (_as_date(day), provider_id, status)
+            for node_id, day, provider_id, status in db.execute(query)}
+
+
+def _route_day_and_plan(db: Session, route_id: int) -> Tuple[date, str]:
+    day, plan = db.execute(
+        select(func.date(Route.created_at), route_plan()).join(Patient, Patient.id == Route.patient_id)
+        .where(Route.id == route_id)
+    ).one()
+    return _as_date(day), plan
+
+
+def _route_node_counts(db: Session, route_id: int) -> Dict[Tuple[date, int], List[int]]:
+    """(day, provider_id) -> [nodes, completed nodes] of a route's current nodes"""
+    node_day = func.date(RouteNode.created_at)
+    completed = func.sum(case((RouteNode.status == StatusEnum.COMPLETED, 1), else_=0))
+    rows = db.execute(
+        select(node_day, Service.provider_id, func.count(RouteNode.id), func.coalesce(completed, 0))
+        .join(Service, Service.id == RouteNode.service_id)
+        .where(RouteNode.route_id == route_id)
+        .group_by(node_day, Service.provider_id)
+    )
+    return {(_as_date(day), provider_id): [nodes, done] for day, provider_id, nodes, done in rows}
+
+
+def record_route_created(db: Session, route_id: int, total_cost: float, total_distance: Optional[float]):
+    """A new route and its nodes (call after they are inserted, in the same transaction)"""
+    day, plan = _route_day_and_plan(db, route_id)
+    _add_routes(db, day, plan, 1, total_cost, total_distance, int(total_distance is not None))
+    _add_nodes(db, _route_node_counts(db, route_id))
+
+
+def record_status_changes(db: Session, before: Dict[int, NodeState], changes: Dict[int, StatusEnum]):
+    """Nodes whose status changed from their state in `before` to the status in `changes`"""
+    deltas: Dict[Tuple[date, int], List[int]] = defaultdict(lambda: [0, 0])
+    for node_id, new_status in changes.items():
+        if node_id not in before:
+            continue
+        day, provider_id, old_status = before[node_id]
+        completed = int(new_status == StatusEnum.COMPLETED) - int(old_status == StatusEnum.COMPLETED)
+        if completed:
+            deltas[(day, provider_id)][1] += completed
+    _add_nodes(db, deltas)
+
+
+def record_route_replaced(db: Session, route_id: int, old_cost: float, old_distance: Optional[float],
+                          old_nodes: Dict[int, NodeState], new_cost: float, new_distance: Optional[float]):
+    """
+    A re-optimized route: new totals on the route's day and plan, old nodes (node_states
+    before the change) out and the inserted new nodes in
+    """
+    day, plan = _route_day_and_plan(db, route_id)
+    _add_routes(
+        db, day, plan, 0, new_cost - old_cost,
+        (new_distance or 0.0) - (old_distance or 0.0),
+        int(new_distance is not None) - int(old_distance is not None)
+    )
+    deltas: Dict[Tuple[date, int], List[int]] = defaultdict(lambda: [0, 0])
+    for node_day, provider_id, node_status in old_nodes.values():
+        deltas[(node_day, provider_id)][0] -= 1
+        deltas[(node_day, provider_id)][1] -= int(node_status == StatusEnum.COMPLETED)
+    for key, (nodes, completed) in _route_node_counts(db, route_id).items():
+        deltas[key][0] += nodes
+        deltas[key][1] += completed
+    _add_nodes(db, deltas)
+
+
+# ==================== Rebuild ====================
+
+def rebuild_rollups(conn) -> Dict[str, int]:
+    """Recompute both rollup tables from routes and route_nodes; returns rows written"""
+    if conn.dialect.name == "postgresql":
+        # Hold off route writes (and their deltas) until the rebuilt rows commit
+        conn.execute(text("LOCK TABLE routes, route_nodes IN SHARE MODE"))
+    conn.execute(delete(RouteDailyRollup))
+    conn.execute(delete(ProviderDailyRollup))
+
+    route_day = func.date(Route.created_at)
+    plan = route_plan()
+    routes = conn.execute(insert(RouteDailyRollup).from_select(
+        ["day", "insurance_code", "route_count", "total_cost", "total_distance_miles", "distance_route_count"],
+        select(
+            route_day, plan, func.count(Route.id),
+            func.coalesce(func.sum(Route.total_cost), 0.0),
+            func.coalesce(func.sum(Route.total_distance_miles), 0.0),
+            func.count(Route.total_distance_miles)
+        ).join(Patient, Patient.id == Route.patient_id).group_by(route_day, plan)
+    )).rowcount
+
+    node_day = func.date(RouteNode.created_at)
+    completed = func.sum(case((RouteNode.status == StatusEnum.COMPLETED, 1), else_=0))
+    nodes = conn.execute(insert(ProviderDailyRollup).from_select(
+        ["day", "provider_id", "node_count", "completed_count"],
+        select(node_day, Service.provider_id, func.count(RouteNode.id), func.coalesce(completed, 0))
+        .join(Service, Service.id == RouteNode.service_id).group_by(node_day, Service.provider_id)
+    )).rowcount
+    return {"route_daily_rollups": routes, "provider_daily_rollups": nodes}
+
+
+# ==================== Queries ====================
+
+def _ratio(total: float, count: int) -> Optional[float]:
+    return round(total / count, 2) if count else None
+
+
+def routes_per_day(db: Session, since: Optional[date] = None, until: Optional[date] = None,
+                   insurance_code: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Routes, average patient cost and average distance per day in [since, until)"""
+    query = db.query(
+        RouteDailyRollup.day,
+        func.sum(RouteDailyRollup.route_count),
+        func.sum(RouteDailyRollup.total_cost),
+        func.sum(RouteDailyRollup.total_distance_miles),
+        func.sum(RouteDailyRollup.distance_route_count)
+    )
+    query = _window(query, RouteDailyRollup.day, since, until)
+    if insurance_code:
+        query = query.filter(RouteDailyRollup.insurance_code == insurance_code)
+    return [
+        {"day": day, "routes": routes, "avg_patient_cost": _ratio(cost, routes),
+         "avg_distance_miles": _ratio(distance, distance_routes)}
+        for day, routes, cost, distance, distance_routes
+        in query.group_by(RouteDailyRollup.day).order_by(RouteDailyRollup.day)
+        if routes
+    ]
+
+
+def insurance_stats(db: Session, since: Optional[date] = None, until: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Routes, average patient cost and average distance per insurance plan"""
+    query = db.query(
+        RouteDailyRollup.insurance_code,
+        func.sum(RouteDailyRollup.route_count),
+        func.sum(RouteDailyRollup.total_cost),
+        func.sum(RouteDailyRollup.total_distance_miles),
+        func.sum(RouteDailyRollup.distance_route_count)
+    )
+    query = _window(query, RouteDailyRollup.day, since, until)
+    return [
+        {"insurance_code": code, "routes": routes, "avg_patient_cost": _ratio(cost, routes),
+         "avg_distance_miles": _ratio(distance, distance_routes)}
+        for code, routes, cost, distance, distance_routes
+        in query.group_by(RouteDailyRollup.insurance_code).order_by(RouteDailyRollup.insurance_code)
+        if routes
+    ]
+
+
+def provider_stats(db: Session, since: Optional[date] = None, until: Optional[date] = None,
+                   provider_id: Optional[int] = None, limit: int = 100) -> List[Dict[str, Any]]:
+    """Route nodes, completed nodes and completion rate per provider, busiest first"""
+    node_count = func.sum(ProviderDailyRollup.node_count)
+    query = db.query(
+        ProviderDailyRollup.provider_id, Provider.name, node_count, func.sum(ProviderDailyRollup.completed_count)
+    ).join(Provider, Provider.id == ProviderDailyRollup.provider_id)
+    query = _window(query, ProviderDailyRollup.day, since, until)
+    if provider_id is not None:
+        query = query.filter(ProviderDailyRollup.provider_id == provider_id)
+    query = query.group_by(ProviderDailyRollup.provider_id, Provider.name).having(node_count > 0)
+    return [
+        {"provider_id": pid, "provider_name": name, "nodes": nodes, "completed": completed,
+         "completion_rate": round(completed / nodes, 4)}
+        for pid, name, nodes, completed
+        in query.order_by(node_count.desc(), ProviderDailyRollup.provider_id).limit(limit)
+    ]
+
+
+def _window(query, column, since: Optional[date], until: Optional[date]):
+    if since is not None:
+        query = query.filter(column >= since)
+    if until is not None:
+        query = query.filter(column < until)
+    return query
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Analytics rollups")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("rebuild", help="Recompute the rollup tables from routes and route nodes")
+    args = parser.parse_args()
+
+    with engine.begin() as connection:
+        written = rebuild_rollups(connection)
+    print(", ".join(f"{table}: {rows} rows" for table, rows in written.items()))
@@ -2,25 +2,70 @@
 FastAPI Backend Microservice for Route Optimization
 AI-powered referral route optimization with insurance eligibility verification
 """
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import and_, case, func, insert, or_, select, update
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from typing import List, Optional, Dict, Any, Literal
+from datetime import date, datetime, timedelta
+import asyncio
+from contextlib import asynccontextmanager
 import json
 import math
+import time
 import httpx
 import os
+import shutil
 from dotenv import load_dotenv
 
-from database import get_db, init_db
+from database import (
+    CONSISTENCY_COOKIE, CONSISTENCY_HEADER, READ_YOUR_WRITES_SECONDS,
+    SessionLocal, engine, get_db, get_read_db, init_db, read_session, replicas, write_token
+)
 from models import (
     Patient, Provider, Service, Route, RouteNode, 
-    AuditTrail, InsuranceProgram, StatusEnum, Base
+    AuditTrail, InsuranceProgram, Job, StatusEnum, Base, patient_identity_key
+)
+from geo import haversine_distance, patient_location_cell
+from distance_provider import DistanceProvider, get_distance_provider
+from pareto import group_services, pareto_route_search
+from coverage import covered_services
+from catalog import current_catalog_version
+from route_templates import template_cell, template_store
+from service_matcher import match_service_names, matcher_backend, trigram_match
+from provider_matrix import provider_matrix_refresher
+from admission import (
+    ADMISSION_CONCURRENCY, DEFAULT_PRIORITY, AdmissionController, AdmissionRejected, pool_concurrency,
+    register_admission_gauges, request_priority
+)
+from jobs import enqueue_job
+from fhir_import import FHIR_IMPORT_DIR, input_path
+from fhir_export import EXPORT_TYPES, export_dir, parse_since
+from transport import TRANSPORT_TIME_LIMIT_SECONDS, TRANSPORT_VAN_CAPACITY
+from audit import query_audit
+from analytics_export import EXPORT_FORMATS, PARQUET_AVAILABLE, export_filename, export_routes
+from rollups import (
+    insurance_stats, node_states, provider_stats, record_route_created, record_route_replaced,
+    record_status_changes, routes_per_day
+)
+from events import EVENT_HEARTBEAT_SECONDS, hub, publish_route_event, publish_route_events, start_listener
+from idempotency import (
+    IdempotencyConflict, ResultCache, SingleFlight, claim_idempotency_key,
+    complete_idempotency_key, release_idempotency_key, request_fingerprint, store_idempotency_response
 )
+from metrics import REQUEST_SECONDS, render_metrics, server_timing_header, stage, start_request
+from tracing import current_span, span, traced
+
+# orjson for fast response serialization (falls back to Pydantic's JSON encoder)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 # AI Service for LLM-powered recommendations
 try:
@@ -32,6 +77,11 @@ except ImportError:
 
 load_dotenv()
 
+# inline: LLM recommendations in the request; job: queued for a worker (recommendations_job_id)
+AI_RECOMMENDATIONS_MODE = os.getenv("AI_RECOMMENDATIONS_MODE", "inline").lower()
+# Largest list accepted by PUT /api/routes/node_status
+BULK_STATUS_MAX_UPDATES = int(os.getenv("BULK_STATUS_MAX_UPDATES", "1000"))
+
 app = FastAPI(
     title="ReferHarmony Route Optimizer API",
     description="AI-Powered Referral Route Optimization System",
@@ -47,13 +97,82 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+def route_template(request: Request) -> str:
+    """Route path template (e.g. /api/routes/{route_id}) to keep metric labels low-cardinality"""
+    route = request.scope.get("route")
+    if route is None:
+        for candidate in app.router.routes:
+            match, _ = candidate.matches(request.scope)
+            if match.name == "FULL":
+                route = candidate
+                break
+    return getattr(route, "path", "unmatched")
+
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """Record request latency and expose per-stage timings via Server-Timing"""
+    stages = start_request()
+    started = time.perf_counter()
+    with span("HTTP " + request.method, traceparent=request.headers.get("traceparent")) as request_span:
+        response = await call_next(request)
+        route = route_template(request)
+        request_span.update_name(f"{request.method} {route}")
+        request_span.set_attributes({
+            "http.method": request.method,
+            "http.route": route,
+            "http.target": request.url.path,
+            "http.status_code": response.status_code
+        })
+    if replicas.engines and request.method in WRITE_METHODS and response.status_code < 400:
+        # Read-your-writes: later reads by this client wait for (or skip) lagging replicas
+        token = await run_in_threadpool(write_token, getattr(request.state, "db", None))
+        response.headers[CONSISTENCY_HEADER] = token
+        response.set_cookie(CONSISTENCY_COOKIE, token, max_age=max(int(READ_YOUR_WRITES_SECONDS), 60),
+                            httponly=True, samesite="lax")
+    elapsed = time.perf_counter() - started
+    REQUEST_SECONDS.observe(elapsed, method=request.method, route=route, status=response.status_code)
+    response.headers["Server-Timing"] = server_timing_header(stages, elapsed)
+    if request_span.sampled:
+        response.headers["traceparent"] = request_span.traceparent
+    return response
+
 # Security
 security = HTTPBearer()
 
+event_listener = None
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if event_listener is not None:
+        event_listener.stop()
+    replicas.stop()
+
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
+    global event_listener
     init_db()
+    
+    # Route status events from other workers (PostgreSQL LISTEN/NOTIFY)
+    event_listener = start_listener(engine)
+    
+    # Read replica health (no-op without DATABASE_REPLICA_URLS)
+    replicas.start_health_checks()
+    
+    # Precompute the shared provider matrix (one worker builds, all workers map it)
+    matrix_dir = os.getenv("PROVIDER_MATRIX_DIR")
+    if matrix_dir and os.getenv("PROVIDER_MATRIX_BUILD_ON_STARTUP", "false").lower() == "true":
+        asyncio.create_task(provider_matrix_refresher(
+            matrix_dir,
+            get_distance_provider(),
+            float(os.getenv("PROVIDER_MATRIX_REFRESH_SECONDS", "0"))
+        ))
 
 
 # ==================== Pydantic Models ====================
@@ -67,6 +186,12 @@ class PatientInput(BaseModel):
     address: Optional[str] = None
     phone: Optional[str] = None
     email: Optional[str] = None
+    date_of_birth: Optional[date] = None
+    fhir_id: Optional[str] = Field(None, description="FHIR Patient ID; takes precedence over location matching")
+    optimization_mode: Literal["weighted", "pareto"] = Field(
+        "weighted",
+        description="'weighted' returns one fixed-weight route, 'pareto' also returns non-dominated alternatives"
+    )
 
 
 class ServiceNode(BaseModel):
@@ -78,6 +203,8 @@ class ServiceNode(BaseModel):
     covered: bool
     status: str = "Pending"
     order_index: Optional[int] = None
+    node_id: Optional[int] = None  # RouteNode id (stored routes)
+    version: Optional[int] = None  # RouteNode version, for expected_version on status updates
     service_id: Optional[int] = None
     provider_id: Optional[int] = None
     latitude: Optional[float] = None
@@ -86,6 +213,16 @@ class ServiceNode(BaseModel):
     travel_cost: Optional[float] = None
 
 
+class RouteAlternative(BaseModel):
+    """Non-dominated route alternative (member of the Pareto front)"""
+    rank: int
+    labels: List[str] = []  # e.g. "lowest_cost", "shortest_distance", "fastest"
+    route: List[ServiceNode]
+    total_patient_cost: float  # Services after coverage + travel
+    total_distance_miles: float
+    total_time_minutes: int  # Services + driving time
+
+
 class RouteResponse(BaseModel):
     """Optimized route response"""
     patient_id: str
@@ -98,12 +235,145 @@ class RouteResponse(BaseModel):
     total_estimated_time: str
     total_distance_miles: Optional[float] = None
     ai_recommendations: Optional[Dict[str, Any]] = None  # LLM-powered recommendations
+    optimization_mode: Optional[str] = None
+    alternatives: Optional[List[RouteAlternative]] = None  # Pareto front (pareto mode only)
+    recommendations_job_id: Optional[int] = None  # Set when AI recommendations run as a background job
+    version: Optional[int] = None  # Route version, for expected_version on re-optimization
+
+
+class JobRequest(BaseModel):
+    """Background job submission"""
+    kind: str  # e.g. "optimize_route", "route_recommendations", "rebuild_service_coverage"
+    payload: Dict[str, Any] = Field(default_factory=dict)
+    priority: int = 0
+    max_attempts: int = Field(5, ge=1, le=50)
+    delay_seconds: float = Field(0.0, ge=0)
+
+
+class JobResponse(BaseModel):
+    """Background job status"""
+    job_id: int
+    kind: str
+    status: str  # queued, running, succeeded, failed
+    attempts: int
+    max_attempts: int
+    run_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+    result: Optional[Any] = None
+
+
+class BatchOptimizeResponse(BaseModel):
+    """Jobs queued for a batch of optimization requests"""
+    job_ids: List[int]
+    status: str = "queued"
 
 
 class RouteUpdateRequest(BaseModel):
     """Request to update route node status"""
     status: str
     notes: Optional[str] = None
+    expected_version: Optional[int] = None  # Node version the client saw; 409 if it changed
+
+
+class NodeStatusUpdate(BaseModel):
+    """One item of a bulk node status update"""
+    route_id: int
+    node_id: int
+    status: str
+    notes: Optional[str] = None
+    expected_version: Optional[int] = None
+
+
+class NodeStatusResult(BaseModel):
+    """Outcome of one bulk node status update"""
+    route_id: int
+    node_id: int
+    success: bool
+    status: Optional[str] = None
+    version: Optional[int] = None  # New version, or the current one on a version conflict
+    error: Optional[str] = None
+
+
+class BulkNodeStatusResponse(BaseModel):
+    """Per-item results of a bulk node status update"""
+    updated: int
+    failed: int
+    results: List[NodeStatusResult]
+
+
+class AuditEntry(BaseModel):
+    """Audit trail row"""
+    id: int
+    user_id: str
+    user_role: str
+    action: str
+    entity_type: str
+    entity_id: Optional[int] = None
+    details: Optional[Any] = None
+    ip_address: Optional[str] = None
+    timestamp: Optional[datetime] = None
+
+
+class AuditQueryResponse(BaseModel):
+    """Audit rows for an entity within a time window (older months are archived)"""
+    since: datetime
+    until: Optional[datetime] = None
+    entries: List[AuditEntry]
+
+
+class FhirImportInput(BaseModel):
+    """One NDJSON file of a FHIR bulk import"""
+    type: Literal["Patient", "Organization", "Practitioner", "Location"]
+    url: str  # file:// url or path, relative to FHIR_IMPORT_DIR
+
+
+class FhirImportRequest(BaseModel):
+    """FHIR Bulk Data $import request (local NDJSON files)"""
+    inputFormat: Literal["application/fhir+ndjson", "application/ndjson"] = "application/fhir+ndjson"
+    input: List[FhirImportInput] = Field(..., min_length=1)
+
+
+class TransportAppointment(BaseModel):
+    """Booked appointment time of a route node"""
+    route_node_id: int
+    appointment_time: datetime
+
+
+class TransportPlanRequest(BaseModel):
+    """Shared van transport plan for the route nodes scheduled on a day"""
+    day: date
+    time_limit_seconds: float = Field(TRANSPORT_TIME_LIMIT_SECONDS, gt=0, le=240)  # Within the job lease
+    capacity: int = Field(TRANSPORT_VAN_CAPACITY, ge=1, le=20)
+    return_trips: bool = True
+    # From the scheduling system; omitted = the nodes' stored estimated_arrival_time
+    appointments: Optional[List[TransportAppointment]] = Field(None, max_length=20000)
+
+
+class DailyRouteStats(BaseModel):
+    """Routes created on a day (analytics rollups)"""
+    day: date
+    routes: int
+    avg_patient_cost: Optional[float] = None
+    avg_distance_miles: Optional[float] = None
+
+
+class InsuranceRouteStats(BaseModel):
+    """Routes of an insurance plan (analytics rollups)"""
+    insurance_code: str
+    routes: int
+    avg_patient_cost: Optional[float] = None
+    avg_distance_miles: Optional[float] = None
+
+
+class ProviderCompletionStats(BaseModel):
+    """Route nodes of a provider and how many were completed (analytics rollups)"""
+    provider_id: int
+    provider_name: str
+    nodes: int
+    completed: int
+    completion_rate: float
 
 
 class ReoptimizeRequest(BaseModel):
@@ -113,20 +383,11 @@ class ReoptimizeRequest(BaseModel):
     preferred_provider_ids: Optional[List[int]] = []
     max_cost: Optional[float] = None
     max_time_minutes: Optional[int] = None
+    expected_version: Optional[int] = None  # Route version the client saw; 409 if it changed
 
 
 # ==================== Helper Functions ====================
 
-def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Calculate distance between two coordinates in miles using Haversine formula"""
-    R = 3959  # Earth radius in miles
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    return R * c
-
-
 def calculate_travel_cost(distance_miles: float, cost_per_mile: float = 0.50) -> float:
     """
     Calculate travel cost based on distance
@@ -135,6 +396,7 @@ def calculate_travel_cost(distance_miles: float, cost_per_mile: float = 0.50) ->
     return round(distance_miles * cost_per_mile, 2)
 
 
+@traced("geocode_address")
 def geocode_address(address: str) -> Optional[Dict[str, float]]:
     """
     Geocode address to get latitude and longitude
@@ -159,6 +421,7 @@ def geocode_address(address: str) -> Optional[Dict[str, float]]:
             )
             if response.status_code == 200:
                 data = response.json()
+                current_span().set_attribute("geocode.resolved", bool(data))
                 if data:
                     return {
                         "latitude": float(data[0]["lat"]),
@@ -203,11 +466,13 @@ def verify_insurance_eligibility(insurance_code: str) -> Dict[str, Any]:
     })
 
 
+@traced("solver.astar")
 def optimize_route_astar(
     patient_lat: float,
     patient_lon: float,
     services: List[Service],
-    providers: List[Provider]
+    providers: List[Provider],
+    distance_provider: Optional[DistanceProvider] = None
 ) -> List[tuple]:
     """
     A* algorithm for route optimization
@@ -217,32 +482,38 @@ def optimize_route_astar(
     if not services:
         return []
     
+    # Travel matrix over patient (index 0) and providers (index k + 1)
+    distance_provider = distance_provider or get_distance_provider()
+    provider_index = {p.id: idx + 1 for idx, p in enumerate(providers)}
+    
     # Create graph nodes (services with their providers)
     nodes = []
     for service in services:
-        provider = next((p for p in providers if p.id == service.provider_id), None)
-        if provider:
+        point = provider_index.get(service.provider_id)
+        if point:
             nodes.append({
                 'service_id': service.id,
-                'provider_id': provider.id,
-                'lat': provider.location_latitude,
-                'lon': provider.location_longitude,
+                'provider_id': service.provider_id,
+                'point': point,
                 'cost': service.price,
-                'time': service.duration_minutes,
-                'service': service,
-                'provider': provider
+                'time': service.duration_minutes
             })
     
+    current_span().set_attributes({
+        "solver.mode": "weighted",
+        "solver.candidates": len(nodes),
+        "solver.providers": len(providers),
+        "distance.provider": distance_provider.name
+    })
     if not nodes:
         return []
     
-    # Start from patient location
-    start_lat, start_lon = patient_lat, patient_lon
+    matrix = distance_provider.provider_matrix((patient_lat, patient_lon), providers)
     
-    # A* algorithm implementation
+    # A* algorithm implementation (start from patient location)
     visited = set()
     path = []
-    current_lat, current_lon = start_lat, start_lon
+    current_point = 0
     
     while len(visited) < len(nodes):
         best_node = None
@@ -253,10 +524,7 @@ def optimize_route_astar(
                 continue
             
             # Calculate distance (heuristic)
-            distance = haversine_distance(
-                current_lat, current_lon,
-                node['lat'], node['lon']
-            )
+            distance = matrix.leg(current_point, node['point'])[0]
             
             # Calculate cost
             cost = node['cost']
@@ -271,14 +539,349 @@ def optimize_route_astar(
         if best_node:
             visited.add(best_node['service_id'])
             path.append((best_node['service_id'], best_node['provider_id']))
-            current_lat = best_node['lat']
-            current_lon = best_node['lon']
+            current_point = best_node['point']
         else:
             break
     
     return path
 
 
+@traced("solver.pareto")
+def optimize_route_pareto(
+    patient_lat: float,
+    patient_lon: float,
+    services: List[Service],
+    providers: List[Provider],
+    covered_service_names: List[str],
+    coverage_pct: float,
+    cost_per_mile: float,
+    max_alternatives: int = 5,
+    distance_provider: Optional[DistanceProvider] = None
+) -> List[Dict[str, Any]]:
+    """
+    Multi-objective route optimization
+    Visits one site per covered service and returns non-dominated routes
+    (patient cost, distance, total time), cheapest first
+    """
+    distance_provider = distance_provider or get_distance_provider()
+    providers_by_id = {p.id: p for p in providers}
+    point_index = {p.id: idx + 1 for idx, p in enumerate(providers)}
+    matrix = distance_provider.provider_matrix((patient_lat, patient_lon), providers)
+
+    groups = []
+    for group in group_services(services, covered_service_names).values():
+        groups.append([
+            {
+                'point': point_index[s.provider_id],
+                'service_id': s.id,
+                'provider_id': s.provider_id,
+                'cost': s.price * (1 - coverage_pct / 100.0),
+                'time': s.duration_minutes
+            }
+            for s in group if s.provider_id in providers_by_id
+        ])
+
+    front = pareto_route_search(groups, matrix.leg, cost_per_mile, max_alternatives)
+    current_span().set_attributes({
+        "solver.mode": "pareto",
+        "solver.candidates": sum(len(group) for group in groups),
+        "solver.groups": len(groups),
+        "solver.providers": len(providers),
+        "solver.alternatives": len(front),
+        "distance.provider": distance_provider.name
+    })
+    return front
+
+
+def assemble_route(
+    optimized_path: List[tuple],
+    services_by_id: Dict[int, Service],
+    providers_by_id: Dict[int, Provider],
+    patient_lat: float,
+    patient_lon: float,
+    coverage_pct: float,
+    cost_per_mile: float,
+    distance_provider: Optional[DistanceProvider] = None
+) -> Dict[str, Any]:
+    """
+    Single pass over an ordered path: one leg per stop feeds both the route node rows
+    and the response nodes, plus route totals
+    """
+    distance_provider = distance_provider or get_distance_provider()
+    patient_share = 1 - coverage_pct / 100.0
+    rows = []
+    service_nodes = []
+    total_service_cost = 0.0
+    total_travel_cost = 0.0
+    total_distance = 0.0
+    total_time = 0
+    stops = [(services_by_id[service_id], providers_by_id[provider_id]) for service_id, provider_id in optimized_path]
+    # All legs in one matrix query (one batched road-network search instead of one per stop)
+    legs = distance_provider.path_legs(
+        [(patient_lat, patient_lon)] + [(p.location_latitude, p.location_longitude) for _, p in stops]
+    )
+
+    for idx, ((service, provider), (distance, _)) in enumerate(zip(stops, legs)):
+        travel_cost = calculate_travel_cost(distance, cost_per_mile)
+        service_cost = service.price * patient_share
+
+        total_distance += distance
+        total_travel_cost += travel_cost
+        total_service_cost += service_cost
+        total_time += service.duration_minutes
+
+        rows.append({"service_id": service.id, "order_index": idx, "status": StatusEnum.PENDING})
+        # Values come straight from the DB and solver, so skip re-validation
+        service_nodes.append(ServiceNode.model_construct(
+            service_name=service.name,
+            location=provider.name,
+            price=round(service_cost, 2),
+            duration=f"{service.duration_minutes} mins",
+            covered=True,
+            status="Pending",
+            order_index=idx,
+            service_id=service.id,
+            provider_id=provider.id,
+            latitude=provider.location_latitude,
+            longitude=provider.location_longitude,
+            travel_distance_miles=round(distance, 2),
+            travel_cost=travel_cost
+        ))
+
+    return {
+        "rows": rows,
+        "nodes": service_nodes,
+        "total_service_cost": total_service_cost,
+        "total_travel_cost": total_travel_cost,
+        "total_distance": total_distance,
+        "total_time": total_time
+    }
+
+
+def format_duration(total_minutes: int) -> str:
+    """Format minutes as e.g. "1 hr 30 mins" """
+    hours = total_minutes // 60
+    minutes = total_minutes % 60
+    return f"{hours} hr {minutes} mins" if hours > 0 else f"{minutes} mins"
+
+
+def json_response(model: BaseModel) -> Response:
+    """Serialize a trusted response model without re-validating it (orjson when installed)"""
+    if ORJSON_AVAILABLE:
+        return ORJSONResponse(model.model_dump())
+    return Response(model.model_dump_json(), media_type="application/json")
+
+
+def upsert_patient(db: Session, patient_input: PatientInput, patient_lat: float, patient_lon: float) -> int:
+    """
+    Find or create the patient in one statement and return its id
+    Identity is the FHIR ID when given, otherwise insurance code + location cell + name
+    and birth date (patient_identity_key), so two people on the same plan at the same
+    address stay separate records.
+    Uses INSERT ... ON CONFLICT on PostgreSQL and SQLite, so concurrent requests
+    for the same patient cannot create duplicates.
+    """
+    birth = patient_input.date_of_birth
+    values = {
+        "fhir_id": patient_input.fhir_id,
+        "name": patient_input.name,
+        "insurance_code": patient_input.insurance_code,
+        "location_latitude": patient_lat,
+        "location_longitude": patient_lon,
+        "location_cell": patient_location_cell(patient_lat, patient_lon),
+        "identity_key": None if patient_input.fhir_id else patient_identity_key(patient_input.name, birth),
+        "address": patient_input.address,
+        "phone": patient_input.phone,
+        "email": patient_input.email,
+        "date_of_birth": datetime.combine(birth, datetime.min.time()) if birth else None
+    }
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+        stmt = dialect_insert(Patient).values(**values)
+        if patient_input.fhir_id:
+            # FHIR ID is authoritative: refresh demographics and location
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Patient.fhir_id],
+                set_={
+                    key: stmt.excluded[key]
+                    for key in ("name", "insurance_code", "location_latitude", "location_longitude",
+                                "location_cell", "address", "phone", "email")
+                } | {"updated_at": func.now()}
+            )
+        else:
+            # Same person: keep the record, only fill in contact details it lacks
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Patient.insurance_code, Patient.location_cell, Patient.identity_key],
+                index_where=Patient.fhir_id.is_(None),
+                set_={
+                    key: func.coalesce(getattr(Patient, key), stmt.excluded[key])
+                    for key in ("address", "phone", "email", "date_of_birth")
+                } | {"updated_at": func.now()}
+            )
+        patient_id = db.execute(stmt.returning(Patient.id)).scalar_one()
+        db.commit()
+        return patient_id
+
+    # Other databases: indexed lookup, then insert
+    if patient_input.fhir_id:
+        identity = Patient.fhir_id == patient_input.fhir_id
+    else:
+        identity = and_(
+            Patient.fhir_id.is_(None),
+            Patient.insurance_code == patient_input.insurance_code,
+            Patient.location_cell == values["location_cell"],
+            Patient.identity_key == values["identity_key"]
+        )
+    patient = db.query(Patient).filter(identity).first()
+    if not patient:
+        patient = Patient(**values)
+        db.add(patient)
+        db.commit()
+    return patient.id
+
+
+def query_covered_services(
+    db: Session,
+    covered_service_names: List[str],
+    insurance_code: Optional[str] = None
+) -> List[Service]:
+    """
+    Available services matching the plan's covered services
+    Uses the normalized coverage table when the plan has rows there; otherwise free-text
+    name matching (pg_trgm or the compiled automaton, see service_matcher), best match first
+    """
+    if insurance_code:
+        services = covered_services(db, insurance_code)
+        if services is not None:
+            return services
+
+    backend = matcher_backend(db)
+    if backend == "trgm":
+        services = [service for service, _ in trigram_match(db, covered_service_names)]
+    elif backend == "ilike":
+        services = query_services_ilike(db, covered_service_names)
+    else:
+        ranked = match_service_names(db, covered_service_names)
+        services = load_services_ranked(db, [service_id for service_id, _, _ in ranked])
+
+    if not services:
+        services = db.query(Service).join(Provider).filter(
+            Service.is_available == True
+        ).order_by(Service.id).limit(3).all()  # Fallback to first 3
+    return services
+
+
+def query_services_ilike(db: Session, covered_service_names: List[str]) -> List[Service]:
+    """Partial name matches as one ILIKE OR-chain (SERVICE_MATCHER=ilike)"""
+    return db.query(Service).join(Provider).filter(
+        Service.is_available == True,
+        or_(*[Service.name.ilike(f"%{name}%") for name in covered_service_names])
+    ).all()
+
+
+def load_services_ranked(db: Session, service_ids: List[int], chunk_size: int = 5000) -> List[Service]:
+    """Load services by primary key, keeping the given order"""
+    by_id = {}
+    for start in range(0, len(service_ids), chunk_size):
+        chunk = service_ids[start:start + chunk_size]
+        for service in db.query(Service).join(Provider).filter(Service.id.in_(chunk)):
+            by_id[service.id] = service
+    return [by_id[service_id] for service_id in service_ids if service_id in by_id]
+
+
+def load_template_route(db: Session, path) -> Optional[tuple]:
+    """
+    (services, providers) of a template path in stop order, or None when any stop is
+    no longer available at the same provider
+    """
+    services = load_services_ranked(db, [service_id for service_id, _ in path])
+    if len(services) != len(path):
+        return None
+    for service, (_, provider_id) in zip(services, path):
+        if not service.is_available or service.provider_id != provider_id:
+            return None
+    providers = db.query(Provider).filter(Provider.id.in_({pid for _, pid in path})).all()
+    return services, providers
+
+
+def generate_recommendations(
+    patient_info: Dict[str, Any],
+    services: List[Service],
+    providers_by_id: Dict[int, Provider],
+    eligibility: Dict[str, Any],
+    route_nodes: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """LLM recommendations for an optimized route (raises on backend errors)"""
+    available_services_data = [
+        {
+            "name": s.name,
+            "price": s.price,
+            "duration": s.duration_minutes,
+            "provider": providers_by_id[s.provider_id].name if s.provider_id in providers_by_id else "Unknown"
+        }
+        for s in services
+    ]
+    return ai_service.generate_route_recommendations(
+        patient_info=patient_info,
+        available_services=available_services_data,
+        insurance_coverage=eligibility,
+        optimized_route=[
+            {
+                "service_name": node["service_name"],
+                "location": node["location"],
+                "price": node["price"],
+                "duration": node["duration"],
+                "status": node["status"]
+            }
+            for node in route_nodes
+        ]
+    )
+
+
+def route_recommendations(db: Session, route_id: int, patient_info: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """AI recommendations for a persisted route (background job entry point)"""
+    if not AI_AVAILABLE:
+        return None
+    route = db.query(Route).options(
+        joinedload(Route.patient),
+        selectinload(Route.route_nodes).joinedload(RouteNode.service).joinedload(Service.provider)
+    ).filter(Route.id == route_id).first()
+    if not route:
+        return None
+    patient = route.patient
+    eligibility = verify_insurance_eligibility(patient.insurance_code)
+    services = query_covered_services(db, eligibility.get("covered_services", []), patient.insurance_code)
+    providers_by_id = {
+        p.id: p for p in db.query(Provider).filter(Provider.id.in_({s.provider_id for s in services}))
+    }
+    patient_share = 1 - eligibility.get("coverage_percentage", 100.0) / 100.0
+    route_nodes = [
+        {
+            "service_name": node.service.name,
+            "location": node.service.provider.name,
+            "price": round(node.service.price * patient_share, 2),
+            "duration": f"{node.service.duration_minutes} mins",
+            "status": node.status.value
+        }
+        for node in sorted(route.route_nodes, key=lambda n: n.order_index)
+    ]
+    return generate_recommendations(
+        patient_info or {
+            "name": patient.name,
+            "insurance_code": patient.insurance_code,
+            "location_latitude": patient.location_latitude,
+            "location_longitude": patient.location_longitude
+        },
+        services, providers_by_id, eligibility, route_nodes
+    )
+
+
 def log_audit_trail(
     db: Session,
     user_id: str,
@@ -287,9 +890,10 @@ def log_audit_trail(
     entity_type: str,
     entity_id: Optional[int] = None,
     details: Optional[Dict] = None,
-    ip_address: Optional[str] = None
+    ip_address: Optional[str] = None,
+    commit: bool = True
 ):
-    """Log action to audit trail for HIPAA compliance"""
+    """Log action to audit trail for HIPAA compliance (commit=False: in the caller's transaction)"""
     audit = AuditTrail(
         user_id=user_id,
         user_role=user_role,
@@ -300,7 +904,8 @@ def log_audit_trail(
         ip_address=ip_address
     )
     db.add(audit)
-    db.commit()
+    if commit:
+        db.commit()
 
 
 # ==================== API Endpoints ====================
@@ -311,18 +916,166 @@ async def health_check():
     return {"status": "healthy", "service": "route_optimizer"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics (request/stage latency, connection pool)"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# Identical optimization requests share one computation and recent results
+route_flights = SingleFlight()
+route_results = ResultCache()
+
+# Solves are admitted by priority, at most one DB connection's worth each, leaving part of the
+# pool to unadmitted work
+admission = AdmissionController(ADMISSION_CONCURRENCY or pool_concurrency(engine))
+register_admission_gauges(admission)
+
+
+def admission_priority(request: Request) -> str:
+    """Dependency: priority class from X-Request-Priority: urgent, interactive (default) or batch"""
+    return request_priority(request.headers.get("X-Request-Priority"))
+
+
+@asynccontextmanager
+async def admitted(priority: str):
+    """Hold an admission slot for the block; a rejection becomes 429 with Retry-After"""
+    try:
+        async with admission.slot(priority):
+            yield
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Route optimizer is busy ({e.reason}), retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+
 @app.post("/api/route_optimizer", response_model=RouteResponse)
 async def optimize_route(
     patient_input: PatientInput,
+    request: Request,
+    priority: str = Depends(admission_priority),
     db: Session = Depends(get_db)
 ):
     """
     Main route optimization endpoint
     Accepts patient input and returns optimized care route
+    Identical requests are coalesced and briefly cached; with an Idempotency-Key header a
+    retried request returns the route it already created. Only the solve waits for admission.
     """
+    fingerprint = request_fingerprint(patient_input.model_dump())
+    idempotency_key = request.headers.get("Idempotency-Key")
+    claim_token = None
+    if idempotency_key:
+        try:
+            stored, claim_token = claim_idempotency_key(db, idempotency_key, fingerprint)
+        except IdempotencyConflict as e:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT if e.in_progress else status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=str(e)
+            )
+        if stored is not None:
+            replayed = json.loads(stored)
+            if set(replayed) == {"route_id"}:
+                # Completed with the route, but the full response was never stored
+                response = json_response(await get_route(replayed["route_id"], db))
+            else:
+                response = Response(stored, media_type="application/json")
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+
+    try:
+        route_response, source = await solve_route_request(
+            patient_input, fingerprint, db, priority, idempotency_key, claim_token
+        )
+    except Exception:
+        if idempotency_key:
+            release_idempotency_key(db, idempotency_key, claim_token)
+        raise
+
+    response = json_response(route_response)
+    if idempotency_key:
+        store_idempotency_response(db, idempotency_key, route_response.route_id, response.body.decode())
+    if source:
+        response.headers["X-Route-Cache"] = source
+    return response
+
+
+def route_version(db: Session, route_id: int) -> Optional[int]:
+    """Current version of a route (None once it is gone)"""
+    return db.query(Route.version).filter(Route.id == route_id).scalar()
+
+
+async def solve_route_request(
+    patient_input: PatientInput,
+    fingerprint: str,
+    db: Session,
+    priority: str = DEFAULT_PRIORITY,
+    idempotency_key: Optional[str] = None,
+    claim_token: Optional[str] = None
+):
+    """
+    Route for a request fingerprint: a cached result ("hit"), the result of an identical
+    request already in flight ("shared"), or a new optimization (None)
+    A cached result is only served while its route is still at the cached version, so a
+    status update or re-optimization on any worker retires it. A new optimization holds an
+    admission slot of the given priority while it runs. A request with a claimed
+    Idempotency-Key always runs its own optimization, which completes the key in the
+    transaction that inserts the route.
+    """
+    if not idempotency_key:
+        cached = route_results.get(fingerprint, lambda route_id: route_version(db, route_id))
+        if cached is not None:
+            return cached, "hit"
+    # End the version read so the request holds no connection while it waits for the flight
+    db.rollback()
+
+    def solve():
+        # Its own session: the flight outlives the request that started it if that one is cancelled
+        with SessionLocal() as flight_db:
+            return create_optimized_route(patient_input, flight_db, idempotency_key, claim_token)
+
+    async def run():
+        async with admitted(priority):
+            result = await run_in_threadpool(solve)
+        route_results.put(fingerprint, result, result.route_id, result.version)
+        return result
+
+    flight_key = f"{fingerprint}:{idempotency_key}" if idempotency_key else fingerprint
+    result, shared = await route_flights.do(flight_key, run)
+    return result, "shared" if shared else None
+
+
+def create_optimized_route(
+    patient_input: PatientInput,
+    db: Session,
+    idempotency_key: Optional[str] = None,
+    claim_token: Optional[str] = None
+) -> RouteResponse:
+    """
+    Verify eligibility, solve, persist and explain a new route for the patient
+    An idempotency_key claimed with claim_token is completed with {"route_id": ...} in the route's
+    own transaction, so a crash after the insert cannot leave the key pending; if the claim
+    was lost meanwhile the route is rolled back and a 409 raised
+    """
+    # Catalog loads (services, providers, templates) may be served by a read replica
+    with read_session(fallback=db) as catalog_db:
+        return build_optimized_route(patient_input, db, catalog_db, idempotency_key, claim_token)
+
+
+def build_optimized_route(
+    patient_input: PatientInput,
+    db: Session,
+    catalog_db: Session,
+    idempotency_key: Optional[str] = None,
+    claim_token: Optional[str] = None
+) -> RouteResponse:
+    """create_optimized_route with catalog reads on catalog_db and writes on db"""
     try:
         # Verify insurance eligibility
-        eligibility = verify_insurance_eligibility(patient_input.insurance_code)
+        with stage("eligibility"):
+            eligibility = verify_insurance_eligibility(patient_input.insurance_code)
         
         if not eligibility.get("eligible", False):
             raise HTTPException(
@@ -334,259 +1087,218 @@ async def optimize_route(
         patient_lat = patient_input.location_latitude
         patient_lon = patient_input.location_longitude
         
-        if patient_input.address:
-            geocoded = geocode_address(patient_input.address)
-            if geocoded:
-                patient_lat = geocoded["latitude"]
-                patient_lon = geocoded["longitude"]
-                # Update patient input with geocoded coordinates
-                patient_input.location_latitude = patient_lat
-                patient_input.location_longitude = patient_lon
+        with stage("geocoding"):
+            if patient_input.address:
+                geocoded = geocode_address(patient_input.address)
+                if geocoded:
+                    patient_lat = geocoded["latitude"]
+                    patient_lon = geocoded["longitude"]
+                    # Update patient input with geocoded coordinates
+                    patient_input.location_latitude = patient_lat
+                    patient_input.location_longitude = patient_lon
         
         # Get or create patient
-        patient = db.query(Patient).filter(
-            Patient.insurance_code == patient_input.insurance_code,
-            Patient.location_latitude == patient_input.location_latitude,
-            Patient.location_longitude == patient_input.location_longitude
-        ).first()
-        
-        if not patient:
-            patient = Patient(
-                name=patient_input.name,
-                insurance_code=patient_input.insurance_code,
-                location_latitude=patient_lat,
-                location_longitude=patient_lon,
-                address=patient_input.address,
-                phone=patient_input.phone,
-                email=patient_input.email
-            )
-            db.add(patient)
-            db.commit()
-            db.refresh(patient)
+        with stage("patient_upsert"):
+            patient_id = upsert_patient(db, patient_input, patient_lat, patient_lon)
         
         # Get covered services from insurance
         covered_service_names = eligibility.get("covered_services", [])
         
-        # Query available services that match covered services
-        # First try exact matches, then partial matches
-        services = db.query(Service).join(Provider).filter(
-            Service.is_available == True,
-            or_(*[Service.name.ilike(f"%{name}%") for name in covered_service_names])
-        ).all()
+        # Reuse the route already solved for this plan and neighbourhood (weighted mode)
+        template_key = None
+        template_route = None
+        if template_store.enabled and patient_input.optimization_mode == "weighted":
+            with stage("template"):
+                template_key = (
+                    template_cell(patient_lat, patient_lon),
+                    patient_input.insurance_code,
+                    current_catalog_version(catalog_db)
+                )
+                template_path = template_store.lookup(catalog_db, template_key)
+                if template_path:
+                    template_route = load_template_route(catalog_db, template_path)
+                    if template_route is None:
+                        template_store.forget(template_key)
+                current_span().set_attribute("route.template", "hit" if template_route else "miss")
         
-        # If no services found, try broader search
-        if not services:
-            # Try matching by service name keywords
-            all_services = db.query(Service).join(Provider).filter(
-                Service.is_available == True
-            ).all()
+        if template_route:
+            services, providers = template_route
+        else:
+            # Query available services that match covered services
+            with stage("service_query"):
+                services = query_covered_services(catalog_db, covered_service_names, patient_input.insurance_code)
             
-            # Filter services that might match
-            matched_services = []
-            for service in all_services:
-                service_lower = service.name.lower()
-                for covered in covered_service_names:
-                    if covered.lower() in service_lower or service_lower in covered.lower():
-                        matched_services.append(service)
-                        break
+                if not services:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail="No available services found. Please seed the database with providers and services."
+                    )
             
-            services = matched_services if matched_services else all_services[:3]  # Fallback to first 3
-        
-        if not services:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="No available services found. Please seed the database with providers and services."
-            )
-        
-        # Get providers for these services
-        provider_ids = [s.provider_id for s in services]
-        providers = db.query(Provider).filter(Provider.id.in_(provider_ids)).all()
-        
-        # Optimize route using A* algorithm (use geocoded coordinates if available)
-        optimized_path = optimize_route_astar(
-            patient_lat,
-            patient_lon,
-            services,
-            providers
-        )
+                # Get providers for these services
+                provider_ids = [s.provider_id for s in services]
+                providers = catalog_db.query(Provider).filter(Provider.id.in_(provider_ids)).all()
         
         # Get travel cost per mile from environment (default $0.50/mile)
         travel_cost_per_mile = float(os.getenv("TRAVEL_COST_PER_MILE", "0.50"))
-        
-        # Create route in database
-        total_service_cost = 0.0
-        total_travel_cost = 0.0
-        total_time = 0
-        total_distance = 0.0
-        
-        route = Route(
-            patient_id=patient.id,
-            total_cost=0.0,
-            total_time_minutes=0,
-            status="Pending"
-        )
-        db.add(route)
-        db.commit()
-        db.refresh(route)
-        
-        # Create route nodes
-        route_nodes = []
-        current_lat = patient_lat
-        current_lon = patient_lon
-        
-        for order_idx, (service_id, provider_id) in enumerate(optimized_path):
-            service = next(s for s in services if s.id == service_id)
-            provider = next(p for p in providers if p.id == provider_id)
-            
-            # Calculate distance from current location to provider
-            distance = haversine_distance(
-                current_lat, current_lon,
-                provider.location_latitude, provider.location_longitude
-            )
-            total_distance += distance
-            
-            # Calculate travel cost for this segment
-            segment_travel_cost = calculate_travel_cost(distance, travel_cost_per_mile)
-            total_travel_cost += segment_travel_cost
-            
-            # Calculate service cost (apply insurance coverage)
-            coverage_pct = eligibility.get("coverage_percentage", 100.0)
-            patient_service_cost = service.price * (1 - coverage_pct / 100.0)
-            total_service_cost += patient_service_cost
-            
-            total_time += service.duration_minutes
-            
-            route_node = RouteNode(
-                route_id=route.id,
-                service_id=service.id,
-                order_index=order_idx,
-                status=StatusEnum.PENDING
+        coverage_pct = eligibility.get("coverage_percentage", 100.0)
+        distance_provider = get_distance_provider()
+
+        with stage("solve"):
+            front = None
+            if patient_input.optimization_mode == "pareto":
+                # Pareto front of non-dominated routes; the cheapest one is persisted
+                front = optimize_route_pareto(
+                    patient_lat,
+                    patient_lon,
+                    services,
+                    providers,
+                    covered_service_names,
+                    coverage_pct,
+                    travel_cost_per_mile,
+                    distance_provider=distance_provider
+                )
+                optimized_path = front[0]["path"] if front else []
+            elif template_route:
+                # Same stop order; legs are recomputed from the exact location on assembly
+                optimized_path = list(template_path)
+            else:
+                # Optimize route using A* algorithm (use geocoded coordinates if available)
+                optimized_path = optimize_route_astar(
+                    patient_lat,
+                    patient_lon,
+                    services,
+                    providers,
+                    distance_provider=distance_provider
+                )
+                if template_key:
+                    template_store.store(db, template_key, optimized_path)
+
+        # Compute legs once for the node rows, the response and the route totals
+        with stage("assemble"):
+            services_by_id = {s.id: s for s in services}
+            providers_by_id = {p.id: p for p in providers}
+            assembled = assemble_route(
+                optimized_path, services_by_id, providers_by_id,
+                patient_lat, patient_lon, coverage_pct, travel_cost_per_mile,
+                distance_provider=distance_provider
             )
-            db.add(route_node)
-            route_nodes.append(route_node)
-            
-            current_lat = provider.location_latitude
-            current_lon = provider.location_longitude
-        
-        # Calculate total cost (services + travel)
-        total_cost = total_service_cost + total_travel_cost
-        
-        # Update route totals
-        route.total_cost = total_cost
-        route.total_time_minutes = total_time
-        route.total_distance_miles = total_distance
-        db.commit()
-        
-        # Build response with travel costs
-        service_nodes = []
-        current_lat_resp = patient_lat
-        current_lon_resp = patient_lon
-        
-        for idx, (service_id, provider_id) in enumerate(optimized_path):
-            service = next(s for s in services if s.id == service_id)
-            provider = next(p for p in providers if p.id == provider_id)
-            
-            # Calculate distance from current location to this provider
-            node_distance = haversine_distance(
-                current_lat_resp, current_lon_resp,
-                provider.location_latitude, provider.location_longitude
+            service_nodes = assembled["nodes"]
+            total_service_cost = assembled["total_service_cost"]
+            total_travel_cost = assembled["total_travel_cost"]
+            total_distance = assembled["total_distance"]
+            total_time = assembled["total_time"]
+            total_cost = total_service_cost + total_travel_cost
+
+            alternatives = None
+            if front is not None:
+                alternatives = []
+                for rank, alt in enumerate(front, 1):
+                    alt_nodes = assemble_route(
+                        alt["path"], services_by_id, providers_by_id,
+                        patient_lat, patient_lon, coverage_pct, travel_cost_per_mile,
+                        distance_provider=distance_provider
+                    )["nodes"]
+                    alternatives.append(RouteAlternative.model_construct(
+                        rank=rank,
+                        labels=alt["labels"],
+                        route=alt_nodes,
+                        total_patient_cost=round(alt["patient_cost"], 2),
+                        total_distance_miles=round(alt["distance_miles"], 2),
+                        total_time_minutes=round(alt["time_minutes"])
+                    ))
+
+        # Create route and its nodes in one transaction
+        with stage("persistence"):
+            route = Route(
+                patient_id=patient_id,
+                insurance_code=patient_input.insurance_code,
+                total_cost=total_cost,
+                total_time_minutes=total_time,
+                total_distance_miles=total_distance,
+                status="Pending"
             )
-            
-            # Calculate travel cost for this segment
-            node_travel_cost = calculate_travel_cost(node_distance, travel_cost_per_mile)
-            
-            # Calculate service cost
-            node_service_cost = round(service.price * (1 - eligibility.get("coverage_percentage", 100.0) / 100.0), 2)
-            
-            # Update current location for next iteration
-            current_lat_resp = provider.location_latitude
-            current_lon_resp = provider.location_longitude
-            
-            service_nodes.append(ServiceNode(
-                service_name=service.name,
-                location=provider.name,
-                price=node_service_cost,
-                duration=f"{service.duration_minutes} mins",
-                covered=True,
-                status="Pending",
-                order_index=idx,
-                service_id=service.id,
-                provider_id=provider.id,
-                latitude=provider.location_latitude,
-                longitude=provider.location_longitude,
-                travel_distance_miles=round(node_distance, 2),
-                travel_cost=node_travel_cost
-            ))
+            db.add(route)
+            db.flush()
+            route_id = route.id
+            route_version = route.version
+            if assembled["rows"]:
+                db.execute(insert(RouteNode), [{**row, "route_id": route_id} for row in assembled["rows"]])
+            record_route_created(db, route_id, total_cost, total_distance)
+            if idempotency_key and not complete_idempotency_key(
+                db, idempotency_key, claim_token, route_id, json.dumps({"route_id": route_id}), commit=False
+            ):
+                db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="The Idempotency-Key claim lapsed before the route was saved; retry the request"
+                )
+            db.commit()
         
         # Get AI recommendations if available
-        ai_recommendations = None
-        if AI_AVAILABLE:
-            try:
+        with stage("llm"):
+            ai_recommendations = None
+            recommendations_job_id = None
+            if AI_AVAILABLE:
                 patient_info = {
                     "name": patient_input.name,
                     "insurance_code": patient_input.insurance_code,
                     "location_latitude": patient_input.location_latitude,
                     "location_longitude": patient_input.location_longitude
                 }
-                
-                available_services_data = [
-                    {
-                        "name": s.name,
-                        "price": s.price,
-                        "duration": s.duration_minutes,
-                        "provider": next((p.name for p in providers if p.id == s.provider_id), "Unknown")
-                    }
-                    for s in services
-                ]
-                
-                ai_recommendations = ai_service.generate_route_recommendations(
-                    patient_info=patient_info,
-                    available_services=available_services_data,
-                    insurance_coverage=eligibility,
-                    optimized_route=[
-                        {
-                            "service_name": node.service_name,
-                            "location": node.location,
-                            "price": node.price,
-                            "duration": node.duration,
-                            "status": node.status
-                        }
-                        for node in service_nodes
-                    ]
-                )
-            except Exception as e:
-                print(f"AI recommendations error: {e}")
-                ai_recommendations = None
+                if AI_RECOMMENDATIONS_MODE == "job":
+                    # Generated by a job worker; clients poll GET /api/jobs/{id}
+                    recommendations_job_id = enqueue_job(
+                        db, "route_recommendations", {"route_id": route_id, "patient_info": patient_info}
+                    ).id
+                else:
+                    try:
+                        ai_recommendations = generate_recommendations(
+                            patient_info, services, providers_by_id, eligibility,
+                            [node.model_dump() for node in service_nodes]
+                        )
+                    except Exception as e:
+                        print(f"AI recommendations error: {e}")
+                        ai_recommendations = None
         
-        # Log audit trail
-        log_audit_trail(
-            db=db,
-            user_id=f"patient_{patient.id}",
-            user_role="patient",
-            action="route_created",
-            entity_type="Route",
-            entity_id=route.id,
-            details={"insurance_code": patient_input.insurance_code, "ai_used": AI_AVAILABLE}
-        )
+        # Structured Pareto alternatives replace the LLM's free-text suggestions
+        if alternatives is not None and ai_recommendations is not None:
+            ai_recommendations["alternatives"] = [alt.model_dump() for alt in alternatives]
         
-        # Format total time
-        hours = total_time // 60
-        minutes = total_time % 60
-        time_str = f"{hours} hr {minutes} mins" if hours > 0 else f"{minutes} mins"
+        # Log audit trail
+        with stage("audit"):
+            log_audit_trail(
+                db=db,
+                user_id=f"patient_{patient_id}",
+                user_role="patient",
+                action="route_created",
+                entity_type="Route",
+                entity_id=route_id,
+                details={
+                    "insurance_code": patient_input.insurance_code,
+                    "ai_used": AI_AVAILABLE,
+                    "optimization_mode": patient_input.optimization_mode
+                }
+            )
         
-        return RouteResponse(
-            patient_id=f"P{patient.id}",
-            route_id=route.id,
+        return RouteResponse.model_construct(
+            patient_id=f"P{patient_id}",
+            route_id=route_id,
             insurance_code=patient_input.insurance_code,
             route=service_nodes,
             total_estimated_cost=round(total_cost, 2),
             total_service_cost=round(total_service_cost, 2),
             total_travel_cost=round(total_travel_cost, 2),
-            total_estimated_time=time_str,
+            total_estimated_time=format_duration(total_time),
             total_distance_miles=round(total_distance, 2),
-            ai_recommendations=ai_recommendations
+            ai_recommendations=ai_recommendations,
+            optimization_mode=patient_input.optimization_mode,
+            alternatives=alternatives,
+            recommendations_job_id=recommendations_job_id,
+            version=route_version
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -594,13 +1306,282 @@ async def optimize_route(
         )
 
 
+# ==================== Background Jobs ====================
+
+def job_response(job: Job) -> JobResponse:
+    return JobResponse(
+        job_id=job.id,
+        kind=job.kind,
+        status=job.status,
+        attempts=job.attempts,
+        max_attempts=job.max_attempts,
+        run_at=job.run_at,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+        last_error=job.last_error,
+        result=json.loads(job.result) if job.result else None
+    )
+
+
+@app.post("/api/jobs", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_job(job_request: JobRequest, db: Session = Depends(get_db)):
+    """Queue a background job for the worker processes (python jobs.py worker)"""
+    try:
+        job = enqueue_job(
+            db, job_request.kind, job_request.payload, job_request.priority,
+            job_request.max_attempts, job_request.delay_seconds
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return job_response(job)
+
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: int, db: Session = Depends(get_read_db)):
+    """Status and result of a background job"""
+    job = db.get(Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(job)
+
+
+@app.get("/api/jobs", response_model=List[JobResponse])
+async def list_jobs(
+    status_filter: Optional[str] = Query(None, alias="status"),
+    kind: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_read_db)
+):
+    """Most recent jobs, optionally filtered by status and kind"""
+    query = db.query(Job)
+    if status_filter:
+        query = query.filter(Job.status == status_filter)
+    if kind:
+        query = query.filter(Job.kind == kind)
+    return [job_response(job) for job in query.order_by(Job.id.desc()).limit(limit)]
+
+
+@app.post("/api/route_optimizer/batch", response_model=BatchOptimizeResponse, status_code=status.HTTP_202_ACCEPTED)
+async def optimize_route_batch(
+    patient_inputs: List[PatientInput],
+    priority: int = 0,
+    db: Session = Depends(get_db)
+):
+    """Queue one optimize_route job per patient; poll GET /api/jobs/{id} for the route ids"""
+    jobs = [
+        enqueue_job(db, "optimize_route", patient_input.model_dump(), priority, commit=False)
+        for patient_input in patient_inputs
+    ]
+    db.commit()
+    return BatchOptimizeResponse(job_ids=[job.id for job in jobs])
+
+
+@app.post("/api/fhir/$import", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def fhir_import(import_request: FhirImportRequest, response: Response, db: Session = Depends(get_db)):
+    """
+    Queue a FHIR bulk import of Patient/Organization/Practitioner/Location NDJSON files
+    Poll the job (Content-Location) for per-file counts and throughput
+    """
+    inputs = [item.model_dump() for item in import_request.input]
+    for item in inputs:
+        try:
+            path = input_path(item["url"], FHIR_IMPORT_DIR)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        if not os.path.isfile(path):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{item['url']} not found")
+    job = enqueue_job(db, "fhir_import", {"input": inputs}, max_attempts=3)
+    response.headers["Content-Location"] = f"/api/jobs/{job.id}"
+    return job_response(job)
+
+
+@app.post("/api/transport/plans", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def plan_transport(plan_request: TransportPlanRequest, response: Response, db: Session = Depends(get_db)):
+    """
+    Queue shared van routes for a day's scheduled route nodes (pickups and drop-offs under
+    capacity and time windows); the job result lists each van's timed stops
+    """
+    job = enqueue_job(db, "plan_transport", plan_request.model_dump(mode="json"), max_attempts=2)
+    response.headers["Content-Location"] = f"/api/jobs/{job.id}"
+    return job_response(job)
+
+
+def operation_outcome(status_code: int, diagnostics: str) -> Response:
+    """FHIR OperationOutcome error response"""
+    return Response(json.dumps({
+        "resourceType": "OperationOutcome",
+        "issue": [{"severity": "error", "code": "processing", "diagnostics": diagnostics}]
+    }), status_code=status_code, media_type="application/fhir+json")
+
+
+@app.get("/api/fhir/$export")
+async def fhir_export(
+    request: Request,
+    type_filter: Optional[str] = Query(None, alias="_type"),
+    since: Optional[str] = Query(None, alias="_since"),
+    db: Session = Depends(get_db)
+):
+    """
+    Kick off a FHIR bulk export of routes (CarePlan, ServiceRequest); 202 with the status
+    URL in Content-Location. _since exports only routes changed since that instant.
+    """
+    types = [t.strip() for t in type_filter.split(",") if t.strip()] if type_filter else list(EXPORT_TYPES)
+    unknown = sorted(set(types) - set(EXPORT_TYPES))
+    if unknown:
+        return operation_outcome(400, f"Unsupported _type: {', '.join(unknown)} (supported: {', '.join(EXPORT_TYPES)})")
+    try:
+        parse_since(since)
+    except ValueError:
+        return operation_outcome(400, f"Invalid _since: {since}")
+    job = enqueue_job(db, "fhir_export", {"types": types, "since": since, "request": str(request.url)}, max_attempts=3)
+    return Response(status_code=status.HTTP_202_ACCEPTED, headers={"Content-Location": f"/api/fhir/$export/{job.id}"})
+
+
+def export_job(db: Session, job_id: int) -> Job:
+    job = db.get(Job, job_id)
+    if job is None or job.kind != "fhir_export":
+        raise HTTPException(status_code=404, detail="Export not found")
+    return job
+
+
+@app.get("/api/fhir/$export/{job_id}")
+async def fhir_export_status(job_id: int, request: Request, db: Session = Depends(get_read_db)):
+    """Export status: 202 while running (X-Progress), then the Bulk Data manifest"""
+    job = export_job(db, job_id)
+    if job.status in ("queued", "running"):
+        return Response(status_code=status.HTTP_202_ACCEPTED,
+                        headers={"X-Progress": f"{job.status} (attempt {job.attempts})", "Retry-After": "5"})
+    if job.status != "succeeded":
+        return operation_outcome(500, job.last_error or "Export failed")
+    manifest = json.loads(job.result)
+    base = str(request.base_url).rstrip("/")
+    manifest["output"] = [
+        {**item, "url": f"{base}/api/fhir/$export/{job_id}/{item['url']}"} for item in manifest["output"]
+    ]
+    return manifest
+
+
+@app.get("/api/fhir/$export/{job_id}/{file_name}")
+async def fhir_export_file(job_id: int, file_name: str, db: Session = Depends(get_read_db)):
+    """One NDJSON output file of a finished export (gzip content encoding)"""
+    job = export_job(db, job_id)
+    outputs = {item["url"] for item in json.loads(job.result)["output"]} if job.status == "succeeded" else set()
+    path = os.path.join(export_dir(job_id), file_name)
+    if file_name not in outputs or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Export file not found")
+    return FileResponse(path, media_type="application/fhir+ndjson", headers={"Content-Encoding": "gzip"})
+
+
+@app.delete("/api/fhir/$export/{job_id}", status_code=status.HTTP_202_ACCEPTED)
+async def fhir_export_delete(job_id: int, db: Session = Depends(get_db)):
+    """Delete a finished export's files"""
+    job = export_job(db, job_id)
+    if job.status in ("queued", "running"):
+        raise HTTPException(status_code=409, detail="Export is still running")
+    shutil.rmtree(export_dir(job_id), ignore_errors=True)
+    return Response(status_code=status.HTTP_202_ACCEPTED)
+
+
+@app.get("/api/audit", response_model=AuditQueryResponse)
+async def get_audit_trail(
+    entity_type: str,
+    entity_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    action: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Audit trail of an entity, newest first (compliance queries)
+    since defaults to AUDIT_QUERY_DEFAULT_DAYS ago; the window limits the partitions scanned
+    """
+    rows, since = query_audit(db, entity_type, entity_id, since, until, action, limit)
+    return AuditQueryResponse(since=since, until=until, entries=[
+        AuditEntry(
+            id=row.id,
+            user_id=row.user_id,
+            user_role=row.user_role,
+            action=row.action,
+            entity_type=row.entity_type,
+            entity_id=row.entity_id,
+            details=json.loads(row.details) if row.details else None,
+            ip_address=row.ip_address,
+            timestamp=row.timestamp
+        )
+        for row in rows
+    ])
+
+
+@app.get("/api/analytics/routes/export")
+async def export_routes_endpoint(
+    export_format: Literal["csv", "parquet"] = Query("csv", alias="format"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    insurance_code: Optional[str] = None
+):
+    """
+    Routes created in [since, until), one row per route node with its service and provider
+    Streamed from a server-side cursor (a replica when configured) as chunked CSV or Parquet
+    """
+    if export_format == "parquet" and not PARQUET_AVAILABLE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Parquet export needs pyarrow")
+
+    def stream():
+        # Own session: the stream outlives the request's dependencies
+        with read_session() as db:
+            yield from export_routes(db, export_format, since, until, insurance_code)
+
+    return StreamingResponse(
+        stream(),
+        media_type=EXPORT_FORMATS[export_format][0],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(export_format)}"'}
+    )
+
+
+@app.get("/api/analytics/routes_per_day", response_model=List[DailyRouteStats])
+async def analytics_routes_per_day(
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    insurance_code: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Routes, average patient cost and average distance per day in [since, until) (rollups only)"""
+    return routes_per_day(db, since, until, insurance_code)
+
+
+@app.get("/api/analytics/insurance", response_model=List[InsuranceRouteStats])
+async def analytics_insurance(
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Routes, average patient cost and average distance per insurance plan (rollups only)"""
+    return insurance_stats(db, since, until)
+
+
+@app.get("/api/analytics/providers", response_model=List[ProviderCompletionStats])
+async def analytics_providers(
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    provider_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_read_db)
+):
+    """Completion rate per provider, busiest first (rollups only)"""
+    return provider_stats(db, since, until, provider_id, limit)
+
+
 @app.get("/api/routes/{route_id}", response_model=RouteResponse)
 async def get_route(
     route_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get route by ID"""
-    route = db.query(Route).filter(Route.id == route_id).first()
+    route = db.query(Route).options(
+        joinedload(Route.patient),
+        selectinload(Route.route_nodes).joinedload(RouteNode.service).joinedload(Service.provider)
+    ).filter(Route.id == route_id).first()
     if not route:
         raise HTTPException(status_code=404, detail="Route not found")
     
@@ -609,23 +1590,21 @@ async def get_route(
     
     # Get travel cost per mile
     travel_cost_per_mile = float(os.getenv("TRAVEL_COST_PER_MILE", "0.50"))
+    distance_provider = get_distance_provider()
     
     # Calculate travel costs for each node
-    current_lat = patient.location_latitude
-    current_lon = patient.location_longitude
     total_service_cost = 0.0
     total_travel_cost = 0.0
+    nodes = sorted(route.route_nodes, key=lambda n: n.order_index)
+    legs = distance_provider.path_legs(
+        [(patient.location_latitude, patient.location_longitude)]
+        + [(n.service.provider.location_latitude, n.service.provider.location_longitude) for n in nodes]
+    )
     
-    for node in sorted(route.route_nodes, key=lambda n: n.order_index):
+    for node, (distance, _) in zip(nodes, legs):
         service = node.service
         provider = service.provider
         
-        # Calculate distance
-        distance = haversine_distance(
-            current_lat, current_lon,
-            provider.location_latitude, provider.location_longitude
-        )
-        
         # Calculate travel cost
         node_travel_cost = calculate_travel_cost(distance, travel_cost_per_mile)
         total_travel_cost += node_travel_cost
@@ -634,7 +1613,7 @@ async def get_route(
         node_service_cost = service.price * 0.2
         total_service_cost += node_service_cost
         
-        service_nodes.append(ServiceNode(
+        service_nodes.append(ServiceNode.model_construct(
             service_name=service.name,
             location=provider.name,
             price=round(node_service_cost, 2),
@@ -642,6 +1621,8 @@ async def get_route(
             covered=True,
             status=node.status.value,
             order_index=node.order_index,
+            node_id=node.id,
+            version=node.version,
             service_id=service.id,
             provider_id=provider.id,
             latitude=provider.location_latitude,
@@ -649,16 +1630,8 @@ async def get_route(
             travel_distance_miles=round(distance, 2),
             travel_cost=node_travel_cost
         ))
-        
-        # Update current location
-        current_lat = provider.location_latitude
-        current_lon = provider.location_longitude
     
-    hours = route.total_time_minutes // 60
-    minutes = route.total_time_minutes % 60
-    time_str = f"{hours} hr {minutes} mins" if hours > 0 else f"{minutes} mins"
-    
-    return RouteResponse(
+    return json_response(RouteResponse.model_construct(
         patient_id=f"P{patient.id}",
         route_id=route.id,
         insurance_code=patient.insurance_code,
@@ -666,9 +1639,109 @@ async def get_route(
         total_estimated_cost=route.total_cost,
         total_service_cost=round(total_service_cost, 2),
         total_travel_cost=round(total_travel_cost, 2),
-        total_estimated_time=time_str,
-        total_distance_miles=route.total_distance_miles
-    )
+        total_estimated_time=format_duration(route.total_time_minutes),
+        total_distance_miles=route.total_distance_miles,
+        version=route.version
+    ))
+
+
+# ==================== Route Events ====================
+
+def route_exists(route_id: int) -> bool:
+    """Short-lived lookup, so long-lived event streams do not hold a pooled connection"""
+    with SessionLocal() as db:
+        return db.query(Route.id).filter(Route.id == route_id).first() is not None
+
+
+@app.get("/api/routes/{route_id}/events")
+async def route_events_stream(route_id: int, request: Request):
+    """
+    Server-Sent Events stream of status deltas for a route
+    Events: node_status, route_updated, resync (the client fell behind; refetch the route)
+    """
+    if not route_exists(route_id):
+        raise HTTPException(status_code=404, detail="Route not found")
+    subscription = hub.subscribe(route_id)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                event = await subscription.get(EVENT_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+@app.websocket("/ws/routes/{route_id}")
+async def route_events_socket(websocket: WebSocket, route_id: int):
+    """WebSocket stream of status deltas for a route (same events as the SSE stream)"""
+    if not route_exists(route_id):
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    subscription = hub.subscribe(route_id)
+
+    async def wait_closed():
+        # Clients do not send anything; reading only notices the close
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    closed = asyncio.ensure_future(wait_closed())
+    try:
+        await websocket.send_json({"type": "subscribed", "route_id": route_id})
+        while True:
+            getter = asyncio.ensure_future(subscription.get(EVENT_HEARTBEAT_SECONDS))
+            await asyncio.wait({getter, closed}, return_when=asyncio.FIRST_COMPLETED)
+            if closed.done():
+                getter.cancel()
+                break
+            await websocket.send_json(getter.result() or {"type": "heartbeat", "route_id": route_id})
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        closed.cancel()
+        hub.unsubscribe(subscription)
+
+
+def node_state(node: RouteNode) -> Dict[str, Any]:
+    """Current state of a node, as returned with 409 responses"""
+    return {
+        "node_id": node.id,
+        "route_id": node.route_id,
+        "order_index": node.order_index,
+        "status": node.status.value if node.status else None,
+        "notes": node.notes,
+        "version": node.version
+    }
+
+
+def route_conflict(db: Session, route_id: int) -> HTTPException:
+    """409 carrying the route's current version and node states (404 if it is gone)"""
+    route = db.query(Route).filter(Route.id == route_id).first()
+    if not route:
+        return HTTPException(status_code=404, detail="Route not found")
+    nodes = db.query(RouteNode).filter(RouteNode.route_id == route_id).order_by(RouteNode.order_index).all()
+    return HTTPException(status_code=409, detail={
+        "message": "Route was modified; retry with the current version",
+        "current": {"route_id": route.id, "version": route.version, "route": [node_state(n) for n in nodes]}
+    })
+
+
+def bump_route_versions(db: Session, route_ids: List[int]) -> int:
+    """Increment the version of routes whose nodes change; returns routes found"""
+    return db.execute(
+        update(Route).where(Route.id.in_(route_ids)).values(version=Route.version + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
 
 
 @app.put("/api/routes/{route_id}/update_node_status")
@@ -678,75 +1751,263 @@ async def update_node_status(
     update_request: RouteUpdateRequest,
     db: Session = Depends(get_db)
 ):
-    """Update status of a route node (for provider dashboard)"""
-    route = db.query(Route).filter(Route.id == route_id).first()
-    if not route:
-        raise HTTPException(status_code=404, detail="Route not found")
-    
-    node = db.query(RouteNode).filter(
-        RouteNode.id == node_id,
-        RouteNode.route_id == route_id
-    ).first()
-    
-    if not node:
-        raise HTTPException(status_code=404, detail="Route node not found")
-    
-    # Update status
+    """
+    Update status of a route node (for provider dashboard)
+    With expected_version, the update only applies if the node is still at that version;
+    otherwise 409 with the node's current state.
+    """
     try:
-        node.status = StatusEnum(update_request.status)
+        node_status = StatusEnum(update_request.status)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid status")
     
-    if update_request.notes:
-        node.notes = update_request.notes
+    # Route row first, then its nodes: the same lock order as reoptimize_route
+    if not bump_route_versions(db, [route_id]):
+        raise HTTPException(status_code=404, detail="Route not found")
     
-    if update_request.status == "Completed":
-        node.actual_completion_time = datetime.utcnow()
+    values = {"status": node_status, "version": RouteNode.version + 1}
+    if update_request.notes:
+        values["notes"] = update_request.notes
+    if node_status == StatusEnum.COMPLETED:
+        values["actual_completion_time"] = datetime.utcnow()
     
-    db.commit()
-    db.refresh(node)
+    conditions = [RouteNode.id == node_id, RouteNode.route_id == route_id]
+    if update_request.expected_version is not None:
+        conditions.append(RouteNode.version == update_request.expected_version)
+    before = node_states(db, [node_id])
+    if not db.execute(update(RouteNode).where(*conditions).values(**values)
+                      .execution_options(synchronize_session=False)).rowcount:
+        db.rollback()
+        node = db.query(RouteNode).filter(RouteNode.id == node_id, RouteNode.route_id == route_id).first()
+        if not node:
+            raise HTTPException(status_code=404, detail="Route node not found")
+        raise HTTPException(status_code=409, detail={
+            "message": "Route node was modified; retry with the current version",
+            "current": node_state(node)
+        })
     
-    # Log audit trail
     log_audit_trail(
         db=db,
         user_id="provider",
         user_role="provider",
         action="node_status_updated",
         entity_type="RouteNode",
-        entity_id=node.id,
-        details={"status": update_request.status, "route_id": route_id}
+        entity_id=node_id,
+        details={"status": update_request.status, "route_id": route_id},
+        commit=False
     )
+    record_status_changes(db, before, {node_id: node_status})
+    node = db.query(RouteNode).filter(RouteNode.id == node_id).one()
+    state = node_state(node)
+    new_route_version = route_version(db, route_id)
+    db.commit()
+    route_results.invalidate_route(route_id)
+    publish_route_event(db, {
+        "type": "node_status",
+        "route_id": route_id,
+        "node_id": node_id,
+        "order_index": state["order_index"],
+        "status": state["status"],
+        "notes": state["notes"],
+        "version": state["version"],
+        "route_version": new_route_version
+    })
     
-    return {"success": True, "message": "Node status updated", "node_id": node.id}
+    return {"success": True, "message": "Node status updated", "node_id": node_id, "version": state["version"],
+            "route_version": new_route_version}
+
+
+def apply_node_status_updates(db: Session, updates: List[NodeStatusUpdate]) -> List[NodeStatusResult]:
+    """
+    Apply many node status updates in one transaction
+    One SELECT for the nodes, one locking SELECT of their routes, one UPDATE per status (per
+    node on databases without UPDATE ... RETURNING), one UPDATE for the versions of the routes
+    whose nodes changed, one batched audit INSERT and one commit (a rollback when nothing
+    applied). Invalid items and version conflicts are reported and skipped; for repeated
+    nodes the last update wins.
+    """
+    results: List[Optional[NodeStatusResult]] = [None] * len(updates)
+    latest: Dict[int, int] = {}  # node_id -> index of its last valid update
+    for index, item in enumerate(updates):
+        try:
+            StatusEnum(item.status)
+        except ValueError:
+            results[index] = NodeStatusResult(route_id=item.route_id, node_id=item.node_id,
+                                              success=False, error="Invalid status")
+            continue
+        previous = latest.get(item.node_id)
+        if previous is not None:
+            results[previous] = NodeStatusResult(route_id=updates[previous].route_id, node_id=item.node_id,
+                                                 success=False, error="Superseded by a later update in this batch")
+        latest[item.node_id] = index
+
+    nodes = {
+        row.id: row
+        for row in db.query(RouteNode.id, RouteNode.route_id, RouteNode.order_index, RouteNode.notes, RouteNode.version)
+        .filter(RouteNode.id.in_(latest.keys()))
+    } if latest else {}
+
+    by_status: Dict[StatusEnum, List[int]] = {}
+    for node_id, index in latest.items():
+        item = updates[index]
+        node = nodes.get(node_id)
+        if node is None or node.route_id != item.route_id:
+            results[index] = NodeStatusResult(route_id=item.route_id, node_id=node_id,
+                                              success=False, error="Route node not found")
+        elif item.expected_version is not None and item.expected_version != node.version:
+            results[index] = NodeStatusResult(route_id=item.route_id, node_id=node_id, success=False,
+                                              version=node.version, error="Version conflict")
+        else:
+            by_status.setdefault(StatusEnum(item.status), []).append(index)
+
+    # Route rows first, then their nodes: the same lock order as reoptimize_route. Only the
+    # routes whose nodes pass the compare-and-swap below have their version bumped.
+    before = {}
+    if by_status:
+        db.execute(
+            select(Route.id).where(
+                Route.id.in_({updates[i].route_id for indexes in by_status.values() for i in indexes})
+            ).order_by(Route.id).with_for_update()
+        )
+        before = node_states(db, [updates[i].node_id for indexes in by_status.values() for i in indexes])
+
+    returning = db.get_bind().dialect.update_returning
+    now = datetime.utcnow()
+    audit_rows = []
+    applied = []  # (index, status, new version)
+    for node_status, indexes in by_status.items():
+        node_ids = [updates[i].node_id for i in indexes]
+        values = {"status": node_status, "version": RouteNode.version + 1}
+        notes = {updates[i].node_id: updates[i].notes for i in indexes if updates[i].notes}
+        if notes:
+            values["notes"] = case(notes, value=RouteNode.id, else_=RouteNode.notes)
+        if node_status == StatusEnum.COMPLETED:
+            values["actual_completion_time"] = now
+        # Compare-and-swap for items that sent expected_version (they were checked above, but
+        # another request may have changed the node since the SELECT)
+        expected = {updates[i].node_id: updates[i].expected_version for i in indexes
+                    if updates[i].expected_version is not None}
+        if returning:
+            stmt = update(RouteNode).where(RouteNode.id.in_(node_ids))
+            if expected:
+                stmt = stmt.where(RouteNode.version == case(expected, value=RouteNode.id, else_=RouteNode.version))
+            stmt = stmt.values(**values).returning(RouteNode.id, RouteNode.version)
+            versions = dict(db.execute(stmt.execution_options(synchronize_session=False)).all())
+        else:
+            # No RETURNING: one UPDATE per node, so each rowcount says whether that node's
+            # CAS matched; the new versions are read back under the row locks just taken
+            matched = []
+            for node_id in node_ids:
+                stmt = update(RouteNode).where(RouteNode.id == node_id)
+                if node_id in expected:
+                    stmt = stmt.where(RouteNode.version == expected[node_id])
+                if db.execute(stmt.values(**values).execution_options(synchronize_session=False)).rowcount:
+                    matched.append(node_id)
+            versions = dict(
+                db.query(RouteNode.id, RouteNode.version).filter(RouteNode.id.in_(matched)).all()
+            ) if matched else {}
+
+        missed = [node_id for node_id in node_ids if node_id not in versions]
+        current = dict(
+            db.query(RouteNode.id, RouteNode.version).filter(RouteNode.id.in_(missed)).all()
+        ) if missed else {}
+        for i in indexes:
+            item = updates[i]
+            if item.node_id not in versions:
+                results[i] = NodeStatusResult(route_id=item.route_id, node_id=item.node_id, success=False,
+                                              version=current.get(item.node_id), error="Version conflict")
+                continue
+            results[i] = NodeStatusResult(route_id=item.route_id, node_id=item.node_id, success=True,
+                                          status=node_status.value, version=versions[item.node_id])
+            applied.append(i)
+            audit_rows.append({
+                "user_id": "provider",
+                "user_role": "provider",
+                "action": "node_status_updated",
+                "entity_type": "RouteNode",
+                "entity_id": item.node_id,
+                "details": json.dumps({"status": node_status.value, "route_id": item.route_id, "bulk": True})
+            })
+    if not applied:
+        db.rollback()
+        return results
+    changed_routes = sorted({updates[i].route_id for i in applied})
+    bump_route_versions(db, changed_routes)
+    db.execute(insert(AuditTrail), audit_rows)
+    record_status_changes(db, before, {updates[i].node_id: StatusEnum(results[i].status) for i in applied})
+    route_versions = dict(db.query(Route.id, Route.version).filter(Route.id.in_(changed_routes)).all())
+    db.commit()
+
+    events = []
+    for i in applied:
+        item, node = updates[i], nodes[updates[i].node_id]
+        route_results.invalidate_route(item.route_id)
+        events.append({
+            "type": "node_status",
+            "route_id": item.route_id,
+            "node_id": item.node_id,
+            "order_index": node.order_index,
+            "status": results[i].status,
+            "notes": item.notes or node.notes,
+            "version": results[i].version,
+            "route_version": route_versions[item.route_id]
+        })
+    publish_route_events(db, events)
+    return results
+
+
+@app.put("/api/routes/node_status", response_model=BulkNodeStatusResponse)
+async def update_node_statuses(
+    updates: List[NodeStatusUpdate],
+    db: Session = Depends(get_db)
+):
+    """Update the status of many route nodes at once (end of a clinic session)"""
+    if len(updates) > BULK_STATUS_MAX_UPDATES:
+        raise HTTPException(status_code=422, detail=f"At most {BULK_STATUS_MAX_UPDATES} updates per request")
+    results = await run_in_threadpool(apply_node_status_updates, db, updates)
+    updated = sum(1 for result in results if result.success)
+    return BulkNodeStatusResponse(updated=updated, failed=len(results) - updated, results=results)
 
 
 @app.post("/api/reoptimize_route", response_model=RouteResponse)
 async def reoptimize_route(
     reopt_request: ReoptimizeRequest,
+    priority: str = Depends(admission_priority),
     db: Session = Depends(get_db)
 ):
-    """Re-optimize route with updated parameters"""
+    """
+    Re-optimize route with updated parameters
+    The new nodes replace the old ones only if the route is still at the version read here
+    (or expected_version, if given); otherwise 409 with the route's current state. The
+    reads, solve and write run in the threadpool while holding an admission slot.
+    """
+    async with admitted(priority):
+        response = await run_in_threadpool(apply_reoptimization, db, reopt_request)
+    return json_response(response)
+
+
+def apply_reoptimization(db: Session, reopt_request: ReoptimizeRequest) -> RouteResponse:
+    """Solve the route again and compare-and-swap it in; the body of reoptimize_route"""
     route = db.query(Route).filter(Route.id == reopt_request.route_id).first()
     if not route:
         raise HTTPException(status_code=404, detail="Route not found")
     
+    expected_version = route.version if reopt_request.expected_version is None else reopt_request.expected_version
+    if expected_version != route.version:
+        raise route_conflict(db, route.id)
     patient = route.patient
     
     # Get eligibility
     eligibility = verify_insurance_eligibility(patient.insurance_code)
     covered_service_names = eligibility.get("covered_services", [])
     
-    # Query services, excluding specified ones
-    service_query = db.query(Service).join(Provider).filter(
-        Service.is_available == True,
-        ~Service.id.in_(reopt_request.excluded_service_ids),
-        or_(*[Service.name.ilike(f"%{name}%") for name in covered_service_names])
-    )
-    
-    if reopt_request.preferred_provider_ids:
-        service_query = service_query.filter(Service.provider_id.in_(reopt_request.preferred_provider_ids))
-    
-    services = service_query.all()
+    # Covered services, excluding specified ones
+    excluded_ids = set(reopt_request.excluded_service_ids or [])
+    preferred_ids = set(reopt_request.preferred_provider_ids or [])
+    services = [
+        s for s in query_covered_services(db, covered_service_names, patient.insurance_code)
+        if s.id not in excluded_ids and (not preferred_ids or s.provider_id in preferred_ids)
+    ]
     
     if not services:
         raise HTTPException(status_code=404, detail="No available services found")
@@ -755,120 +2016,88 @@ async def reoptimize_route(
     providers = db.query(Provider).filter(Provider.id.in_(provider_ids)).all()
     
     # Re-optimize
+    travel_cost_per_mile = float(os.getenv("TRAVEL_COST_PER_MILE", "0.50"))
+    coverage_pct = eligibility.get("coverage_percentage", 100.0)
+    distance_provider = get_distance_provider()
+    patient_id = patient.id
     optimized_path = optimize_route_astar(
         patient.location_latitude,
         patient.location_longitude,
         services,
-        providers
+        providers,
+        distance_provider=distance_provider
     )
-    
-    # Delete old route nodes
-    db.query(RouteNode).filter(RouteNode.route_id == route.id).delete()
-    
-    # Create new route nodes
-    total_cost = 0.0
-    total_time = 0
-    total_distance = 0.0
-    current_lat = patient.location_latitude
-    current_lon = patient.location_longitude
-    
-    for order_idx, (service_id, provider_id) in enumerate(optimized_path):
-        service = next(s for s in services if s.id == service_id)
-        provider = next(p for p in providers if p.id == provider_id)
-        
-        distance = haversine_distance(
-            current_lat, current_lon,
-            provider.location_latitude, provider.location_longitude
-        )
-        total_distance += distance
-        
-        coverage_pct = eligibility.get("coverage_percentage", 100.0)
-        patient_cost = service.price * (1 - coverage_pct / 100.0)
-        total_cost += patient_cost
-        total_time += service.duration_minutes
-        
-        route_node = RouteNode(
-            route_id=route.id,
-            service_id=service.id,
-            order_index=order_idx,
-            status=StatusEnum.PENDING
-        )
-        db.add(route_node)
-        
-        current_lat = provider.location_latitude
-        current_lon = provider.location_longitude
-    
-    # Calculate total cost
+    assembled = assemble_route(
+        optimized_path,
+        {s.id: s for s in services},
+        {p.id: p for p in providers},
+        patient.location_latitude,
+        patient.location_longitude,
+        coverage_pct,
+        travel_cost_per_mile,
+        distance_provider=distance_provider
+    )
+    total_service_cost = assembled["total_service_cost"]
+    total_travel_cost = assembled["total_travel_cost"]
+    total_distance = assembled["total_distance"]
+    total_time = assembled["total_time"]
     total_cost = total_service_cost + total_travel_cost
     
-    # Update route
-    route.total_cost = total_cost
-    route.total_time_minutes = total_time
-    route.total_distance_miles = total_distance
-    db.commit()
-    db.refresh(route)
-    
-    # Build response with travel costs
-    service_nodes = []
-    current_lat_resp = patient.location_latitude
-    current_lon_resp = patient.location_longitude
-    
-    for idx, (service_id, provider_id) in enumerate(optimized_path):
-        service = next(s for s in services if s.id == service_id)
-        provider = next(p for p in providers if p.id == provider_id)
-        
-        # Calculate distance and travel cost
-        node_distance = haversine_distance(
-            current_lat_resp, current_lon_resp,
-            provider.location_latitude, provider.location_longitude
-        )
-        node_travel_cost = calculate_travel_cost(node_distance, travel_cost_per_mile)
-        node_service_cost = round(service.price * (1 - eligibility.get("coverage_percentage", 100.0) / 100.0), 2)
-        
-        service_nodes.append(ServiceNode(
-            service_name=service.name,
-            location=provider.name,
-            price=node_service_cost,
-            duration=f"{service.duration_minutes} mins",
-            covered=True,
-            status="Pending",
-            order_index=idx,
-            service_id=service.id,
-            provider_id=provider.id,
-            latitude=provider.location_latitude,
-            longitude=provider.location_longitude,
-            travel_distance_miles=round(node_distance, 2),
-            travel_cost=node_travel_cost
-        ))
-        
-        # Update current location
-        current_lat_resp = provider.location_latitude
-        current_lon_resp = provider.location_longitude
+    route_id = route.id
+    insurance_code = patient.insurance_code
+    old_totals = (route.total_cost, route.total_distance_miles)
     
-    hours = total_time // 60
-    minutes = total_time % 60
-    time_str = f"{hours} hr {minutes} mins" if hours > 0 else f"{minutes} mins"
+    # Compare-and-swap the route version, then replace its nodes, in one transaction
+    swapped = db.execute(
+        update(Route).where(Route.id == route_id, Route.version == expected_version)
+        .values(total_cost=total_cost, total_time_minutes=total_time,
+                total_distance_miles=total_distance, version=expected_version + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not swapped:
+        db.rollback()
+        raise route_conflict(db, route_id)
+    old_nodes = node_states(db, route_id=route_id)
+    db.query(RouteNode).filter(RouteNode.route_id == route_id).delete(synchronize_session=False)
+    if assembled["rows"]:
+        # New nodes start at the new route version: node ids may be reused, and a stale
+        # expected_version must not match a replacement node
+        db.execute(insert(RouteNode), [
+            {**row, "route_id": route_id, "version": expected_version + 1} for row in assembled["rows"]
+        ])
+    record_route_replaced(db, route_id, old_totals[0], old_totals[1], old_nodes, total_cost, total_distance)
+    db.commit()
+    route_results.invalidate_route(route_id)
+    publish_route_event(db, {
+        "type": "route_updated",
+        "route_id": route_id,
+        "total_estimated_cost": round(total_cost, 2),
+        "total_time_minutes": total_time,
+        "stops": len(assembled["rows"]),
+        "version": expected_version + 1
+    })
     
     # Log audit trail
     log_audit_trail(
         db=db,
-        user_id=f"patient_{patient.id}",
+        user_id=f"patient_{patient_id}",
         user_role="patient",
         action="route_reoptimized",
         entity_type="Route",
-        entity_id=route.id
+        entity_id=route_id
     )
     
-    return RouteResponse(
-        patient_id=f"P{patient.id}",
-        route_id=route.id,
-        insurance_code=patient.insurance_code,
-        route=service_nodes,
+    return RouteResponse.model_construct(
+        patient_id=f"P{patient_id}",
+        route_id=route_id,
+        insurance_code=insurance_code,
+        route=assembled["nodes"],
         total_estimated_cost=round(total_cost, 2),
         total_service_cost=round(total_service_cost, 2),
         total_travel_cost=round(total_travel_cost, 2),
-        total_estimated_time=time_str,
-        total_distance_miles=round(total_distance, 2)
+        total_estimated_time=format_duration(total_time),
+        total_distance_miles=round(total_distance, 2),
+        version=expected_version + 1
     )
 
 
@@ -0,0 +1,258 @@
+"""
+Route templates
+Patients a block apart on the same plan get (nearly) the same route, so the ordered
+(service, provider) sequence solved for one of them is reused for the others; the legs,
+starting with the first one from the exact patient location, are recomputed on assembly.
+
+Templates are keyed by (geohash cell, insurance code, catalog version): a bounded in-process
+LRU in front of the route_templates table, filled lazily on a miss or ahead of time by the
+warm-up job. A catalog change yields a new version, so stale templates are never looked up
+again; `purge` deletes them.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from geo import PATIENT_CELL_PRECISION, geohash_encode
+from models import Patient, RouteTemplate
+
+# Geohash length of a template cell (6 = ~1.2 km x 0.6 km); must not exceed PATIENT_CELL_PRECISION
+TEMPLATE_CELL_PRECISION = min(int(os.getenv("ROUTE_TEMPLATE_CELL_PRECISION", "6")), PATIENT_CELL_PRECISION)
+# Memory bound of the in-process cache, in route stops summed over all cached templates
+TEMPLATE_CACHE_STOPS = int(os.getenv("ROUTE_TEMPLATE_CACHE_STOPS", "200000"))
+
+TemplateKey = Tuple[str, str, str]  # (cell, insurance_code, catalog_version)
+Path = Tuple[Tuple[int, int], ...]  # ((service_id, provider_id), ...)
+
+
+def template_cell(lat: float, lon: float) -> str:
+    """Template cell of a location (a prefix of the patient's location_cell)"""
+    return geohash_encode(lat, lon, TEMPLATE_CELL_PRECISION)
+
+
+class TemplateStore:
+    """LRU of solved paths bounded by total stops, backed by the route_templates table"""
+
+    def __init__(self, max_stops: int = TEMPLATE_CACHE_STOPS, enabled: bool = True):
+        self.max_stops = max_stops
+        self.enabled = enabled
+        self._paths: "OrderedDict[TemplateKey, Path]" = OrderedDict()
+        self._stops = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, db: Session, key: TemplateKey) -> Optional[Path]:
+        """Cached path for the key, loading it from the table on a cache miss"""
+        with self._lock:
+            path = self._paths.get(key)
+            if path is not None:
+                self._paths.move_to_end(key)
+                return path
+        pending = db.info.get("pending_templates", {}).get((id(self), key))
+        if pending is not None:
+            return pending[1]  # Stored earlier in this (uncommitted) transaction
+
+        cell, insurance_code, version = key
+        stored = db.query(RouteTemplate.path).filter(
+            RouteTemplate.location_cell == cell,
+            RouteTemplate.insurance_code == insurance_code,
+            RouteTemplate.catalog_version == version
+        ).scalar()
+        if stored is None:
+            return None
+        path = tuple((service_id, provider_id) for service_id, provider_id in json.loads(stored))
+        self._remember(key, path)
+        return path
+
+    def store(self, db: Session, key: TemplateKey, path: Sequence[Tuple[int, int]]):
+        """
+        Save a solved path, replacing a stored one for the same key (a stop went unavailable
+        without changing the catalog fingerprint). Written in the caller's transaction; the
+        cache only takes the path once that transaction commits.
+        """
+        if not path:
+            return
+        path = tuple((int(service_id), int(provider_id)) for service_id, provider_id in path)
+        db.info.setdefault("pending_templates", {})[(id(self), key)] = (self, path)
+
+        cell, insurance_code, version = key
+        values = {
+            "location_cell": cell,
+            "insurance_code": insurance_code,
+            "catalog_version": version,
+            "path": json.dumps(path),
+            "stop_count": len(path)
+        }
+        dialect = db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            stmt = dialect_insert(RouteTemplate).values(**values)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[RouteTemplate.location_cell, RouteTemplate.insurance_code, RouteTemplate.catalog_version],
+                set_={"path": stmt.excluded.path, "stop_count": stmt.excluded.stop_count}
+            ))
+            return
+
+        template = db.query(RouteTemplate).filter(
+            RouteTemplate.location_cell == cell,
+            RouteTemplate.insurance_code == insurance_code,
+            RouteTemplate.catalog_version == version
+        ).first()
+        if template:
+            template.path = values["path"]
+            template.stop_count = values["stop_count"]
+            return
+        try:
+            with db.begin_nested():
+                db.add(RouteTemplate(**values))
+        except IntegrityError:
+            pass  # Another worker stored this key first
+
+    def forget(self, key: TemplateKey):
+        """Drop a cached path (e.g. it references a service that is no longer available)"""
+        with self._lock:
+            path = self._paths.pop(key, None)
+            if path is not None:
+                self._stops -= len(path)
+
+    def clear(self):
+        with self._lock:
+            self._paths.clear()
+            self._stops = 0
+
+    def _remember(self, key: TemplateKey, path: Path):
+        if len(path) > self.max_stops:
+            return
+        with self._lock:
+            previous = self._paths.pop(key, None)
+            if previous is not None:
+                self._stops -= len(previous)
+            self._paths[key] = path
+            self._stops += len(path)
+            while self._stops > self.max_stops:
+                _, evicted = self._paths.popitem(last=False)
+                self._stops -= len(evicted)
+
+
+@event.listens_for(Session, "after_commit")
+def _cache_committed_templates(session: Session):
+    for (_, key), (store, path) in session.info.pop("pending_templates", {}).items():
+        store._remember(key, path)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_pending_templates(session: Session):
+    session.info.pop("pending_templates", None)
+
+
+template_store = TemplateStore(enabled=os.getenv("ROUTE_TEMPLATES", "true").lower() == "true")
+
+
+# ==================== Warm-up and Maintenance ====================
+
+def populated_cells(db: Session, min_patients: int = 1, insurance_codes: Optional[List[str]] = None):
+    """(cell, insurance_code, patients, mean lat, mean lon) for cells with patients, busiest first"""
+    cell = func.substr(Patient.location_cell, 1, TEMPLATE_CELL_PRECISION)
+    patients = func.count(Patient.id)
+    query = db.query(
+        cell, Patient.insurance_code, patients,
+        func.avg(Patient.location_latitude), func.avg(Patient.location_longitude)
+    ).filter(Patient.location_cell.isnot(None))
+    if insurance_codes:
+        query = query.filter(Patient.insurance_code.in_(insurance_codes))
+    return query.group_by(cell, Patient.insurance_code).having(patients >= min_patients).order_by(patients.desc())
+
+
+def warm_templates(
+    db: Session,
+    min_patients: int = 1,
+    insurance_codes: Optional[List[str]] = None,
+    limit: Optional[int] = None
+) -> Dict[str, int]:
+    """
+    Solve and store templates for populated cells that have none for the current catalog
+    Each cell is solved from the mean location of its patients
+    """
+    from catalog import catalog_version
+    from distance_provider import get_distance_provider
+    from models import Provider
+    from route_optimizer import optimize_route_astar, query_covered_services, verify_insurance_eligibility
+
+    version = catalog_version(db)
+    distance_provider = get_distance_provider()
+    existing = {
+        (cell, code) for cell, code in db.query(RouteTemplate.location_cell, RouteTemplate.insurance_code)
+        .filter(RouteTemplate.catalog_version == version)
+    }
+    candidates = {}  # insurance_code -> (services, providers), loaded once per plan
+    counts = {"cells": 0, "existing": 0, "solved": 0, "empty": 0}
+
+    for cell, insurance_code, _, lat, lon in populated_cells(db, min_patients, insurance_codes).all():
+        if limit is not None and counts["solved"] >= limit:
+            break
+        counts["cells"] += 1
+        if (cell, insurance_code) in existing:
+            counts["existing"] += 1
+            continue
+        if insurance_code not in candidates:
+            covered = verify_insurance_eligibility(insurance_code).get("covered_services", [])
+            services = query_covered_services(db, covered, insurance_code)
+            providers = db.query(Provider).filter(Provider.id.in_({s.provider_id for s in services})).all()
+            candidates[insurance_code] = (services, providers)
+        services, providers = candidates[insurance_code]
+        path = optimize_route_astar(lat, lon, services, providers, distance_provider=distance_provider)
+        if not path:
+            counts["empty"] += 1
+            continue
+        template_store.store(db, (cell, insurance_code, version), path)
+        counts["solved"] += 1
+    # One commit at the end: committing earlier would expire the cached candidate services
+    db.commit()
+    return counts
+
+
+def purge_stale_templates(db: Session) -> int:
+    """Delete templates solved against an older catalog version; returns rows removed"""
+    from catalog import catalog_version
+
+    removed = db.query(RouteTemplate).filter(
+        RouteTemplate.catalog_version != catalog_version(db)
+    ).delete(synchronize_session=False)
+    db.commit()
+    return removed
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Route template maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    warm = subparsers.add_parser("warm", help="Precompute templates for populated cells")
+    warm.add_argument("--plan", action="append", dest="plans", help="Only this insurance code (repeatable)")
+    warm.add_argument("--min-patients", type=int, default=1, help="Skip cells with fewer patients")
+    warm.add_argument("--limit", type=int, help="Stop after solving this many templates")
+    subparsers.add_parser("purge", help="Delete templates for older catalog versions")
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    started = time.perf_counter()
+    try:
+        if args.command == "warm":
+            counts = warm_templates(session, args.min_patients, args.plans, args.limit)
+            print(f"Solved {counts['solved']} templates ({counts['existing']} already current, "
+                  f"{counts['empty']} without covered services) in {time.perf_counter() - started:.1f}s")
+        else:
+            print(f"Purged {purge_stale_templates(session)} stale route templates")
+    finally:
+        session.close()
@@ -1,10 +1,29 @@
 """
 Seed data for Joplin, MO healthcare providers
+
+    python seed_data.py                  # small demo catalog
+    python seed_data.py --generate ...   # large synthetic dataset for load testing (see --help)
 """
+from sqlalchemy import func, insert, text
 from sqlalchemy.orm import Session
-from models import Provider, Service, InsuranceProgram, Base
+from models import (
+    Provider, Service, InsuranceProgram, Patient, Route, RouteNode, AuditTrail, StatusEnum, Base,
+    patient_identity_key
+)
 from database import engine, SessionLocal
+from geo import patient_location_cell
+from coverage import rebuild_service_coverage
+from rollups import rebuild_rollups
+from datetime import datetime, timedelta
+import argparse
+import csv
+import enum
+import io
+import itertools
 import json
+import math
+import random
+import time
 
 # Joplin, MO coordinates (approximately)
 JOPLIN_LAT = 37.0842
@@ -205,6 +224,11 @@ def seed_database():
         
         db.commit()
         
+        # Normalized coverage rows used by the optimizer's service lookup
+        print("Building service coverage...")
+        rebuild_service_coverage(db.connection())
+        db.commit()
+        
         print("Database seeded successfully!")
         print(f"   - {len(PROVIDERS)} providers")
         print(f"   - {len(SERVICES)} services")
@@ -218,7 +242,449 @@ def seed_database():
         db.close()
 
 
+# ==================== Synthetic Dataset Generator ====================
+
+# Four-state area around Joplin: (name, latitude, longitude, radius in miles)
+REGIONS = [
+    ("Joplin, MO", JOPLIN_LAT, JOPLIN_LON, 8),
+    ("Webb City, MO", 37.1464, -94.4630, 4),
+    ("Carthage, MO", 37.1765, -94.3102, 5),
+    ("Neosho, MO", 36.8689, -94.3677, 5),
+    ("Pittsburg, KS", 37.4109, -94.7050, 5),
+    ("Miami, OK", 36.8745, -94.8775, 5),
+    ("Springfield, MO", 37.2090, -93.2923, 12),
+    ("Bentonville, AR", 36.3729, -94.2088, 8),
+]
+
+# Service templates per specialty: (name, description, price, duration_minutes, service_code)
+SPECIALTY_SERVICES = {
+    "Primary Care": [
+        ("Primary Care Consultation", "General health checkup and consultation", 100.0, 30, "99213"),
+        ("Primary Care Annual Physical", "Preventive annual exam", 180.0, 45, "99396"),
+    ],
+    "Cardiology": [
+        ("Cardiology Follow-up", "Cardiologist consultation and follow-up", 250.0, 45, "99214"),
+        ("Cardiology Echocardiogram", "Transthoracic echocardiogram", 600.0, 60, "93306"),
+    ],
+    "Radiology": [
+        ("Chest X-Ray", "Radiology imaging service", 150.0, 20, "71020"),
+        ("Radiology CT Scan", "CT abdomen and pelvis", 900.0, 40, "74177"),
+    ],
+    "Dermatology": [
+        ("Dermatology Consultation", "Skin condition evaluation", 180.0, 30, "99213"),
+    ],
+    "Lab Work": [
+        ("Blood Work Panel", "Comprehensive lab panel", 120.0, 15, "80053"),
+        ("Lab Work Lipid Panel", "Cholesterol screening", 60.0, 10, "80061"),
+    ],
+    "Physical Therapy": [
+        ("Physical Therapy Evaluation", "Initial PT evaluation", 140.0, 60, "97161"),
+    ],
+    "Orthopedics": [
+        ("Orthopedics Consultation", "Orthopedic surgeon consultation", 300.0, 40, "99204"),
+    ],
+}
+
+# Health systems that operate multi-site specialty clinics
+HEALTH_SYSTEMS = ["Mercy", "Freeman", "JRAH", "Access Family Care", "CoxHealth", "Integris"]
+
+GENERATED_PLAN_CARRIERS = ["Aetna", "Blue Cross Blue Shield", "UnitedHealthcare", "Cigna", "Humana", "MO HealthNet"]
+
+FIRST_NAMES = ["James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David", "Elizabeth",
+               "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Maria", "Daniel"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+              "Hernandez", "Lopez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee"]
+
+
+def random_point(rng: random.Random, lat: float, lon: float, radius_miles: float):
+    """Uniform point within radius_miles of (lat, lon)"""
+    r = radius_miles * math.sqrt(rng.random())
+    theta = rng.random() * 2 * math.pi
+    return (
+        lat + (r * math.cos(theta)) / 69.0,
+        lon + (r * math.sin(theta)) / (69.0 * math.cos(math.radians(lat)))
+    )
+
+
+def _next_id(conn, model) -> int:
+    return (conn.execute(func.max(model.id).select()).scalar() or 0) + 1
+
+
+def _copy_value(value):
+    if value is None:
+        return None
+    if isinstance(value, enum.Enum):
+        return value.name  # SQLAlchemy stores Enum columns by member name
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return value
+
+
+def bulk_load(conn, model, rows, batch_size: int = 10000, use_copy: bool = False) -> int:
+    """
+    Stream row dicts into a table in batches
+    Uses Postgres COPY when use_copy is set, otherwise Core multi-row INSERTs
+    """
+    table = model.__table__
+    total = 0
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        if use_copy:
+            columns = list(batch[0].keys())
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in batch:
+                writer.writerow([_copy_value(row[c]) for c in columns])
+            buffer.seek(0)
+            cursor = conn.connection.cursor()
+            cursor.copy_expert(
+                f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+        else:
+            conn.execute(insert(table), batch)
+        batch.clear()
+
+    for row in rows:
+        batch.append(row)
+        total += 1
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return total
+
+
+def _reset_sequences(conn, models):
+    """Explicit IDs bypass Postgres serial sequences; move them past the loaded rows"""
+    for model in models:
+        table = model.__tablename__
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT COALESCE(MAX(id), 1) FROM {table}))"
+        ))
+
+
+def generate_dataset(
+    providers: int = 1000,
+    services_per_provider: int = 2,
+    plans: int = 10,
+    patients: int = 10000,
+    routes: int = 20000,
+    max_nodes_per_route: int = 4,
+    history_days: int = 365,
+    seed: int = 42,
+    batch_size: int = 10000,
+    use_copy: bool = None,
+    bind=None
+) -> dict:
+    """
+    Generate and bulk-load a realistic synthetic dataset
+    Providers are spread across REGIONS as multi-site specialty clinics; patients, routes,
+    route nodes and audit rows form a plausible history. Returns row counts per table.
+    """
+    bind = bind or engine
+    rng = random.Random(seed)
+    if use_copy is None:
+        use_copy = bind.dialect.name == "postgresql"
+    specialties = list(SPECIALTY_SERVICES)
+    counts = {}
+    timings = {}
+
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        # Insurance programs: the demo plans plus generated ones with random specialty coverage
+        plan_rows = []
+        existing_codes = set(conn.execute(InsuranceProgram.__table__.select().with_only_columns(
+            InsuranceProgram.insurance_code)).scalars())
+        plan_coverage = {}
+        for program in INSURANCE_PROGRAMS:
+            plan_coverage[program["insurance_code"]] = (
+                set(json.loads(program["covered_services"])), program["coverage_percentage"]
+            )
+            if program["insurance_code"] not in existing_codes:
+                plan_rows.append(dict(program, is_active=True))
+        for idx in range(plans):
+            code = f"GEN-{idx + 1:04d}"
+            covered = set(rng.sample(specialties, rng.randint(2, len(specialties))))
+            coverage_pct = float(rng.choice([60, 70, 75, 80, 85, 90]))
+            plan_coverage[code] = (covered, coverage_pct)
+            if code not in existing_codes:
+                plan_rows.append({
+                    "insurance_code": code,
+                    "provider_name": rng.choice(GENERATED_PLAN_CARRIERS),
+                    "plan_name": f"Generated Plan {idx + 1}",
+                    "covered_services": json.dumps(sorted(covered)),
+                    "coverage_percentage": coverage_pct,
+                    "is_active": True
+                })
+        counts["insurance_programs"] = bulk_load(conn, InsuranceProgram, plan_rows, batch_size, use_copy)
+        plan_codes = list(plan_coverage)
+
+        # Providers: each health system runs numbered sites of a specialty across regions
+        provider_start = _next_id(conn, Provider)
+        provider_sites = []  # (id, lat, lon, region index, specialty)
+
+        def provider_rows():
+            for idx in range(providers):
+                region_idx = rng.randrange(len(REGIONS))
+                region, lat, lon, radius = REGIONS[region_idx]
+                specialty = specialties[idx % len(specialties)]
+                system = HEALTH_SYSTEMS[(idx // len(specialties)) % len(HEALTH_SYSTEMS)]
+                site_lat, site_lon = random_point(rng, lat, lon, radius)
+                provider_id = provider_start + idx
+                provider_sites.append((provider_id, site_lat, site_lon, region_idx, specialty))
+                yield {
+                    "id": provider_id,
+                    "name": f"{system} {specialty} - {region} Site {idx + 1}",
+                    "specialty": specialty,
+                    "location_latitude": site_lat,
+                    "location_longitude": site_lon,
+                    "address": f"{rng.randint(100, 9999)} {rng.choice(['Main', 'Range Line', 'Maiden Ln', '32nd', '20th'])} St, {region}",
+                    "phone": f"(417) {rng.randint(200, 999)}-{rng.randint(1000, 9999)}",
+                    "npi": str(1000000000 + provider_id),
+                    "is_active": True
+                }
+
+        started = time.perf_counter()
+        counts["providers"] = bulk_load(conn, Provider, provider_rows(), batch_size, use_copy)
+        timings["providers"] = time.perf_counter() - started
+
+        # Services: services_per_provider per site, priced around the template
+        service_start = _next_id(conn, Service)
+        service_catalog = []  # (id, provider index, price, duration)
+        services_by_region = {}
+
+        def service_rows():
+            service_id = service_start
+            for site_idx, (provider_id, _, _, region_idx, specialty) in enumerate(provider_sites):
+                templates = SPECIALTY_SERVICES[specialty]
+                covering_plans = [code for code, (covered, _) in plan_coverage.items() if specialty in covered]
+                for k in range(services_per_provider):
+                    name, description, price, duration, code = templates[k % len(templates)]
+                    price = round(price * rng.uniform(0.7, 1.3), 2)
+                    service_catalog.append((service_id, site_idx, price, duration))
+                    services_by_region.setdefault(region_idx, []).append(len(service_catalog) - 1)
+                    yield {
+                        "id": service_id,
+                        "name": name,
+                        "description": description,
+                        "price": price,
+                        "duration_minutes": duration,
+                        "provider_id": provider_id,
+                        "insurance_coverage": json.dumps(covering_plans),
+                        "service_code": code,
+                        "is_available": rng.random() > 0.02
+                    }
+                    service_id += 1
+
+        started = time.perf_counter()
+        counts["services"] = bulk_load(conn, Service, service_rows(), batch_size, use_copy)
+        timings["services"] = time.perf_counter() - started
+
+        # Historical patients
+        patient_start = _next_id(conn, Patient)
+        patient_info = []  # (id, lat, lon, region index, insurance code)
+        now = datetime.utcnow()
+
+        taken_cells = set()  # (insurance code, location cell) must stay unique
+
+        def patient_rows():
+            for idx in range(patients):
+                region_idx = rng.randrange(len(REGIONS))
+                region, lat, lon, radius = REGIONS[region_idx]
+                insurance_code = rng.choice(plan_codes)
+                while True:
+                    p_lat, p_lon = random_point(rng, lat, lon, radius * 1.5)
+                    cell = patient_location_cell(p_lat, p_lon)
+                    if (insurance_code, cell) not in taken_cells:
+                        taken_cells.add((insurance_code, cell))
+                        break
+                patient_id = patient_start + idx
+                patient_info.append((patient_id, p_lat, p_lon, region_idx, insurance_code))
+                name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+                date_of_birth = now - timedelta(days=rng.randint(18 * 365, 90 * 365))
+                yield {
+                    "id": patient_id,
+                    "name": name,
+                    "insurance_code": insurance_code,
+                    "location_latitude": p_lat,
+                    "location_longitude": p_lon,
+                    "location_cell": cell,
+                    "identity_key": patient_identity_key(name, date_of_birth),
+                    "address": f"{rng.randint(100, 9999)} Residential Ave, {region}",
+                    "date_of_birth": date_of_birth,
+                    "created_at": now - timedelta(days=rng.randint(0, history_days))
+                }
+
+        started = time.perf_counter()
+        counts["patients"] = bulk_load(conn, Patient, patient_rows(), batch_size, use_copy)
+        timings["patients"] = time.perf_counter() - started
+
+        # Routes, route nodes and audit rows share one generated history
+        route_start = _next_id(conn, Route)
+        node_start = _next_id(conn, RouteNode)
+        audit_ids = itertools.count(_next_id(conn, AuditTrail))
+        pending_nodes = []
+        pending_audits = []
+        statuses = list(StatusEnum)
+
+        def route_rows():
+            if not patient_info or not service_catalog:
+                return
+            from geo import haversine_distance
+
+            node_id = node_start
+            for idx in range(routes):
+                route_id = route_start + idx
+                patient_id, p_lat, p_lon, region_idx, insurance_code = rng.choice(patient_info)
+                coverage_pct = plan_coverage[insurance_code][1]
+                local = services_by_region.get(region_idx) or range(len(service_catalog))
+                picks = list(dict.fromkeys(
+                    local[rng.randrange(len(local))] for _ in range(rng.randint(1, max_nodes_per_route))
+                ))
+                created_at = now - timedelta(days=rng.randint(0, history_days), minutes=rng.randint(0, 1439))
+
+                total_cost, total_time, total_distance = 0.0, 0, 0.0
+                cur_lat, cur_lon = p_lat, p_lon
+                for order_idx, catalog_idx in enumerate(picks):
+                    service_id, site_idx, price, duration = service_catalog[catalog_idx]
+                    _, s_lat, s_lon, _, _ = provider_sites[site_idx]
+                    total_distance += haversine_distance(cur_lat, cur_lon, s_lat, s_lon)
+                    total_cost += price * (1 - coverage_pct / 100.0)
+                    total_time += duration
+                    cur_lat, cur_lon = s_lat, s_lon
+
+                    # Older routes are further along
+                    age_days = (now - created_at).days
+                    status = StatusEnum.COMPLETED if age_days > 30 and rng.random() < 0.8 else rng.choice(statuses)
+                    pending_nodes.append({
+                        "id": node_id,
+                        "route_id": route_id,
+                        "service_id": service_id,
+                        "order_index": order_idx,
+                        "status": status,
+                        "estimated_arrival_time": created_at + timedelta(days=order_idx + 1),
+                        "actual_completion_time": created_at + timedelta(days=order_idx + 1, hours=1)
+                        if status == StatusEnum.COMPLETED else None,
+                        "created_at": created_at
+                    })
+                    if status != StatusEnum.PENDING:
+                        pending_audits.append({
+                            "id": next(audit_ids),
+                            "user_id": "provider",
+                            "user_role": "provider",
+                            "action": "node_status_updated",
+                            "entity_type": "RouteNode",
+                            "entity_id": node_id,
+                            "details": json.dumps({"status": status.value, "route_id": route_id}),
+                            "timestamp": created_at + timedelta(days=order_idx + 1, hours=1)
+                        })
+                    node_id += 1
+
+                pending_audits.append({
+                    "id": next(audit_ids),
+                    "user_id": f"patient_{patient_id}",
+                    "user_role": "patient",
+                    "action": "route_created",
+                    "entity_type": "Route",
+                    "entity_id": route_id,
+                    "details": json.dumps({"insurance_code": insurance_code, "ai_used": False}),
+                    "timestamp": created_at
+                })
+                yield {
+                    "id": route_id,
+                    "patient_id": patient_id,
+                    "insurance_code": insurance_code,
+                    "total_cost": round(total_cost + total_distance * 0.5, 2),
+                    "total_time_minutes": total_time,
+                    "total_distance_miles": round(total_distance, 2),
+                    "status": "Pending",
+                    "created_at": created_at
+                }
+
+        def drain(items):
+            # Child rows are produced while routes stream; hand them over batch by batch
+            while items:
+                chunk = items[:batch_size]
+                del items[:batch_size]
+                yield from chunk
+
+        started = time.perf_counter()
+        counts["routes"] = 0
+        counts["route_nodes"] = 0
+        counts["audit_trails"] = 0
+        route_batch = []
+
+        def flush_history():
+            counts["routes"] += bulk_load(conn, Route, route_batch, batch_size, use_copy)
+            counts["route_nodes"] += bulk_load(conn, RouteNode, drain(pending_nodes), batch_size, use_copy)
+            counts["audit_trails"] += bulk_load(conn, AuditTrail, drain(pending_audits), batch_size, use_copy)
+            route_batch.clear()
+
+        for row in route_rows():
+            route_batch.append(row)
+            if len(route_batch) >= batch_size:
+                flush_history()
+        flush_history()
+        timings["history"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        counts["service_coverage"] = rebuild_service_coverage(conn)
+        timings["service_coverage"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        counts.update(rebuild_rollups(conn))
+        timings["rollups"] = time.perf_counter() - started
+
+        if bind.dialect.name == "postgresql":
+            _reset_sequences(conn, [InsuranceProgram, Provider, Service, Patient, Route, RouteNode, AuditTrail])
+
+    return {"rows": counts, "seconds": {k: round(v, 2) for k, v in timings.items()}, "copy": use_copy}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the route optimizer database")
+    parser.add_argument("--generate", action="store_true", help="Bulk-generate a synthetic dataset instead of the demo seed")
+    parser.add_argument("--providers", type=int, default=1000)
+    parser.add_argument("--services-per-provider", type=int, default=2)
+    parser.add_argument("--plans", type=int, default=10, help="Generated insurance plans (in addition to the demo plans)")
+    parser.add_argument("--patients", type=int, default=10000)
+    parser.add_argument("--routes", type=int, default=20000)
+    parser.add_argument("--max-nodes-per-route", type=int, default=4)
+    parser.add_argument("--history-days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--no-copy", action="store_true", help="Use multi-row INSERTs even on PostgreSQL")
+    args = parser.parse_args()
+
+    if not args.generate:
+        seed_database()
+        return
+
+    started = time.perf_counter()
+    result = generate_dataset(
+        providers=args.providers,
+        services_per_provider=args.services_per_provider,
+        plans=args.plans,
+        patients=args.patients,
+        routes=args.routes,
+        max_nodes_per_route=args.max_nodes_per_route,
+        history_days=args.history_days,
+        seed=args.seed,
+        batch_size=args.batch_size,
+        use_copy=False if args.no_copy else None
+    )
+    elapsed = time.perf_counter() - started
+    total_rows = sum(result["rows"].values())
+    print(f"Generated {total_rows} rows in {elapsed:.1f}s ({total_rows / max(elapsed, 1e-9):,.0f} rows/s, "
+          f"{'COPY' if result['copy'] else 'multi-row INSERT'})")
+    for table, count in result["rows"].items():
+        print(f"   - {count} {table}")
+
+
 if __name__ == "__main__":
-    seed_database()
+    main()
 
 
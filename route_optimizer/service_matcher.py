@@ -0,0 +1,206 @@
+"""
+Free-text service name matching for plans without coded coverage
+Two backends, selected with SERVICE_MATCHER=auto|automaton|trgm|ilike:
+
+- automaton: an Aho-Corasick automaton compiled once per covered-service vocabulary scans
+  each service name in a single pass. Available service names are cached per catalog
+  version (catalog.current_catalog_version, re-checked every CATALOG_VERSION_TTL_SECONDS),
+  and ranked results per vocabulary, so repeat lookups skip the scan and the version query.
+- trgm: PostgreSQL pg_trgm word-similarity search backed by a GIN index on services.name
+  (created by the migration) narrows the candidates; each is then re-checked with the
+  automaton's whole-word rule, so coverage is never decided by a fuzzy match.
+
+auto uses trgm when the pg_trgm extension is installed, otherwise the automaton.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import or_, text
+from sqlalchemy.orm import Session
+
+from models import Service
+
+SERVICE_MATCHER = os.getenv("SERVICE_MATCHER", "auto").lower()
+
+# Ranked results kept per catalog version (one entry per covered-service vocabulary)
+MATCH_CACHE_SIZE = 256
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+Match = Tuple[int, str, float]  # (service_id, covered name, score)
+
+
+def normalize(value: str) -> str:
+    """Lowercase words separated by single spaces, padded so matches fall on word boundaries"""
+    return " " + " ".join(_WORD.findall(value.lower())) + " "
+
+
+class AhoCorasick:
+    """Multi-pattern substring automaton (goto / failure / output)"""
+
+    def __init__(self, patterns: Sequence[str]):
+        self.patterns = list(patterns)
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                nxt = self.goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][char] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = nxt
+            self.output[state].append(index)
+
+        # Breadth-first failure links; outputs inherit from the failure state
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(char, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def find(self, value: str) -> Iterable[Tuple[int, int]]:
+        """Yield (pattern index, end offset) for every occurrence in value"""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for offset, char in enumerate(value):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in output[state]:
+                yield index, offset
+
+
+class ServiceMatcher:
+    """Compiled matcher for one covered-service vocabulary"""
+
+    def __init__(self, vocabulary: Sequence[str]):
+        self.vocabulary = [name for name in vocabulary if _WORD.search(name.lower())]
+        self.automaton = AhoCorasick([normalize(name) for name in self.vocabulary])
+
+    def match(self, service_name: str) -> Optional[Tuple[str, float]]:
+        """
+        Best covered name contained (as whole words) in the service name, with a score
+        Score favours covered names that make up more of the service name, then earlier matches
+        """
+        normalized = normalize(service_name)
+        best = None
+        for index, end in self.automaton.find(normalized):
+            length = len(self.automaton.patterns[index])
+            score = length / len(normalized) - (end - length + 1) / (len(normalized) * 100)
+            if best is None or score > best[1]:
+                best = (self.vocabulary[index], score)
+        return best
+
+    def rank(self, services: Iterable[Tuple[int, str]]) -> List[Match]:
+        """Ranked (service_id, covered name, score) for the services that match"""
+        matches = []
+        for service_id, name in services:
+            found = self.match(name)
+            if found:
+                matches.append((service_id, found[0], round(found[1], 4)))
+        matches.sort(key=lambda m: (-m[2], m[0]))
+        return matches
+
+
+@lru_cache(maxsize=64)
+def get_matcher(vocabulary: Tuple[str, ...]) -> ServiceMatcher:
+    """Matcher for a vocabulary, compiled once per process"""
+    return ServiceMatcher(vocabulary)
+
+
+class _NameIndex:
+    """Available service names and ranked results for one catalog version"""
+
+    def __init__(self, version: str, names: List[Tuple[int, str]]):
+        self.version = version
+        self.names = names
+        self.results: "OrderedDict[Tuple[str, ...], List[Match]]" = OrderedDict()
+
+
+_index: Optional[_NameIndex] = None
+_index_lock = threading.Lock()
+
+
+def match_service_names(db: Session, vocabulary: Sequence[str]) -> List[Match]:
+    """Ranked matches of available service names against the vocabulary (automaton backend)"""
+    from catalog import current_catalog_version
+
+    global _index
+    key = tuple(sorted(set(vocabulary)))
+    version = current_catalog_version(db)
+    index = _index
+    if index is None or index.version != version:
+        names = [tuple(row) for row in db.query(Service.id, Service.name).filter(Service.is_available == True)]
+        index = _NameIndex(version, names)
+        with _index_lock:
+            _index = index
+
+    with _index_lock:
+        cached = index.results.get(key)
+        if cached is not None:
+            index.results.move_to_end(key)
+            return cached
+    ranked = get_matcher(key).rank(index.names)
+    with _index_lock:
+        index.results[key] = ranked
+        if len(index.results) > MATCH_CACHE_SIZE:
+            index.results.popitem(last=False)
+    return ranked
+
+
+# ==================== PostgreSQL pg_trgm ====================
+
+_trigram_available: Optional[bool] = None
+
+
+def trigram_available(db: Session) -> bool:
+    """True on PostgreSQL with the pg_trgm extension installed (checked once per process)"""
+    global _trigram_available
+    if _trigram_available is None:
+        if db.get_bind().dialect.name != "postgresql":
+            _trigram_available = False
+        else:
+            _trigram_available = db.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            ).first() is not None
+    return _trigram_available
+
+
+def trigram_match(db: Session, vocabulary: Sequence[str]) -> List[Tuple[Service, float]]:
+    """
+    Services whose names contain any covered name as whole words, best first
+    `name %> :covered` is answered from the gin_trgm_ops index on services.name and only
+    narrows the candidates (an exact word match has word_similarity 1); near misses such as
+    "Radiology" in "Cardiology Follow-up" are dropped by the automaton's re-check.
+    """
+    names = [name for name in vocabulary if name.strip()]
+    if not names:
+        return []
+    candidates = db.query(Service).filter(
+        Service.is_available == True,
+        or_(*[Service.name.op("%>")(name) for name in names])
+    ).all()
+    by_id = {service.id: service for service in candidates}
+    ranked = get_matcher(tuple(sorted(set(names)))).rank((service.id, service.name) for service in candidates)
+    return [(by_id[service_id], score) for service_id, _, score in ranked]
+
+
+def matcher_backend(db: Session) -> str:
+    """Resolve SERVICE_MATCHER=auto to the backend used for this database"""
+    if SERVICE_MATCHER == "auto":
+        return "trgm" if trigram_available(db) else "automaton"
+    return SERVICE_MATCHER
@@ -0,0 +1,82 @@
+"""Admission control: only solves take a slot, and the limit leaves pool headroom"""
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+import route_optimizer
+from admission import AdmissionController, pool_concurrency
+from database import make_engine
+from idempotency import request_fingerprint
+from route_optimizer import (
+    PatientInput, ReoptimizeRequest, optimize_route, reoptimize_route, route_results, solve_route_request
+)
+
+
+class FakeRequest:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+@pytest.fixture
+def single_slot(monkeypatch):
+    controller = AdmissionController(1, queue_size=0, urgent_reserve=0)
+    monkeypatch.setattr(route_optimizer, "admission", controller)
+    route_results.clear()
+    yield controller
+    route_results.clear()
+
+
+def patient(name="Ana Diaz"):
+    return PatientInput(name=name, insurance_code="AET-GOLD", location_latitude=37.08, location_longitude=-94.51)
+
+
+def test_limit_is_below_the_pool(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'pool.db'}")
+    assert pool_concurrency(engine) == 10 + 20 - 4
+    assert pool_concurrency(engine, reserve=100) == 1
+
+
+def test_cache_hits_and_replays_skip_admission(db, catalog, single_slot):
+    async def scenario():
+        request = FakeRequest({"Idempotency-Key": "visit-1"})
+        first = await optimize_route(patient(), request, "interactive", db)
+        assert single_slot.active == 0
+
+        async with single_slot.slot("urgent"):
+            replayed = await optimize_route(patient(), request, "interactive", db)
+            assert replayed.headers["Idempotent-Replayed"] == "true"
+            assert replayed.body == first.body
+
+            hit = await optimize_route(patient(), FakeRequest({}), "interactive", db)
+            assert hit.headers["X-Route-Cache"] == "hit"
+
+            with pytest.raises(HTTPException) as rejected:
+                await solve_route_request(patient("Ben Diaz"), request_fingerprint({"other": 1}), db, "interactive")
+            assert rejected.value.status_code == 429
+            assert "Retry-After" in rejected.value.headers
+
+    asyncio.run(scenario())
+
+
+def test_reoptimize_solves_off_the_event_loop_under_a_slot(db, route, single_slot, monkeypatch):
+    solve = route_optimizer.optimize_route_astar
+    threads = []
+
+    def recording_solve(*args, **kwargs):
+        threads.append((threading.current_thread(), single_slot.active))
+        return solve(*args, **kwargs)
+
+    monkeypatch.setattr(route_optimizer, "optimize_route_astar", recording_solve)
+
+    async def scenario():
+        async with single_slot.slot("urgent"):
+            with pytest.raises(HTTPException) as rejected:
+                await reoptimize_route(ReoptimizeRequest(route_id=route.route_id), "interactive", db)
+            assert rejected.value.status_code == 429
+        await reoptimize_route(ReoptimizeRequest(route_id=route.route_id), "interactive", db)
+        assert single_slot.active == 0
+
+    asyncio.run(scenario())
+    assert [(thread is threading.main_thread(), active) for thread, active in threads] == [(False, 1)]
@@ -0,0 +1,72 @@
+"""Analytics export: CSV and Parquet rows match the route join, filtered on the route's plan"""
+import csv
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+from analytics_export import COLUMN_NAMES, PARQUET_AVAILABLE, export_routes
+from models import Patient, Route, RouteNode
+
+
+def expected_rows(db):
+    """(route_id, insurance_code, node_id, order_index, service_name, provider_name) from the ORM"""
+    return sorted(
+        (route.id, route.insurance_code, node.id, node.order_index, node.service.name, node.service.provider.name)
+        for route in db.query(Route).all() for node in route.route_nodes
+    )
+
+
+def key(row):
+    return (int(row["route_id"]), row["insurance_code"], int(row["node_id"]), int(row["order_index"]),
+            row["service_name"], row["provider_name"])
+
+
+def read_csv(db, **filters):
+    data = b"".join(export_routes(db, "csv", batch_size=1, **filters)).decode()
+    reader = csv.DictReader(io.StringIO(data))
+    assert reader.fieldnames == COLUMN_NAMES
+    return sorted(key(row) for row in reader)
+
+
+def read_parquet(db, **filters):
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(io.BytesIO(b"".join(export_routes(db, "parquet", batch_size=1, **filters))))
+    assert table.column_names == COLUMN_NAMES
+    return sorted(key(row) for row in table.to_pylist())
+
+
+@pytest.fixture(params=["csv", "parquet"])
+def read_export(request):
+    if request.param == "parquet" and not PARQUET_AVAILABLE:
+        pytest.skip("pyarrow is not installed")
+    return read_csv if request.param == "csv" else read_parquet
+
+
+def test_rows_match_the_route_join(db, route, read_export):
+    rows = read_export(db)
+    assert rows == expected_rows(db)
+    assert len(rows) == db.query(RouteNode).filter(RouteNode.route_id == route.route_id).count() > 0
+
+
+def test_filters_use_the_plan_the_route_was_made_under(db, route, read_export):
+    # The patient changes plans after the route was created
+    db.query(Patient).update({"insurance_code": "BCBS-BASIC"})
+    db.commit()
+    assert {row[1] for row in read_export(db, insurance_code="AET-GOLD")} == {"AET-GOLD"}
+    assert read_export(db, insurance_code="BCBS-BASIC") == []
+
+    # Routes from before the snapshot column fall back to the patient's plan
+    db.query(Route).update({"insurance_code": None})
+    db.commit()
+    assert {row[1] for row in read_export(db, insurance_code="BCBS-BASIC")} == {"BCBS-BASIC"}
+
+
+def test_created_at_range(db, route, read_export):
+    created = datetime(2026, 1, 15, 12, 0)
+    db.query(Route).update({"created_at": created})
+    db.commit()
+    assert read_export(db, since=created, until=created + timedelta(seconds=1)) == expected_rows(db)
+    assert read_export(db, since=created + timedelta(seconds=1)) == []
+    assert read_export(db, until=created) == []
@@ -0,0 +1,85 @@
+"""Audit archival: hot window bounds, job payload limits and retries after a crash"""
+import gzip
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+import audit
+from audit import add_months, archive_month, archive_old_months, archive_path, month_start
+from models import AuditTrail
+
+
+def add_rows(db, month, count):
+    for index in range(count):
+        db.add(AuditTrail(user_id="u", user_role="admin", action="viewed", entity_type="Route",
+                          entity_id=index, timestamp=month.replace(day=2, hour=index % 24)))
+    db.commit()
+
+
+@pytest.fixture
+def months(db):
+    current = month_start(datetime.utcnow())
+    old = add_months(current, -(audit.AUDIT_HOT_MONTHS + 2))
+    add_rows(db, current, 3)
+    add_rows(db, add_months(current, -1), 2)
+    add_rows(db, old, 4)
+    return current, old
+
+
+def test_short_hot_window_is_clamped(db, months, tmp_path):
+    current, old = months
+    archived = archive_old_months(db, hot_months=0, archive_dir=str(tmp_path))
+
+    assert [a["month"] for a in archived] == [f"{old:%Y-%m}"]
+    assert db.query(AuditTrail).count() == 5
+    assert db.query(AuditTrail).filter(AuditTrail.timestamp >= current).count() == 3
+
+
+def test_current_month_is_never_archived(db, months, tmp_path):
+    current, _ = months
+    with pytest.raises(ValueError):
+        archive_month(db, current, str(tmp_path))
+    assert db.query(AuditTrail).filter(AuditTrail.timestamp >= current).count() == 3
+
+
+def test_job_ignores_archive_dir_and_short_window(db, months, tmp_path, monkeypatch):
+    from jobs import run_archive_audit_trails
+
+    monkeypatch.setattr(audit, "AUDIT_ARCHIVE_DIR", str(tmp_path / "configured"))
+    elsewhere = tmp_path / "elsewhere"
+    result = run_archive_audit_trails(db, {"hot_months": 0, "archive_dir": str(elsewhere)}, None)
+
+    assert len(result["months"]) == 1
+    assert result["months"][0]["path"].startswith(str(tmp_path / "configured"))
+    assert not elsewhere.exists()
+    assert db.query(AuditTrail).count() == 5
+
+
+def test_retry_replaces_archive_left_by_crashed_run(db, months, tmp_path):
+    _, old = months
+    path = archive_path(old, str(tmp_path))
+    # A crashed run: a truncated archive and temp file on disk, rows still in the table
+    with gzip.open(path, "wb") as partial:
+        partial.write(json.dumps({"id": 1}).encode() + b"\n")
+    open(path + ".stale.tmp", "wb").close()
+
+    archived = archive_month(db, old, str(tmp_path))
+
+    assert archived["rows"] == 4
+    with gzip.open(path, "rb") as archived_file:
+        assert sum(1 for _ in archived_file) == 4
+    assert db.query(AuditTrail).count() == 5
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp") and "stale" not in name]
+
+
+def test_archive_with_rows_gone_from_table_is_kept(db, months, tmp_path):
+    _, old = months
+    archive_month(db, old, str(tmp_path))
+    add_rows(db, old, 1)  # Late row for a month already archived
+
+    with pytest.raises(RuntimeError):
+        archive_month(db, old, str(tmp_path))
+    with gzip.open(archive_path(old, str(tmp_path)), "rb") as archived_file:
+        assert sum(1 for _ in archived_file) == 4
@@ -0,0 +1,93 @@
+"""Normalized service coverage: matching rules and maintenance on catalog writes"""
+import json
+
+from coverage import rebuild_service_coverage
+from models import InsuranceProgram, Provider, Service, ServiceCoverage
+from route_optimizer import query_covered_services
+from service_matcher import match_service_names
+
+
+def plan(code="AET-GOLD", covered=("Primary Care", "Cardiology", "Radiology", "Lab Work")):
+    return InsuranceProgram(insurance_code=code, provider_name="Aetna", covered_services=json.dumps(list(covered)))
+
+
+def covered(db, code="AET-GOLD"):
+    return {
+        name for (name,) in db.query(Service.name).join(ServiceCoverage, ServiceCoverage.service_id == Service.id)
+        .filter(ServiceCoverage.insurance_code == code)
+    }
+
+
+def add_services(db, *names, specialty="Radiology"):
+    provider = Provider(name="Imaging", specialty=specialty, location_latitude=37.1, location_longitude=-94.5,
+                        address="2 Oak Ave")
+    db.add(provider)
+    db.flush()
+    services = [Service(name=name, price=100.0, duration_minutes=20, provider_id=provider.id) for name in names]
+    db.add_all(services)
+    db.commit()
+    return services
+
+
+def test_rows_match_the_fallback_word_rule(db, catalog):
+    add_services(db, "Chest X-Ray", "radiology ct scan", "Blood Draw (lab work)", "Collab Workshop",
+                 "Neuroradiology Consult")
+    db.add(plan())
+    db.commit()
+    # Provider specialty alone does not make a service covered (Chest X-Ray), nor do
+    # categories found inside other words (Collab Workshop, Neuroradiology)
+    assert covered(db) == {"Cardiology Follow-up", "Radiology Imaging", "radiology ct scan", "Blood Draw (lab work)"}
+
+    names = ["Primary Care", "Cardiology", "Radiology", "Lab Work"]
+    assert {s.name for s in query_covered_services(db, names, "AET-GOLD")} == \
+        {db.get(Service, service_id).name for service_id, _, _ in match_service_names(db, names)}
+
+
+def test_rebuild_agrees_with_maintained_rows(db, catalog):
+    db.add_all([plan(), plan("BCBS-SILVER", ("Primary Care", "Cardiology", "Dermatology"))])
+    db.commit()
+    add_services(db, "Dermatology Consultation", specialty="Dermatology")
+    maintained = sorted(db.query(ServiceCoverage.insurance_code, ServiceCoverage.service_id, ServiceCoverage.category))
+
+    rebuild_service_coverage(db.connection())
+    db.commit()
+    rebuilt = sorted(db.query(ServiceCoverage.insurance_code, ServiceCoverage.service_id, ServiceCoverage.category))
+    assert maintained == rebuilt
+    assert len(rebuilt) == 4
+
+
+def test_service_writes_update_rows(db, catalog):
+    db.add(plan())
+    db.commit()
+    (service,) = add_services(db, "Lab Work Panel")
+    assert "Lab Work Panel" in covered(db)
+
+    service.name = "Vision Screening"
+    db.commit()
+    assert "Vision Screening" not in covered(db)
+
+    service.name = "Radiology Review"
+    service.service_code = "76140"
+    db.commit()
+    row = db.query(ServiceCoverage).filter(ServiceCoverage.service_id == service.id).one()
+    assert (row.service_code, row.category) == ("76140", "Radiology")
+
+
+def test_plan_writes_update_rows(db, catalog):
+    program = plan(covered=("Cardiology",))
+    db.add(program)
+    db.commit()
+    assert covered(db) == {"Cardiology Follow-up"}
+
+    program.covered_services = json.dumps(["Radiology"])
+    db.commit()
+    assert covered(db) == {"Radiology Imaging"}
+
+    program.insurance_code = "AET-GOLD-2"
+    db.commit()
+    assert covered(db) == set()
+    assert covered(db, "AET-GOLD-2") == {"Radiology Imaging"}
+
+    db.delete(program)
+    db.commit()
+    assert db.query(ServiceCoverage).count() == 0
@@ -0,0 +1,101 @@
+"""Read replicas: consistency tokens and replay checks share the request's connections"""
+import pytest
+from sqlalchemy import event, text
+
+import database
+from database import ReplicaSet, make_engine, write_token
+
+
+@pytest.fixture
+def two_databases(tmp_path, monkeypatch):
+    """A primary and a "replica" on two local SQLite files, counting pool checkouts"""
+    primary = make_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    replica = make_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    checkouts = {"primary": 0, "replica": 0}
+    state = {"current_lsn": 200, "replay_lsn": 150}
+
+    def count(name):
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            checkouts[name] += 1
+        return checkout
+
+    @event.listens_for(primary, "connect")
+    def wal_position(dbapi_connection, connection_record):
+        dbapi_connection.create_function("pg_current_wal_lsn", 0, lambda: str(state["current_lsn"]))
+
+    @event.listens_for(replica, "connect")
+    def replay_position(dbapi_connection, connection_record):
+        # CAST(:lsn AS pg_lsn) has numeric affinity on SQLite, so LSNs compare as numbers
+        dbapi_connection.create_function("pg_last_wal_replay_lsn", 0, lambda: state["replay_lsn"])
+
+    event.listen(primary.pool, "checkout", count("primary"))
+    event.listen(replica.pool, "checkout", count("replica"))
+    monkeypatch.setattr(database, "engine", primary)
+    monkeypatch.setattr(database, "replicas", ReplicaSet(primary, [replica]))
+    monkeypatch.setattr(database, "SessionLocal", database.sessionmaker(bind=primary))
+    monkeypatch.setattr(database, "REPLICA_LSN_WAIT_SECONDS", 0.01)
+    monkeypatch.setattr(primary.dialect, "name", "postgresql")
+    yield primary, replica, checkouts, state
+    primary.dispose()
+    replica.dispose()
+
+
+def test_write_token_reads_on_the_session_connection(two_databases):
+    primary, _, checkouts, _ = two_databases
+    db = database.SessionLocal()
+    db.execute(text("SELECT 1"))
+    assert write_token(db) == "lsn:200"
+    assert checkouts["primary"] == 1
+    db.close()
+
+
+def test_replayed_replica_is_read_on_one_connection(two_databases):
+    _, replica, checkouts, _ = two_databases
+    db = database._read_session("lsn:120")
+    assert db.get_bind() is replica
+    assert db.execute(text("SELECT 1")).scalar() == 1
+    assert checkouts == {"primary": 0, "replica": 1}
+    db.close()
+
+
+def test_lagging_replica_falls_back_to_the_primary(two_databases):
+    primary, _, checkouts, _ = two_databases
+    db = database._read_session("lsn:180")
+    assert db.get_bind() is primary
+    db.execute(text("SELECT 1"))
+    assert checkouts == {"primary": 1, "replica": 1}
+    # Lagging is not unhealthy: later reads without a token still use the replica
+    assert database.replicas.healthy == [True]
+    db.close()
+
+
+def test_recent_time_token_reads_the_primary(two_databases):
+    primary, _, checkouts, _ = two_databases
+    db = database._read_session("t:9999999999")
+    assert db.get_bind() is primary
+    assert checkouts["replica"] == 0
+    db.close()
+
+
+class FakeRequest:
+    def __init__(self):
+        self.state = type("State", (), {})()
+
+
+def test_get_db_times_the_checkout_on_first_use(two_databases):
+    _, _, checkouts, _ = two_databases
+    waits = lambda: database.POOL_WAIT_SECONDS._series.get((), [None, 0.0, 0])[2]
+    before = waits()
+    request = FakeRequest()
+    dependency = database.get_db(request)
+    db = next(dependency)
+    assert request.state.db is db
+    assert checkouts["primary"] == 0 and waits() == before
+
+    db.execute(text("SELECT 1"))
+    db.execute(text("SELECT 2"))
+    assert checkouts["primary"] == 1 and waits() == before + 1
+    db.commit()
+    db.execute(text("SELECT 3"))
+    assert checkouts["primary"] == 2 and waits() == before + 2
+    dependency.close()
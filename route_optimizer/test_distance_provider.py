@@ -0,0 +1,46 @@
+"""Distance providers: interface and batched path legs"""
+import pytest
+
+from distance_provider import DenseTravelMatrix, DistanceProvider, HaversineProvider, TravelMatrix
+from models import Provider, Service
+from route_optimizer import assemble_route
+
+
+class CountingProvider(HaversineProvider):
+    """Straight-line legs, counting matrix queries like a road-network backend would pay for"""
+
+    def __init__(self):
+        self.queries = []
+
+    def matrix(self, origins, destinations):
+        self.queries.append((len(origins), len(destinations)))
+        legs = [[HaversineProvider.leg(self, o, d) for d in destinations] for o in origins]
+        return DenseTravelMatrix([[m for m, _ in row] for row in legs], [[t for _, t in row] for row in legs])
+
+
+def test_interfaces_are_abstract():
+    with pytest.raises(TypeError):
+        TravelMatrix()
+    with pytest.raises(TypeError):
+        DistanceProvider()
+
+
+def test_path_legs_match_single_legs():
+    points = [(37.08, -94.51), (37.09, -94.51), (37.10, -94.53), (37.08, -94.51)]
+    provider = CountingProvider()
+    legs = provider.path_legs(points)
+    assert provider.queries == [(3, 3)]
+    assert legs == pytest.approx([HaversineProvider().leg(a, b) for a, b in zip(points, points[1:])])
+    assert provider.path_legs(points[:1]) == []
+
+
+def test_assembly_queries_legs_once():
+    providers = {
+        k: Provider(id=k, name=f"P{k}", location_latitude=37.08 + k / 100, location_longitude=-94.51)
+        for k in (1, 2, 3)
+    }
+    services = {k: Service(id=k, name=f"S{k}", price=100.0, duration_minutes=15, provider_id=k) for k in (1, 2, 3)}
+    provider = CountingProvider()
+    assembled = assemble_route([(1, 1), (2, 2), (3, 3)], services, providers, 37.08, -94.51, 80.0, 0.5, provider)
+    assert provider.queries == [(3, 3)]
+    assert [n.travel_distance_miles for n in assembled["nodes"]] == pytest.approx([0.69, 0.69, 0.69], abs=0.01)
@@ -0,0 +1,108 @@
+"""Route event fan-out: in-memory hub, SSE and WebSocket streams"""
+import asyncio
+import json
+import threading
+
+import pytest
+from fastapi import WebSocketDisconnect
+from fastapi.testclient import TestClient
+
+from events import PostgresListener, RouteEventHub, hub, publish_route_event
+from models import RouteNode
+from route_optimizer import (
+    NodeStatusUpdate, RouteUpdateRequest, app, apply_node_status_updates, route_events_stream, update_node_status
+)
+
+
+def test_hub_fans_out_per_route():
+    async def scenario():
+        event_hub = RouteEventHub()
+        first, second = event_hub.subscribe(1), event_hub.subscribe(1)
+        other = event_hub.subscribe(2)
+        event_hub.dispatch({"type": "node_status", "route_id": 1})
+        assert await first.get(1) == await second.get(1) == {"type": "node_status", "route_id": 1}
+        assert await other.get(0.01) is None
+
+        event_hub.unsubscribe(first)
+        assert event_hub.subscriber_count == 2
+        # From another thread (the PostgreSQL listener), delivery goes through the loop
+        thread = threading.Thread(target=event_hub.dispatch, args=({"type": "route_updated", "route_id": 2},))
+        thread.start()
+        thread.join()
+        assert (await other.get(1))["type"] == "route_updated"
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_gets_one_resync():
+    async def scenario():
+        event_hub = RouteEventHub()
+        subscription = event_hub.subscribe(1)
+        subscription.queue = asyncio.Queue(maxsize=3)
+        for index in range(5):
+            event_hub.dispatch({"type": "node_status", "route_id": 1, "index": index})
+        events = [await subscription.get(0.01) for _ in range(3)]
+        assert events[0] == {"type": "resync", "route_id": 1, "dropped": 3}
+        assert [e["index"] for e in events[1:] if e] == [4]
+
+    asyncio.run(scenario())
+
+
+def test_listener_stop_does_not_shadow_thread_internals():
+    listener = PostgresListener(engine=None)
+    listener.stop()
+    assert listener._stopping.is_set()
+    assert callable(listener._stop)  # threading.Thread's own method, used by join()
+
+
+class FakeRequest:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+def test_sse_stream_delivers_published_events(db, route):
+    async def scenario():
+        request = FakeRequest()
+        response = await route_events_stream(route.route_id, request)
+        body = response.body_iterator
+        assert await body.__anext__() == "retry: 3000\n\n"
+        publish_route_event(db, {"type": "node_status", "route_id": route.route_id, "status": "Completed"})
+        chunk = await body.__anext__()
+        event, data = chunk.strip().split("\n")
+        assert event == "event: node_status"
+        assert json.loads(data[len("data: "):])["status"] == "Completed"
+        request.disconnected = True
+        assert [chunk async for chunk in body] == []
+        assert hub.subscriber_count == 0
+
+    asyncio.run(scenario())
+
+
+def test_websocket_receives_status_updates(db, route):
+    node = db.query(RouteNode.id, RouteNode.version).filter(RouteNode.route_id == route.route_id).first()
+    client = TestClient(app)
+    with client.websocket_connect(f"/ws/routes/{route.route_id}") as socket:
+        assert socket.receive_json() == {"type": "subscribed", "route_id": route.route_id}
+        apply_node_status_updates(db, [
+            NodeStatusUpdate(route_id=route.route_id, node_id=node.id, status="Completed")
+        ])
+        event = socket.receive_json()
+        assert (event["type"], event["node_id"], event["status"], event["version"], event["route_version"]) == (
+            "node_status", node.id, "Completed", node.version + 1, route.version + 1
+        )
+
+        # Single updates carry the route version too, so dashboards keep expected_version current
+        asyncio.run(update_node_status(route.route_id, node.id, RouteUpdateRequest(status="In Progress"), db))
+        event = socket.receive_json()
+        assert (event["status"], event["route_version"]) == ("In Progress", route.version + 2)
+
+
+def test_websocket_closes_for_unknown_route(db):
+    client = TestClient(app)
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/ws/routes/999"):
+            pass
+    assert closed.value.code == 4404
@@ -0,0 +1,129 @@
+"""FHIR bulk $import / $export"""
+import gzip
+import json
+import os
+from datetime import timedelta
+
+from sqlalchemy import update
+
+from fhir_export import FHIR_EXPORT_SINCE_MARGIN_SECONDS, export_routes, export_transaction_time, parse_since
+from fhir_import import PROVIDER_COLUMNS, copy_statement, run_import
+from models import Patient, Provider, Route, RouteNode, Service, StatusEnum
+
+GEO = "http://hl7.org/fhir/StructureDefinition/geolocation"
+
+
+def _point(latitude, longitude):
+    return {"extension": [{"url": GEO, "extension": [
+        {"url": "latitude", "valueDecimal": latitude}, {"url": "longitude", "valueDecimal": longitude}
+    ]}]}
+
+
+def _write_ndjson(path, resources):
+    with open(path, "w") as f:
+        for resource in resources:
+            f.write(json.dumps(resource) + "\n")
+    return path
+
+
+def _read_ndjson_gz(path):
+    with gzip.open(path, "rt") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_copy_keeps_empty_not_null_columns(db):
+    statement = copy_statement("fhir_import_providers", Provider, PROVIDER_COLUMNS)
+    assert "FORMAT csv" in statement
+    assert "FORCE_NOT_NULL (name, specialty, address)" in statement
+    # Nullable columns still read an empty field as NULL
+    assert "phone" not in statement.split("FORCE_NOT_NULL")[1]
+
+
+def test_import_provider_without_address(db, tmp_path):
+    path = _write_ndjson(tmp_path / "Location.ndjson", [
+        {"resourceType": "Location", "id": "loc-1", "name": "Clinic",
+         "position": {"latitude": 40.7, "longitude": -74.0}},
+        {"resourceType": "Location", "id": "loc-2", "name": "Lab", "address": {"text": "1 Main St"},
+         "position": {"latitude": 40.8, "longitude": -74.1}}
+    ])
+    summary = run_import(db, [{"type": "Location", "url": str(path)}])
+    assert summary["written"] == 2 and summary["skipped"] == 0
+    addresses = dict(db.query(Provider.fhir_id, Provider.address))
+    assert addresses == {"Location/loc-1": "", "Location/loc-2": "1 Main St"}
+
+
+def test_import_is_idempotent(db, tmp_path):
+    patient = {"resourceType": "Patient", "id": "p-1", "name": [{"text": "Ada Lovelace"}],
+               "birthDate": "1815-12-10", "address": [dict(_point(40.7, -74.0), text="1 Main St")],
+               "extension": [{"url": "http://referharmony.org/fhir/StructureDefinition/insurance-code",
+                              "valueString": "AET-GOLD"}]}
+    path = _write_ndjson(tmp_path / "Patient.ndjson", [patient])
+    run_import(db, [{"url": str(path)}])
+    patient["name"] = [{"text": "Ada King"}]
+    _write_ndjson(path, [patient])
+    run_import(db, [{"url": str(path)}])
+    rows = db.query(Patient).all()
+    assert [(p.fhir_id, p.name, p.insurance_code) for p in rows] == [("p-1", "Ada King", "AET-GOLD")]
+
+
+def test_import_export_round_trip(db, tmp_path):
+    inputs = tmp_path / "in"
+    inputs.mkdir()
+    _write_ndjson(inputs / "Organization.ndjson", [
+        {"resourceType": "Organization", "id": "org-1", "name": "Harbor Health",
+         "identifier": [{"system": "http://hl7.org/fhir/sid/us-npi", "value": "1234567890"}],
+         "type": [{"text": "Cardiology"}], "address": [_point(40.7, -74.0)]}
+    ])
+    _write_ndjson(inputs / "Location.ndjson", [
+        {"resourceType": "Location", "id": "loc-1", "managingOrganization": {"reference": "Organization/org-1"},
+         "position": {"latitude": 40.71, "longitude": -74.01}}
+    ])
+    _write_ndjson(inputs / "Patient.ndjson", [
+        {"resourceType": "Patient", "id": "p-1", "name": [{"given": ["Ada"], "family": "Lovelace"}],
+         "address": [_point(40.72, -74.02)],
+         "extension": [{"url": "http://referharmony.org/fhir/StructureDefinition/insurance-code",
+                        "valueString": "AET-GOLD"}]}
+    ])
+    # Locations listed first still take their Organization's details
+    run_import(db, [{"type": t, "url": f"{t}.ndjson"} for t in ("Patient", "Location", "Organization")],
+               base_dir=str(inputs))
+
+    location = db.query(Provider).filter(Provider.fhir_id == "Location/loc-1").one()
+    assert (location.name, location.specialty, location.npi) == ("Harbor Health", "Cardiology", "1234567890")
+    patient = db.query(Patient).filter(Patient.fhir_id == "p-1").one()
+    assert patient.name == "Ada Lovelace"
+
+    service = Service(name="Echocardiogram", price=300.0, duration_minutes=45, provider_id=location.id,
+                      service_code="93306")
+    db.add(service)
+    db.flush()
+    route = Route(patient_id=patient.id, total_cost=300.0, total_time_minutes=45, status="Active")
+    db.add(route)
+    db.flush()
+    db.add(RouteNode(route_id=route.id, service_id=service.id, order_index=0, status=StatusEnum.PENDING))
+    db.commit()
+
+    manifest = export_routes(db, str(tmp_path / "out"))
+    assert {o["type"]: o["count"] for o in manifest["output"]} == {"CarePlan": 1, "ServiceRequest": 1}
+    (care_plan,) = _read_ndjson_gz(os.path.join(tmp_path, "out", "CarePlan.ndjson.gz"))
+    (request,) = _read_ndjson_gz(os.path.join(tmp_path, "out", "ServiceRequest.ndjson.gz"))
+    # Imported FHIR ids are the references of the exported resources
+    assert care_plan["subject"] == {"reference": "Patient/p-1"}
+    assert request["subject"] == {"reference": "Patient/p-1"}
+    assert request["performer"][0]["reference"] == "Location/loc-1"
+    assert request["locationReference"] == [{"reference": "Location/loc-1"}]
+    assert request["basedOn"] == [{"reference": f"CarePlan/{care_plan['id']}"}]
+    assert request["code"]["coding"][0]["code"] == "93306"
+
+
+def test_incremental_export_covers_transactions_open_during_the_last_one(db, route, tmp_path):
+    clock = export_transaction_time(db) + timedelta(seconds=FHIR_EXPORT_SINCE_MARGIN_SECONDS)
+    manifest = export_routes(db, str(tmp_path / "full"))
+    # A status update whose transaction began a minute before the export and committed after it
+    db.execute(update(Route).where(Route.id == route.route_id).values(
+        version=Route.version + 1, updated_at=clock - timedelta(seconds=60)
+    ))
+    db.commit()
+
+    since = parse_since(manifest["transactionTime"])
+    assert export_routes(db, str(tmp_path / "incremental"), since)["routes"] == 1
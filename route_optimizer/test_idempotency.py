@@ -0,0 +1,152 @@
+"""Request coalescing and the route result cache"""
+import asyncio
+
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import update
+
+from idempotency import (
+    ResultCache, SingleFlight, claim_idempotency_key, complete_idempotency_key, release_idempotency_key,
+    request_fingerprint
+)
+from models import IdempotencyKey, Route, RouteNode
+from route_optimizer import (
+    NodeStatusUpdate, PatientInput, ReoptimizeRequest, apply_node_status_updates, create_optimized_route,
+    reoptimize_route, route_results, solve_route_request
+)
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def scenario():
+        flights = SingleFlight()
+        release = asyncio.Event()
+        runs = []
+
+        async def work():
+            runs.append(1)
+            await release.wait()
+            return "route"
+
+        leader = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await follower == ("route", True)
+        assert leader.cancelled()
+        assert runs == [1]
+        assert await flights.do("key", work) == ("route", False)  # The finished flight was forgotten
+
+    asyncio.run(scenario())
+
+
+def test_failure_reaches_every_caller():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("no route")
+
+        results = await asyncio.gather(flights.do("key", work), flights.do("key", work), return_exceptions=True)
+        assert [type(r) for r in results] == [ValueError, ValueError]
+
+    asyncio.run(scenario())
+
+
+def test_cache_entry_is_retired_when_the_route_version_moves():
+    cache = ResultCache(max_entries=4, ttl_seconds=60)
+    cache.put("fingerprint", "response", route_id=7, version=1)
+    assert cache.get("fingerprint", lambda route_id: 1) == "response"
+    assert cache.get("fingerprint", lambda route_id: 2) is None
+    assert cache.get("fingerprint") is None
+
+
+@pytest.fixture
+def solve(db, catalog):
+    route_results.clear()
+    patient_input = PatientInput(name="Ana Diaz", insurance_code="AET-GOLD", location_latitude=37.08,
+                                 location_longitude=-94.51)
+    fingerprint = request_fingerprint(patient_input.model_dump())
+    yield lambda: asyncio.run(solve_route_request(patient_input, fingerprint, db))
+    route_results.clear()
+
+
+def test_cached_route_is_served_until_it_changes(db, solve):
+    route, source = solve()
+    assert (source, route.version) == (None, 1)
+    assert solve() == (route, "hit")
+
+    node_id = db.query(RouteNode.id).filter(RouteNode.route_id == route.route_id).first()[0]
+    apply_node_status_updates(db, [NodeStatusUpdate(route_id=route.route_id, node_id=node_id, status="Completed")])
+    fresh, source = solve()
+    assert source is None and fresh.route_id != route.route_id
+
+
+def test_change_from_another_worker_retires_the_cached_route(db, solve):
+    route, _ = solve()
+    # Another process bumps the version; this process's invalidate_route never runs
+    db.execute(update(Route).where(Route.id == route.route_id).values(version=Route.version + 1))
+    db.commit()
+    assert solve()[1] is None
+
+
+def test_reoptimize_invalidates_the_cached_route(db, solve):
+    route, _ = solve()
+    asyncio.run(reoptimize_route(ReoptimizeRequest(route_id=route.route_id), "interactive", db))
+    assert route_results.get(request_fingerprint(
+        PatientInput(name="Ana Diaz", insurance_code="AET-GOLD", location_latitude=37.08,
+                     location_longitude=-94.51).model_dump()
+    )) is None
+
+
+def lapse(db, key):
+    db.query(IdempotencyKey).filter(IdempotencyKey.key == key).update(
+        {"expires_at": datetime.utcnow() - timedelta(seconds=1)}, synchronize_session=False
+    )
+    db.commit()
+
+
+def test_keyed_request_completes_its_key_with_the_route(db, catalog):
+    route_results.clear()
+    patient_input = PatientInput(name="Ana Diaz", insurance_code="AET-GOLD", location_latitude=37.08,
+                                 location_longitude=-94.51)
+    fingerprint = request_fingerprint(patient_input.model_dump())
+    stored, claim_token = claim_idempotency_key(db, "retry-1", fingerprint)
+    assert stored is None
+
+    route, source = asyncio.run(solve_route_request(patient_input, fingerprint, db, idempotency_key="retry-1",
+                                                    claim_token=claim_token))
+    record = db.query(IdempotencyKey).filter(IdempotencyKey.key == "retry-1").one()
+    assert source is None and record.route_id == route.route_id and record.response is not None
+    assert claim_idempotency_key(db, "retry-1", fingerprint) == (record.response, None)
+    route_results.clear()
+
+
+def test_lapsed_claim_taken_over_by_a_retry_is_not_completed_or_released(db):
+    _, first = claim_idempotency_key(db, "retry-2", "hash")
+    lapse(db, "retry-2")
+    _, second = claim_idempotency_key(db, "retry-2", "hash")
+    assert second != first
+
+    release_idempotency_key(db, "retry-2", first)
+    assert complete_idempotency_key(db, "retry-2", first, None, "{}") is False
+    assert complete_idempotency_key(db, "retry-2", second, None, '{"route_id": null}') is True
+    assert db.query(IdempotencyKey.response).filter(IdempotencyKey.key == "retry-2").scalar() == '{"route_id": null}'
+
+
+def test_route_of_a_lost_claim_is_rolled_back(db, catalog):
+    patient_input = PatientInput(name="Ana Diaz", insurance_code="AET-GOLD", location_latitude=37.08,
+                                 location_longitude=-94.51)
+    _, first = claim_idempotency_key(db, "retry-3", "hash")
+    lapse(db, "retry-3")
+    claim_idempotency_key(db, "retry-3", "hash")
+
+    with pytest.raises(HTTPException) as lost:
+        create_optimized_route(patient_input, db, idempotency_key="retry-3", claim_token=first)
+    assert lost.value.status_code == 409
+    assert db.query(Route).count() == 0
@@ -0,0 +1,141 @@
+"""Job queue: claims, retries, lease expiry and heartbeats (SQLite compare-and-set path)"""
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from database import SessionLocal
+from jobs import (
+    FAILED, QUEUED, RUNNING, SUCCEEDED, PermanentJobError, Worker, claim_jobs, complete_job, enqueue_job,
+    fail_job, job_handler, renew_lease
+)
+from models import IdempotencyKey, Job, Route
+
+calls = []
+
+
+@job_handler("test_echo")
+def echo(db, payload, job):
+    calls.append(job.id)
+    if payload.get("sleep"):
+        time.sleep(payload["sleep"])
+        # The heartbeat keeps the lease, so no other worker can take the job meanwhile
+        other = SessionLocal()
+        try:
+            payload["stolen"] = claim_jobs(other, "thief", kinds=["test_echo"])
+        finally:
+            other.close()
+    if payload.get("fail"):
+        raise RuntimeError("boom")
+    if payload.get("invalid"):
+        raise PermanentJobError("bad payload")
+    return payload
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(jobs, "retry_delay", lambda attempts: 0)
+    calls.clear()
+
+
+def test_claim_by_priority_and_only_once(db):
+    low = enqueue_job(db, "test_echo", priority=0).id
+    high = enqueue_job(db, "test_echo", priority=5).id
+    later = enqueue_job(db, "test_echo", delay_seconds=60).id
+
+    assert claim_jobs(db, "w1", limit=1) == [high]
+    assert claim_jobs(db, "w2", limit=5) == [low]
+    assert claim_jobs(db, "w3", limit=5) == []
+    assert db.get(Job, later).status == QUEUED
+
+
+def test_failures_retry_until_max_attempts(db):
+    job_id = enqueue_job(db, "test_echo", {"fail": True}, max_attempts=2).id
+    worker = Worker(SessionLocal, "w1")
+
+    assert worker.run(once=True) == 2
+    db.expire_all()
+    job = db.get(Job, job_id)
+    assert (job.status, job.attempts) == (FAILED, 2)
+    assert "boom" in job.last_error
+    assert calls == [job_id, job_id]
+
+
+def test_permanent_error_is_not_retried(db):
+    job_id = enqueue_job(db, "test_echo", {"invalid": True}).id
+    Worker(SessionLocal, "w1").run(once=True)
+    db.expire_all()
+    assert (db.get(Job, job_id).status, db.get(Job, job_id).attempts) == (FAILED, 1)
+
+
+def test_expired_lease_is_reclaimed_and_fences_the_old_worker(db):
+    job_id = enqueue_job(db, "test_echo").id
+    assert claim_jobs(db, "w1", lease_seconds=-1) == [job_id]
+    assert claim_jobs(db, "w2") == [job_id]
+    db.expire_all()
+    assert db.get(Job, job_id).attempts == 2
+
+    assert not renew_lease(db, job_id, "w1", attempt=1)
+    assert not complete_job(db, job_id, "w1", {"late": True}, attempt=1)
+    assert fail_job(db, job_id, "w1", "late failure", attempt=1) == RUNNING
+    assert complete_job(db, job_id, "w2", {"ok": True}, attempt=2)
+    db.expire_all()
+    job = db.get(Job, job_id)
+    assert (job.status, json.loads(job.result)) == (SUCCEEDED, {"ok": True})
+
+
+def test_same_worker_id_cannot_complete_a_reclaimed_attempt(db):
+    job_id = enqueue_job(db, "test_echo").id
+    claim_jobs(db, "w1", lease_seconds=-1)
+    claim_jobs(db, "w1")  # Restarted worker with the same host:pid id
+    assert not complete_job(db, job_id, "w1", None, attempt=1)
+    assert complete_job(db, job_id, "w1", None, attempt=2)
+
+
+def test_heartbeat_keeps_the_lease_during_a_long_job(db):
+    job_id = enqueue_job(db, "test_echo", {"sleep": 0.5}).id
+    worker = Worker(SessionLocal, "w1", lease_seconds=0.3)
+    assert worker.run(once=True) == 1
+    db.expire_all()
+    job = db.get(Job, job_id)
+    assert job.status == SUCCEEDED
+    assert json.loads(job.result)["stolen"] == []
+    assert job.attempts == 1
+
+
+def test_optimize_route_job_completes_its_key_with_the_route(db, catalog):
+    payload = {"name": "Ana Diaz", "insurance_code": "AET-GOLD", "location_latitude": 37.08,
+               "location_longitude": -94.51}
+    job_id = enqueue_job(db, "optimize_route", payload).id
+    Worker(SessionLocal, "w1").run(once=True)
+    db.expire_all()
+    job = db.get(Job, job_id)
+    assert job.status == SUCCEEDED
+    route_id = json.loads(job.result)["route_id"]
+    key = db.query(IdempotencyKey).filter(IdempotencyKey.key == f"job:{job_id}").one()
+    assert key.route_id == route_id and key.response is not None
+
+    # Re-delivery (lease lost after the insert) returns the same route
+    db.query(Job).filter(Job.id == job_id).update({
+        "status": RUNNING, "lease_expires_at": datetime.utcnow() - timedelta(seconds=1)
+    })
+    db.commit()
+    Worker(SessionLocal, "w2").run(once=True)
+    db.expire_all()
+    assert json.loads(db.get(Job, job_id).result)["route_id"] == route_id
+    assert db.query(Route).count() == 1
+
+
+def test_batched_job_reclaimed_while_waiting_is_skipped(db):
+    first = enqueue_job(db, "test_echo", {"sleep": 0.5}, priority=1).id
+    second = enqueue_job(db, "test_echo").id
+    worker = Worker(SessionLocal, "w1", batch_size=2, lease_seconds=0.3)
+    # The first job outlives the second's lease; its handler lets "thief" claim the second
+    assert worker.run_batch() == 2
+    db.expire_all()
+    assert json.loads(db.get(Job, first).result)["stolen"] == [second]
+    assert calls == [first]
+    job = db.get(Job, second)
+    assert (job.status, job.locked_by, job.attempts) == (RUNNING, "thief", 2)
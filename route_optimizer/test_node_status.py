@@ -0,0 +1,103 @@
+"""Node status updates: compare-and-swap on the node version"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import update
+
+import route_optimizer
+from models import Route, RouteNode, StatusEnum
+from route_optimizer import NodeStatusUpdate, RouteUpdateRequest, apply_node_status_updates, update_node_status
+
+
+@pytest.fixture(params=[True, False], ids=["returning", "rowcount"])
+def update_returning(request, db, monkeypatch):
+    """Run with UPDATE ... RETURNING and with the per-statement rowcount fallback"""
+    monkeypatch.setattr(db.get_bind().dialect, "update_returning", request.param)
+    return request.param
+
+
+def route_nodes(db, route):
+    """(id, version) of the route's nodes in order"""
+    return db.query(RouteNode.id, RouteNode.version).filter(
+        RouteNode.route_id == route.route_id
+    ).order_by(RouteNode.order_index).all()
+
+
+def concurrent_write(monkeypatch, db, node_id):
+    """Bump the node's version after the batch read it, as another request would"""
+    states = route_optimizer.node_states
+
+    def race_and_read(session, node_ids):
+        session.execute(update(RouteNode).where(RouteNode.id == node_id).values(version=RouteNode.version + 1))
+        return states(session, node_ids)
+
+    monkeypatch.setattr(route_optimizer, "node_states", race_and_read)
+
+
+def test_bulk_update_bumps_versions(db, route, update_returning):
+    first, second = route_nodes(db, route)
+    results = apply_node_status_updates(db, [
+        NodeStatusUpdate(route_id=route.route_id, node_id=first.id, status="Completed",
+                         expected_version=first.version),
+        NodeStatusUpdate(route_id=route.route_id, node_id=second.id, status="Scheduled")
+    ])
+    assert [(r.success, r.status, r.version) for r in results] == [
+        (True, "Completed", first.version + 1), (True, "Scheduled", second.version + 1)
+    ]
+    db.expire_all()
+    assert db.get(RouteNode, first.id).status == StatusEnum.COMPLETED
+
+
+def test_bulk_stale_version_is_a_conflict(db, route, update_returning):
+    node = route_nodes(db, route)[0]
+    (result,) = apply_node_status_updates(db, [
+        NodeStatusUpdate(route_id=route.route_id, node_id=node.id, status="Completed",
+                         expected_version=node.version + 5)
+    ])
+    assert (result.success, result.error, result.version) == (False, "Version conflict", node.version)
+
+
+def test_bulk_write_after_read_is_a_conflict(db, route, update_returning, monkeypatch):
+    raced, other = route_nodes(db, route)
+    concurrent_write(monkeypatch, db, raced.id)
+    results = apply_node_status_updates(db, [
+        NodeStatusUpdate(route_id=route.route_id, node_id=raced.id, status="Completed",
+                         expected_version=raced.version),
+        NodeStatusUpdate(route_id=route.route_id, node_id=other.id, status="Completed",
+                         expected_version=other.version)
+    ])
+    assert (results[0].success, results[0].error, results[0].version) == (False, "Version conflict", raced.version + 1)
+    assert (results[1].success, results[1].version) == (True, other.version + 1)
+    db.expire_all()
+    assert db.get(RouteNode, raced.id).status == StatusEnum.PENDING
+    assert db.get(RouteNode, other.id).status == StatusEnum.COMPLETED
+
+
+def test_route_version_moves_only_when_a_node_changes(db, route, update_returning):
+    node = route_nodes(db, route)[0]
+    version = db.query(Route.version).filter(Route.id == route.route_id).scalar()
+    (result,) = apply_node_status_updates(db, [
+        NodeStatusUpdate(route_id=route.route_id, node_id=node.id, status="Completed",
+                         expected_version=node.version + 5)
+    ])
+    assert not result.success
+    assert db.query(Route.version).filter(Route.id == route.route_id).scalar() == version
+
+    apply_node_status_updates(db, [
+        NodeStatusUpdate(route_id=route.route_id, node_id=node.id, status="Completed"),
+        NodeStatusUpdate(route_id=route.route_id, node_id=node.id + 1000, status="Completed")
+    ])
+    assert db.query(Route.version).filter(Route.id == route.route_id).scalar() == version + 1
+
+
+def test_single_update_conflict_is_409(db, route):
+    node = route_nodes(db, route)[0]
+    request = RouteUpdateRequest(status="Completed", expected_version=node.version)
+    ok = asyncio.run(update_node_status(route.route_id, node.id, request, db))
+    assert ok["version"] == node.version + 1
+
+    with pytest.raises(HTTPException) as conflict:
+        asyncio.run(update_node_status(route.route_id, node.id, request, db))
+    assert conflict.value.status_code == 409
+    assert conflict.value.detail["current"]["version"] == node.version + 1
@@ -0,0 +1,89 @@
+"""Patient upsert identity: FHIR ID, or plan + location cell + name and birth date"""
+from datetime import date
+
+from models import Patient
+from route_optimizer import PatientInput, upsert_patient
+
+LAT, LON = 37.0842, -94.5133
+
+
+def patient(name="Ana Diaz", **fields):
+    return PatientInput(name=name, insurance_code="AET-GOLD", location_latitude=LAT, location_longitude=LON, **fields)
+
+
+def test_same_patient_with_coordinate_jitter_is_one_record(db):
+    first = upsert_patient(db, patient(phone="555-0100"), LAT, LON)
+    again = upsert_patient(db, patient(name="  ana   DIAZ"), LAT + 0.00001, LON)
+    assert first == again
+    assert db.query(Patient).count() == 1
+
+
+def test_different_people_at_same_address_stay_separate(db):
+    ana = upsert_patient(db, patient(phone="555-0100", email="ana@example.org"), LAT, LON)
+    ben = upsert_patient(db, patient(name="Ben Diaz", phone="555-0199", email="ben@example.org"), LAT, LON)
+
+    assert ana != ben
+    db.expire_all()
+    stored = db.get(Patient, ana)
+    assert (stored.name, stored.phone, stored.email) == ("Ana Diaz", "555-0100", "ana@example.org")
+
+
+def test_birth_date_separates_namesakes(db):
+    senior = upsert_patient(db, patient(date_of_birth=date(1950, 1, 2)), LAT, LON)
+    junior = upsert_patient(db, patient(date_of_birth=date(1990, 3, 4)), LAT, LON)
+    assert senior != junior
+    assert upsert_patient(db, patient(date_of_birth=date(1950, 1, 2)), LAT, LON) == senior
+
+
+def test_match_fills_missing_contact_details_without_overwriting(db):
+    patient_id = upsert_patient(db, patient(phone="555-0100"), LAT, LON)
+    upsert_patient(db, patient(phone="555-0199", email="ana@example.org"), LAT, LON)
+    db.expire_all()
+    stored = db.get(Patient, patient_id)
+    assert (stored.phone, stored.email) == ("555-0100", "ana@example.org")
+
+
+def test_fhir_id_is_authoritative(db):
+    first = upsert_patient(db, patient(fhir_id="pat-1"), LAT, LON)
+    moved = upsert_patient(db, patient(fhir_id="pat-1", phone="555-0142"), LAT + 0.01, LON)
+    assert first == moved
+    db.expire_all()
+    assert db.get(Patient, first).location_latitude == LAT + 0.01
+
+
+def test_migration_keeps_existing_duplicates_separate(tmp_path, capsys):
+    import importlib.util
+    import os
+
+    import sqlalchemy as sa
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+
+    path = os.path.join(os.path.dirname(__file__), "alembic", "versions", "3f2b9c1d7e01_patient_location_cell.py")
+    spec = importlib.util.spec_from_file_location("patient_location_cell_migration", path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as conn:
+        conn.execute(sa.text(
+            "CREATE TABLE patients (id INTEGER PRIMARY KEY, fhir_id VARCHAR, name VARCHAR NOT NULL, "
+            "insurance_code VARCHAR NOT NULL, location_latitude FLOAT NOT NULL, location_longitude FLOAT NOT NULL, "
+            "date_of_birth DATETIME)"
+        ))
+        conn.execute(sa.text(
+            "INSERT INTO patients (id, fhir_id, name, insurance_code, location_latitude, location_longitude) VALUES "
+            f"(1, NULL, 'Ana Diaz', 'AET-GOLD', {LAT}, {LON}), (2, NULL, 'ana diaz', 'AET-GOLD', {LAT}, {LON}), "
+            f"(3, NULL, 'Ben Diaz', 'AET-GOLD', {LAT}, {LON}), (4, 'pat-9', 'Ana Diaz', 'AET-GOLD', {LAT}, {LON})"
+        ))
+        migration.op = Operations(MigrationContext.configure(conn))
+        migration.upgrade()
+        rows = conn.execute(sa.text("SELECT id, location_cell, identity_key FROM patients ORDER BY id")).all()
+
+    assert all(cell for _, cell, _ in rows)
+    keys = {patient_id: key for patient_id, _, key in rows}
+    assert keys[1] == "ana diaz|"
+    assert keys[2] == "ana diaz||duplicate:2"
+    assert keys[3] == "ben diaz|"
+    assert keys[4] is None
+    assert "ids 2" in capsys.readouterr().out
@@ -0,0 +1,107 @@
+"""Shared provider matrix: byte order and freshness"""
+import json
+import os
+import struct
+from array import array
+
+import pytest
+
+import provider_matrix
+from distance_provider import HaversineProvider
+from models import Provider
+from provider_matrix import (
+    LOCK_NAME, MANIFEST_NAME, MatrixBackedProvider, MatrixSnapshot, ProviderMatrixStore, SharedTravelMatrix,
+    _BuildLock, build_provider_matrix
+)
+
+
+@pytest.fixture
+def matrix_dir(db, catalog, tmp_path, monkeypatch):
+    monkeypatch.setattr(provider_matrix, "MANIFEST_CHECK_SECONDS", 0)
+    build_provider_matrix(db, str(tmp_path), HaversineProvider())
+    return tmp_path
+
+
+def _manifest(directory):
+    with open(os.path.join(directory, MANIFEST_NAME)) as f:
+        return json.load(f)
+
+
+def _swap_byte_order(path):
+    """Rewrite a matrix file as a host of the other byte order would have written it"""
+    with open(path, "rb") as f:
+        data = f.read()
+    (n,) = struct.unpack_from("=I", data, 12)
+    other = b">" if data[8:9] == b"<" else b"<"
+    parts = [data[:8], other + bytes(3), struct.pack(other.decode() + "I", n)]
+    offset = 16
+    for code, count in (("d", 2 * n), ("I", n), ("f", n * n), ("f", n * n)):
+        values = array(code)
+        values.frombytes(data[offset:offset + values.itemsize * count])
+        values.byteswap()
+        parts.append(values.tobytes())
+        offset += values.itemsize * count
+    with open(path, "wb") as f:
+        f.write(b"".join(parts))
+
+
+def test_snapshot_reads_either_byte_order(db, matrix_dir):
+    manifest = _manifest(matrix_dir)
+    path = os.path.join(matrix_dir, manifest["file"])
+    native = MatrixSnapshot(path, manifest)
+    legs = [native.leg(i, j) for i in range(native.size) for j in range(native.size)]
+    index = dict(native.index)
+
+    _swap_byte_order(path)
+    swapped = MatrixSnapshot(path, manifest)
+    assert swapped.index == index
+    assert [swapped.leg(i, j) for i in range(swapped.size) for j in range(swapped.size)] == legs
+    assert legs[1][0] > 0
+
+
+def test_moved_provider_is_computed_live(db, matrix_dir):
+    providers = db.query(Provider).order_by(Provider.id).all()
+    backed = MatrixBackedProvider(HaversineProvider(), ProviderMatrixStore(str(matrix_dir)))
+    origin = (37.08, -94.51)
+    assert isinstance(backed.provider_matrix(origin, providers), SharedTravelMatrix)
+
+    providers[1].location_latitude += 0.5
+    matrix = backed.provider_matrix(origin, providers)
+    assert not isinstance(matrix, SharedTravelMatrix)
+    expected = HaversineProvider().leg(
+        (providers[0].location_latitude, providers[0].location_longitude),
+        (providers[1].location_latitude, providers[1].location_longitude)
+    )
+    assert matrix.leg(1, 2) == pytest.approx(expected)
+
+
+def test_older_file_format_is_rebuilt(db, matrix_dir):
+    manifest = _manifest(matrix_dir)
+    assert build_provider_matrix(db, str(matrix_dir), HaversineProvider()) is None
+    manifest.pop("format")
+    with open(os.path.join(matrix_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f)
+    assert build_provider_matrix(db, str(matrix_dir), HaversineProvider())["format"] == "PMATRIX2"
+
+
+def test_streamed_rows_match_the_provider(db, matrix_dir):
+    manifest = _manifest(matrix_dir)
+    snapshot = MatrixSnapshot(os.path.join(matrix_dir, manifest["file"]), manifest)
+    points = [(snapshot.points[2 * row], snapshot.points[2 * row + 1]) for row in range(snapshot.size)]
+    for i, origin in enumerate(points):
+        for j, destination in enumerate(points):
+            expected = HaversineProvider().leg(origin, destination) if i != j else (0.0, 0.0)
+            assert snapshot.leg(i, j) == pytest.approx(expected, rel=1e-6)
+    assert not [name for name in os.listdir(matrix_dir) if name.endswith(".tmp")]
+
+
+@pytest.mark.skipif(provider_matrix.fcntl is None, reason="lock files go stale without fcntl")
+def test_running_build_keeps_its_lock_however_long_it_takes(db, matrix_dir):
+    running = _BuildLock(str(matrix_dir))
+    assert running.acquire()
+    try:
+        os.utime(os.path.join(matrix_dir, LOCK_NAME), (0, 0))  # Untouched for far longer than LOCK_STALE_SECONDS
+        assert build_provider_matrix(db, str(matrix_dir), HaversineProvider(), force=True) is None
+    finally:
+        running.release()
+    assert build_provider_matrix(db, str(matrix_dir), HaversineProvider(), force=True) is not None
@@ -0,0 +1,86 @@
+"""Analytics rollups: incremental deltas agree with a rebuild from routes and nodes"""
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from models import Patient, ProviderDailyRollup, Route, RouteDailyRollup, RouteNode
+from rollups import rebuild_rollups
+from route_optimizer import (
+    NodeStatusUpdate, PatientInput, ReoptimizeRequest, apply_node_status_updates, create_optimized_route,
+    reoptimize_route
+)
+
+
+def snapshot(db):
+    """Non-empty rollup rows by key"""
+    routes = {
+        (str(r.day), r.insurance_code): (r.route_count, round(r.total_cost, 6), round(r.total_distance_miles, 6),
+                                         r.distance_route_count)
+        for r in db.query(RouteDailyRollup) if r.route_count or abs(r.total_cost) > 1e-9
+    }
+    providers = {
+        (str(r.day), r.provider_id): (r.node_count, r.completed_count)
+        for r in db.query(ProviderDailyRollup) if r.node_count or r.completed_count
+    }
+    return routes, providers
+
+
+def assert_rebuild_agrees(db):
+    db.expire_all()
+    maintained = snapshot(db)
+    rebuild_rollups(db.connection())
+    db.commit()
+    assert snapshot(db) == maintained
+    return maintained
+
+
+def new_route(db, name, plan):
+    return create_optimized_route(
+        PatientInput(name=name, insurance_code=plan, location_latitude=37.08, location_longitude=-94.51), db
+    )
+
+
+def test_rollups_match_rebuild_after_every_write_path(db, catalog):
+    gold = new_route(db, "Ana Diaz", "AET-GOLD")
+    silver = new_route(db, "Ben Diaz", "BCBS-SILVER")
+    nodes = db.query(RouteNode.id, RouteNode.route_id).order_by(RouteNode.id).all()
+    apply_node_status_updates(db, [
+        NodeStatusUpdate(route_id=route_id, node_id=node_id, status="Completed") for node_id, route_id in nodes[:2]
+    ])
+    routes, providers = assert_rebuild_agrees(db)
+    assert sum(count for count, _, _, _ in routes.values()) == 2
+    assert sum(completed for _, completed in providers.values()) == 2
+
+    asyncio.run(reoptimize_route(ReoptimizeRequest(route_id=gold.route_id), "interactive", db))
+    asyncio.run(reoptimize_route(
+        ReoptimizeRequest(route_id=silver.route_id, excluded_service_ids=[catalog[1]]), "interactive", db
+    ))
+    assert_rebuild_agrees(db)
+
+
+def test_days_come_from_the_stored_created_at(db, catalog):
+    route = new_route(db, "Ana Diaz", "AET-GOLD")
+    # A route created before midnight, re-optimized after it
+    yesterday = datetime.utcnow() - timedelta(days=1)
+    db.execute(update(Route).where(Route.id == route.route_id).values(created_at=yesterday))
+    db.execute(update(RouteNode).where(RouteNode.route_id == route.route_id).values(created_at=yesterday))
+    db.commit()
+    rebuild_rollups(db.connection())
+    db.commit()
+
+    asyncio.run(reoptimize_route(ReoptimizeRequest(route_id=route.route_id), "interactive", db))
+    routes, providers = assert_rebuild_agrees(db)
+    assert list(routes) == [(str(yesterday.date()), "AET-GOLD")]
+    assert {day for day, _ in providers} == {str(datetime.utcnow().date())}
+
+
+def test_routes_stay_under_the_plan_they_were_created_with(db, catalog):
+    route = new_route(db, "Ana Diaz", "AET-GOLD")
+    db.query(Patient).update({"insurance_code": "UHC-PLATINUM"})
+    db.commit()
+    asyncio.run(reoptimize_route(ReoptimizeRequest(route_id=route.route_id), "interactive", db))
+
+    routes, _ = assert_rebuild_agrees(db)
+    assert [plan for _, plan in routes] == ["AET-GOLD"]
+    assert db.get(Route, route.route_id).insurance_code == "AET-GOLD"
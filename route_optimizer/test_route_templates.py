@@ -0,0 +1,33 @@
+"""Route template cache: filled only with committed templates"""
+from models import RouteTemplate
+from route_templates import TemplateStore
+
+KEY = ("9ys0s1", "AET-GOLD", "v1")
+PATH = ((1, 10), (2, 20))
+
+
+def test_rolled_back_template_is_not_cached(db):
+    store = TemplateStore()
+    store.store(db, KEY, PATH)
+    db.rollback()
+    assert store._paths == {}
+    assert store.lookup(db, KEY) is None
+    assert db.query(RouteTemplate).count() == 0
+
+
+def test_committed_template_is_cached(db):
+    store = TemplateStore()
+    store.store(db, KEY, PATH)
+    # The writing transaction still sees its own template
+    assert store.lookup(db, KEY) == PATH
+    assert store._paths == {}
+    db.commit()
+    assert dict(store._paths) == {KEY: PATH}
+
+
+def test_template_loaded_from_table(db):
+    writer, reader = TemplateStore(), TemplateStore()
+    writer.store(db, KEY, PATH)
+    db.commit()
+    assert reader.lookup(db, KEY) == PATH
+    assert dict(reader._paths) == {KEY: PATH}
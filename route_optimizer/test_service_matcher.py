@@ -0,0 +1,70 @@
+"""Automaton service matching and its catalog-version cache"""
+from datetime import datetime, timedelta
+
+import catalog as catalog_module
+import service_matcher
+from models import Service
+from service_matcher import ServiceMatcher, match_service_names
+
+
+def test_matches_whole_words_best_first():
+    matcher = ServiceMatcher(["Cardiology", "Lab Work"])
+    ranked = matcher.rank([(1, "Cardiology Follow-up"), (2, "Cardiology"), (3, "Collab Workshop"), (4, "lab work panel")])
+    # "Collab Workshop" only contains "lab work" inside words
+    assert [(service_id, name) for service_id, name, _ in ranked] == [(2, "Cardiology"), (4, "Lab Work"),
+                                                                      (1, "Cardiology")]
+
+
+def test_version_is_not_recomputed_per_request(db, catalog, monkeypatch):
+    calls = []
+    fingerprint = catalog_module.catalog_version
+    monkeypatch.setattr(catalog_module, "catalog_version", lambda session: calls.append(1) or fingerprint(session))
+    catalog_module.invalidate_catalog_version()
+    for _ in range(3):
+        assert len(match_service_names(db, ["Cardiology", "Radiology"])) == 2
+    assert len(calls) == 1
+
+
+def test_catalog_writes_are_seen_at_once(db, catalog):
+    assert len(match_service_names(db, ["Cardiology"])) == 1
+    db.add(Service(name="Cardiology Stress Test", price=300.0, duration_minutes=60,
+                   provider_id=db.get(Service, catalog[0]).provider_id))
+    db.commit()
+    assert len(match_service_names(db, ["Cardiology"])) == 2
+
+    service = db.get(Service, catalog[0])
+    service.is_available = False
+    # The fingerprint reads max(updated_at); SQLite's now() has one-second resolution
+    service.updated_at = datetime.utcnow() + timedelta(seconds=1)
+    db.commit()
+    assert catalog[0] not in [service_id for service_id, _, _ in match_service_names(db, ["Cardiology"])]
+    assert service_matcher._index.version == catalog_module.current_catalog_version(db)
+
+
+class CandidateQuery:
+    """Stands in for the pg_trgm query: returns every candidate the index would"""
+
+    def __init__(self, services):
+        self.services = services
+
+    def filter(self, *criteria):
+        return self
+
+    def all(self):
+        return self.services
+
+
+class TrigramSession:
+    def __init__(self, services):
+        self.services = services
+
+    def query(self, *entities):
+        return CandidateQuery(self.services)
+
+
+def test_trigram_candidates_are_rechecked_on_whole_words():
+    # word_similarity('Radiology', 'Cardiology Follow-up') = 0.6 passes `%>`; it is not coverage
+    services = [Service(id=1, name="Cardiology Follow-up"), Service(id=2, name="Radiology Imaging"),
+                Service(id=3, name="Radiology")]
+    matched = service_matcher.trigram_match(TrigramSession(services), ["Radiology"])
+    assert [service.id for service, _ in matched] == [3, 2]
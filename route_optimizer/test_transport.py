@@ -0,0 +1,85 @@
+"""Shared van transport: rides, route feasibility and plans"""
+from datetime import date, datetime
+
+from distance_provider import HaversineProvider
+from models import RouteNode
+from transport import Ride, VanRoutingSolver, load_rides, plan_rides, route_rides
+
+DEPOT = (37.0842, -94.5133)
+DAY = date(2026, 10, 20)
+HOME = (37.05, -94.50)
+CLINIC = (37.09, -94.51)
+LAB = (37.10, -94.53)
+
+
+def stop(node_id, point, appointment, duration=30, provider_id=None):
+    return {"node_id": node_id, "provider_id": provider_id or node_id, "point": point,
+            "appointment": appointment, "duration": duration}
+
+
+def test_route_rides_split_a_day():
+    stops = [stop(1, CLINIC, 540), stop(2, CLINIC, 600, provider_id=1), stop(3, LAB, 690, duration=20)]
+    rides = route_rides(7, 70, HOME, stops)
+    assert [(r.kind, r.node_id, r.pickup, r.dropoff, r.ready, r.due) for r in rides] == [
+        ("outbound", 1, HOME, CLINIC, None, 540),
+        # Two appointments at the same provider need no ride in between
+        ("transfer", 3, CLINIC, LAB, 630, 690),
+        ("return", 3, LAB, HOME, 710, None),
+    ]
+    assert [r.kind for r in route_rides(7, 70, HOME, stops, return_trip=False)] == ["outbound", "transfer"]
+
+
+def solver(rides, capacity=6):
+    return VanRoutingSolver(rides, DEPOT, HaversineProvider(), capacity=capacity, shift=(360, 1200))
+
+
+def outbound(patient_id, home, due):
+    return Ride(patient_id, patient_id, patient_id, "outbound", home, CLINIC, home, due=due, to_provider_id=1)
+
+
+def test_evaluate_rejects_capacity_and_late_arrivals():
+    rides = [outbound(1, HOME, 600), outbound(2, (37.051, -94.501), 600)]
+    shared = [0, 2, 1, 3]  # Both picked up, then both dropped off
+    assert solver(rides).evaluate(shared) is not None
+    assert solver(rides, capacity=1).evaluate(shared) is None
+    assert solver(rides, capacity=1).evaluate([0, 1, 2, 3]) is not None
+
+    # The van cannot reach the clinic by 06:05 after leaving the depot at 06:00 via a pickup
+    early = solver([outbound(1, HOME, 365)])
+    assert early.evaluate([0, 1]) is None
+    assert early.solo == [None] and early.feasible == []
+
+
+def test_plan_serves_every_ride_once():
+    homes = [(37.05, -94.50), (37.06, -94.49), (37.12, -94.55), (37.04, -94.53), (37.07, -94.47)]
+    rides = []
+    for patient_id, home in enumerate(homes, start=1):
+        rides.extend(route_rides(patient_id, patient_id, home, [
+            stop(patient_id * 10, CLINIC, 540 + 15 * patient_id, provider_id=1),
+            stop(patient_id * 10 + 1, LAB, 660 + 15 * patient_id, provider_id=2),
+        ]))
+    plan = plan_rides(rides, DAY, DEPOT, time_limit=1, capacity=3, distance_provider=HaversineProvider())
+
+    assert plan["unassigned"] == []
+    served = []
+    for van in plan["vans"]:
+        assert van["max_onboard"] <= 3
+        actions = [(s["action"], s["route_node_id"], s["ride"]) for s in van["stops"]]
+        for action, node_id, kind in actions:
+            if action == "pickup":
+                served.append((node_id, kind))
+                assert actions.index(("dropoff", node_id, kind)) > actions.index((action, node_id, kind))
+    assert sorted(served) == sorted((r.node_id, r.kind) for r in rides)
+    assert plan["summary"]["rides_served"] == len(rides) == 15
+
+
+def test_rides_use_appointments_from_the_request(db, route):
+    nodes = db.query(RouteNode.id).filter(RouteNode.route_id == route.route_id).order_by(RouteNode.order_index)
+    node_ids = [node_id for (node_id,) in nodes]
+    # Routes created through the API carry no appointment times
+    assert load_rides(db, DAY) == []
+
+    appointments = {node_ids[0]: datetime(2026, 10, 20, 9, 0), node_ids[1]: datetime(2026, 10, 20, 11, 0)}
+    rides = load_rides(db, DAY, appointments=appointments)
+    assert [(r.kind, r.due) for r in rides] == [("outbound", 540), ("transfer", 660), ("return", None)]
+    assert load_rides(db, date(2026, 10, 21), appointments=appointments) == []
@@ -0,0 +1,423 @@
+"""
+Request tracing with OpenTelemetry-style spans
+Spans cover HTTP handlers, SQL statements, geocoding, the solvers and LLM calls, and are
+exported in batches as NDJSON to a local file or to a collector over HTTP.
+
+Configuration:
+    TRACE_EXPORTER       none (default) | file | collector | console
+    TRACE_FILE           NDJSON output for the file exporter (default ./traces.ndjson)
+    TRACE_COLLECTOR_URL  collector endpoint (default http://localhost:4318/v1/spans)
+    TRACE_SAMPLE_RATIO   fraction of new traces to record, 0.0 - 1.0 (default 1.0)
+
+Trace and span ids follow W3C Trace Context, and an incoming `traceparent` header is honoured,
+so spans can be joined with traces from the calling service.
+
+Local collector stand-in and viewer:
+    python tracing.py collector --port 4318 --output traces.ndjson
+    python tracing.py show traces.ndjson --slowest 5
+"""
+import atexit
+import functools
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "route_optimizer")
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "./traces.ndjson")
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL", "http://localhost:4318/v1/spans")
+TRACE_SAMPLE_RATIO = min(1.0, max(0.0, float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))))
+
+# Export batching: spans beyond the queue size are dropped rather than slowing requests down
+EXPORT_BATCH_SIZE = 256
+EXPORT_INTERVAL_SECONDS = 1.0
+EXPORT_QUEUE_SIZE = 4096
+
+# Longest SQL statement kept on a span
+MAX_STATEMENT_LENGTH = 1000
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes: Dict[str, Any] = dict(attributes or {}) if sampled else {}
+        self.events: List[Dict[str, Any]] = []
+        self.status = "OK"
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    def update_name(self, name: str):
+        self.name = name
+
+    def set_attribute(self, key: str, value: Any):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        if self.sampled:
+            self.attributes.update(attributes)
+
+    def record_exception(self, exc: BaseException):
+        self.status = "ERROR"
+        if self.sampled:
+            self.events.append({
+                "name": "exception",
+                "time_unix_nano": time.time_ns(),
+                "attributes": {"exception.type": type(exc).__name__, "exception.message": str(exc)}
+            })
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self.sampled and _processor is not None:
+            _processor.submit(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "service": SERVICE_NAME,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+            "events": self.events
+        }
+
+
+class _NoopSpan:
+    """Returned when tracing is disabled; accepts and ignores everything"""
+    sampled = False
+    traceparent = None
+
+    def update_name(self, name: str):
+        pass
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+    def record_exception(self, exc: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def _should_sample(trace_id: str) -> bool:
+    """Deterministic ratio sampling on the low 64 bits of the trace id"""
+    return int(trace_id[16:], 16) < TRACE_SAMPLE_RATIO * (1 << 64)
+
+
+def _parse_traceparent(header: Optional[str]):
+    """Return (trace_id, parent_span_id, sampled) from a W3C traceparent header"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None, traceparent: Optional[str] = None):
+    """
+    Create a span under the current span (or a new trace) without activating it
+    Sampling is decided once per trace and inherited by child spans
+    """
+    if _processor is None:
+        return NOOP_SPAN
+    parent = _current_span.get()
+    if parent is not None:
+        return Span(name, parent.trace_id, parent.span_id, parent.sampled, attributes)
+    remote = _parse_traceparent(traceparent)
+    if remote:
+        trace_id, parent_id, sampled = remote
+        return Span(name, trace_id, parent_id, sampled, attributes)
+    trace_id = "%032x" % random.getrandbits(128)
+    return Span(name, trace_id, None, _should_sample(trace_id), attributes)
+
+
+@contextmanager
+def span(name: str, attributes: Optional[Dict[str, Any]] = None, traceparent: Optional[str] = None):
+    """Run a block inside a new active span"""
+    current = start_span(name, attributes, traceparent)
+    if current is NOOP_SPAN:
+        yield current
+        return
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def current_span():
+    """The active span (a no-op span outside of a trace)"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def traced(name: Optional[str] = None):
+    """Decorator: run the function inside a span (named after the function by default)"""
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ==================== SQLAlchemy ====================
+
+def instrument_engine(engine):
+    """Record a child span for every SQL statement executed inside a trace"""
+    from sqlalchemy import event
+
+    system = engine.dialect.name
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        parent = _current_span.get()
+        if parent is None or not parent.sampled or context is None:
+            return
+        context._trace_span = start_span("db.query", {
+            "db.system": system,
+            "db.statement": statement[:MAX_STATEMENT_LENGTH],
+            "db.executemany": executemany
+        })
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statement_span = getattr(context, "_trace_span", None)
+        if statement_span is not None:
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                statement_span.set_attribute("db.rowcount", cursor.rowcount)
+            statement_span.end()
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        statement_span = getattr(exception_context.execution_context, "_trace_span", None) \
+            if exception_context.execution_context is not None else None
+        if statement_span is not None:
+            statement_span.record_exception(exception_context.original_exception)
+            statement_span.end()
+
+
+# ==================== Exporters ====================
+
+class FileSpanExporter:
+    """Append spans as NDJSON lines to a local file"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Dict[str, Any]]):
+        with open(self.path, "a") as f:
+            for item in spans:
+                f.write(json.dumps(item, default=str) + "\n")
+
+
+class ConsoleSpanExporter:
+    """Print one line per span (development)"""
+
+    def export(self, spans: List[Dict[str, Any]]):
+        for item in spans:
+            print(f"[trace {item['trace_id'][:8]}] {item['name']} {item['duration_ms']}ms {item['attributes']}")
+
+
+class CollectorSpanExporter:
+    """POST span batches as JSON to a collector (see `python tracing.py collector`)"""
+
+    def __init__(self, url: str):
+        import httpx
+        self.url = url
+        self.client = httpx.Client(timeout=5)
+
+    def export(self, spans: List[Dict[str, Any]]):
+        self.client.post(self.url, content=json.dumps({"spans": spans}, default=str),
+                         headers={"Content-Type": "application/json"})
+
+
+class BatchSpanProcessor:
+    """Queue finished spans and export them in batches from a background thread"""
+
+    def __init__(self, exporter):
+        self.exporter = exporter
+        self.queue: queue.Queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, finished: Span):
+        try:
+            self.queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < EXPORT_BATCH_SIZE:
+            try:
+                batch.append(self.queue.get_nowait().to_dict())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self):
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            try:
+                self.exporter.export(batch)
+            except Exception as e:
+                print(f"Span export failed ({len(batch)} spans dropped): {e}")
+
+    def _run(self):
+        while True:
+            time.sleep(EXPORT_INTERVAL_SECONDS)
+            self.flush()
+
+
+def _build_processor() -> Optional[BatchSpanProcessor]:
+    if TRACE_EXPORTER == "file":
+        return BatchSpanProcessor(FileSpanExporter(TRACE_FILE))
+    if TRACE_EXPORTER == "collector":
+        return BatchSpanProcessor(CollectorSpanExporter(TRACE_COLLECTOR_URL))
+    if TRACE_EXPORTER == "console":
+        return BatchSpanProcessor(ConsoleSpanExporter())
+    return None
+
+
+_processor = _build_processor()
+
+
+def flush():
+    """Export all queued spans now (tests, CLI jobs)"""
+    if _processor is not None:
+        _processor.flush()
+
+
+# ==================== Collector / Viewer ====================
+
+def run_collector(port: int, output: str):
+    """Minimal local collector: accepts span batches and appends them to an NDJSON file"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    lock = threading.Lock()
+    exporter = FileSpanExporter(output)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                spans = body.get("spans", [])
+            except ValueError:
+                self.send_response(400)
+                self.end_headers()
+                return
+            with lock:
+                exporter.export(spans)
+            self.send_response(202)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    print(f"Collecting spans on :{port} -> {output}")
+    ThreadingHTTPServer(("0.0.0.0", port), Handler).serve_forever()
+
+
+def show_traces(path: str, slowest: int, trace_id: Optional[str] = None):
+    """Print the slowest traces in a span file as indented span trees"""
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                traces.setdefault(item["trace_id"], []).append(item)
+
+    def root_duration(spans):
+        roots = [s for s in spans if not s.get("parent_span_id")] or spans
+        return max(s["duration_ms"] for s in roots)
+
+    selected = [trace_id] if trace_id else sorted(traces, key=lambda t: root_duration(traces[t]), reverse=True)[:slowest]
+    for tid in selected:
+        spans = traces.get(tid, [])
+        ids = {s["span_id"] for s in spans}
+        children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        for s in spans:
+            parent = s.get("parent_span_id") if s.get("parent_span_id") in ids else None
+            children.setdefault(parent, []).append(s)
+
+        print(f"trace {tid}  ({root_duration(spans):.1f} ms, {len(spans)} spans)")
+
+        def walk(parent, depth):
+            for s in sorted(children.get(parent, []), key=lambda s: s["start_time_unix_nano"]):
+                attributes = {k: v for k, v in s["attributes"].items() if k != "db.statement"}
+                label = s["attributes"].get("db.statement", "")[:80] if s["name"] == "db.query" else ""
+                print(f"{'  ' * (depth + 1)}{s['name']} {s['duration_ms']:.2f} ms "
+                      f"{label}{' ' + json.dumps(attributes) if attributes else ''}"
+                      f"{' [ERROR]' if s['status'] == 'ERROR' else ''}")
+                walk(s["span_id"], depth + 1)
+        walk(None, 0)
+        print()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Trace collector and viewer")
+    commands = parser.add_subparsers(dest="command", required=True)
+    collector = commands.add_parser("collector", help="Run a local span collector")
+    collector.add_argument("--port", type=int, default=4318)
+    collector.add_argument("--output", default=TRACE_FILE)
+    show = commands.add_parser("show", help="Print the slowest traces from a span file")
+    show.add_argument("path", nargs="?", default=TRACE_FILE)
+    show.add_argument("--slowest", type=int, default=5)
+    show.add_argument("--trace", help="Show a single trace id")
+    args = parser.parse_args()
+
+    if args.command == "collector":
+        run_collector(args.port, args.output)
+    else:
+        show_traces(args.path, args.slowest, args.trace)
@@ -0,0 +1,733 @@
+"""
+Shared van transport planning (vehicle routing across referrals)
+Non-emergency medical transport vans can carry several patients at once, so instead of a
+dedicated trip per patient route, the day's scheduled route nodes become ride requests
+(home -> first provider, provider -> next provider, last provider -> home) that are packed
+into shared pickup/drop-off van routes under:
+
+- capacity: at most TRANSPORT_VAN_CAPACITY passengers on board
+- time windows: dropped off by the appointment time, picked up at most
+  TRANSPORT_EARLY_ARRIVAL_MINUTES earlier than needed; after the last appointment ends
+  the return ride picks up within TRANSPORT_RETURN_WINDOW_MINUTES
+- ride time: at most TRANSPORT_MAX_RIDE_FACTOR x the direct drive + TRANSPORT_MAX_RIDE_EXTRA_MINUTES
+- shift: vans leave the depot (TRANSPORT_DEPOT) and are back between
+  TRANSPORT_SHIFT_START and TRANSPORT_SHIFT_END
+
+Patients are swept into clusters of up to TRANSPORT_CLUSTER_SIZE rides by the bearing of
+their home from the depot. Each cluster is solved by adaptive large neighbourhood search
+(ruin and recreate, simulated annealing acceptance) within its share of the time limit,
+minimizing vans x TRANSPORT_VAN_COST + miles x TRANSPORT_COST_PER_MILE.
+
+Usage:
+    python transport.py 2026-10-20 --time-limit 30
+"""
+import math
+import os
+import random
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from distance_provider import DistanceProvider, Point, get_distance_provider
+from models import Patient, Provider, Route, RouteNode, Service, StatusEnum
+
+TRANSPORT_DEPOT = os.getenv("TRANSPORT_DEPOT", "37.0842,-94.5133")  # "lat,lon" (default: Joplin, MO)
+TRANSPORT_VAN_CAPACITY = int(os.getenv("TRANSPORT_VAN_CAPACITY", "6"))
+TRANSPORT_SHIFT_START = os.getenv("TRANSPORT_SHIFT_START", "06:00")
+TRANSPORT_SHIFT_END = os.getenv("TRANSPORT_SHIFT_END", "20:00")
+TRANSPORT_BOARDING_MINUTES = float(os.getenv("TRANSPORT_BOARDING_MINUTES", "3"))
+TRANSPORT_EARLY_ARRIVAL_MINUTES = float(os.getenv("TRANSPORT_EARLY_ARRIVAL_MINUTES", "45"))
+TRANSPORT_RETURN_WINDOW_MINUTES = float(os.getenv("TRANSPORT_RETURN_WINDOW_MINUTES", "60"))
+TRANSPORT_MAX_RIDE_FACTOR = float(os.getenv("TRANSPORT_MAX_RIDE_FACTOR", "1.5"))
+TRANSPORT_MAX_RIDE_EXTRA_MINUTES = float(os.getenv("TRANSPORT_MAX_RIDE_EXTRA_MINUTES", "20"))
+TRANSPORT_VAN_COST = float(os.getenv("TRANSPORT_VAN_COST", "120"))  # Fixed cost of a van on the road for the day
+TRANSPORT_COST_PER_MILE = float(os.getenv("TRANSPORT_COST_PER_MILE", "1.0"))
+TRANSPORT_CLUSTER_SIZE = int(os.getenv("TRANSPORT_CLUSTER_SIZE", "80"))  # Rides per independently solved cluster
+TRANSPORT_TIME_LIMIT_SECONDS = float(os.getenv("TRANSPORT_TIME_LIMIT_SECONDS", "20"))
+
+# Route nodes still to be travelled to
+PLANNED_STATUSES = (StatusEnum.PENDING, StatusEnum.SCHEDULED)
+
+# Cheapest insertion positions re-checked in full (ride times of the other passengers)
+INSERTION_CHECKS = 25
+
+# ALNS: operator scores (new best, improved, accepted worse), weight reaction, segment length
+SCORE_BEST, SCORE_BETTER, SCORE_ACCEPTED = 33.0, 9.0, 13.0
+REACTION = 0.1
+SEGMENT_ITERATIONS = 50
+
+
+def parse_clock(value: str) -> float:
+    """'HH:MM' as minutes after midnight"""
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def parse_depot(value: str) -> Point:
+    lat, lon = (float(part) for part in value.split(","))
+    return lat, lon
+
+
+class Ride:
+    """
+    One leg of a patient's day, from `pickup` to `dropoff`
+    ready: minutes after midnight the patient can leave (end of the previous appointment), None from home
+    due: appointment time at the drop-off, None for the ride home
+    """
+    __slots__ = ("patient_id", "route_id", "node_id", "kind", "pickup", "dropoff",
+                 "from_provider_id", "to_provider_id", "home", "ready", "due")
+
+    def __init__(self, patient_id: int, route_id: int, node_id: int, kind: str, pickup: Point, dropoff: Point,
+                 home: Point, ready: Optional[float] = None, due: Optional[float] = None,
+                 from_provider_id: Optional[int] = None, to_provider_id: Optional[int] = None):
+        self.patient_id = patient_id
+        self.route_id = route_id
+        self.node_id = node_id  # Route node travelled to (return rides: travelled from)
+        self.kind = kind  # outbound, transfer, return
+        self.pickup = pickup
+        self.dropoff = dropoff
+        self.home = home
+        self.ready = ready
+        self.due = due
+        self.from_provider_id = from_provider_id
+        self.to_provider_id = to_provider_id
+
+    def describe(self) -> Dict[str, Any]:
+        return {"patient_id": self.patient_id, "route_id": self.route_id, "route_node_id": self.node_id,
+                "ride": self.kind}
+
+
+def route_rides(patient_id: int, route_id: int, home: Point, stops: List[Dict[str, Any]],
+                return_trip: bool = True) -> List[Ride]:
+    """
+    Rides of one route's appointments on a day, in appointment order
+    stops: dicts with node_id, provider_id, point, appointment and duration (minutes after midnight / minutes)
+    """
+    rides = []
+    previous = None
+    for stop in stops:
+        if previous is None:
+            rides.append(Ride(patient_id, route_id, stop["node_id"], "outbound", home, stop["point"], home,
+                              due=stop["appointment"], to_provider_id=stop["provider_id"]))
+        elif stop["point"] != previous["point"]:
+            rides.append(Ride(patient_id, route_id, stop["node_id"], "transfer", previous["point"], stop["point"], home,
+                              ready=previous["appointment"] + previous["duration"], due=stop["appointment"],
+                              from_provider_id=previous["provider_id"], to_provider_id=stop["provider_id"]))
+        previous = stop
+    if return_trip and previous is not None and previous["point"] != home:
+        rides.append(Ride(patient_id, route_id, previous["node_id"], "return", previous["point"], home, home,
+                          ready=previous["appointment"] + previous["duration"],
+                          from_provider_id=previous["provider_id"]))
+    return rides
+
+
+def load_rides(
+    db: Session,
+    day: date,
+    return_trips: bool = True,
+    appointments: Optional[Dict[int, datetime]] = None
+) -> List[Ride]:
+    """
+    Rides for the route nodes with an appointment on `day` still to be visited
+    Route creation does not book appointments, so their times come from the scheduling side:
+    `appointments` (route node id -> appointment time) when given, otherwise the nodes'
+    stored estimated_arrival_time.
+    """
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1)
+    query = (
+        select(
+            RouteNode.id, RouteNode.route_id, RouteNode.estimated_arrival_time, RouteNode.order_index,
+            Service.duration_minutes, Route.patient_id, Patient.location_latitude, Patient.location_longitude,
+            Provider.id, Provider.location_latitude, Provider.location_longitude
+        )
+        .join(Route, Route.id == RouteNode.route_id)
+        .join(Patient, Patient.id == Route.patient_id)
+        .join(Service, Service.id == RouteNode.service_id)
+        .join(Provider, Provider.id == Service.provider_id)
+        .where(RouteNode.status.in_(PLANNED_STATUSES))
+    )
+    if appointments is not None:
+        appointments = {node_id: at for node_id, at in appointments.items() if start <= at < end}
+        if not appointments:
+            return []
+        query = query.where(RouteNode.id.in_(list(appointments)))
+    else:
+        query = query.where(RouteNode.estimated_arrival_time >= start, RouteNode.estimated_arrival_time < end)
+
+    nodes = []
+    for node_id, route_id, stored, order_index, *rest in db.execute(query):
+        arrival = appointments[node_id] if appointments is not None else stored
+        nodes.append((route_id, arrival, order_index, node_id, *rest))
+    nodes.sort(key=lambda node: node[:3])
+
+    routes: Dict[int, Tuple[int, Point, List[Dict[str, Any]]]] = {}
+    for route_id, arrival, _, node_id, duration, patient_id, p_lat, p_lon, provider_id, s_lat, s_lon in nodes:
+        _, _, stops = routes.setdefault(route_id, (patient_id, (p_lat, p_lon), []))
+        stops.append({
+            "node_id": node_id,
+            "provider_id": provider_id,
+            "point": (s_lat, s_lon),
+            "appointment": (arrival - start).total_seconds() / 60,
+            "duration": duration or 0
+        })
+    return [
+        ride for route_id, (patient_id, home, stops) in routes.items()
+        for ride in route_rides(patient_id, route_id, home, stops, return_trips)
+    ]
+
+
+def sweep_clusters(rides: List[Ride], depot: Point, size: int = TRANSPORT_CLUSTER_SIZE) -> List[List[Ride]]:
+    """
+    Rides grouped by patient, patients ordered by the bearing of their home from the depot,
+    cut into clusters of at most `size` rides (a patient's rides always stay together)
+    """
+    by_patient: Dict[int, List[Ride]] = defaultdict(list)
+    for ride in rides:
+        by_patient[ride.patient_id].append(ride)
+    if not by_patient:
+        return []
+
+    scale = math.cos(math.radians(depot[0]))
+
+    def bearing(patient_rides: List[Ride]) -> float:
+        lat, lon = patient_rides[0].home
+        return math.atan2((lon - depot[1]) * scale, lat - depot[0]) % (2 * math.pi)
+
+    patients = sorted(by_patient.values(), key=bearing)
+    # Start the sweep after the widest empty sector so no cluster straddles it
+    angles = [bearing(patient_rides) for patient_rides in patients]
+    gaps = [(angles[(k + 1) % len(angles)] - angles[k]) % (2 * math.pi) for k in range(len(angles))]
+    start = (max(range(len(gaps)), key=gaps.__getitem__) + 1) % len(patients)
+    patients = patients[start:] + patients[:start]
+
+    clusters: List[List[Ride]] = [[]]
+    for patient_rides in patients:
+        if clusters[-1] and len(clusters[-1]) + len(patient_rides) > size:
+            clusters.append([])
+        clusters[-1].extend(patient_rides)
+    return clusters
+
+
+class VanRoutingSolver:
+    """
+    Pickup and delivery with time windows for one cluster of rides
+    Stops are encoded as 2 * ride (pickup) and 2 * ride + 1 (drop-off). A van route is a
+    list of stops leaving from and returning to the depot (point 0), timed as early as
+    possible: vans wait at a pickup until its window opens.
+    """
+
+    def __init__(
+        self,
+        rides: List[Ride],
+        depot: Point,
+        distance_provider: Optional[DistanceProvider] = None,
+        capacity: int = TRANSPORT_VAN_CAPACITY,
+        shift: Tuple[float, float] = (parse_clock(TRANSPORT_SHIFT_START), parse_clock(TRANSPORT_SHIFT_END)),
+        seed: int = 0
+    ):
+        self.rides = rides
+        self.capacity = capacity
+        self.shift_start, self.shift_end = shift
+        self.boarding = TRANSPORT_BOARDING_MINUTES
+        self.rng = random.Random(seed)
+
+        index: Dict[Point, int] = {depot: 0}
+        for ride in rides:
+            index.setdefault(ride.pickup, len(index))
+            index.setdefault(ride.dropoff, len(index))
+        self.points = list(index)
+        matrix = (distance_provider or get_distance_provider()).matrix(self.points, self.points)
+        legs = [[matrix.leg(i, j) for j in range(len(self.points))] for i in range(len(self.points))]
+        self.miles = [[leg[0] for leg in row] for row in legs]
+        self.minutes = [[leg[1] for leg in row] for row in legs]
+
+        self.pick = [index[ride.pickup] for ride in rides]
+        self.drop = [index[ride.dropoff] for ride in rides]
+        self.earliest: List[float] = []  # Pickup window
+        self.latest_pickup: List[float] = []
+        self.latest_drop: List[float] = []
+        self.max_ride: List[float] = []
+        for r, ride in enumerate(rides):
+            direct = self.minutes[self.pick[r]][self.drop[r]]
+            max_ride = direct * TRANSPORT_MAX_RIDE_FACTOR + TRANSPORT_MAX_RIDE_EXTRA_MINUTES
+            if ride.due is not None:
+                latest_drop = ride.due
+                latest_pickup = ride.due - direct
+                earliest = ride.ready if ride.ready is not None else latest_pickup - TRANSPORT_EARLY_ARRIVAL_MINUTES
+            else:
+                earliest = ride.ready
+                latest_pickup = ride.ready + TRANSPORT_RETURN_WINDOW_MINUTES
+                latest_drop = latest_pickup + max_ride
+            self.earliest.append(earliest)
+            self.latest_pickup.append(latest_pickup)
+            self.latest_drop.append(latest_drop)
+            self.max_ride.append(max_ride)
+
+        # A ride no van can serve on its own (window outside the shift, too tight) is never planned
+        self.solo = [self.evaluate([2 * r, 2 * r + 1]) for r in range(len(rides))]
+        self.feasible = [r for r in range(len(rides)) if self.solo[r] is not None]
+        self.iterations = 0
+
+    # ==================== Route Evaluation ====================
+
+    def evaluate(self, stops: Sequence[int]) -> Optional[float]:
+        """Miles of a van route, or None if it breaks capacity, a time window, a ride time or the shift"""
+        minutes, miles = self.minutes, self.miles
+        t, at, load, total = self.shift_start, 0, 0, 0.0
+        picked_at: Dict[int, float] = {}
+        for stop in stops:
+            r = stop >> 1
+            if stop & 1:
+                point = self.drop[r]
+                t += minutes[at][point]
+                if t > self.latest_drop[r] or t - picked_at[r] > self.max_ride[r]:
+                    return None
+                load -= 1
+            else:
+                point = self.pick[r]
+                t += minutes[at][point]
+                if t > self.latest_pickup[r]:
+                    return None
+                if t < self.earliest[r]:
+                    t = self.earliest[r]
+                picked_at[r] = t
+                load += 1
+                if load > self.capacity:
+                    return None
+            total += miles[at][point]
+            t += self.boarding
+            at = point
+        if t + minutes[at][0] > self.shift_end:
+            return None
+        return total + miles[at][0]
+
+    def schedule(self, stops: Sequence[int]) -> List[Tuple[int, float, float, int]]:
+        """(stop, arrival, service start, passengers on board after the stop) along a feasible route"""
+        t, at, load = self.shift_start, 0, 0
+        timeline = []
+        for stop in stops:
+            r = stop >> 1
+            point = self.drop[r] if stop & 1 else self.pick[r]
+            arrival = t + self.minutes[at][point]
+            start = arrival if stop & 1 else max(arrival, self.earliest[r])
+            load += -1 if stop & 1 else 1
+            timeline.append((stop, arrival, start, load))
+            t, at = start + self.boarding, point
+        return timeline
+
+    def _state(self, stops: List[int]):
+        """
+        Arrival, start, wait, latest start and load per stop (index len(stops) is the return
+        to the depot), forward time slack (how much each stop's start can be delayed without
+        breaking any time window from there on) and the route's miles
+        """
+        n = len(stops)
+        points, arrival, start, wait, latest, loads = [], [], [], [], [], []
+        for stop, arrive, begin, load in self.schedule(stops):
+            r = stop >> 1
+            points.append(self.drop[r] if stop & 1 else self.pick[r])
+            arrival.append(arrive)
+            start.append(begin)
+            wait.append(begin - arrive)
+            latest.append(self.latest_drop[r] if stop & 1 else self.latest_pickup[r])
+            loads.append(load)
+        end = (start[-1] + self.boarding + self.minutes[points[-1]][0]) if n else self.shift_start
+        points.append(0)
+        arrival.append(end)
+        start.append(end)
+        wait.append(0.0)
+        latest.append(self.shift_end)
+        loads.append(0)
+        slack = [0.0] * (n + 1)
+        slack[n] = self.shift_end - end
+        for k in range(n - 1, -1, -1):
+            slack[k] = min(latest[k] - start[k], wait[k + 1] + slack[k + 1])
+        distance = sum(self.miles[a][b] for a, b in zip([0] + points, points))
+        return points, arrival, start, wait, latest, loads, slack, distance
+
+    def _best_insertion(self, r: int, stops: List[int], state) -> Optional[Tuple[float, int, int]]:
+        """
+        Cheapest feasible (extra miles, pickup position, drop-off position) for ride r
+        Capacity and time windows are checked in O(1) per position pair from the route's
+        slack; only the cheapest few candidates get the full check (others' ride times)
+        """
+        points, arrival, start, wait, latest, loads, slack, distance = state
+        minutes, miles, boarding, capacity = self.minutes, self.miles, self.boarding, self.capacity
+        pick, drop = self.pick[r], self.drop[r]
+        earliest, latest_pickup = self.earliest[r], self.latest_pickup[r]
+        latest_drop, max_ride = self.latest_drop[r], self.max_ride[r]
+        n = len(stops)
+
+        candidates = []
+        for i in range(n + 1):
+            before = points[i - 1] if i else 0
+            depart = start[i - 1] + boarding if i else self.shift_start
+            pickup_at = depart + minutes[before][pick]
+            if pickup_at > latest_pickup:
+                break
+            if i and loads[i - 1] >= capacity:
+                continue
+            if pickup_at < earliest:
+                pickup_at = earliest
+            after = points[i]
+
+            # Drop-off right after the pickup
+            drop_at = pickup_at + boarding + minutes[pick][drop]
+            if drop_at <= latest_drop and drop_at - pickup_at <= max_ride:
+                push = drop_at + boarding + minutes[drop][after] - arrival[i]
+                if push - wait[i] <= slack[i]:
+                    candidates.append((
+                        miles[before][pick] + miles[pick][drop] + miles[drop][after] - miles[before][after], i, i
+                    ))
+            if i == n:
+                break
+
+            # Passenger on board past stops i..j-1
+            pickup_miles = miles[before][pick] + miles[pick][after] - miles[before][after]
+            push = pickup_at + boarding + minutes[pick][after] - arrival[i]
+            for j in range(i + 1, n + 1):
+                k = j - 1
+                delay = push - wait[k] if push > wait[k] else 0.0
+                if delay > latest[k] - start[k] or loads[k] >= capacity:
+                    break
+                drop_at = start[k] + delay + boarding + minutes[points[k]][drop]
+                if drop_at > latest_drop or drop_at - pickup_at > max_ride:
+                    break
+                after = points[j]
+                if drop_at + boarding + minutes[drop][after] - arrival[j] - wait[j] <= slack[j]:
+                    candidates.append((
+                        pickup_miles + miles[points[k]][drop] + miles[drop][after] - miles[points[k]][after], i, j
+                    ))
+                push = delay
+
+        candidates.sort()
+        for _, i, j in candidates[:INSERTION_CHECKS]:
+            total = self.evaluate(stops[:i] + [2 * r] + stops[i:j] + [2 * r + 1] + stops[j:])
+            if total is not None:
+                return total - distance, i, j
+        return None
+
+    # ==================== Solutions ====================
+
+    def cost(self, routes: List[List[int]]) -> float:
+        return sum(TRANSPORT_VAN_COST + self.evaluate(stops) * TRANSPORT_COST_PER_MILE for stops in routes)
+
+    def _insert(self, routes: List[List[int]], pending: Sequence[int], regret: int):
+        """
+        Insert pending rides, greedily (regret 1) or hardest to place first (regret-k: largest
+        gap between the best and k-th best option); a new van is always an option
+        """
+        states = [self._state(stops) for stops in routes]
+        options = {r: [self._best_insertion(r, stops, state) for stops, state in zip(routes, states)]
+                   for r in pending}
+        pending = list(pending)
+        self.rng.shuffle(pending)
+        while pending:
+            choice, choice_score = None, None
+            for r in pending:
+                costs = [(option[0] * TRANSPORT_COST_PER_MILE, k) for k, option in enumerate(options[r]) if option]
+                costs.append((TRANSPORT_VAN_COST + self.solo[r] * TRANSPORT_COST_PER_MILE, -1))
+                costs.sort()
+                if regret <= 1:
+                    score = (-costs[0][0],)
+                else:
+                    score = (sum(costs[min(h, len(costs) - 1)][0] - costs[0][0] for h in range(1, regret)),
+                             -costs[0][0])
+                if choice_score is None or score > choice_score:
+                    choice, choice_score = (r, costs[0][1]), score
+            r, k = choice
+            pending.remove(r)
+            if k < 0:
+                routes.append([2 * r, 2 * r + 1])
+                states.append(self._state(routes[-1]))
+                for other in pending:
+                    options[other].append(self._best_insertion(other, routes[-1], states[-1]))
+                continue
+            _, i, j = options[r][k]
+            stops = routes[k]
+            routes[k] = stops[:i] + [2 * r] + stops[i:j] + [2 * r + 1] + stops[j:]
+            states[k] = self._state(routes[k])
+            for other in pending:
+                options[other][k] = self._best_insertion(other, routes[k], states[k])
+
+    def _remove(self, routes: List[List[int]], rides: Sequence[int]) -> List[int]:
+        """Take rides out of their routes; returns the removed rides (routes left invalid are emptied too)"""
+        removed = set(rides)
+        removed_stops = {2 * r for r in removed} | {2 * r + 1 for r in removed}
+        for k, stops in enumerate(routes):
+            kept = [stop for stop in stops if stop not in removed_stops]
+            # Earlier arrivals can lengthen another passenger's ride; re-plan that whole van
+            if len(kept) != len(stops) and kept and self.evaluate(kept) is None:
+                removed.update(stop >> 1 for stop in kept)
+                kept = []
+            routes[k] = kept
+        routes[:] = [stops for stops in routes if stops]
+        return list(removed)
+
+    def _assigned(self, routes: List[List[int]]) -> List[int]:
+        return [stop >> 1 for stops in routes for stop in stops if not stop & 1]
+
+    # ==================== Destroy Operators ====================
+
+    def _destroy_random(self, routes: List[List[int]], q: int) -> List[int]:
+        return self.rng.sample(self._assigned(routes), q)
+
+    def _relatedness(self, a: int, b: int) -> float:
+        return (self.minutes[self.pick[a]][self.pick[b]] + self.minutes[self.drop[a]][self.drop[b]]
+                + abs(self.earliest[a] - self.earliest[b]) + abs(self.latest_drop[a] - self.latest_drop[b]))
+
+    def _destroy_related(self, routes: List[List[int]], q: int) -> List[int]:
+        """Shaw removal: rides close in space and time to already chosen ones"""
+        remaining = self._assigned(routes)
+        chosen = [remaining.pop(self.rng.randrange(len(remaining)))]
+        while len(chosen) < q and remaining:
+            reference = self.rng.choice(chosen)
+            remaining.sort(key=lambda r: self._relatedness(reference, r))
+            chosen.append(remaining.pop(int(self.rng.random() ** 6 * len(remaining))))
+        return chosen
+
+    def _destroy_worst(self, routes: List[List[int]], q: int) -> List[int]:
+        """Rides whose removal saves the most miles (randomized rank)"""
+        savings = []
+        for stops in routes:
+            total = self.evaluate(stops)
+            for stop in stops:
+                if not stop & 1:
+                    rest = [other for other in stops if other >> 1 != stop >> 1]
+                    rest_miles = self.evaluate(rest) if rest else 0.0
+                    if rest_miles is not None:
+                        savings.append((total - rest_miles, stop >> 1))
+        savings.sort(reverse=True)
+        chosen = []
+        while len(chosen) < q and savings:
+            chosen.append(savings.pop(int(self.rng.random() ** 3 * len(savings)))[1])
+        return chosen
+
+    def _destroy_route(self, routes: List[List[int]], q: int) -> List[int]:
+        """Every ride of a lightly loaded van, so the others can absorb them and the fleet shrinks"""
+        by_size = sorted(range(len(routes)), key=lambda k: len(routes[k]))
+        k = by_size[int(self.rng.random() ** 2 * len(by_size))]
+        return [stop >> 1 for stop in routes[k] if not stop & 1]
+
+    # ==================== Search ====================
+
+    def solve(self, time_limit: float, max_iterations: Optional[int] = None) -> List[List[int]]:
+        """Best van routes found within time_limit seconds, covering every feasible ride"""
+        started = time.perf_counter()
+        routes: List[List[int]] = []
+        self._insert(routes, self.feasible, regret=2)
+        current_cost = self.cost(routes)
+        best, best_cost = [list(stops) for stops in routes], current_cost
+        rides = len(self.feasible)
+        self.iterations = 0
+        if rides < 2:
+            return best
+
+        destroys = [self._destroy_random, self._destroy_related, self._destroy_worst, self._destroy_route]
+        repairs = [1, 2, 3]  # Regret degree
+        weights = {"destroy": [1.0] * len(destroys), "repair": [1.0] * len(repairs)}
+        scores = {"destroy": [0.0] * len(destroys), "repair": [0.0] * len(repairs)}
+        uses = {"destroy": [0] * len(destroys), "repair": [0] * len(repairs)}
+        # Accept a 5% worse solution with probability 1/2 at first, cooling towards greedy by the deadline
+        initial_temperature = 0.05 * current_cost / math.log(2)
+        max_removed = min(rides, max(4, int(0.3 * rides)))
+
+        while max_iterations is None or self.iterations < max_iterations:
+            elapsed = time.perf_counter() - started
+            if elapsed >= time_limit:
+                break
+            temperature = initial_temperature * 0.002 ** (elapsed / time_limit)
+            d = self.rng.choices(range(len(destroys)), weights["destroy"])[0]
+            p = self.rng.choices(range(len(repairs)), weights["repair"])[0]
+            self.iterations += 1
+
+            candidate = [list(stops) for stops in routes]
+            q = self.rng.randint(min(2, max_removed), max_removed)
+            self._insert(candidate, self._remove(candidate, destroys[d](candidate, q)), repairs[p])
+            candidate_cost = self.cost(candidate)
+
+            score = 0.0
+            if candidate_cost < best_cost - 1e-9:
+                best, best_cost = [list(stops) for stops in candidate], candidate_cost
+                score = SCORE_BEST
+            if candidate_cost < current_cost - 1e-9:
+                score = score or SCORE_BETTER
+            elif self.rng.random() < math.exp((current_cost - candidate_cost) / max(temperature, 1e-9)):
+                score = score or SCORE_ACCEPTED
+            else:
+                candidate = None
+            if candidate is not None:
+                routes, current_cost = candidate, candidate_cost
+            for kind, used in (("destroy", d), ("repair", p)):
+                scores[kind][used] += score
+                uses[kind][used] += 1
+
+            if self.iterations % SEGMENT_ITERATIONS == 0:
+                for kind in weights:
+                    for o, count in enumerate(uses[kind]):
+                        if count:
+                            weights[kind][o] = (1 - REACTION) * weights[kind][o] + REACTION * scores[kind][o] / count
+                        weights[kind][o] = max(weights[kind][o], 0.05)
+                    scores[kind] = [0.0] * len(scores[kind])
+                    uses[kind] = [0] * len(uses[kind])
+        return best
+
+
+# ==================== Planning ====================
+
+def _clock(day: date, minutes: float) -> str:
+    return (datetime.combine(day, datetime.min.time()) + timedelta(minutes=minutes)).isoformat(timespec="seconds")
+
+
+def _dedicated_miles(solver: VanRoutingSolver, rides: List[int]) -> float:
+    """Miles of one van serving a single patient's rides on its own, depot to depot"""
+    at, total = 0, 0.0
+    for r in rides:
+        total += solver.miles[at][solver.pick[r]] + solver.miles[solver.pick[r]][solver.drop[r]]
+        at = solver.drop[r]
+    return total + solver.miles[at][0]
+
+
+def plan_rides(
+    rides: List[Ride],
+    day: date,
+    depot: Optional[Point] = None,
+    time_limit: float = TRANSPORT_TIME_LIMIT_SECONDS,
+    capacity: int = TRANSPORT_VAN_CAPACITY,
+    cluster_size: int = TRANSPORT_CLUSTER_SIZE,
+    distance_provider: Optional[DistanceProvider] = None,
+    seed: int = 0,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """Shared van routes for a day's rides: per-van stop lists with times, unassigned rides and a summary"""
+    started = time.perf_counter()
+    depot = depot or parse_depot(TRANSPORT_DEPOT)
+    clusters = sweep_clusters(rides, depot, cluster_size)
+    vans: List[Dict[str, Any]] = []
+    unassigned: List[Dict[str, Any]] = []
+    totals = {"miles": 0.0, "passenger_miles": 0.0, "dedicated_miles": 0.0, "iterations": 0}
+
+    for cluster_index, cluster in enumerate(clusters):
+        # Each cluster gets the share of the remaining time matching its share of the remaining rides
+        remaining_rides = sum(len(c) for c in clusters[cluster_index:])
+        remaining_time = max(0.0, time_limit - (time.perf_counter() - started))
+        solver = VanRoutingSolver(cluster, depot, distance_provider, capacity, seed=seed + cluster_index)
+        routes = solver.solve(remaining_time * len(cluster) / remaining_rides)
+        totals["iterations"] += solver.iterations
+        unassigned.extend(
+            {**cluster[r].describe(), "reason": "no van can meet its time window within the shift"}
+            for r in range(len(cluster)) if solver.solo[r] is None
+        )
+        served_by_patient: Dict[int, List[int]] = defaultdict(list)
+        for stops in routes:
+            for stop in stops:
+                if not stop & 1:
+                    served_by_patient[cluster[stop >> 1].patient_id].append(stop >> 1)
+        for patient_rides in served_by_patient.values():
+            totals["dedicated_miles"] += _dedicated_miles(solver, sorted(
+                patient_rides, key=lambda r: solver.earliest[r]
+            ))
+
+        for stops in routes:
+            timeline = solver.schedule(stops)
+            miles = solver.evaluate(stops)
+            at, load, passenger_miles = 0, 0, 0.0
+            van_stops = []
+            for stop, arrival, start, onboard in timeline:
+                ride = cluster[stop >> 1]
+                point = solver.drop[stop >> 1] if stop & 1 else solver.pick[stop >> 1]
+                passenger_miles += load * solver.miles[at][point]
+                at, load = point, onboard
+                lat, lon = ride.dropoff if stop & 1 else ride.pickup
+                van_stops.append({
+                    "action": "dropoff" if stop & 1 else "pickup",
+                    **ride.describe(),
+                    "provider_id": ride.to_provider_id if stop & 1 else ride.from_provider_id,
+                    "latitude": lat,
+                    "longitude": lon,
+                    "arrive_at": _clock(day, arrival),
+                    "depart_at": _clock(day, start + solver.boarding),
+                    "onboard": onboard
+                })
+            first_start = timeline[0][2]
+            last_stop, last_start = timeline[-1][0], timeline[-1][2]
+            last_point = solver.drop[last_stop >> 1] if last_stop & 1 else solver.pick[last_stop >> 1]
+            vans.append({
+                "van": len(vans) + 1,
+                "cluster": cluster_index,
+                "leave_depot_at": _clock(day, first_start - solver.minutes[0][solver.pick[stops[0] >> 1]]),
+                "return_depot_at": _clock(day, last_start + solver.boarding + solver.minutes[last_point][0]),
+                "miles": round(miles, 2),
+                "riders": len(stops) // 2,
+                "max_onboard": max(onboard for _, _, _, onboard in timeline),
+                "stops": van_stops
+            })
+            totals["miles"] += miles
+            totals["passenger_miles"] += passenger_miles
+        if progress:
+            progress({"cluster": cluster_index + 1, "clusters": len(clusters), "rides": len(cluster),
+                      "vans": len(vans), "iterations": solver.iterations})
+
+    served = sum(van["riders"] for van in vans)
+    return {
+        "day": day.isoformat(),
+        "vans": vans,
+        "unassigned": unassigned,
+        "summary": {
+            "patients": len({ride.patient_id for ride in rides}),
+            "rides": len(rides),
+            "rides_served": served,
+            "vans": len(vans),
+            "clusters": len(clusters),
+            "miles": round(totals["miles"], 2),
+            # Same rides with one van trip per patient, for comparison
+            "dedicated_trip_miles": round(totals["dedicated_miles"], 2),
+            "average_occupancy": round(totals["passenger_miles"] / totals["miles"], 2) if totals["miles"] else None,
+            "iterations": totals["iterations"],
+            "seconds": round(time.perf_counter() - started, 2)
+        }
+    }
+
+
+def plan_day(
+    db: Session,
+    day: date,
+    return_trips: bool = True,
+    appointments: Optional[Dict[int, datetime]] = None,
+    **options
+) -> Dict[str, Any]:
+    """Shared van routes for the route nodes scheduled on `day` (see load_rides; options as for plan_rides)"""
+    return plan_rides(load_rides(db, day, return_trips, appointments), day, **options)
+
+
+def print_progress(stats: Dict[str, Any]):
+    print(f"Cluster {stats['cluster']}/{stats['clusters']}: {stats['rides']} rides, "
+          f"{stats['iterations']} iterations, {stats['vans']} vans so far", flush=True)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from database import read_session
+
+    parser = argparse.ArgumentParser(description="Plan shared van transport for a day's scheduled route nodes")
+    parser.add_argument("day", type=date.fromisoformat, help="YYYY-MM-DD")
+    parser.add_argument("--time-limit", type=float, default=TRANSPORT_TIME_LIMIT_SECONDS, help="Seconds")
+    parser.add_argument("--capacity", type=int, default=TRANSPORT_VAN_CAPACITY)
+    parser.add_argument("--no-return-trips", action="store_true", help="Only rides to appointments")
+    parser.add_argument("--output", help="Write the plan as JSON to this file (default: summary only)")
+    args = parser.parse_args()
+
+    with read_session() as session:
+        plan = plan_day(session, args.day, not args.no_return_trips, time_limit=args.time_limit,
+                        capacity=args.capacity, progress=print_progress)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(plan, f, indent=2)
+    print(json.dumps(plan["summary"], indent=2))